@@ -10,12 +10,14 @@ from pyscf.lib import logger
 from pyscf.ao2mo import _ao2mo
 
 BLOCK = 56
+# Buffer size (in MB) to unpack memory-mapped 8-fold symmetric integrals
+MMAP_BUFSIZE = 400
 
 def full(eri_ao, mo_coeff, verbose=0, compact=True):
     r'''MO integral transformation for the given orbital.
 
     Args:
-        eri_ao : ndarray
+        eri_ao : ndarray or numpy.memmap
             AO integrals, can be either 8-fold or 4-fold symmetry.
         mo_coeff : ndarray
             Transform (ij|kl) with the same set of orbitals.
@@ -56,7 +58,7 @@ def general(eri_ao, mo_coeffs, verbose=0, compact=True):
     AO integrals to MO integrals.
 
     Args:
-        eri_ao : ndarray
+        eri_ao : ndarray or numpy.memmap
             AO integrals, can be either 8-fold or 4-fold symmetry.
         mo_coeffs : 4-item list of ndarray
             Four sets of orbital coefficients, corresponding to the four
@@ -159,7 +161,7 @@ def half_e1(eri_ao, mo_coeffs, compact=True):
     4-fold AO integrals (ij|kl)
 
     Args:
-        eri_ao : ndarray
+        eri_ao : ndarray or numpy.memmap
             AO integrals, can be either 8-fold or 4-fold symmetry.
         mo_coeffs : list of ndarray
             Two sets of orbital coefficients, corresponding to the i, j
@@ -196,6 +198,7 @@ def half_e1(eri_ao, mo_coeffs, compact=True):
     >>> print(eri1.shape)
     (55, 28)
     '''
+    mmap = isinstance(eri_ao, numpy.memmap)
     eri_ao = numpy.asarray(eri_ao, order='C')
     ijsame = compact and iden_coeffs(mo_coeffs[0], mo_coeffs[1])
 
@@ -230,6 +233,10 @@ def half_e1(eri_ao, mo_coeffs, compact=True):
     fdrv = getattr(_ao2mo.libao2mo, 'AO2MOnr_e1incore_drv')
     eri1 = numpy.empty((nij_pair,nao_pair))
 
+    if mmap and eri_ao.size != nao_pair**2:
+        _half_e1_s8_mmap(eri_ao, eri1, fmmm, moij, nao, ijshape)
+        return eri1
+
     bufs = numpy.empty((BLOCK, nij_pair))
     for blk0 in range(0, nao_pair, BLOCK):
         blk1 = min(blk0+BLOCK, nao_pair)
@@ -245,6 +252,38 @@ def half_e1(eri_ao, mo_coeffs, compact=True):
         eri1[:,blk0:blk1] = buf.T
     return eri1
 
+# Unpacking one row of the 8-fold symmetric integrals touches every row below
+# it.  For memory-mapped integrals, unpack a large block of rows in one pass
+# so that the integrals are read in long contiguous runs, then transform the
+# 4-fold symmetric block in memory.
+def _half_e1_s8_mmap(eri_ao, eri1, fmmm, moij, nao, ijshape):
+    nao_pair = nao*(nao+1)//2
+    nij_pair = eri1.shape[0]
+    blksize = max(BLOCK, int(MMAP_BUFSIZE*1e6/8/(nao_pair+nij_pair)))
+    blksize = min(blksize, nao_pair)
+    ftrans = _ao2mo._fpointer('AO2MOtranse1_incore_s4')
+    fdrv = getattr(_ao2mo.libao2mo, 'AO2MOnr_e1incore_drv')
+    funpack = getattr(_ao2mo.libao2mo, 'AO2MOunpack_s8_rows')
+    eribuf = numpy.empty((blksize,nao_pair))
+    bufs = numpy.empty((blksize,nij_pair))
+    for blk0 in range(0, nao_pair, blksize):
+        blk1 = min(blk0+blksize, nao_pair)
+        buf = bufs[:blk1-blk0]
+        funpack(eribuf.ctypes.data_as(ctypes.c_void_p),
+                eri_ao.ctypes.data_as(ctypes.c_void_p),
+                ctypes.c_int(blk0), ctypes.c_int(blk1-blk0),
+                ctypes.c_int(nao_pair))
+        fdrv(ftrans, fmmm,
+             buf.ctypes.data_as(ctypes.c_void_p),
+             eribuf.ctypes.data_as(ctypes.c_void_p),
+             moij.ctypes.data_as(ctypes.c_void_p),
+             ctypes.c_int(0), ctypes.c_int(blk1-blk0),
+             ctypes.c_int(nao),
+             ctypes.c_int(ijshape[0]), ctypes.c_int(ijshape[1]),
+             ctypes.c_int(ijshape[2]), ctypes.c_int(ijshape[3]))
+        eri1[:,blk0:blk1] = buf.T
+    return eri1
+
 def iden_coeffs(mo1, mo2):
     return (id(mo1) == id(mo2)) or \
             (mo1.shape==mo2.shape and numpy.allclose(mo1,mo2))
@@ -2,18 +2,34 @@
 # $Id$
 # -*- coding: utf-8
 
+import sys
 import time
 import tempfile
+import threading
+import multiprocessing
 import numpy
 import h5py
 import pyscf.lib
 import pyscf.lib.logger as logger
+from pyscf.lib import h5io
 from pyscf.ao2mo import _ao2mo
 
 # default ioblk_size is 256 MB
 
 IOBUF_WORDS_PREFER = 1e8
 IOBUF_ROW_MIN = 160
+# Overlap the computation with the I/O.  In half_e1, a writer thread flushes
+# the transformed block while the next block is computed.  In the e2 pass
+# of general, the next block of the half-transformed integrals is read ahead
+# and the MO integrals are written in background.  The I/O buffers are
+# doubled, the size of each buffer is halved to keep the memory footprint.
+ASYNC_IO = True
+# Number of processes to generate and half-transform the AO integrals in
+# half_e1.  The shell ranges are distributed over a pool of spawned processes
+# (Python 3.4 or newer).  The transformed blocks are sent back to the current
+# process which writes them to the swap file.  The OpenMP threads are divided
+# among the processes.
+NPROC = 1
 
 def full(mol, mo_coeff, erifile, dataname='eri_mo', tmpdir=None,
          intor='cint2e_sph', aosym='s4', comp=1,
@@ -251,14 +267,13 @@ def general(mol, mo_coeffs, erifile, dataname='eri_mo', tmpdir=None,
     else:
         assert(isinstance(erifile, h5py.Group))
         feri = erifile
+# The consumers (CCSD, MP2, ...) read the MO integrals in blocks of ij rows
     if comp == 1:
-        chunks = (nmoj,nmol)
-        h5d_eri = feri.create_dataset(dataname, (nij_pair,nkl_pair),
-                                      'f8', chunks=chunks)
+        h5d_eri = h5io.create_dataset(feri, dataname, (nij_pair,nkl_pair),
+                                      'f8', access='row')
     else:
-        chunks = (1,nmoj,nmol)
-        h5d_eri = feri.create_dataset(dataname, (comp,nij_pair,nkl_pair),
-                                      'f8', chunks=chunks)
+        h5d_eri = h5io.create_dataset(feri, dataname, (comp,nij_pair,nkl_pair),
+                                      'f8', access='row')
 
     if nij_pair == 0 or nkl_pair == 0:
         if isinstance(erifile, str):
@@ -278,46 +293,68 @@ def general(mol, mo_coeffs, erifile, dataname='eri_mo', tmpdir=None,
                            *time_0pass)
 
     mem_words = max_memory * 1e6 / 8
-    iobuflen = guess_e2bufsize(ioblk_size, nij_pair, nao_pair)[0]
+    if ASYNC_IO:
+        iobuflen = guess_e2bufsize(ioblk_size*.5, nij_pair, nao_pair)[0]
+        nbuf = 2
+    else:
+        iobuflen = guess_e2bufsize(ioblk_size, nij_pair, nao_pair)[0]
+        nbuf = 1
 
     log.debug('step2: kl-pair (ao %d, mo %d), mem %.8g MB, ioblock %.8g MB',
-              nao_pair, nkl_pair, iobuflen*nao_pair*8/1e6,
+              nao_pair, nkl_pair, iobuflen*nao_pair*8/1e6*nbuf,
               iobuflen*nkl_pair*8/1e6)
 
     klaoblks = len(fswap['0'])
     ijmoblks = int(numpy.ceil(float(nij_pair)/iobuflen)) * comp
     ao_loc = numpy.asarray(mol.ao_loc_nr(), dtype=numpy.int32)
     ti0 = time_1pass
-    bufs1 = numpy.empty((iobuflen,nkl_pair))
-    buf = numpy.empty((iobuflen, nao_pair))
-    istep = 0
-    for row0, row1 in prange(0, nij_pair, iobuflen):
-        nrow = row1 - row0
-
-        for icomp in range(comp):
-            istep += 1
-            tioi = 0
-            log.debug('step 2 [%d/%d], [%d,%d:%d], row = %d', \
-                      istep, ijmoblks, icomp, row0, row1, nrow)
-
-            buf = _load_from_h5g(fswap['%d'%icomp], row0, row1, buf)
-            ti2 = log.timer('step 2 [%d/%d], load buf'%(istep,ijmoblks), *ti0)
-            tioi += ti2[1]-ti0[1]
-            pbuf = bufs1[:nrow]
-            _ao2mo.nr_e2_(buf[:nrow], mokl, klshape, aosym, klmosym,
-                          ao_loc=ao_loc, out=pbuf)
-
-            tw1 = time.time()
-            if comp == 1:
-                h5d_eri[row0:row1] = pbuf
-            else:
-                h5d_eri[icomp,row0:row1] = pbuf
-            tioi += time.time()-tw1
+    bufs1 = [numpy.empty((iobuflen,nkl_pair)) for i in range(nbuf)]
+    bufs2 = [numpy.empty((iobuflen,nao_pair)) for i in range(nbuf)]
+    tasks = [(icomp, row0, row1)
+             for row0, row1 in prange(0, nij_pair, iobuflen)
+             for icomp in range(comp)]
+    def load(istep):
+        icomp, row0, row1 = tasks[istep]
+        return _load_from_h5g(fswap['%d'%icomp], row0, row1,
+                              bufs2[istep%nbuf])
+    def save(istep, pbuf):
+        icomp, row0, row1 = tasks[istep]
+        if comp == 1:
+            h5d_eri[row0:row1] = pbuf
+        else:
+            h5d_eri[icomp,row0:row1] = pbuf
 
-            ti1 = (time.clock(), time.time())
-            log.debug('step 2 [%d/%d] CPU time: %9.2f, Wall time: %9.2f, I/O time: %9.2f', \
-                      istep, ijmoblks, ti1[0]-ti0[0], ti1[1]-ti0[1], tioi)
-            ti0 = ti1
+    wait_load = _background(load, 0)
+    wait_save = _background(None)
+    for istep, (icomp, row0, row1) in enumerate(tasks):
+        nrow = row1 - row0
+        log.debug('step 2 [%d/%d], [%d,%d:%d], row = %d', \
+                  istep+1, ijmoblks, icomp, row0, row1, nrow)
+
+        tw1 = time.time()
+        buf = wait_load()
+        if istep+1 < len(tasks) and nbuf > 1:
+            # read ahead to the other buffer
+            wait_load = _background(load, istep+1)
+        tioi = time.time() - tw1
+
+        pbuf = bufs1[istep%nbuf][:nrow]
+        _ao2mo.nr_e2_(buf[:nrow], mokl, klshape, aosym, klmosym,
+                      ao_loc=ao_loc, out=pbuf)
+
+        tw1 = time.time()
+        if istep+1 < len(tasks) and nbuf == 1:
+            wait_load = _background(load, istep+1)
+        wait_save()
+        wait_save = _background(save, istep, pbuf)
+        tioi += time.time() - tw1
+
+        ti1 = (time.clock(), time.time())
+        log.debug('step 2 [%d/%d] CPU time: %9.2f, Wall time: %9.2f, I/O wait: %9.2f', \
+                  istep+1, ijmoblks, ti1[0]-ti0[0], ti1[1]-ti0[1], tioi)
+        ti0 = ti1
+    wait_save()
+    bufs1 = bufs2 = None
     fswap.close()
     if isinstance(erifile, str):
         feri.close()
@@ -331,7 +368,7 @@ def general(mol, mo_coeffs, erifile, dataname='eri_mo', tmpdir=None,
 def half_e1(mol, mo_coeffs, swapfile,
             intor='cint2e_sph', aosym='s4', comp=1,
             max_memory=2000, ioblk_size=256, verbose=logger.WARN, compact=True,
-            ao2mopt=None):
+            ao2mopt=None, nproc=None):
     r'''Half transform arbitrary spherical AO integrals to MO integrals
     for the given two sets of orbitals
 
@@ -377,7 +414,12 @@ def half_e1(mol, mo_coeffs, swapfile,
             If it's False, the function will abandon any permutation symmetry,
             and return the "plain" MO integrals
         ao2mopt : :class:`AO2MOpt` object
-            Precomputed data to improve perfomance
+            Precomputed data to improve perfomance.  It is not used by the
+            worker processes of the parallel mode.
+        nproc : int
+            Number of processes to transform the shell ranges.  Default is
+            NPROC.  max_memory is shared by the processes and the blocks
+            they send back.
 
     Returns:
         None
@@ -412,12 +454,29 @@ def half_e1(mol, mo_coeffs, swapfile,
         moij = numpy.asarray(numpy.hstack((mo_coeffs[0],mo_coeffs[1])), order='F')
         ijshape = (0, nmoi, nmoi, nmoj)
 
+    if nproc is None:
+        nproc = NPROC
+    if nproc > 1 and not hasattr(multiprocessing, 'get_context'):
+        log.warn('Multi-process half_e1 needs the spawn start method of '
+                 'Python 3.4+.  Fork after OpenMP may deadlock.  nproc = 1')
+        nproc = 1
+    if nproc > 1:
+# Each process holds its own buffers and the current process holds up to
+# nproc transformed blocks to be written
+        max_memory = max_memory / (nproc*2)
     e1buflen, mem_words, iobuf_words, ioblk_words = \
             guess_e1bufsize(max_memory, ioblk_size, nij_pair, nao_pair, comp)
+    if ASYNC_IO and nproc == 1:
+# Two iobufs, one is filled while the other is written to disk
+        nbuf = 2
+        e1buflen = min(e1buflen, iobuf_words//(2*comp*nij_pair))
+    else:
+        nbuf = 1
 # The buffer to hold AO integrals in C code, see line (@)
     aobuflen = int((mem_words - iobuf_words) // (nao_pair*comp))
     shranges = guess_shell_ranges(mol, e1buflen, aobuflen, aosym)
-    if ao2mopt is None:
+    nproc = min(nproc, len(shranges))
+    if ao2mopt is None and nproc == 1:
         if intor == 'cint2e_sph':
             ao2mopt = _ao2mo.AO2MOpt(mol, intor, 'CVHFnr_schwarz_cond',
                                      'CVHFsetnr_direct_scf')
@@ -435,17 +494,31 @@ def half_e1(mol, mo_coeffs, swapfile,
     for icomp in range(comp):
         g = fswap.create_group(str(icomp)) # for h5py old version
 
+    def save(istep, iobuf, e2buflen):
+        for icomp in range(comp):
+            _transpose_to_h5g(fswap, '%d/%d'%(icomp,istep), iobuf[icomp],
+                              e2buflen, None, h5io.block_dtype(iobuf[icomp]))
+
     # transform e1
     ti0 = log.timer('Initializing ao2mo.outcore.half_e1', *time0)
+    if nproc > 1:
+        _half_e1_pool(mol, shranges, intor, aosym, comp, moij, ijshape,
+                      ijmosym, nij_pair, nao_pair, ioblk_size, nproc, save, log)
+        log.timer('half_e1 in %d processes' % nproc, *ti0)
+        if isinstance(swapfile, str):
+            fswap.close()
+        return swapfile
+
     nstep = len(shranges)
     maxbuflen = max([x[2] for x in shranges])
     bufs1 = numpy.empty((comp*maxbuflen,nao_pair))
-    bufs2 = numpy.empty((comp*maxbuflen,nij_pair))
+    bufs2 = numpy.empty((nbuf,comp*maxbuflen,nij_pair))
+    wait_save = _background(None)
     for istep,sh_range in enumerate(shranges):
         log.debug('step 1 [%d/%d], AO [%d:%d], len(buf) = %d', \
                   istep+1, nstep, *(sh_range[:3]))
         buflen = sh_range[2]
-        iobuf = bufs2[:comp*buflen].reshape(comp,buflen,nij_pair)
+        iobuf = bufs2[istep%nbuf,:comp*buflen].reshape(comp,buflen,nij_pair)
         nmic = len(sh_range[3])
         p0 = 0
         for imic, aoshs in enumerate(sh_range[3]):
@@ -460,15 +533,123 @@ def half_e1(mol, mo_coeffs, swapfile,
         ti2 = log.timer('gen AO/transform MO [%d/%d]'%(istep+1,nstep), *ti0)
 
         e2buflen, chunks = guess_e2bufsize(ioblk_size, nij_pair, buflen)
-        for icomp in range(comp):
-            _transpose_to_h5g(fswap, '%d/%d'%(icomp,istep), iobuf[icomp],
-                              e2buflen, None)
+        wait_save()
+        wait_save = _background(save, istep, iobuf, e2buflen)
         ti0 = log.timer('transposing to disk', *ti2)
+    wait_save()
     bufs1 = bufs2 = None
     if isinstance(swapfile, str):
         fswap.close()
     return swapfile
 
+def _half_e1_pool(mol, shranges, intor, aosym, comp, moij, ijshape,
+                  ijmosym, nij_pair, nao_pair, ioblk_size, nproc, save, log):
+    '''The parallel mode of half_e1.  The worker processes are started with
+    the spawn method, since the OpenMP runtime of the current process may not
+    survive fork.  Each worker transforms one shell range at a time and sends
+    the block back.  The blocks are written by save(istep, iobuf, e2buflen)
+    in the current process in the order of the shell ranges.  At most nproc
+    blocks are in flight.
+    '''
+    nstep = len(shranges)
+    nthreads = max(1, pyscf.lib.num_threads() // nproc)
+    log.debug('step1: %d processes, %d threads per process', nproc, nthreads)
+
+    args = (mol._atm, mol._bas, mol._env, intor, aosym, comp, moij, ijshape,
+            ijmosym, nao_pair, shranges, nthreads)
+    ctx = multiprocessing.get_context('spawn')
+    pool = ctx.Pool(nproc, _init_e1_worker, args)
+    try:
+        ti0 = (time.clock(), time.time())
+        pending = [pool.apply_async(_e1_worker_step, (istep,))
+                   for istep in range(min(nproc, nstep))]
+        for istep in range(nstep):
+            iobuf = pending.pop(0).get()
+            if istep + nproc < nstep:
+                pending.append(pool.apply_async(_e1_worker_step,
+                                                (istep+nproc,)))
+            e2buflen = guess_e2bufsize(ioblk_size, nij_pair,
+                                       shranges[istep][2])[0]
+            save(istep, iobuf, e2buflen)
+            iobuf = None
+            ti0 = log.timer('step 1 [%d/%d], AO [%d:%d], len(buf) = %d' %
+                            ((istep+1, nstep) + shranges[istep][:3]), *ti0)
+        pool.close()
+        pool.join()
+        pool = None
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+# Per-process states of the half_e1 workers
+_e1_worker = {}
+
+def _init_e1_worker(atm, bas, env, intor, aosym, comp, moij, ijshape, ijmosym,
+                    nao_pair, shranges, nthreads):
+    pyscf.lib.num_threads(nthreads)
+    import pyscf.gto
+    mol = pyscf.gto.Mole()
+    mol._atm, mol._bas, mol._env = atm, bas, env
+    if intor == 'cint2e_sph':
+        ao2mopt = _ao2mo.AO2MOpt(mol, intor, 'CVHFnr_schwarz_cond',
+                                 'CVHFsetnr_direct_scf')
+    else:
+        ao2mopt = _ao2mo.AO2MOpt(mol, intor)
+    maxaolen = max([aoshs[2] for sh_range in shranges for aoshs in sh_range[3]])
+    _e1_worker.update(atm=atm, bas=bas, env=env, intor=intor, aosym=aosym,
+                      comp=comp, moij=moij, ijshape=ijshape, ijmosym=ijmosym,
+                      shranges=shranges, ao2mopt=ao2mopt,
+                      bufs1=numpy.empty((comp*maxaolen,nao_pair)))
+
+def _e1_worker_step(istep):
+    '''Half-transformed integrals (comp,len(buf),nij_pair) of shell range
+    istep'''
+    w = _e1_worker
+    comp = w['comp']
+    sh_range = w['shranges'][istep]
+    iobuf = None
+    p0 = 0
+    for aoshs in sh_range[3]:
+        buf = w['bufs1'][:comp*aoshs[2]]
+        _ao2mo.nr_e1fill_(w['intor'], aoshs, w['atm'], w['bas'], w['env'],
+                          w['aosym'], comp, w['ao2mopt'], out=buf)
+        buf = _ao2mo.nr_e1_(buf, w['moij'], w['ijshape'], w['aosym'],
+                            w['ijmosym'])
+        if iobuf is None:
+            iobuf = numpy.empty((comp,sh_range[2],buf.shape[1]))
+        iobuf[:,p0:p0+aoshs[2]] = buf.reshape(comp,aoshs[2],-1)
+        p0 += aoshs[2]
+    return iobuf
+
+def _background(fn, *args):
+    '''Call fn(*args) in a background thread (in the foreground if ASYNC_IO
+    is False).  Return a function which waits for the thread and returns the
+    result of fn.  The exception raised by fn is re-raised by the returned
+    function.
+    '''
+    if fn is None:
+        return lambda: None
+    elif not ASYNC_IO:
+        result = fn(*args)
+        return lambda: result
+
+    result = []
+    def run():
+        try:
+            result.append((True, fn(*args)))
+        except:
+            result.append((False, sys.exc_info()[1]))
+    thread = threading.Thread(target=run)
+    thread.start()
+    def wait():
+        thread.join()
+        ok, r = result[0]
+        if ok:
+            return r
+        else:
+            raise r
+    return wait
+
 def _load_from_h5g(h5group, row0, row1, out):
     nrow = row1 - row0
     col0 = 0
@@ -479,39 +660,28 @@ def _load_from_h5g(h5group, row0, row1, out):
         col0 = col1
     return out
 
-def _transpose_to_h5g(h5group, key, dat, blksize, chunks=None):
+def _transpose_to_h5g(h5group, key, dat, blksize, chunks=None, dtype='f8'):
     nrow, ncol = dat.shape
-    dset = h5group.create_dataset(key, (ncol,nrow), 'f8', chunks=chunks)
+# The transposed data are read in blocks of rows, of the size of multiple
+# IOBUF_ROW_MIN
+    dset = h5io.create_dataset(h5group, key, (ncol,nrow), dtype, access='row',
+                               blksize=IOBUF_ROW_MIN, chunks=chunks)
     for col0, col1 in prange(0, ncol, blksize):
         dset[col0:col1] = pyscf.lib.transpose(dat[:,col0:col1])
 
 def full_iofree(mol, mo_coeff, intor='cint2e_sph', aosym='s4', comp=1,
-                verbose=logger.WARN, compact=True):
+                verbose=logger.WARN, compact=True, max_memory=2000):
     r'''Transfer arbitrary spherical AO integrals to MO integrals for given orbitals
-    This function is a wrap for :func:`ao2mo.outcore.general`.  It's not really
-    IO free.  The returned MO integrals are held in memory.  For backward compatibility,
-    it is used to replace the non-existed function direct.full_iofree.
+    This function is a wrap for :func:`ao2mo.outcore.general_iter`.  No
+    temporary file is used.  The returned MO integrals are held in memory.
 
     Args:
         mol : :class:`Mole` object
             AO integrals will be generated in terms of mol._atm, mol._bas, mol._env
         mo_coeff : ndarray
             Transform (ij|kl) with the same set of orbitals.
-        erifile : str
-            To store the transformed integrals, in HDF5 format.
 
     Kwargs
-        dataname : str
-            The dataset name in the erifile (ref the hierarchy of HDF5 format
-            http://www.hdfgroup.org/HDF5/doc1.6/UG/09_Groups.html).  By assigning
-            different dataname, the existed integral file can be reused.  If
-            the erifile contains the dataname, the new integrals data will
-            overwrite the old one.
-        tmpdir : str
-            The directory where to temporarily store the intermediate data
-            (the half-transformed integrals).  By default, it's controlled by
-            shell environment variable ``TMPDIR``.  The disk space requirement
-            is about  comp*mo_coeffs[0].shape[1]*mo_coeffs[1].shape[1]*nao**2
         intor : str
             Name of the 2-electron integral.  Ref to :func:`getints_by_shell`
             for the complete list of available 2-electron integral names
@@ -532,12 +702,8 @@ def full_iofree(mol, mo_coeff, intor='cint2e_sph', aosym='s4', comp=1,
         verbose : int
             Print level
         max_memory : float or int
-            The maximum size of cache to use (in MB), large cache may **not**
-            improve performance.
-        ioblk_size : float or int
-            The block size for IO, large block size may **not** improve performance
-        verbose : int
-            Print level
+            The memory (in MB) to generate the MO integrals, in addition to
+            the returned array.
         compact : bool
             When compact is True, depending on the four oribital sets, the
             returned MO integrals has (up to 4-fold) permutation symmetry.
@@ -569,23 +735,15 @@ def full_iofree(mol, mo_coeff, intor='cint2e_sph', aosym='s4', comp=1,
     >>> print(eri1.shape)
     (3, 100, 55)
     '''
-    erifile = tempfile.NamedTemporaryFile()
-    with h5py.File(erifile.name, 'w') as feri:
-        general(mol, (mo_coeff,)*4, feri, dataname='eri_mo',
-                intor=intor, aosym=aosym, comp=comp,
-                verbose=verbose, compact=compact)
-        eri = numpy.asarray(feri['eri_mo'])
-        for key in feri.keys():
-            del(feri[key])
-        return eri
+    return general_iofree(mol, (mo_coeff,)*4, intor, aosym, comp,
+                          verbose, compact, max_memory)
 
 def general_iofree(mol, mo_coeffs, intor='cint2e_sph', aosym='s4', comp=1,
-                   verbose=logger.WARN, compact=True):
+                   verbose=logger.WARN, compact=True, max_memory=2000):
     r'''For the given four sets of orbitals, transfer arbitrary spherical AO
     integrals to MO integrals on the fly.  This function is a wrap for
-    :func:`ao2mo.outcore.general`.  It's not really IO free.  The returned MO
-    integrals are held in memory.  For backward compatibility, it is used to
-    replace the non-existed function direct.general_iofree.
+    :func:`ao2mo.outcore.general_iter`.  No temporary file is used.  The
+    returned MO integrals are held in memory.
 
     Args:
         mol : :class:`Mole` object
@@ -614,6 +772,9 @@ def general_iofree(mol, mo_coeffs, intor='cint2e_sph', aosym='s4', comp=1,
             Components of the integrals, e.g. cint2e_ip_sph has 3 components.
         verbose : int
             Print level
+        max_memory : float or int
+            The memory (in MB) to generate the MO integrals, in addition to
+            the returned array.
         compact : bool
             When compact is True, depending on the four oribital sets, the
             returned MO integrals has (up to 4-fold) permutation symmetry.
@@ -630,11 +791,6 @@ def general_iofree(mol, mo_coeffs, intor='cint2e_sph', aosym='s4', comp=1,
 
     >>> from pyscf import gto
     >>> from pyscf import ao2mo
-    >>> import h5py
-    >>> def view(h5file, dataname='eri_mo'):
-    ...     f5 = h5py.File(h5file)
-    ...     print('dataset %s, shape %s' % (str(f5.keys()), str(f5[dataname].shape)))
-    ...     f5.close()
     >>> mol = gto.M(atom='O 0 0 0; H 0 1 0; H 0 0 1', basis='sto3g')
     >>> mo1 = numpy.random.random((mol.nao_nr(), 10))
     >>> mo2 = numpy.random.random((mol.nao_nr(), 8))
@@ -656,15 +812,207 @@ def general_iofree(mol, mo_coeffs, intor='cint2e_sph', aosym='s4', comp=1,
     >>> print(eri1.shape)
     (3, 100, 55)
     '''
-    erifile = tempfile.NamedTemporaryFile()
-    with h5py.File(erifile.name, 'w') as feri:
-        general(mol, mo_coeffs, feri, dataname='eri_mo',
-                intor=intor, aosym=aosym, comp=comp,
-                verbose=verbose, compact=compact)
-        eri = numpy.asarray(feri['eri_mo'])
-        for key in feri.keys():
-            del(feri[key])
-        return eri
+    nij_pair, nkl_pair = _mo_pair_sizes(mo_coeffs, aosym, compact)
+    if comp == 1:
+        eri = numpy.empty((nij_pair,nkl_pair))
+    else:
+        eri = numpy.empty((comp,nij_pair,nkl_pair))
+    for ij0, ij1, buf in general_iter(mol, mo_coeffs, intor, aosym, comp,
+                                      max_memory, verbose, compact):
+        if comp == 1:
+            eri[ij0:ij1] = buf
+        else:
+            eri[:,ij0:ij1] = buf
+    return eri
+
+def full_iter(mol, mo_coeff, intor='cint2e_sph', aosym='s4', comp=1,
+              max_memory=2000, verbose=logger.WARN, compact=True):
+    '''Generator of the MO integrals (ij|kl) of the given orbitals.  See
+    :func:`general_iter`
+    '''
+    return general_iter(mol, (mo_coeff,)*4, intor, aosym, comp,
+                        max_memory, verbose, compact)
+
+def general_iter(mol, mo_coeffs, intor='cint2e_sph', aosym='s4', comp=1,
+                 max_memory=2000, verbose=logger.WARN, compact=True):
+    r'''Generator of the MO integrals (ij|kl) for the given four sets of
+    orbitals.  The integrals are computed on the fly in slabs of ij rows
+    (for all kl) and are never written to disk.
+
+    The AO integrals are generated for a range of the first MO index i at a
+    time.  The half-transformed integrals of the i-range are held in memory
+    and transformed to the kl MO pairs.  The number of i in each range is
+    determined by max_memory.  If max_memory is not enough to hold the
+    half-transformed integrals of all i, the AO integrals are recomputed for
+    each i-range.
+
+    Args:
+        mol : :class:`Mole` object
+            AO integrals will be generated in terms of mol._atm, mol._bas, mol._env
+        mo_coeffs : 4-item list of ndarray
+            Four sets of orbital coefficients, corresponding to the four
+            indices of (ij|kl)
+
+    Kwargs
+        intor, aosym, comp, verbose, compact :
+            See :func:`general`
+        max_memory : float or int
+            The memory (in MB) for the AO integrals, the half-transformed
+            integrals and the slab of the MO integrals.
+
+    Yields:
+        ij0, ij1, eri.  eri holds the rows ij0:ij1 of the MO integrals.  The
+        rows are ordered and compressed as the rows of the array returned
+        by :func:`general_iofree`.  eri has shape (ij1-ij0,nkl_pair), or
+        (comp,ij1-ij0,nkl_pair) for comp > 1.  A new array is allocated for
+        each slab.
+
+    Examples:
+
+    >>> from pyscf import gto
+    >>> from pyscf import ao2mo
+    >>> mol = gto.M(atom='O 0 0 0; H 0 1 0; H 0 0 1', basis='ccpvdz')
+    >>> mo = numpy.random.random((mol.nao_nr(), 10))
+    >>> eri = numpy.empty((55,55))
+    >>> for ij0, ij1, buf in ao2mo.outcore.general_iter(mol, (mo,)*4, max_memory=.05):
+    ...     eri[ij0:ij1] = buf
+    >>> print(numpy.allclose(eri, ao2mo.outcore.general_iofree(mol, (mo,)*4)))
+    True
+    '''
+    time0 = (time.clock(), time.time())
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(mol.stdout, verbose)
+
+    ijsame = compact and iden_coeffs(mo_coeffs[0], mo_coeffs[1])
+    klsame = compact and iden_coeffs(mo_coeffs[2], mo_coeffs[3])
+
+    nmoi = mo_coeffs[0].shape[1]
+    nmoj = mo_coeffs[1].shape[1]
+    nmok = mo_coeffs[2].shape[1]
+    nao = mo_coeffs[0].shape[0]
+    aosym = _stand_sym_code(aosym)
+    if aosym in ('s4', 's2ij'):
+        nao_pair_ij = nao * (nao+1) // 2
+    else:
+        nao_pair_ij = nao * nao
+    if aosym in ('s4', 's2kl'):
+        nao_pair_kl = nao * (nao+1) // 2
+    else:
+        nao_pair_kl = nao * nao
+    nij_pair, nkl_pair = _mo_pair_sizes(mo_coeffs, aosym, compact)
+    if nij_pair == 0 or nkl_pair == 0:
+        return
+
+    if compact and ijsame and aosym in ('s4', 's2ij'):
+        ij_tril = True
+        moij = numpy.asarray(mo_coeffs[0], order='F')
+    else:
+        ij_tril = False
+        moij = numpy.asarray(numpy.hstack((mo_coeffs[0],mo_coeffs[1])), order='F')
+    if compact and klsame and aosym in ('s4', 's2kl'):
+        klmosym = 's2'
+        mokl = numpy.asarray(mo_coeffs[2], order='F')
+        klshape = (0, nmok, 0, nmok)
+    else:
+        klmosym = 's1'
+        mokl = numpy.asarray(numpy.hstack((mo_coeffs[2],mo_coeffs[3])), order='F')
+        klshape = (0, nmok, nmok, mo_coeffs[3].shape[1])
+
+# A quarter of the memory for the AO integrals, the rest for the
+# half-transformed integrals and the MO integrals of the i-range
+    mem_words = max(1, max_memory * 1e6 / 8)
+    aobuflen = int(mem_words * .25 // (comp*nao_pair_ij))
+    shranges = guess_shell_ranges(mol, aobuflen, aobuflen, aosym)
+    aoranges = [aoshs for sh_range in shranges for aoshs in sh_range[3]]
+    maxaolen = max([x[2] for x in aoranges])
+    if ij_tril:
+        nrow_i = numpy.arange(1, nmoi+1)
+    else:
+        nrow_i = numpy.ones(nmoi, dtype=int) * nmoj
+    row_words = comp * (nao_pair_kl + nkl_pair + maxaolen)
+    max_rows = max(int((mem_words - comp*maxaolen*nao_pair_ij) // row_words),
+                   nrow_i.max())
+    irange = []
+    i0 = rows = 0
+    for i in range(nmoi):
+        if rows + nrow_i[i] > max_rows:
+            irange.append((i0, i))
+            i0, rows = i, 0
+        rows += nrow_i[i]
+    irange.append((i0, nmoi))
+    log.debug('general_iter: %d i-ranges, AO buffer %.8g MB, i-range buffer '
+              '%.8g MB', len(irange), comp*maxaolen*nao_pair_ij*8/1e6,
+              max_rows*row_words*8/1e6)
+
+    if intor == 'cint2e_sph':
+        ao2mopt = _ao2mo.AO2MOpt(mol, intor, 'CVHFnr_schwarz_cond',
+                                 'CVHFsetnr_direct_scf')
+    else:
+        ao2mopt = _ao2mo.AO2MOpt(mol, intor)
+    ao_loc = numpy.asarray(mol.ao_loc_nr(), dtype=numpy.int32)
+    bufs1 = numpy.empty((comp*maxaolen,nao_pair_ij))
+    ti0 = log.timer('Initializing ao2mo.outcore.general_iter', *time0)
+
+    for istep, (i0, i1) in enumerate(irange):
+        if ij_tril:
+            ij0 = i0 * (i0+1) // 2
+            ij1 = i1 * (i1+1) // 2
+            ijshape = (i0, i1-i0, 0, i1)
+            # (i,j) of j <= i in the (i0:i1,0:i1) block
+            idx = numpy.hstack([numpy.arange(i*i1, i*i1+i0+i+1)
+                                for i in range(i1-i0)])
+        else:
+            ij0 = i0 * nmoj
+            ij1 = i1 * nmoj
+            ijshape = (i0, i1-i0, nmoi, nmoj)
+        nrow = ij1 - ij0
+        half = numpy.empty((comp,nrow,nao_pair_kl))
+        p0 = 0
+        for aoshs in aoranges:
+            nkl = aoshs[2]
+            buf = bufs1[:comp*nkl]
+            _ao2mo.nr_e1fill_(intor, aoshs, mol._atm, mol._bas, mol._env,
+                              aosym, comp, ao2mopt, out=buf)
+            buf = _ao2mo.nr_e1_(buf, moij, ijshape, aosym, 's1')
+            if ij_tril:
+                buf = buf[:,idx]
+            buf = buf.reshape(comp,nkl,nrow)
+            for icomp in range(comp):
+                half[icomp,:,p0:p0+nkl] = buf[icomp].T
+            p0 += nkl
+        buf = None
+
+        eri = numpy.empty((comp,nrow,nkl_pair))
+        for icomp in range(comp):
+            _ao2mo.nr_e2_(half[icomp], mokl, klshape, aosym, klmosym,
+                          ao_loc=ao_loc, out=eri[icomp])
+        half = None
+        ti0 = log.timer('general_iter [%d/%d], i = [%d:%d]' %
+                        (istep+1, len(irange), i0, i1), *ti0)
+        if comp == 1:
+            yield ij0, ij1, eri[0]
+        else:
+            yield ij0, ij1, eri
+
+def _mo_pair_sizes(mo_coeffs, aosym, compact):
+    aosym = _stand_sym_code(aosym)
+    nmoi = mo_coeffs[0].shape[1]
+    nmoj = mo_coeffs[1].shape[1]
+    nmok = mo_coeffs[2].shape[1]
+    nmol = mo_coeffs[3].shape[1]
+    if (compact and aosym in ('s4', 's2ij') and
+        iden_coeffs(mo_coeffs[0], mo_coeffs[1])):
+        nij_pair = nmoi*(nmoi+1) // 2
+    else:
+        nij_pair = nmoi*nmoj
+    if (compact and aosym in ('s4', 's2kl') and
+        iden_coeffs(mo_coeffs[2], mo_coeffs[3])):
+        nkl_pair = nmok*(nmok+1) // 2
+    else:
+        nkl_pair = nmok*nmol
+    return nij_pair, nkl_pair
 
 
 def iden_coeffs(mo1, mo2):
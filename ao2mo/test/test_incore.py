@@ -44,6 +44,26 @@ class KnowValues(unittest.TestCase):
         eri1 = eri1.reshape(2,2,3,3)
         self.assertTrue(numpy.allclose(eri1, eriref[:2,1:3,:3,2:5]))
 
+    def test_incore_mmap(self):
+        from pyscf.scf import _vhf
+        numpy.random.seed(15)
+        nmo = 12
+        mo = numpy.random.random((nao,nmo))
+        eri = _vhf.int2e_sph(mol._atm, mol._bas, mol._env)
+        eriref = ao2mo.incore.full(eri, mo)
+        ftmp = tempfile.TemporaryFile()
+        eri_mmap = numpy.memmap(ftmp, dtype=numpy.double, mode='w+',
+                                shape=eri.shape)
+        eri_mmap[:] = eri
+        bufsize = ao2mo.incore.MMAP_BUFSIZE
+        ao2mo.incore.MMAP_BUFSIZE = .5
+        eri1 = ao2mo.incore.full(eri_mmap, mo)
+        self.assertTrue(numpy.allclose(eri1, eriref))
+        eri1 = ao2mo.incore.general(eri_mmap, (mo[:,:2], mo[:,1:3], mo[:,:3], mo[:,2:5]))
+        eri0 = ao2mo.incore.general(eri, (mo[:,:2], mo[:,1:3], mo[:,:3], mo[:,2:5]))
+        ao2mo.incore.MMAP_BUFSIZE = bufsize
+        self.assertTrue(numpy.allclose(eri1, eri0))
+
 
 if __name__ == '__main__':
     print('Full Tests for incore')
@@ -115,6 +115,94 @@ class KnowValues(unittest.TestCase):
         eri1 = s2kl_s1(1, numpy.array(feri['eri_mo']), nao)
         eri1 = eri1.reshape(nao,nao,nao,nao)
         self.assertTrue(numpy.allclose(eri1, eriref))
+    def test_half_e1_modes(self):
+        # (ASYNC_IO, NPROC, max_memory) against the synchronous serial
+        # half_e1.  With max_memory=10, 8 processes are more than the shell
+        # ranges (2 for s4, 5 for s2kl)
+        modes = ((True, 1, 1), (False, 3, 1), (False, 8, 10))
+        ftmp = tempfile.NamedTemporaryFile()
+        erifile = ftmp.name
+        mo1 = mo[:,:10]
+        mo2 = mo[:,4:]
+        try:
+            for aosym, comp, intor in (('s4', 1, 'cint2e_sph'),
+                                       ('s2kl', 3, 'cint2e_ip1_sph')):
+                ao2mo.outcore.ASYNC_IO = False
+                ao2mo.outcore.NPROC = 1
+                ao2mo.outcore.general(mol, (mo1,mo2,mo2,mo2), erifile,
+                                      dataname='eri0', intor=intor,
+                                      aosym=aosym, comp=comp,
+                                      max_memory=1, ioblk_size=.5)
+                for k, (async_io, nproc, max_memory) in enumerate(modes):
+                    ao2mo.outcore.ASYNC_IO = async_io
+                    ao2mo.outcore.NPROC = nproc
+                    ao2mo.outcore.general(mol, (mo1,mo2,mo2,mo2), erifile,
+                                          dataname='eri%d'%(k+1), intor=intor,
+                                          aosym=aosym, comp=comp,
+                                          max_memory=max_memory,
+                                          ioblk_size=.5)
+                with h5py.File(erifile) as feri:
+                    eri0 = numpy.array(feri['eri0'])
+                    for k in range(len(modes)):
+                        eri1 = numpy.array(feri['eri%d'%(k+1)])
+                        self.assertTrue(numpy.allclose(eri0, eri1))
+        finally:
+            ao2mo.outcore.ASYNC_IO = True
+            ao2mo.outcore.NPROC = 1
+
+    def test_general_iter(self):
+        ftmp = tempfile.NamedTemporaryFile()
+        erifile = ftmp.name
+        mo1 = mo[:,:10]
+        mo2 = mo[:,4:]
+        for mos, aosym, comp, intor in (((mo1,)*4, 's4', 1, 'cint2e_sph'),
+                                        ((mo1,mo2,mo2,mo2), 's4', 1, 'cint2e_sph'),
+                                        ((mo1,mo1,mo2,mo2), 's2kl', 3, 'cint2e_ip1_sph')):
+            ao2mo.outcore.general(mol, mos, erifile, intor=intor,
+                                  aosym=aosym, comp=comp)
+            with h5py.File(erifile) as feri:
+                eriref = numpy.array(feri['eri_mo'])
+            nblk = 0
+            for ij0, ij1, eri in ao2mo.outcore.general_iter(mol, mos, intor=intor,
+                                                            aosym=aosym, comp=comp,
+                                                            max_memory=.05):
+                if comp == 1:
+                    self.assertTrue(numpy.allclose(eri, eriref[ij0:ij1]))
+                else:
+                    self.assertTrue(numpy.allclose(eri, eriref[:,ij0:ij1]))
+                nblk += 1
+            self.assertTrue(nblk > 1)
+            eri = ao2mo.outcore.general_iofree(mol, mos, intor=intor, aosym=aosym,
+                                               comp=comp, max_memory=.05)
+            self.assertTrue(numpy.allclose(eri, eriref))
+
+    def test_compressed_layout(self):
+        ftmp = tempfile.NamedTemporaryFile()
+        erifile = ftmp.name
+        fswap = tempfile.NamedTemporaryFile()
+        ao2mo.outcore.full(mol, mo, erifile, dataname='eri0',
+                           max_memory=10, ioblk_size=5)
+        try:
+            lib.h5io.COMPRESSION = 'lzf'
+            # The half-transformed integrals of the random mo are below 15.
+            # All swap blocks are stored in float32.
+            lib.h5io.FLOAT32_THRESHOLD = 100
+            ao2mo.outcore.full(mol, mo, erifile, dataname='eri1',
+                               max_memory=10, ioblk_size=5)
+            with h5py.File(fswap.name, 'w') as f:
+                ao2mo.outcore.half_e1(mol, (mo,mo), f, max_memory=10,
+                                      ioblk_size=5)
+                self.assertEqual(f['0/0'].dtype, numpy.float32)
+        finally:
+            lib.h5io.COMPRESSION = None
+            lib.h5io.FLOAT32_THRESHOLD = 0
+        with h5py.File(erifile) as feri:
+            self.assertEqual(feri['eri1'].compression, 'lzf')
+            self.assertEqual(feri['eri1'].chunks[1], feri['eri1'].shape[1])
+            eri0 = numpy.array(feri['eri0'])
+            eri1 = numpy.array(feri['eri1'])
+            self.assertTrue(abs(eri0).max() > 1)
+            self.assertTrue(numpy.allclose(eri0, eri1, rtol=1e-5, atol=1e-4))
 
 def s2ij_s1(symmetry, eri, norb):
     idx = numpy.tril_indices(norb)
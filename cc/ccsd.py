@@ -642,9 +642,13 @@ class _ERIS:
         mem_now = pyscf.lib.current_memory()[0]
 
         log = logger.Logger(cc.stdout, cc.verbose)
-        if (method == 'incore' and cc._scf._eri is not None and
+        eri = cc._scf._eri
+        if (method == 'incore' and eri is not None and
             (mem_incore+mem_now < cc.max_memory) or cc.mol.incore_anyway):
-            eri1 = pyscf.ao2mo.incore.full(cc._scf._eri, mo_coeff)
+            if eri is None:
+                from pyscf.scf import eri_cache
+                eri = eri_cache.get_eri(cc.mol)
+            eri1 = pyscf.ao2mo.incore.full(eri, mo_coeff)
             #:eri1 = pyscf.ao2mo.restore(1, eri1, nmo)
             #:self.oooo = eri1[:nocc,:nocc,:nocc,:nocc].copy()
             #:self.ooov = eri1[:nocc,:nocc,:nocc,nocc:].copy()
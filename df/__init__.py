@@ -2,6 +2,7 @@ from pyscf.df import incore
 from pyscf.df import outcore
 from pyscf.df.incore import format_aux_basis
 from pyscf.df.addons import load
+from pyscf.df.df import DF
 
 from pyscf.df import r_incore
 
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Density fitting integrals shared by the DF methods.
+
+The :class:`DF` object holds the Cholesky decomposed 3-center integrals
+(L|ij), in memory or in an HDF5 file, and generates the AO, MO and
+half-transformed 3-index integrals on request.  DF-HF, DF-MP2 and DF-CASSCF
+reuse the DF object of the mean-field (SCF.with_df) when they use the same
+auxiliary basis, so that the 3-center integrals are computed only once.
+
+Examples:
+
+>>> from pyscf import gto, scf, mp, mcscf
+>>> mol = gto.M(atom='N 0 0 0; N 0 0 1.1', basis='ccpvdz')
+>>> mf = scf.density_fit(scf.RHF(mol))
+>>> mf.kernel()
+>>> mp.dfmp2.MP2(mf).kernel()              # reuses mf.with_df
+>>> mcscf.density_fit(mcscf.CASSCF(mf, 6, 6)).kernel()  # reuses mf.with_df
+'''
+
+import time
+import tempfile
+import numpy
+import h5py
+import pyscf.lib
+from pyscf.lib import logger
+from pyscf.lib import h5io
+from pyscf.ao2mo import _ao2mo
+from pyscf.df import incore
+from pyscf.df import outcore
+from pyscf.df import addons
+
+
+class DF(object):
+    '''Density fitting integrals
+
+    Attributes:
+        auxbasis : str or dict
+            Auxiliary basis, same format to :attr:`Mole.basis`.
+        max_memory : float or int
+            Allowed memory in MB.  The Cholesky decomposed integrals are held
+            in memory if they fit, otherwise they are saved in a temporary
+            file.
+        blockdim : int
+            The number of auxiliary functions to load at a time.
+    '''
+    def __init__(self, mol, auxbasis='weigend'):
+        self.mol = mol
+        self.stdout = mol.stdout
+        self.verbose = mol.verbose
+        self.max_memory = mol.max_memory
+        self.auxbasis = auxbasis
+        self.blockdim = 240
+        self.auxmol = None
+# _cderi is an ndarray of (naoaux,nao*(nao+1)/2), or the (temporary) HDF5
+# file which holds the array
+        self._cderi = None
+
+    def build(self):
+        '''Generate the Cholesky decomposed 3-center integrals.  Nothing is
+        done if the integrals exist.'''
+        if self._cderi is not None:
+            return self
+        t0 = (time.clock(), time.time())
+        log = logger.Logger(self.stdout, self.verbose)
+        mol = self.mol
+        self.auxmol = incore.format_aux_basis(mol, self.auxbasis)
+        nao = mol.nao_nr()
+        nao_pair = nao*(nao+1)//2
+        naoaux = self.auxmol.nao_nr()
+        if (nao_pair*naoaux*8/1e6*2+pyscf.lib.current_memory()[0]
+            < self.max_memory*.8):
+            self._cderi = incore.cholesky_eri(mol, auxbasis=self.auxbasis,
+                                              verbose=log)
+        else:
+            self._cderi = tempfile.NamedTemporaryFile()
+            outcore.cholesky_eri(mol, self._cderi.name, auxbasis=self.auxbasis,
+                                 verbose=log)
+        log.timer('DF.build', *t0)
+        return self
+
+    def get_naoaux(self):
+        '''Number of the auxiliary functions'''
+        if self.auxmol is not None:
+            return self.auxmol.nao_nr()
+# The Cholesky decomposed integrals may be assigned by the user
+        with addons.load(self._cderi) as feri:
+            return feri.shape[0]
+
+    def loop(self, blksize=None):
+        '''Iterate over the blocks of the AO integrals (L|ij), ij being the
+        lower triangular AO pairs.  Each block is a C-contiguous array of
+        (blksize,nao*(nao+1)/2).'''
+        if self._cderi is None:
+            self.build()
+        if blksize is None:
+            blksize = self.blockdim
+        naoaux = self.get_naoaux()
+        with addons.load(self._cderi) as feri:
+            for b0, b1 in pyscf.lib.prange(0, naoaux, blksize):
+                yield numpy.asarray(feri[b0:b1], order='C')
+
+    def ao2mo(self, mo_coeffs, compact=True, erifile=None, dataname='eri_mo'):
+        '''Transform the 3-index integrals (L|ij) to (L|pq) for the given two
+        sets of orbitals.  If the second set is None, the AO index is kept,
+        which gives the half-transformed integrals (L|p nu).
+
+        Kwargs:
+            compact : bool
+                Whether to save only the lower triangular pq pairs if the two
+                sets of orbitals are identical.
+            erifile : str or h5py Group
+                If given, the integrals are saved in erifile/dataname,
+                otherwise they are returned in memory.
+
+        Returns:
+            2D array (naoaux,npq), or erifile
+        '''
+        if self._cderi is None:
+            self.build()
+        mo1, mo2 = mo_coeffs
+        nao = mo1.shape[0]
+        if mo2 is None:
+            mo2 = numpy.eye(nao)
+        nmo1 = mo1.shape[1]
+        nmo2 = mo2.shape[1]
+        if compact and outcore.iden_coeffs(mo1, mo2):
+            mosym = 's2'
+            mo = mo1
+            shape = (0, nmo1, 0, nmo1)
+            npair = nmo1*(nmo1+1)//2
+        else:
+            mosym = 's1'
+            mo = numpy.hstack((mo1, mo2))
+            shape = (0, nmo1, nmo1, nmo2)
+            npair = nmo1*nmo2
+        naoaux = self.get_naoaux()
+
+        if erifile is None:
+            out = numpy.empty((naoaux,npair))
+        elif isinstance(erifile, str):
+            feri = h5py.File(erifile, 'w')
+            out = h5io.create_dataset(feri, dataname, (naoaux,npair), 'f8',
+                                      access='row', blksize=self.blockdim)
+        else:
+            out = h5io.create_dataset(erifile, dataname, (naoaux,npair), 'f8',
+                                      access='row', blksize=self.blockdim)
+        b0 = 0
+        for eri1 in self.loop():
+            b1 = b0 + eri1.shape[0]
+            out[b0:b1] = _ao2mo.nr_e2_(eri1, mo, shape, 's2kl', mosym)
+            b0 = b1
+
+        if erifile is None:
+            return out
+        elif isinstance(erifile, str):
+            feri.close()
+        return erifile
+
+    def get_eri(self):
+        '''4-center AO integrals (ij|kl) of 4-fold symmetry, approximated by
+        the density fitting integrals.'''
+        if self._cderi is None:
+            self.build()
+        nao = self.mol.nao_nr()
+        nao_pair = nao*(nao+1)//2
+        eri = numpy.zeros((nao_pair,nao_pair))
+        for eri1 in self.loop():
+            eri += pyscf.lib.dot(eri1.T, eri1)
+        return eri
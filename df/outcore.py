@@ -12,6 +12,7 @@ import scipy.linalg
 import h5py
 import pyscf.lib
 from pyscf.lib import logger
+from pyscf.lib import h5io
 import pyscf.gto
 from pyscf.ao2mo import _ao2mo
 from pyscf.scf import _vhf
@@ -60,15 +61,14 @@ def cholesky_eri(mol, erifile, auxbasis='weigend', dataname='eri_mo', tmpdir=Non
             del(feri[dataname])
     else:
         feri = h5py.File(erifile, 'w')
+# DF-JK and DF-MP2 read the integrals in blocks of the auxiliary basis
     if comp == 1:
-        chunks = (min(int(16e3/nao),naoaux), nao) # 128K
-        h5d_eri = feri.create_dataset(dataname, (naoaux,nao_pair), 'f8',
-                                      chunks=chunks)
+        h5d_eri = h5io.create_dataset(feri, dataname, (naoaux,nao_pair), 'f8',
+                                      access='row')
         aopairblks = len(fswap[dataname])
     else:
-        chunks = (1, min(int(16e3/nao),naoaux), nao) # 128K
-        h5d_eri = feri.create_dataset(dataname, (comp,naoaux,nao_pair), 'f8',
-                                      chunks=chunks)
+        h5d_eri = h5io.create_dataset(feri, dataname, (comp,naoaux,nao_pair),
+                                      'f8', access='row')
         aopairblks = len(fswap[dataname+'/0'])
     if comp > 1:
         for icomp in range(comp):
@@ -190,7 +190,7 @@ def cholesky_eri_b(mol, erifile, auxbasis='weigend', dataname='eri_mo',
                 label = '%s/%d/%d'%(dataname,icomp,istep)
             cderi = scipy.linalg.solve_triangular(low, buf[icomp].T,
                                                   lower=True, overwrite_b=True)
-            feri[label] = cderi
+            h5io.store_block(feri, label, cderi, access='row')
         time1 = log.timer('gen CD eri [%d/%d]' % (istep+1,len(shranges)), *time1)
     buf = bufs1 = None
 
@@ -250,15 +250,14 @@ def general(mol, mo_coeffs, erifile, auxbasis='weigend', dataname='eri_mo', tmpd
             del(feri[dataname])
     else:
         feri = h5py.File(erifile, 'w')
+# DF-JK and DF-MP2 read the integrals in blocks of the auxiliary basis
     if comp == 1:
-        chunks = (min(int(16e3/nmoj),naoaux), nmoj) # 128K
-        h5d_eri = feri.create_dataset(dataname, (naoaux,nij_pair), 'f8',
-                                      chunks=chunks)
+        h5d_eri = h5io.create_dataset(feri, dataname, (naoaux,nij_pair), 'f8',
+                                      access='row')
         aopairblks = len(fswap[dataname])
     else:
-        chunks = (1, min(int(16e3/nmoj),naoaux), nmoj) # 128K
-        h5d_eri = feri.create_dataset(dataname, (comp,naoaux,nij_pair), 'f8',
-                                      chunks=chunks)
+        h5d_eri = h5io.create_dataset(feri, dataname, (comp,naoaux,nij_pair),
+                                      'f8', access='row')
         aopairblks = len(fswap[dataname+'/0'])
     if comp > 1:
         for icomp in range(comp):
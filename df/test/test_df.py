@@ -11,6 +11,8 @@ from pyscf import gto
 from pyscf import scf
 from pyscf import ao2mo
 from pyscf import df
+from pyscf import mp
+from pyscf import mcscf
 
 mol = gto.Mole()
 mol.build(
@@ -168,6 +170,43 @@ class KnowValues(unittest.TestCase):
         self.assertTrue(numpy.allclose(eri0, j3c))
 
 
+    def test_df_object(self):
+        mf = scf.density_fit(scf.RHF(mol))
+        mf.kernel()
+        with_df = mf.with_df
+        self.assertTrue(mf._cderi is with_df._cderi)
+
+        nocc = mol.nelectron // 2
+        co = mf.mo_coeff[:,:nocc]
+        cv = mf.mo_coeff[:,nocc:]
+        ftmp = tempfile.NamedTemporaryFile()
+        df.outcore.general(mol, (co,cv), ftmp.name)
+        with h5py.File(ftmp.name) as feri:
+            eriref = numpy.array(feri['eri_mo'])
+        self.assertTrue(numpy.allclose(with_df.ao2mo((co,cv)), eriref))
+        half = with_df.ao2mo((co,None))
+        naoaux = with_df.get_naoaux()
+        nao = mol.nao_nr()
+        eri1 = numpy.dot(half.reshape(-1,nao), cv).reshape(naoaux,-1)
+        self.assertTrue(numpy.allclose(eri1, eriref))
+
+        pt = mp.dfmp2.MP2(mf)
+        e = pt.kernel()[0]
+        self.assertTrue(pt.with_df is with_df)
+        mf0 = scf.RHF(mol)
+        mf0.mo_coeff = mf.mo_coeff
+        mf0.mo_energy = mf.mo_energy
+        pt = mp.dfmp2.MP2(mf0)
+        self.assertAlmostEqual(pt.kernel()[0], e, 9)
+        self.assertTrue(pt.with_df is not with_df)
+
+        mc = mcscf.density_fit(mcscf.CASSCF(mf, 4, 4))
+        self.assertTrue(mc.with_df is with_df)
+        mf1 = scf.density_fit(scf.UHF(mol), with_df=with_df)
+        self.assertAlmostEqual(mf1.scf(), mf.e_tot, 9)
+        self.assertTrue(mf1._cderi is with_df._cderi)
+
+
 if __name__ == "__main__":
     print("Full Tests for df")
     unittest.main()
@@ -14,9 +14,12 @@ import pyscf.lib
 from pyscf.lib import logger
 from pyscf import gto
 from pyscf.dft import radi
+from pyscf.dft import numint
 
 libdft = pyscf.lib.load_library('libdft')
 
+BLKSIZE = 1024  # grids per block in the python implementation of gen_partition
+
 # ~= (L+1)**2/3
 SPHERICAL_POINTS_ORDER = {
       0:    1,
@@ -210,6 +213,11 @@ def gen_atomic_grids(mol, atom_grid={}, radi_method=radi.gauss_chebyshev,
                      level=3, prune_scheme=treutler_prune):
     '''Generate number of radial grids and angular grids for the given molecule.
 
+    The atomic grids are memoized in the process-wide table _ATOM_GRIDS,
+    keyed by the nuclear charge, the number of radial and angular grids,
+    radi_method and prune_scheme.  The cached arrays are read-only and shared
+    by all molecules (see :func:`atomic_grids_cache_info`).
+
     Returns:
         A dict, with the atom symbol for the dict key.  For each atom type,
         the dict value has two items: one is the meshgrid coordinates wrt the
@@ -227,46 +235,116 @@ def gen_atomic_grids(mol, atom_grid={}, radi_method=radi.gauss_chebyshev,
             else:
                 n_rad = _default_rad(chg, level)
                 n_ang = _default_ang(chg, level)
-            rad, dr = radi_method(n_rad)
-            rad_weight = 4*numpy.pi * rad*rad * dr
-            # atomic_scale = 1
-            # rad *= atomic_scale
-            # rad_weight *= atomic_scale
-
-            if callable(prune_scheme):
-                angs = prune_scheme(chg, rad, n_ang)
-            else:
-                angs = [n_ang] * n_rad
-            pyscf.lib.logger.debug(mol, 'atom %s rad-grids = %d, ang-grids = %s',
-                                   symb, n_rad, angs)
-
-            angs = numpy.array(angs)
-            coords = []
-            vol = []
-            for n in set(angs):
-                grid = numpy.empty((n,4))
-                libdft.MakeAngularGrid(grid.ctypes.data_as(ctypes.c_void_p),
-                                       ctypes.c_int(n))
-                idx = numpy.where(angs==n)[0]
-                for i0, i1 in prange(0, len(idx), 12):  # 12 radi-grids as a group
-                    coords.append(numpy.einsum('i,jk->jik',rad[idx[i0:i1]],
-                                               grid[:,:3]).reshape(-1,3))
-                    vol.append(numpy.einsum('i,j->ji', rad_weight[idx[i0:i1]],
-                                            grid[:,3]).ravel())
-            atom_grids_tab[symb] = (numpy.vstack(coords), numpy.hstack(vol))
+            key = (chg, int(n_rad), int(n_ang), radi_method, prune_scheme)
+            if key not in _ATOM_GRIDS:
+                _ATOM_GRIDS[key] = _make_atomic_grid(mol, symb, chg, n_rad,
+                                                     n_ang, radi_method,
+                                                     prune_scheme)
+            atom_grids_tab[symb] = _ATOM_GRIDS[key]
     return atom_grids_tab
 
+# Process-wide tables of the Lebedev grids (keyed by the number of angular
+# grids) and the atomic grids (see gen_atomic_grids).  Don't modify the
+# cached arrays, they are shared by all molecules.
+_ANG_GRIDS = {}
+_ATOM_GRIDS = {}
+
+def _lebedev_grid(n):
+    '''Lebedev grid of n points, (n,4) array of x, y, z and weight'''
+    if n not in _ANG_GRIDS:
+        grid = numpy.empty((n,4))
+        libdft.MakeAngularGrid(grid.ctypes.data_as(ctypes.c_void_p),
+                               ctypes.c_int(n))
+        grid.flags.writeable = False
+        _ANG_GRIDS[n] = grid
+    return _ANG_GRIDS[n]
+
+def _make_atomic_grid(mol, symb, chg, n_rad, n_ang, radi_method, prune_scheme):
+    rad, dr = radi_method(n_rad)
+    rad_weight = 4*numpy.pi * rad*rad * dr
+    # atomic_scale = 1
+    # rad *= atomic_scale
+    # rad_weight *= atomic_scale
+
+    if callable(prune_scheme):
+        angs = prune_scheme(chg, rad, n_ang)
+    else:
+        angs = [n_ang] * n_rad
+    pyscf.lib.logger.debug(mol, 'atom %s rad-grids = %d, ang-grids = %s',
+                           symb, n_rad, angs)
+
+    angs = numpy.array(angs)
+    coords = []
+    vol = []
+    for n in set(angs):
+        grid = _lebedev_grid(n)
+        idx = numpy.where(angs==n)[0]
+        for i0, i1 in prange(0, len(idx), 12):  # 12 radi-grids as a group
+            coords.append(numpy.einsum('i,jk->jik',rad[idx[i0:i1]],
+                                       grid[:,:3]).reshape(-1,3))
+            vol.append(numpy.einsum('i,j->ji', rad_weight[idx[i0:i1]],
+                                    grid[:,3]).ravel())
+    coords = numpy.vstack(coords)
+    vol = numpy.hstack(vol)
+    coords.flags.writeable = False
+    vol.flags.writeable = False
+    return coords, vol
+
+def atomic_grids_cache_info():
+    '''The number of the memoized Lebedev grids and atomic grids, and the
+    memory (in MB) they hold'''
+    nbytes = sum([g.nbytes for g in _ANG_GRIDS.values()])
+    nbytes+= sum([c.nbytes+v.nbytes for c, v in _ATOM_GRIDS.values()])
+    return len(_ANG_GRIDS), len(_ATOM_GRIDS), nbytes/1e6
+
+def clear_atomic_grids_cache():
+    _ANG_GRIDS.clear()
+    _ATOM_GRIDS.clear()
+
 
 def gen_partition(mol, atom_grids_tab, atomic_radii_adjust=None,
                   becke_scheme=original_becke):
     '''Generate the mesh grid coordinates and weights for DFT numerical integration.
     We can change atomic_radii_adjust becke_scheme to generate different meshgrid.
 
+    For the builtin becke_scheme (original_becke and stratmann) and radii
+    adjust functions (see radi.py), the Becke partition is computed by the
+    compiled kernel which skips the atom pairs of saturated cell functions.
+    Stratmann scheme has the most atom pairs skipped.
+
     Returns:
         grid_coord and grid_weight arrays.  grid_coord array has shape (N,3);
         weight 1D array has N elements.
     '''
     atm_coords = numpy.array([mol.atom_coord(i) for i in range(mol.natm)])
+    if (becke_scheme in (original_becke, stratmann) and
+        (atomic_radii_adjust is None or
+         hasattr(atomic_radii_adjust, 'radii_table'))):
+        atm_coords = numpy.asarray(atm_coords, order='C')
+        if atomic_radii_adjust is None:
+            c_radii = pyscf.lib.c_null_ptr()
+        else:
+            radii_table = numpy.asarray(atomic_radii_adjust.radii_table,
+                                        order='C')
+            c_radii = radii_table.ctypes.data_as(ctypes.c_void_p)
+        scheme = 0 if becke_scheme is original_becke else 1
+        coords_all = []
+        weights_all = []
+        for ia in range(mol.natm):
+            coords, vol = atom_grids_tab[mol.atom_symbol(ia)]
+            coords = numpy.asarray(coords + atm_coords[ia], order='C')
+            weights = numpy.array(vol, order='C')
+            libdft.VXCbecke_partition(weights.ctypes.data_as(ctypes.c_void_p),
+                                      coords.ctypes.data_as(ctypes.c_void_p),
+                                      ctypes.c_int(weights.size),
+                                      ctypes.c_int(ia),
+                                      atm_coords.ctypes.data_as(ctypes.c_void_p),
+                                      c_radii, ctypes.c_int(mol.natm),
+                                      ctypes.c_int(scheme))
+            coords_all.append(coords)
+            weights_all.append(weights)
+        return numpy.vstack(coords_all), numpy.hstack(weights_all)
+
     atm_dist = radi._inter_distance(mol)
     def gen_grid_partition(coords):
         ngrid = coords.shape[0]
@@ -291,13 +369,39 @@ def gen_partition(mol, atom_grids_tab, atomic_radii_adjust=None,
     for ia in range(mol.natm):
         coords, vol = atom_grids_tab[mol.atom_symbol(ia)]
         coords = coords + atm_coords[ia]
-        pbecke = gen_grid_partition(coords)
-        weights = vol * pbecke[ia] / pbecke.sum(axis=0)
+        weights = numpy.empty_like(vol)
+        # Blocks of grids to bound the (natm,ngrid) intermediates
+        for p0, p1 in prange(0, len(vol), BLKSIZE):
+            pbecke = gen_grid_partition(coords[p0:p1])
+            weights[p0:p1] = vol[p0:p1] * pbecke[ia] / pbecke.sum(axis=0)
         coords_all.append(coords)
         weights_all.append(weights)
     return numpy.vstack(coords_all), numpy.hstack(weights_all)
 
 
+def arrange_grids(coords, weights, blksize=numint.BLKSIZE):
+    '''Sort the grids spatially.  The grids are recursively bisected along
+    the longest edge of their bounding box.  The bisection points are aligned
+    to blksize, so that each block of blksize grids in numint holds the
+    grids of a compact region.
+    '''
+    ngrids = len(weights)
+    idx = numpy.arange(ngrids)
+    stack = [(0, ngrids)]
+    while stack:
+        p0, p1 = stack.pop()
+        nblk = (p1 - p0 + blksize - 1) // blksize
+        if nblk <= 1:
+            continue
+        mid = p0 + nblk // 2 * blksize
+        sub = idx[p0:p1]
+        c = coords[sub]
+        axis = numpy.argmax(c.max(axis=0) - c.min(axis=0))
+        idx[p0:p1] = sub[numpy.argpartition(c[:,axis], mid-p0)]
+        stack.append((p0, mid))
+        stack.append((mid, p1))
+    return coords[idx], weights[idx]
+
 
 class Grids(object):
     '''DFT mesh grids
@@ -338,6 +442,21 @@ class Grids(object):
             Eg, grids.atom_grid = {'H': (20,110)} will generate 20 radial
             grids and 110 angular grids for H atom.
 
+        cutoff : float or None
+            Grids of which the weights are smaller than cutoff are dropped.
+            Default is None, to keep all grids.
+
+        sort_grids : bool
+            Whether to sort the grids spatially, so that each block of
+            numint.BLKSIZE grids is compact.  Default is True.
+
+        dtype : numpy.float64 or numpy.float32
+            Data type of the coords and weights arrays.  Default is float64.
+
+        columnar : bool
+            Store coords in a (3,N) array (grids.coords is its (N,3) view).
+            Default is False.
+
         Examples:
 
         >>> mol = gto.M(atom='H 0 0 0; H 0 0 1.1')
@@ -361,6 +480,10 @@ class Grids(object):
         self.prune_scheme = treutler_prune
         self.symmetry = mol.symmetry
         self.atom_grid = {}
+        self.cutoff = None
+        self.sort_grids = True
+        self.dtype = numpy.double
+        self.columnar = False
 
 ##################################################
 # don't modify the following attributes, they are not input options
@@ -379,6 +502,9 @@ class Grids(object):
                         self.atomic_radii.__doc__)
         if self.atom_grid:
             logger.info(self, 'User specified grid scheme %s', str(self.atom_grid))
+        if self.cutoff is not None:
+            logger.info(self, 'weight cutoff: %g', self.cutoff)
+        logger.info(self, 'sort grids: %s', self.sort_grids)
 
     def build_(self, mol=None):
         return self.setup_grids_(mol)
@@ -392,9 +518,23 @@ class Grids(object):
                                                radi_method=self.radi_method,
                                                level=self.level,
                                                prune_scheme=self.prune_scheme)
-        self.coords, self.weights = \
+        coords, weights = \
                 self.gen_partition(mol, atom_grids_tab, self.atomic_radii,
                                    self.becke_scheme)
+        if self.cutoff is not None:
+            idx = weights > self.cutoff
+            pyscf.lib.logger.debug(self, 'Drop %d grids of weights < %g',
+                                   len(weights)-idx.sum(), self.cutoff)
+            coords = coords[idx]
+            weights = weights[idx]
+        if self.sort_grids:
+            coords, weights = arrange_grids(coords, weights)
+
+        if self.columnar:
+            self.coords = numpy.asarray(coords.T, dtype=self.dtype, order='C').T
+        else:
+            self.coords = numpy.asarray(coords, dtype=self.dtype, order='C')
+        self.weights = numpy.asarray(weights, dtype=self.dtype)
         pyscf.lib.logger.info(self, 'tot grids = %d', len(self.weights))
         return self.coords, self.weights
 
@@ -406,10 +546,10 @@ class Grids(object):
                          level=None, prune_scheme=None):
         ''' See gen_grid.gen_atomic_grids function'''
         if atom_grid is None: atom_grid = self.atom_grid
-        if radi_method is None: radi_method = mol.radi_method
+        if radi_method is None: radi_method = self.radi_method
         if level is None: level = self.level
         if prune_scheme is None: prune_scheme = self.prune_scheme
-        return gen_atomic_grids(mol, atom_grid, self.radi_method, level,
+        return gen_atomic_grids(mol, atom_grid, radi_method, level,
                                 prune_scheme)
 
     def gen_partition(self, mol, atom_grids_tab, atomic_radii=None,
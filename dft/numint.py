@@ -4,7 +4,10 @@
 #
 
 import ctypes
+import copy
 import time
+import tempfile
+import threading
 import numpy
 import scipy.linalg
 import pyscf.lib
@@ -14,6 +17,9 @@ from pyscf.lib import logger
 libdft = pyscf.lib.load_library('libdft')
 OCCDROP = 1e-12
 BLKSIZE = 96
+# Max number of grids in each block of nr_rks/nr_uks.  The AOs are evaluated
+# and contracted on the shells which are significant on the block only.
+SPARSE_BLKSIZE = BLKSIZE * 16
 
 def eval_ao(mol, coords, deriv=0, relativity=0, bastart=0, bascount=None,
             non0tab=None, out=None, verbose=None):
@@ -67,7 +73,7 @@ def eval_ao(mol, coords, deriv=0, relativity=0, bastart=0, bascount=None,
     >>> print(ao_value.shape)
     (10, 100, 7)
     '''
-    assert(coords.flags.c_contiguous)
+    coords = numpy.asarray(coords, dtype=numpy.double, order='C')
     if isinstance(deriv, bool):
         logger.warn(mol, '''
 You see this error message because of the API updates in pyscf v1.1.
@@ -102,7 +108,7 @@ def make_mask(mol, coords, relativity=0, bastart=0, bascount=None,
         2D bool array of shape (N,nbas), where N is the number of grids, nbas
         is the number of shells
     '''
-    assert(coords.flags.c_contiguous)
+    coords = numpy.asarray(coords, dtype=numpy.double, order='C')
     natm = ctypes.c_int(mol._atm.shape[0])
     nbas = ctypes.c_int(mol.nbas)
     ngrids = len(coords)
@@ -128,10 +134,11 @@ def eval_rho(mol, ao, dm, non0tab=None, xctype='LDA', verbose=None):
         mol : an instance of :class:`Mole`
 
         ao : 2D array of shape (N,nao) for LDA, 3D array of shape (4,N,nao) for GGA
-            or (5,N,nao) for meta-GGA.  N is the number of grids, nao is the
-            number of AO functions.  If xctype is GGA, ao[0] is AO value
-            and ao[1:3] are the AO gradients.  If xctype is meta-GGA, ao[4:10]
-            are second derivatives of ao values.
+            or (4,N,nao)/(10,N,nao) for meta-GGA.  N is the number of grids,
+            nao is the number of AO functions.  If xctype is GGA, ao[0] is AO
+            value and ao[1:3] are the AO gradients.  If xctype is meta-GGA,
+            ao[4:10] are second derivatives of ao values.  The Laplacian of
+            density is evaluated only if the second derivatives are given.
         dm : 2D array
             Density matrix
 
@@ -188,12 +195,16 @@ def eval_rho(mol, ao, dm, non0tab=None, xctype='LDA', verbose=None):
         for i in range(1, 4):
             c1 = _dot_ao_dm(mol, ao[i], dm, nao, ngrids, non0tab)
             rho[i] = numpy.einsum('pi,pi->p', ao[0], c1) * 2 # *2 for +c.c.
-            rho[5] += numpy.einsum('pi,pi->p', c1, c1)
-        XX, YY, ZZ = 4, 7, 9
-        ao2 = ao[XX] + ao[YY] + ao[ZZ]
-        rho[4] = numpy.einsum('pi,pi->p', ao[0], ao2)
-        rho[4] += rho[5]
-        rho[4] *= 2
+            rho[5] += numpy.einsum('pi,pi->p', ao[i], c1)
+        if len(ao) > 4:
+            XX, YY, ZZ = 4, 7, 9
+            ao2 = ao[XX] + ao[YY] + ao[ZZ]
+            c1 = _dot_ao_dm(mol, ao2, dm, nao, ngrids, non0tab)
+            rho[4] = numpy.einsum('pi,pi->p', ao[0], c1)
+            rho[4] += rho[5]
+            rho[4] *= 2
+        else:
+            rho[4] = 0
 
         rho[5] *= .5
     return rho
@@ -210,10 +221,11 @@ def eval_rho2(mol, ao, mo_coeff, mo_occ, non0tab=None, xctype='LDA',
         mol : an instance of :class:`Mole`
 
         ao : 2D array of shape (N,nao) for LDA, 3D array of shape (4,N,nao) for GGA
-            or (5,N,nao) for meta-GGA.  N is the number of grids, nao is the
-            number of AO functions.  If xctype is GGA, ao[0] is AO value
-            and ao[1:3] are the AO gradients.  If xctype is meta-GGA, ao[4:10]
-            are second derivatives of ao values.
+            or (4,N,nao)/(10,N,nao) for meta-GGA.  N is the number of grids,
+            nao is the number of AO functions.  If xctype is GGA, ao[0] is AO
+            value and ao[1:3] are the AO gradients.  If xctype is meta-GGA,
+            ao[4:10] are second derivatives of ao values.  The Laplacian of
+            density is evaluated only if the second derivatives are given.
         dm : 2D array
             Density matrix
 
@@ -265,12 +277,15 @@ def eval_rho2(mol, ao, mo_coeff, mo_occ, non0tab=None, xctype='LDA',
                 c1 = _dot_ao_dm(mol, ao[i], cpos, nao, ngrids, non0tab)
                 rho[i] = numpy.einsum('pi,pi->p', c0, c1) * 2 # *2 for +c.c.
                 rho[5] += numpy.einsum('pi,pi->p', c1, c1)
-            XX, YY, ZZ = 4, 7, 9
-            ao2 = ao[XX] + ao[YY] + ao[ZZ]
-            c1 = _dot_ao_dm(mol, ao2, cpos, nao, ngrids, non0tab)
-            rho[4] = numpy.einsum('pi,pi->p', c0, c1)
-            rho[4] += rho[5]
-            rho[4] *= 2
+            if len(ao) > 4:
+                XX, YY, ZZ = 4, 7, 9
+                ao2 = ao[XX] + ao[YY] + ao[ZZ]
+                c1 = _dot_ao_dm(mol, ao2, cpos, nao, ngrids, non0tab)
+                rho[4] = numpy.einsum('pi,pi->p', c0, c1)
+                rho[4] += rho[5]
+                rho[4] *= 2
+            else:
+                rho[4] = 0
 
             rho[5] *= .5
     else:
@@ -300,28 +315,30 @@ def eval_rho2(mol, ao, mo_coeff, mo_occ, non0tab=None, xctype='LDA',
             for i in range(1, 4):
                 c1 = _dot_ao_dm(mol, ao[i], cneg, nao, ngrids, non0tab)
                 rho[i] -= numpy.einsum('pi,pi->p', c0, c1) * 2 # *2 for +c.c.
-                rho5 -= numpy.einsum('pi,pi->p', c1, c1)
-            XX, YY, ZZ = 4, 7, 9
-            ao2 = ao[XX] + ao[YY] + ao[ZZ]
-            c1 = _dot_ao_dm(mol, ao2, cneg, nao, ngrids, non0tab)
-            rho[4] -= numpy.einsum('pi,pi->p', c0, c1) * 2
-            rho[4] -= rho5 * 2
+                rho5 += numpy.einsum('pi,pi->p', c1, c1)
+            if len(ao) > 4:
+                XX, YY, ZZ = 4, 7, 9
+                ao2 = ao[XX] + ao[YY] + ao[ZZ]
+                c1 = _dot_ao_dm(mol, ao2, cneg, nao, ngrids, non0tab)
+                rho[4] -= numpy.einsum('pi,pi->p', c0, c1) * 2
+                rho[4] -= rho5 * 2
 
             rho[5] -= rho5 * .5
     return rho
 
 def eval_mat(mol, ao, weight, rho, vrho, vsigma=None, non0tab=None,
-             xctype='LDA', verbose=None):
+             xctype='LDA', verbose=None, vtau=None):
     '''Calculate XC potential matrix.
 
     Args:
         mol : an instance of :class:`Mole`
 
         ao : 2D array of shape (N,nao) for LDA, 3D array of shape (4,N,nao) for GGA
-            or (5,N,nao) for meta-GGA.  N is the number of grids, nao is the
-            number of AO functions.  If xctype is GGA, ao[0] is AO value
-            and ao[1:3] are the AO gradients.  If xctype is meta-GGA, ao[4:10]
-            are second derivatives of ao values.
+            or (4,N,nao)/(10,N,nao) for meta-GGA.  N is the number of grids,
+            nao is the number of AO functions.  If xctype is GGA, ao[0] is AO
+            value and ao[1:3] are the AO gradients.  If xctype is meta-GGA,
+            ao[4:10] are second derivatives of ao values.  The Laplacian of
+            density is evaluated only if the second derivatives are given.
         weight : 1D array
             Integral weights on grids.
         rho : 1D array of size N for LDA or 2D array for GGA/meta-GGA,
@@ -332,6 +349,8 @@ def eval_mat(mol, ao, weight, rho, vrho, vsigma=None, non0tab=None,
     Kwargs:
         vsigma : 2D array of shape (3,N)
             GGA potential value on each grid
+        vtau : 1D array of size N
+            meta-GGA potential value (derivative wrt tau) on each grid
         xctype : str
             LDA/GGA/mGGA.  It affects the shape of `ao` and `rho`
         non0tab : 2D bool array
@@ -374,7 +393,14 @@ def eval_mat(mol, ao, weight, rho, vrho, vsigma=None, non0tab=None,
         #mat = pyscf.lib.dot(ao[0].T, aow)
         mat = _dot_ao_ao(mol, ao[0], aow, nao, ngrids, non0tab)
     else:
-        raise NotImplementedError('meta-GGA')
+        assert(vsigma is not None and vtau is not None)
+        wv = numpy.empty((4,ngrids))
+        wv[0]  = weight * vrho * .5
+        wv[1:] = rho[1:4] * (weight * vsigma * 2)
+        aow = numpy.einsum('npi,np->pi', ao[:4], wv)
+        mat = _dot_ao_ao(mol, ao[0], aow, nao, ngrids, non0tab)
+        # tau = 1/2 (\nabla f)^2
+        mat += _dot_ao_ao_tau(mol, ao, .25*weight*vtau, nao, ngrids, non0tab)
     return mat + mat.T
 
 def eval_x(x_id, rho, spin=0, relativity=0, deriv=1, verbose=None):
@@ -742,6 +768,187 @@ def _dot_ao_dm(mol, ao, dm, nao, ngrids, non0tab):
                         mol._env.ctypes.data_as(ctypes.c_void_p))
     return vm
 
+def _dot_ao_ao_tau(mol, ao, wv, nao, ngrids, non0tab):
+    '''return sum_i numpy.dot(ao[i].T, ao[i]*wv) for i = x,y,z'''
+    mat = 0
+    for i in range(1, 4):
+        aow = numpy.einsum('pi,p->pi', ao[i], wv)
+        mat = mat + _dot_ao_ao(mol, ao[i], aow, nao, ngrids, non0tab)
+    return mat
+
+def _check_vlapl(vlapl):
+    # The Laplacian of density is not evaluated in nr_rks/nr_uks (the AO
+    # buffer holds the first derivatives only)
+    if vlapl is not None and abs(vlapl).max() > 0:
+        raise NotImplementedError('meta-GGA functionals which depend on '
+                                  'the Laplacian of density')
+
+def _sparse_basis(mol, ao_loc, non0tab):
+    '''The shells which are significant on any grid of the block.
+
+    Returns:
+        A shallow copy of mol which holds these shells only, the indices of
+        their AOs (None if all shells are significant) and the non0tab of
+        these shells.
+    '''
+    shls = numpy.where(non0tab.any(axis=0))[0]
+    if len(shls) == mol.nbas:
+        return mol, None, non0tab
+    counts = ao_loc[shls+1] - ao_loc[shls]
+    idx = numpy.arange(counts.sum())
+    idx += numpy.repeat(ao_loc[shls] - numpy.cumsum(counts) + counts, counts)
+    submol = copy.copy(mol)
+    submol._bas = numpy.asarray(mol._bas[shls], order='C')
+    submol.nbas = len(shls)
+    return submol, idx, numpy.asarray(non0tab[:,shls], order='C')
+
+def _take_dm(dm, idx):
+    if idx is None:
+        return dm
+    else:
+        return numpy.asarray(dm)[idx[:,None],idx]
+
+def _take_orb(mo_coeff, idx):
+    if idx is None:
+        return mo_coeff
+    else:
+        return numpy.asarray(mo_coeff[idx], order='C')
+
+def _add_mat(mat, idx, v):
+    if idx is None:
+        mat += v
+    else:
+        mat[idx[:,None],idx] += v
+
+def _run_blocks(ni, fblock, ngrids, blksize, buf_shape, acc_shapes,
+                max_memory=2000):
+    '''Call fblock(ip0, ip1, buf, *acc) for every block of grids.  The
+    blocks are distributed over ni.nthreads threads.  Each thread holds its
+    own AO buffer (of buf_shape) and accumulators (zero arrays of acc_shapes).
+    The OpenMP kernels and BLAS are executed with one thread in each thread
+    to avoid the oversubscription of the cores.
+
+    Returns:
+        The accumulators summed over all threads.
+    '''
+    blocks = list(prange(0, ngrids, blksize))
+    nthreads = ni.nthreads
+    if nthreads is None:
+        nthreads = pyscf.lib.num_threads()
+    size = numpy.prod(buf_shape) + sum([numpy.prod(s) for s in acc_shapes])
+    nthreads = min(nthreads, len(blocks), int(max_memory*.5e6/8/size))
+
+    if nthreads <= 1:
+        buf = numpy.empty(buf_shape)
+        acc = [numpy.zeros(s) for s in acc_shapes]
+        for ip0, ip1 in blocks:
+            fblock(ip0, ip1, buf, *acc)
+        return acc
+
+    tasks = iter(blocks)
+    lock = threading.Lock()
+    errors = []
+    def worker(acc):
+        pyscf.lib.num_threads(1)
+        buf = numpy.empty(buf_shape)
+        try:
+            while not errors:
+                with lock:
+                    blk = next(tasks, None)
+                if blk is None:
+                    break
+                fblock(blk[0], blk[1], buf, *acc)
+        except Exception as err:
+            errors.append(err)
+    accs = [[numpy.zeros(s) for s in acc_shapes] for i in range(nthreads)]
+    threads = [threading.Thread(target=worker, args=(acc,)) for acc in accs]
+    with pyscf.lib.with_omp_threads(1):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+
+    acc = accs[0]
+    for acc1 in accs[1:]:
+        for a, a1 in zip(acc, acc1):
+            a += a1
+    return acc
+
+class _AOCache(object):
+    '''AO values of the grid blocks on the significant shells of each block.
+    The blocks are held in memory up to max_memory (MB).  If mmap is set, the
+    blocks beyond max_memory are saved in a temporary file and loaded through
+    numpy.memmap.  Otherwise they are not cached.
+    '''
+    def __init__(self, mol, grids, deriv, blksize, max_memory=1000,
+                 mmap=False):
+        self.coords = grids.coords
+        self.bas = mol._bas.copy()
+        self.env = mol._env.copy()
+        self.deriv = deriv
+        self.blksize = blksize
+        self.max_memory = max_memory
+        self.mmap = mmap
+        self.nbytes = 0
+        self.blocks = {}
+        self._file = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def match(self, mol, grids, deriv, blksize):
+        return (self.coords is grids.coords and self.deriv == deriv and
+                self.blksize == blksize and
+                numpy.array_equal(self.bas, mol._bas) and
+                numpy.array_equal(self.env, mol._env))
+
+    def get(self, ip0, ip1):
+        blk = self.blocks.get((ip0,ip1))
+        if isinstance(blk, tuple):
+            offset, shape = blk
+            blk = numpy.memmap(self._file.name, dtype=numpy.double, mode='r',
+                               offset=offset, shape=shape)
+        return blk
+
+    def put(self, ip0, ip1, ao):
+        with self._lock:
+            if self.nbytes + ao.nbytes <= self.max_memory*1e6:
+                self.blocks[(ip0,ip1)] = ao.copy()
+                self.nbytes += ao.nbytes
+            elif self.mmap:
+                if self._file is None:
+                    self._file = tempfile.NamedTemporaryFile(
+                        dir=pyscf.lib.parameters.TMPDIR)
+                self._file.seek(self._offset)
+                numpy.asarray(ao, order='C').tofile(self._file)
+                self._file.flush()
+                self.blocks[(ip0,ip1)] = (self._offset, ao.shape)
+                self._offset += ao.nbytes
+
+def _block_size(ni, grids, nao, max_memory):
+    '''Number of grids in each block.  The block size is determined by
+    max_memory when the AO cache (or the incremental XC state) is built and
+    it is kept for the same grids afterwards, so that the cache is not
+    rebuilt when the available memory changes between SCF iterations.
+    '''
+    for cache in (ni._ao_cache, ni._incr_xc):
+        if (cache is not None and cache.coords is grids.coords and
+            cache.blksize % BLKSIZE == 0):
+            return cache.blksize
+# NOTE to index ni.non0tab, the blksize needs to be the integer multiplier of BLKSIZE
+    blksize = min(int(max_memory/6*1e6/8/nao/BLKSIZE)*BLKSIZE, SPARSE_BLKSIZE)
+    return max(blksize, BLKSIZE)
+
+def _block_ao(ni, cache, mol, coords, deriv, non0tab, ip0, ip1, buf):
+    if cache is None:
+        return ni.eval_ao(mol, coords, deriv=deriv, non0tab=non0tab, out=buf)
+    ao = cache.get(ip0, ip1)
+    if ao is None:
+        ao = ni.eval_ao(mol, coords, deriv=deriv, non0tab=non0tab, out=buf)
+        cache.put(ip0, ip1, ao)
+    return ao
+
 def nr_vxc(mol, grids, x_id, c_id, dm, spin=0, relativity=0, hermi=1,
            max_memory=2000, verbose=None):
     if spin == 0:
@@ -809,27 +1016,25 @@ def nr_rks_vxc(ni, mol, grids, x_id, c_id, dms, spin=0, relativity=0, hermi=1,
 
     xctype = _xc_type(x_id, c_id)
     ngrids = len(grids.weights)
-    blksize = min(int(max_memory/6*1e6/8/nao/BLKSIZE)*BLKSIZE, ngrids)
-    if ni.non0tab is None:
-        non0tab = numpy.ones(((ngrids+BLKSIZE-1)//BLKSIZE,mol.nbas),
-                             dtype=numpy.int8)
-    else:
-        non0tab = ni.non0tab
+    blksize = _block_size(ni, grids, nao, max_memory)
+    ao_loc = numpy.asarray(mol.ao_loc_nr())
 
     nset = len(dms)
-    nelec = numpy.zeros(nset)
-    excsum = numpy.zeros(nset)
-    vmat = numpy.zeros_like(dms)
+    acc_shapes = ((nset,), (nset,), (nset,nao,nao))
     if xctype == 'LDA':
-        buf = numpy.empty((blksize,nao))
-        for ip0 in range(0, ngrids, blksize):
-            ip1 = min(ngrids, ip0+blksize)
+        buf_shape = (blksize,nao)
+        cache = ni.ao_cache(mol, grids, 0, blksize, max_memory)
+        def block(ip0, ip1, buf, nelec, excsum, vmat):
             coords = grids.coords[ip0:ip1]
             weight = grids.weights[ip0:ip1]
-            non0 = non0tab[ip0//BLKSIZE:]
-            ao = ni.eval_ao(mol, coords, deriv=0, non0tab=non0, out=buf)
+            if ni.non0tab is None:
+                non0 = ni.make_mask(mol, coords)
+            else:
+                non0 = ni.non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+            submol, idx, non0 = _sparse_basis(mol, ao_loc, non0)
+            ao = _block_ao(ni, cache, submol, coords, 0, non0, ip0, ip1, buf)
             for idm, dm in enumerate(dms):
-                rho = ni.eval_rho(mol, ao, dm, non0, xctype)
+                rho = ni.eval_rho(submol, ao, _take_dm(dm, idx), non0, xctype)
                 exc, vxc = ni.eval_xc(x_id, c_id, rho,
                                       spin, relativity, 1, verbose)[:2]
                 vrho = vxc[0]
@@ -837,35 +1042,45 @@ def nr_rks_vxc(ni, mol, grids, x_id, c_id, dms, spin=0, relativity=0, hermi=1,
                 nelec[idm] += den.sum()
                 excsum[idm] += (den*exc).sum()
                 aow = numpy.einsum('pi,p->pi', ao, .5*weight*vrho)
-                vmat[idm] += _dot_ao_ao(mol, ao, aow, nao, ip1-ip0, non0)
+                _add_mat(vmat[idm], idx, _dot_ao_ao(submol, ao, aow, ao.shape[1],
+                                                    ip1-ip0, non0))
                 rho = exc = vxc = vrho = aow = None
-    elif xctype == 'GGA':
-        buf = numpy.empty((4,blksize,nao))
-        for ip0 in range(0, ngrids, blksize):
-            ip1 = min(ngrids, ip0+blksize)
+    else:  # GGA or meta-GGA
+        buf_shape = (4,blksize,nao)
+        cache = ni.ao_cache(mol, grids, 1, blksize, max_memory)
+        def block(ip0, ip1, buf, nelec, excsum, vmat):
             coords = grids.coords[ip0:ip1]
             weight = grids.weights[ip0:ip1]
-            non0 = non0tab[ip0//BLKSIZE:]
-            ao = ni.eval_ao(mol, coords, deriv=1, non0tab=non0, out=buf)
+            if ni.non0tab is None:
+                non0 = ni.make_mask(mol, coords)
+            else:
+                non0 = ni.non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+            submol, idx, non0 = _sparse_basis(mol, ao_loc, non0)
+            ao = _block_ao(ni, cache, submol, coords, 1, non0, ip0, ip1, buf)
             for idm, dm in enumerate(dms):
-                rho = ni.eval_rho(mol, ao, dm, non0, xctype)
+                rho = ni.eval_rho(submol, ao, _take_dm(dm, idx), non0, xctype)
                 exc, vxc = ni.eval_xc(x_id, c_id, rho,
                                       spin, relativity, 1, verbose)[:2]
                 vrho, vsigma = vxc[:2]
+                if xctype == 'MGGA':
+                    _check_vlapl(vxc[2])
+                    vtau = vxc[3]
                 den = rho[0] * weight
                 nelec[idm] += den.sum()
                 excsum[idm] += (den*exc).sum()
 # ref eval_mat function
-                wv = numpy.empty_like(rho)
+                wv = numpy.empty((4,ip1-ip0))
                 wv[0]  = weight * vrho * .5
-                wv[1:] = rho[1:] * (weight * vsigma * 2)
+                wv[1:] = rho[1:4] * (weight * vsigma * 2)
                 aow = numpy.einsum('npi,np->pi', ao, wv)
-                vmat[idm] += _dot_ao_ao(mol, ao[0], aow, nao, ip1-ip0, non0)
+                v = _dot_ao_ao(submol, ao[0], aow, ao.shape[2], ip1-ip0, non0)
+                if xctype == 'MGGA':
+                    v += _dot_ao_ao_tau(submol, ao, .25*weight*vtau, ao.shape[2],
+                                        ip1-ip0, non0)
+                _add_mat(vmat[idm], idx, v)
                 rho = exc = vxc = vrho = vsigma = wv = aow = None
-    else:
-        buf = numpy.empty((6,blksize,nao))
-        raise NotImplementedError('meta-GGA')
-
+    nelec, excsum, vmat = _run_blocks(ni, block, ngrids, blksize, buf_shape,
+                                      acc_shapes, max_memory)
     for i in range(nset):
         vmat[i] = vmat[i] + vmat[i].T
     if nset == 1:
@@ -915,29 +1130,28 @@ def nr_uks_vxc(ni, mol, grids, x_id, c_id, dms, spin=0, relativity=0, hermi=1,
 
     xctype = _xc_type(x_id, c_id)
     ngrids = len(grids.weights)
-# NOTE to index ni.non0tab, the blksize needs to be the integer multiplier of BLKSIZE
-    blksize = min(int(max_memory/6*1e6/8/nao/BLKSIZE)*BLKSIZE, ngrids)
-    if ni.non0tab is None:
-        non0tab = numpy.ones(((ngrids+BLKSIZE-1)//BLKSIZE,mol.nbas),
-                             dtype=numpy.int8)
-    else:
-        non0tab = ni.non0tab
+    blksize = _block_size(ni, grids, nao, max_memory)
+    ao_loc = numpy.asarray(mol.ao_loc_nr())
 
-    nelec = numpy.zeros((2,nset))
-    excsum = numpy.zeros(nset)
-    vmat = numpy.zeros((2,nset,nao,nao))
+    acc_shapes = ((2,nset), (nset,), (2,nset,nao,nao))
     if xctype == 'LDA':
-        buf = numpy.empty((blksize,nao))
-        for ip0, ip1 in prange(0, ngrids, blksize):
+        buf_shape = (blksize,nao)
+        cache = ni.ao_cache(mol, grids, 0, blksize, max_memory)
+        def block(ip0, ip1, buf, nelec, excsum, vmat):
             coords = grids.coords[ip0:ip1]
             weight = grids.weights[ip0:ip1]
-            non0 = non0tab[ip0//BLKSIZE:]
-            ao = ni.eval_ao(mol, coords, deriv=0, non0tab=non0, out=buf)
+            if ni.non0tab is None:
+                non0 = ni.make_mask(mol, coords)
+            else:
+                non0 = ni.non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+            submol, idx, non0 = _sparse_basis(mol, ao_loc, non0)
+            ao = _block_ao(ni, cache, submol, coords, 0, non0, ip0, ip1, buf)
+            nao_sub = ao.shape[1]
             for idm in range(nset):
-                dm_a = dms[idm]
-                dm_b = dms[nset+idm]
-                rho_a = ni.eval_rho(mol, ao, dm_a, non0, xctype)
-                rho_b = ni.eval_rho(mol, ao, dm_b, non0, xctype)
+                dm_a = _take_dm(dms[idm], idx)
+                dm_b = _take_dm(dms[nset+idm], idx)
+                rho_a = ni.eval_rho(submol, ao, dm_a, non0, xctype)
+                rho_b = ni.eval_rho(submol, ao, dm_b, non0, xctype)
                 exc, vxc = ni.eval_xc(x_id, c_id, (rho_a, rho_b),
                                       1, relativity, 1, verbose)[:2]
                 vrho = vxc[0]
@@ -949,25 +1163,36 @@ def nr_uks_vxc(ni, mol, grids, x_id, c_id, dms, spin=0, relativity=0, hermi=1,
                 excsum[idm] += (den*exc).sum()
 
                 aow = numpy.einsum('pi,p->pi', ao, .5*weight*vrho[:,0])
-                vmat[0,idm] += _dot_ao_ao(mol, ao, aow, nao, ip1-ip0, non0)
+                _add_mat(vmat[0,idm], idx,
+                         _dot_ao_ao(submol, ao, aow, nao_sub, ip1-ip0, non0))
                 aow = numpy.einsum('pi,p->pi', ao, .5*weight*vrho[:,1])
-                vmat[1,idm] += _dot_ao_ao(mol, ao, aow, nao, ip1-ip0, non0)
+                _add_mat(vmat[1,idm], idx,
+                         _dot_ao_ao(submol, ao, aow, nao_sub, ip1-ip0, non0))
                 rho_a = rho_b = exc = vxc = vrho = aow = None
-    elif xctype == 'GGA':
-        buf = numpy.empty((4,blksize,nao))
-        for ip0, ip1 in prange(0, ngrids, blksize):
+    else:  # GGA or meta-GGA
+        buf_shape = (4,blksize,nao)
+        cache = ni.ao_cache(mol, grids, 1, blksize, max_memory)
+        def block(ip0, ip1, buf, nelec, excsum, vmat):
             coords = grids.coords[ip0:ip1]
             weight = grids.weights[ip0:ip1]
-            non0 = non0tab[ip0//BLKSIZE:]
-            ao = ni.eval_ao(mol, coords, deriv=1, non0tab=non0, out=buf)
+            if ni.non0tab is None:
+                non0 = ni.make_mask(mol, coords)
+            else:
+                non0 = ni.non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+            submol, idx, non0 = _sparse_basis(mol, ao_loc, non0)
+            ao = _block_ao(ni, cache, submol, coords, 1, non0, ip0, ip1, buf)
+            nao_sub = ao.shape[2]
             for idm in range(nset):
-                dm_a = dms[idm]
-                dm_b = dms[nset+idm]
-                rho_a = ni.eval_rho(mol, ao, dm_a, non0, xctype)
-                rho_b = ni.eval_rho(mol, ao, dm_b, non0, xctype)
+                dm_a = _take_dm(dms[idm], idx)
+                dm_b = _take_dm(dms[nset+idm], idx)
+                rho_a = ni.eval_rho(submol, ao, dm_a, non0, xctype)
+                rho_b = ni.eval_rho(submol, ao, dm_b, non0, xctype)
                 exc, vxc = ni.eval_xc(x_id, c_id, (rho_a, rho_b),
                                       1, relativity, 1, verbose)[:2]
                 vrho, vsigma = vxc[:2]
+                if xctype == 'MGGA':
+                    _check_vlapl(vxc[2])
+                    vtau = vxc[3]
                 den = rho_a[0]*weight
                 nelec[0,idm] += den.sum()
                 excsum[idm] += (den*exc).sum()
@@ -975,21 +1200,28 @@ def nr_uks_vxc(ni, mol, grids, x_id, c_id, dms, spin=0, relativity=0, hermi=1,
                 nelec[1,idm] += den.sum()
                 excsum[idm] += (den*exc).sum()
 
-                wv = numpy.empty_like(rho_a)
+                wv = numpy.empty((4,ip1-ip0))
                 wv[0]  = weight * vrho[:,0] * .5
-                wv[1:] = rho_a[1:] * (weight * vsigma[:,0] * 2)  # sigma_uu
-                wv[1:]+= rho_b[1:] * (weight * vsigma[:,1])      # sigma_ud
+                wv[1:] = rho_a[1:4] * (weight * vsigma[:,0] * 2)  # sigma_uu
+                wv[1:]+= rho_b[1:4] * (weight * vsigma[:,1])      # sigma_ud
                 aow = numpy.einsum('npi,np->pi', ao, wv)
-                vmat[0,idm] += _dot_ao_ao(mol, ao[0], aow, nao, ip1-ip0, non0)
+                v = _dot_ao_ao(submol, ao[0], aow, nao_sub, ip1-ip0, non0)
+                if xctype == 'MGGA':
+                    v += _dot_ao_ao_tau(submol, ao, .25*weight*vtau[:,0], nao_sub,
+                                        ip1-ip0, non0)
+                _add_mat(vmat[0,idm], idx, v)
                 wv[0]  = weight * vrho[:,1] * .5
-                wv[1:] = rho_b[1:] * (weight * vsigma[:,2] * 2)  # sigma_dd
-                wv[1:]+= rho_a[1:] * (weight * vsigma[:,1])      # sigma_ud
+                wv[1:] = rho_b[1:4] * (weight * vsigma[:,2] * 2)  # sigma_dd
+                wv[1:]+= rho_a[1:4] * (weight * vsigma[:,1])      # sigma_ud
                 aow = numpy.einsum('npi,np->pi', ao, wv)
-                vmat[1,idm] += _dot_ao_ao(mol, ao[0], aow, nao, ip1-ip0, non0)
+                v = _dot_ao_ao(submol, ao[0], aow, nao_sub, ip1-ip0, non0)
+                if xctype == 'MGGA':
+                    v += _dot_ao_ao_tau(submol, ao, .25*weight*vtau[:,1], nao_sub,
+                                        ip1-ip0, non0)
+                _add_mat(vmat[1,idm], idx, v)
                 rho_a = rho_b = exc = vxc = vrho = vsigma = wv = aow = None
-    else:
-        raise NotImplementedError('meta-GGA')
-
+    nelec, excsum, vmat = _run_blocks(ni, block, ngrids, blksize, buf_shape,
+                                      acc_shapes, max_memory)
     for i in range(nset):
         vmat[0,i] = vmat[0,i] + vmat[0,i].T
         vmat[1,i] = vmat[1,i] + vmat[1,i].T
@@ -1000,9 +1232,197 @@ def nr_uks_vxc(ni, mol, grids, x_id, c_id, dms, spin=0, relativity=0, hermi=1,
     return nelec, excsum, vmat
 
 
+class _IncrXCState(object):
+    '''Density, weighted XC potential and the XC matrix of the last call of
+    the incremental XC integration.'''
+    def __init__(self, mol, grids, x_id, c_id, dms, blksize):
+        nspin, nao = dms.shape[:2]
+        ngrids = len(grids.weights)
+        nblk = (ngrids+blksize-1) // blksize
+        self.coords = grids.coords
+        self.bas = mol._bas.copy()
+        self.env = mol._env.copy()
+        self.xc = (x_id, c_id)
+        self.blksize = blksize
+        self.cycle = 0
+        # number of the skipped blocks in the last call
+        self.nskip = 0
+        self.dms = numpy.zeros_like(dms)
+        self.rho = numpy.zeros((nspin,6,ngrids))
+        self.wv = numpy.zeros((nspin,5,ngrids))
+        self.vmat = numpy.zeros((nspin,nao,nao))
+        self.nelec = numpy.zeros((nblk,nspin))
+        self.excsum = numpy.zeros(nblk)
+        self.aomax = [None] * nblk
+        # Upper bound of the density error of the skipped updates
+        self.err = numpy.zeros(nblk)
+
+    def match(self, mol, grids, x_id, c_id, dms, blksize):
+        return (self.coords is grids.coords and self.xc == (x_id, c_id) and
+                self.blksize == blksize and self.dms.shape == dms.shape and
+                numpy.array_equal(self.bas, mol._bas) and
+                numpy.array_equal(self.env, mol._env))
+
+def _nr_incr(ni, mol, grids, x_id, c_id, dms, relativity=0, max_memory=2000,
+             verbose=None):
+    '''Incremental XC integration for a single RKS (dms of shape (1,nao,nao))
+    or UKS (dms of shape (2,nao,nao)) density matrix.  The density of each
+    grid block is updated with the density of dm - dm_last.  The blocks on
+    which the change of density is smaller than ni.incremental_xc_tol are
+    skipped.  The XC matrix is rebuilt from scratch every
+    ni.incremental_xc_rebuild calls.
+    '''
+    dms = numpy.asarray(dms)
+    nspin, nao = dms.shape[:2]
+    spin = nspin - 1
+    xctype = _xc_type(x_id, c_id)
+    ngrids = len(grids.weights)
+    blksize = _block_size(ni, grids, nao, max_memory)
+    ao_loc = numpy.asarray(mol.ao_loc_nr())
+    if ni.non0tab is None:
+        ni.non0tab = ni.make_mask(mol, grids.coords)
+
+    state = ni._incr_xc
+    if (state is None or not state.match(mol, grids, x_id, c_id, dms, blksize)
+        or state.cycle >= ni.incremental_xc_rebuild):
+        ni._incr_xc = None
+        state = ni._incr_xc = _IncrXCState(mol, grids, x_id, c_id, dms, blksize)
+        full = True
+    else:
+        full = False
+    ddms = dms - state.dms
+    abs_ddm = abs(ddms).max(axis=0)
+    tol = ni.incremental_xc_tol
+
+    if xctype == 'LDA':
+        deriv, ncomp = 0, 1
+        buf_shape = (blksize,nao)
+    else:
+        deriv = 1
+        ncomp = 6 if xctype == 'MGGA' else 4
+        buf_shape = (4,blksize,nao)
+    cache = ni.ao_cache(mol, grids, deriv, blksize, max_memory)
+
+    def block(ip0, ip1, buf, vmat, nskip):
+        ib = ip0 // blksize
+        coords = grids.coords[ip0:ip1]
+        weight = grids.weights[ip0:ip1]
+        non0tab = ni.non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+        submol, idx, non0tab = _sparse_basis(mol, ao_loc, non0tab)
+        if not full:
+            # |d(rho)| and |d(nabla rho)| <= 2 * sum_ij |ao_i| |ddm_ij| |ao_j|
+            aomax = state.aomax[ib]
+            err = numpy.dot(aomax, numpy.dot(_take_dm(abs_ddm, idx), aomax)) * 2
+            if state.err[ib] + err < tol:
+                state.err[ib] += err
+                nskip[0] += 1
+                return
+
+        ao = _block_ao(ni, cache, submol, coords, deriv, non0tab, ip0, ip1, buf)
+        if full:
+            if deriv == 0:
+                state.aomax[ib] = abs(ao).max(axis=0)
+            else:
+                state.aomax[ib] = abs(ao).max(axis=1).max(axis=0)
+        rho = state.rho[:,:ncomp,ip0:ip1]
+        for s in range(nspin):
+            rho[s] += ni.eval_rho(submol, ao, _take_dm(ddms[s], idx),
+                                  non0tab, xctype).reshape(ncomp,-1)
+        if spin == 0:
+            exc, vxc = ni.eval_xc(x_id, c_id, rho[0], 0, relativity, 1,
+                                  verbose)[:2]
+            vrho, vsigma, vlapl, vtau = [v if v is None else v.reshape(-1,1)
+                                         for v in vxc]
+        else:
+            exc, vxc = ni.eval_xc(x_id, c_id, (rho[0], rho[1]), 1,
+                                  relativity, 1, verbose)[:2]
+            vrho, vsigma, vlapl, vtau = vxc
+        den = rho[:,0] * weight
+        state.nelec[ib] = den.sum(axis=1)
+        state.excsum[ib] = numpy.dot(den.sum(axis=0), exc)
+
+        # *.5 because vmat + vmat.T
+        wv = numpy.zeros((nspin,5,ip1-ip0))
+        wv[:,0] = (weight * .5) * vrho.T
+        if xctype != 'LDA':
+            if spin == 0:
+                wv[0,1:4] = rho[0,1:4] * (weight * vsigma[:,0] * 2)
+            else:
+                wv[0,1:4] = rho[0,1:4] * (weight * vsigma[:,0] * 2)  # sigma_uu
+                wv[0,1:4]+= rho[1,1:4] * (weight * vsigma[:,1])      # sigma_ud
+                wv[1,1:4] = rho[1,1:4] * (weight * vsigma[:,2] * 2)  # sigma_dd
+                wv[1,1:4]+= rho[0,1:4] * (weight * vsigma[:,1])      # sigma_ud
+        if xctype == 'MGGA':
+            _check_vlapl(vlapl)
+            wv[:,4] = (weight * .25) * vtau.T
+        dwv = wv - state.wv[:,:,ip0:ip1]
+        state.wv[:,:,ip0:ip1] = wv
+
+        for s in range(nspin):
+            if xctype == 'LDA':
+                aow = numpy.einsum('pi,p->pi', ao, dwv[s,0])
+                v = _dot_ao_ao(submol, ao, aow, ao.shape[1], ip1-ip0, non0tab)
+            else:
+                aow = numpy.einsum('npi,np->pi', ao, dwv[s,:4])
+                v = _dot_ao_ao(submol, ao[0], aow, ao.shape[2], ip1-ip0,
+                               non0tab)
+                if xctype == 'MGGA':
+                    v += _dot_ao_ao_tau(submol, ao, dwv[s,4], ao.shape[2],
+                                        ip1-ip0, non0tab)
+            _add_mat(vmat[s], idx, v)
+
+    dvmat, nskip = _run_blocks(ni, block, ngrids, blksize, buf_shape,
+                               ((nspin,nao,nao), (1,)), max_memory)
+    state.vmat += dvmat
+    state.dms = dms.copy()
+    state.cycle += 1
+    state.nskip = int(nskip[0])
+    logger.debug(mol, 'Incremental XC: %d of %d blocks skipped',
+                 nskip[0], len(state.excsum))
+
+    nelec = state.nelec.sum(axis=0)
+    excsum = state.excsum.sum()
+    vmat = state.vmat + state.vmat.transpose(0,2,1)
+    if spin == 0:
+        return nelec[0], excsum, vmat[0]
+    else:
+        return nelec, excsum, vmat
+
+
 class _NumInt(object):
     def __init__(self):
         self.non0tab = None
+# Number of threads to integrate the grid blocks.  None means the number of
+# OpenMP threads.
+        self.nthreads = None
+# Cache the AO values on grids for the next calls of nr_rks/nr_uks (up to
+# max_memory/2).  If cache_ao is 'mmap', the AO values beyond the memory limit
+# are saved in a memory-mapped scratch file in lib.parameters.TMPDIR.  The
+# cache is kept until the grids or the molecule are changed, set _ao_cache to
+# None to release it.
+        self.cache_ao = False
+        self._ao_cache = None
+# Incremental XC integration in nr_rks/nr_uks for a single density matrix:
+# the density is updated with dm - dm_last, and the grid blocks on which the
+# change of density is smaller than incremental_xc_tol are skipped.  The XC
+# matrix is rebuilt from scratch every incremental_xc_rebuild calls.
+        self.incremental_xc = False
+        self.incremental_xc_tol = 1e-10
+        self.incremental_xc_rebuild = 8
+        self._incr_xc = None
+
+    def ao_cache(self, mol, grids, deriv, blksize, max_memory=2000):
+        '''The cache of AO values on grids.  The cache is rebuilt if mol,
+        grids, deriv or blksize are changed.  None if cache_ao is False.
+        '''
+        if not self.cache_ao:
+            self._ao_cache = None
+        elif (self._ao_cache is None or
+              not self._ao_cache.match(mol, grids, deriv, blksize)):
+            self._ao_cache = None  # release the memory of the old cache
+            self._ao_cache = _AOCache(mol, grids, deriv, blksize,
+                                      max_memory*.5, self.cache_ao == 'mmap')
+        return self._ao_cache
 
     def nr_vxc(self, mol, grids, x_id, c_id, dm, spin=0, relativity=0, hermi=1,
                max_memory=2000, verbose=None):
@@ -1052,6 +1472,10 @@ class _NumInt(object):
         if hermi != 1:
             return nr_rks_vxc(self, mol, grids, x_id, c_id, dms,
                               0, relativity, hermi, max_memory, verbose)
+        if (self.incremental_xc and
+            isinstance(dms, numpy.ndarray) and dms.ndim == 2):
+            return _nr_incr(self, mol, grids, x_id, c_id, dms[None],
+                            relativity, max_memory, verbose)
 
         natocc = []
         natorb = []
@@ -1069,24 +1493,23 @@ class _NumInt(object):
 
         xctype = _xc_type(x_id, c_id)
         ngrids = len(grids.weights)
-# NOTE to index self.non0tab, the blksize needs to be the integer multiplier of BLKSIZE
-        blksize = min(int(max_memory/6*1e6/8/nao/BLKSIZE)*BLKSIZE, ngrids)
+        blksize = _block_size(self, grids, nao, max_memory)
+        ao_loc = numpy.asarray(mol.ao_loc_nr())
 
         nset = len(natocc)
-        nelec = numpy.zeros(nset)
-        excsum = numpy.zeros(nset)
-        vmat = numpy.zeros((nset,nao,nao))
+        acc_shapes = ((nset,), (nset,), (nset,nao,nao))
         if xctype == 'LDA':
-            buf = numpy.empty((blksize,nao))
-            for ip0, ip1 in prange(0, ngrids, blksize):
+            buf_shape = (blksize,nao)
+            cache = self.ao_cache(mol, grids, 0, blksize, max_memory)
+            def block(ip0, ip1, buf, nelec, excsum, vmat):
                 coords = grids.coords[ip0:ip1]
                 weight = grids.weights[ip0:ip1]
-                non0tab = self.non0tab[ip0//BLKSIZE:]
-                ao = self.eval_ao(mol, coords, deriv=0, non0tab=non0tab,
-                                  out=buf)
+                non0tab = self.non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+                submol, idx, non0tab = _sparse_basis(mol, ao_loc, non0tab)
+                ao = _block_ao(self, cache, submol, coords, 0, non0tab, ip0, ip1, buf)
                 for idm in range(nset):
-                    rho = self.eval_rho2(mol, ao, natorb[idm], natocc[idm],
-                                         non0tab, xctype)
+                    rho = self.eval_rho2(submol, ao, _take_orb(natorb[idm], idx),
+                                         natocc[idm], non0tab, xctype)
                     exc, vxc = self.eval_xc(x_id, c_id, rho,
                                             0, relativity, 1, verbose)[:2]
                     vrho = vxc[0]
@@ -1095,34 +1518,43 @@ class _NumInt(object):
                     excsum[idm] += (den * exc).sum()
                     # *.5 because vmat + vmat.T
                     aow = numpy.einsum('pi,p->pi', ao, .5*weight*vrho)
-                    vmat[idm] += _dot_ao_ao(mol, ao, aow, nao, ip1-ip0, non0tab)
+                    _add_mat(vmat[idm], idx, _dot_ao_ao(submol, ao, aow, ao.shape[1],
+                                                        ip1-ip0, non0tab))
                     rho = exc = vxc = vrho = aow = None
-        elif xctype == 'GGA':
-            buf = numpy.empty((4,blksize,nao))
-            for ip0, ip1 in prange(0, ngrids, blksize):
+        else:  # GGA or meta-GGA
+            buf_shape = (4,blksize,nao)
+            cache = self.ao_cache(mol, grids, 1, blksize, max_memory)
+            def block(ip0, ip1, buf, nelec, excsum, vmat):
                 coords = grids.coords[ip0:ip1]
                 weight = grids.weights[ip0:ip1]
-                non0tab = self.non0tab[ip0//BLKSIZE:]
-                ao = self.eval_ao(mol, coords, deriv=1, non0tab=non0tab,
-                                  out=buf)
+                non0tab = self.non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+                submol, idx, non0tab = _sparse_basis(mol, ao_loc, non0tab)
+                ao = _block_ao(self, cache, submol, coords, 1, non0tab, ip0, ip1, buf)
                 for idm in range(nset):
-                    rho = self.eval_rho2(mol, ao, natorb[idm], natocc[idm],
-                                         non0tab, xctype)
+                    rho = self.eval_rho2(submol, ao, _take_orb(natorb[idm], idx),
+                                         natocc[idm], non0tab, xctype)
                     exc, vxc = self.eval_xc(x_id, c_id, rho,
                                             0, relativity, 1, verbose)[:2]
                     vrho, vsigma = vxc[:2]
+                    if xctype == 'MGGA':
+                        _check_vlapl(vxc[2])
+                        vtau = vxc[3]
                     den = rho[0] * weight
                     nelec[idm] += den.sum()
                     excsum[idm] += (den * exc).sum()
 # ref eval_mat function
-                    wv = numpy.empty_like(rho)
+                    wv = numpy.empty((4,ip1-ip0))
                     wv[0]  = weight * vrho * .5
-                    wv[1:] = rho[1:] * (weight * vsigma * 2)
+                    wv[1:] = rho[1:4] * (weight * vsigma * 2)
                     aow = numpy.einsum('npi,np->pi', ao, wv)
-                    vmat[idm] += _dot_ao_ao(mol, ao[0], aow, nao, ip1-ip0, non0tab)
+                    v = _dot_ao_ao(submol, ao[0], aow, ao.shape[2], ip1-ip0, non0tab)
+                    if xctype == 'MGGA':
+                        v += _dot_ao_ao_tau(submol, ao, .25*weight*vtau, ao.shape[2],
+                                            ip1-ip0, non0tab)
+                    _add_mat(vmat[idm], idx, v)
                     rho = exc = vxc = vrho = vsigma = wv = aow = None
-        else:
-            raise NotImplementedError('meta-GGA')
+        nelec, excsum, vmat = _run_blocks(self, block, ngrids, blksize,
+                                          buf_shape, acc_shapes, max_memory)
         for i in range(nset):
             vmat[i] = vmat[i] + vmat[i].T
         if nset == 1:
@@ -1166,6 +1598,10 @@ class _NumInt(object):
         if hermi != 1:
             return nr_uks_vxc(self, mol, grids, x_id, c_id, dms,
                               mol.spin, relativity, hermi, max_memory, verbose)
+        if (self.incremental_xc and len(dms) == 2 and
+            not (isinstance(dms, numpy.ndarray) and dms.ndim == 2)):
+            return _nr_incr(self, mol, grids, x_id, c_id, dms,
+                            relativity, max_memory, verbose)
 
         natocc = []
         natorb = []
@@ -1186,24 +1622,26 @@ class _NumInt(object):
 
         xctype = _xc_type(x_id, c_id)
         ngrids = len(grids.weights)
-# NOTE to index self.non0tab, the blksize needs to be the integer multiplier of BLKSIZE
-        blksize = min(int(max_memory/6*1e6/8/nao/BLKSIZE)*BLKSIZE, ngrids)
+        blksize = _block_size(self, grids, nao, max_memory)
+        ao_loc = numpy.asarray(mol.ao_loc_nr())
 
-        nelec = numpy.zeros((2,nset))
-        excsum = numpy.zeros(nset)
-        vmat = numpy.zeros((2,nset,nao,nao))
+        acc_shapes = ((2,nset), (nset,), (2,nset,nao,nao))
         if xctype == 'LDA':
-            buf = numpy.empty((blksize,nao))
-            for ip0, ip1 in prange(0, ngrids, blksize):
+            buf_shape = (blksize,nao)
+            cache = self.ao_cache(mol, grids, 0, blksize, max_memory)
+            def block(ip0, ip1, buf, nelec, excsum, vmat):
                 coords = grids.coords[ip0:ip1]
                 weight = grids.weights[ip0:ip1]
-                non0tab = self.non0tab[ip0//BLKSIZE:]
-                ao = self.eval_ao(mol, coords, deriv=0, non0tab=non0tab, out=buf)
+                non0tab = self.non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+                submol, idx, non0tab = _sparse_basis(mol, ao_loc, non0tab)
+                ao = _block_ao(self, cache, submol, coords, 0, non0tab, ip0, ip1, buf)
                 for idm in range(nset):
                     c_a, c_b = natorb[idm]
                     e_a, e_b = natocc[idm]
-                    rho_a = self.eval_rho2(mol, ao, c_a, e_a, non0tab, xctype)
-                    rho_b = self.eval_rho2(mol, ao, c_b, e_b, non0tab, xctype)
+                    rho_a = self.eval_rho2(submol, ao, _take_orb(c_a, idx), e_a,
+                                           non0tab, xctype)
+                    rho_b = self.eval_rho2(submol, ao, _take_orb(c_b, idx), e_b,
+                                           non0tab, xctype)
                     exc, vxc = self.eval_xc(x_id, c_id, (rho_a, rho_b),
                                             1, relativity, 1, verbose)[:2]
                     vrho = vxc[0]
@@ -1215,25 +1653,34 @@ class _NumInt(object):
                     excsum[idm] += (den*exc).sum()
 
                     aow = numpy.einsum('pi,p->pi', ao, .5*weight*vrho[:,0])
-                    vmat[0,idm] += _dot_ao_ao(mol, ao, aow, nao, ip1-ip0, non0tab)
+                    _add_mat(vmat[0,idm], idx, _dot_ao_ao(submol, ao, aow, ao.shape[1],
+                                                          ip1-ip0, non0tab))
                     aow = numpy.einsum('pi,p->pi', ao, .5*weight*vrho[:,1])
-                    vmat[1,idm] += _dot_ao_ao(mol, ao, aow, nao, ip1-ip0, non0tab)
+                    _add_mat(vmat[1,idm], idx, _dot_ao_ao(submol, ao, aow, ao.shape[1],
+                                                          ip1-ip0, non0tab))
                     rho_a = rho_b = exc = vxc = vrho = aow = None
-        elif xctype == 'GGA':
-            buf = numpy.empty((4,blksize,nao))
-            for ip0, ip1 in prange(0, ngrids, blksize):
+        else:  # GGA or meta-GGA
+            buf_shape = (4,blksize,nao)
+            cache = self.ao_cache(mol, grids, 1, blksize, max_memory)
+            def block(ip0, ip1, buf, nelec, excsum, vmat):
                 coords = grids.coords[ip0:ip1]
                 weight = grids.weights[ip0:ip1]
-                non0tab = self.non0tab[ip0//BLKSIZE:]
-                ao = self.eval_ao(mol, coords, deriv=1, non0tab=non0tab, out=buf)
+                non0tab = self.non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+                submol, idx, non0tab = _sparse_basis(mol, ao_loc, non0tab)
+                ao = _block_ao(self, cache, submol, coords, 1, non0tab, ip0, ip1, buf)
                 for idm in range(nset):
                     c_a, c_b = natorb[idm]
                     e_a, e_b = natocc[idm]
-                    rho_a = self.eval_rho2(mol, ao, c_a, e_a, non0tab, xctype)
-                    rho_b = self.eval_rho2(mol, ao, c_b, e_b, non0tab, xctype)
+                    rho_a = self.eval_rho2(submol, ao, _take_orb(c_a, idx), e_a,
+                                           non0tab, xctype)
+                    rho_b = self.eval_rho2(submol, ao, _take_orb(c_b, idx), e_b,
+                                           non0tab, xctype)
                     exc, vxc = self.eval_xc(x_id, c_id, (rho_a, rho_b),
                                             1, relativity, 1, verbose)[:2]
                     vrho, vsigma = vxc[:2]
+                    if xctype == 'MGGA':
+                        _check_vlapl(vxc[2])
+                        vtau = vxc[3]
                     den = rho_a[0]*weight
                     nelec[0,idm] += den.sum()
                     excsum[idm] += (den*exc).sum()
@@ -1241,21 +1688,28 @@ class _NumInt(object):
                     nelec[1,idm] += den.sum()
                     excsum[idm] += (den*exc).sum()
 
-                    wv = numpy.empty_like(rho_a)
+                    wv = numpy.empty((4,ip1-ip0))
                     wv[0]  = weight * vrho[:,0] * .5
-                    wv[1:] = rho_a[1:] * (weight * vsigma[:,0] * 2)  # sigma_uu
-                    wv[1:]+= rho_b[1:] * (weight * vsigma[:,1])      # sigma_ud
+                    wv[1:] = rho_a[1:4] * (weight * vsigma[:,0] * 2)  # sigma_uu
+                    wv[1:]+= rho_b[1:4] * (weight * vsigma[:,1])      # sigma_ud
                     aow = numpy.einsum('npi,np->pi', ao, wv)
-                    vmat[0,idm] += _dot_ao_ao(mol, ao[0], aow, nao, ip1-ip0, non0tab)
+                    v = _dot_ao_ao(submol, ao[0], aow, ao.shape[2], ip1-ip0, non0tab)
+                    if xctype == 'MGGA':
+                        v += _dot_ao_ao_tau(submol, ao, .25*weight*vtau[:,0],
+                                            ao.shape[2], ip1-ip0, non0tab)
+                    _add_mat(vmat[0,idm], idx, v)
                     wv[0]  = weight * vrho[:,1] * .5
-                    wv[1:] = rho_b[1:] * (weight * vsigma[:,2] * 2)  # sigma_dd
-                    wv[1:]+= rho_a[1:] * (weight * vsigma[:,1])      # sigma_ud
+                    wv[1:] = rho_b[1:4] * (weight * vsigma[:,2] * 2)  # sigma_dd
+                    wv[1:]+= rho_a[1:4] * (weight * vsigma[:,1])      # sigma_ud
                     aow = numpy.einsum('npi,np->pi', ao, wv)
-                    vmat[1,idm] += _dot_ao_ao(mol, ao[0], aow, nao, ip1-ip0, non0tab)
+                    v = _dot_ao_ao(submol, ao[0], aow, ao.shape[2], ip1-ip0, non0tab)
+                    if xctype == 'MGGA':
+                        v += _dot_ao_ao_tau(submol, ao, .25*weight*vtau[:,1],
+                                            ao.shape[2], ip1-ip0, non0tab)
+                    _add_mat(vmat[1,idm], idx, v)
                     rho_a = rho_b = exc = vxc = vrho = vsigma = wv = aow = None
-        else:
-            raise NotImplementedError('meta-GGA')
-
+        nelec, excsum, vmat = _run_blocks(self, block, ngrids, blksize,
+                                          buf_shape, acc_shapes, max_memory)
         for i in range(nset):
             vmat[0,i] = vmat[0,i] + vmat[0,i].T
             vmat[1,i] = vmat[1,i] + vmat[1,i].T
@@ -1299,7 +1753,6 @@ def _xc_type(x_id, c_id):
         xctype = 'LDA'
     elif pyscf.dft.vxc.is_meta_gga(x_id) or pyscf.dft.vxc.is_meta_gga(c_id):
         xctype = 'MGGA'
-        raise NotImplementedError('meta-GGA')
     else:
         xctype = 'GGA'
     return xctype
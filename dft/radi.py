@@ -152,7 +152,11 @@ def becke_atomic_radii_adjust(mol, atomic_radii):
     a = .25 * (rr.T - rr)
     a[a<-.5] = -.5
     a[a>0.5] = 0.5
-    return lambda i,j,g: g + a[i,j]*(1-g**2)
+    def fadjust(i, j, g):
+        return g + a[i,j]*(1-g**2)
+    # a[i,j] is used by the compiled Becke partition
+    fadjust.radii_table = a
+    return fadjust
 
 def treutler_atomic_radii_adjust(mol, atomic_radii):
     '''Treutler atomic radii adjust function: JCP, 102, 346'''
@@ -166,7 +170,11 @@ def treutler_atomic_radii_adjust(mol, atomic_radii):
     a = .25 * (rr.T - rr)
     a[a<-.5] = -.5
     a[a>0.5] = 0.5
-    return lambda i,j,g: g + a[i,j]*(1-g**2)
+    def fadjust(i, j, g):
+        return g + a[i,j]*(1-g**2)
+    # a[i,j] is used by the compiled Becke partition
+    fadjust.radii_table = a
+    return fadjust
 
 def _inter_distance(mol):
 # see gto.mole.energy_nuc
@@ -9,8 +9,12 @@ Non-relativistic Restricted Kohn-Sham
 
 import time
 import numpy
+import pyscf.lib
 from pyscf.lib import logger
 import pyscf.scf
+from pyscf.scf import _vhf
+from pyscf.scf import eri_cache
+from pyscf.gto.mole import PTR_RANGE_OMEGA
 from pyscf.dft import vxc
 from pyscf.dft import gen_grid
 from pyscf.dft import numint
@@ -59,11 +63,17 @@ def get_veff_(ks, mol, dm, dm_last=0, vhf_last=0, hermi=1):
     if ks._numint is None:
         n, ks._exc, vx = numint.nr_rks_vxc(mol, ks.grids, x_code, c_code, dm)
     else:
-        n, ks._exc, vx = ks._numint.nr_rks(mol, ks.grids, x_code, c_code, dm)
+        max_memory = ks.max_memory - pyscf.lib.current_memory()[0]
+        n, ks._exc, vx = ks._numint.nr_rks(mol, ks.grids, x_code, c_code, dm,
+                                           max_memory=max_memory)
     logger.debug(ks, 'nelec by numeric integration = %s', n)
     t0 = logger.timer(ks, 'vxc', *t0)
 
-    hyb = vxc.hybrid_coeff(x_code, spin=(mol.spin>0)+1)
+    omega, alpha, beta = vxc.rsh_coeff(x_code, spin=(mol.spin>0)+1)
+    if abs(omega) > 1e-10:
+        hyb = alpha + beta
+    else:
+        hyb = vxc.hybrid_coeff(x_code, spin=(mol.spin>0)+1)
 
     if abs(hyb) < 1e-10:
         vj = ks.get_j(mol, dm, hermi)
@@ -82,9 +92,16 @@ def get_veff_(ks, mol, dm, dm_last=0, vhf_last=0, hermi=1):
         ks._vj_last, ks._vk_last = vj, vk
 
     if abs(hyb) > 1e-10:
+        vk = vk * hyb
+    else:
+        vk = 0
+    if abs(omega) > 1e-10 and abs(beta) > 1e-10:
+        vk = vk - get_k_lr(ks, mol, dm, omega, hermi, vhf_last) * beta
+
+    if isinstance(vk, numpy.ndarray):
         if isinstance(dm, numpy.ndarray) and dm.ndim == 2:
-            ks._exc -= numpy.einsum('ij,ji', dm, vk) * .5 * hyb*.5
-        vhf = vj - vk * (hyb * .5)
+            ks._exc -= numpy.einsum('ij,ji', dm, vk) * .5 * .5
+        vhf = vj - vk * .5
     else:
         vhf = vj
 
@@ -93,6 +110,98 @@ def get_veff_(ks, mol, dm, dm_last=0, vhf_last=0, hermi=1):
     return vhf + vx
 
 
+def get_k_lr(ks, mol, dm, omega, hermi=1, vhf_last=0):
+    '''Exchange matrix of the long-range Coulomb operator
+    erf(omega r12)/r12 for the range-separated hybrid functionals.
+
+    The long-range integrals are held in ks._eri_lr when they fit in memory
+    in addition to the regular integrals ks._eri.  Otherwise they are
+    computed on the fly with the direct SCF optimizer ks._opt_lr whose
+    Schwarz conditions are evaluated with the long-range operator.  Only
+    the K matrix is built in the direct algorithm.  The long-range
+    integrals decay faster than the Coulomb integrals (they are bounded by
+    2 omega/sqrt(pi)), so the screening is tighter than the one of the full
+    Coulomb operator.
+
+    Args:
+        ks : an instance of :class:`RKS` or :class:`UKS`
+        dm : ndarray or list of ndarrays
+            A density matrix or a list of density matrices
+        omega : float
+            The range-separation parameter
+
+    Kwargs:
+        vhf_last : ndarray or 0
+            If given, the direct SCF method builds the long-range exchange
+            matrix from the density difference to the last call.
+
+    Returns:
+        K matrix of the long-range operator, in the same shape as dm
+    '''
+    omega0 = mol._env[PTR_RANGE_OMEGA]
+    mol.set_range_coulomb_(omega)
+    try:
+        if ks._eri_lr is not None and ks._eri_lr[0] == omega:
+            vk = pyscf.scf.hf.dot_eri_dm(ks._eri_lr[1], dm, hermi)[1]
+        elif mol.incore_anyway or _is_mem_enough_lr(ks):
+            ks._eri_lr = None
+            ks._eri_lr = (omega, eri_cache.get_eri(mol))
+            vk = pyscf.scf.hf.dot_eri_dm(ks._eri_lr[1], dm, hermi)[1]
+        else:
+            if ks.direct_scf and (ks._opt_lr is None or ks._opt_lr[0] != omega):
+                ks._opt_lr = (omega, ks.init_direct_scf(mol))
+                ks._dm_lr_last = None
+            if ks.direct_scf:
+                opt = ks._opt_lr[1]
+            else:
+                opt = None
+            if (ks.direct_scf and isinstance(vhf_last, numpy.ndarray) and
+                ks._dm_lr_last is not None):
+                ddm = numpy.asarray(dm) - numpy.asarray(ks._dm_lr_last)
+                vk = _get_k_direct(mol, ddm, hermi, opt)
+                vk += ks._vk_lr_last
+            else:
+                vk = _get_k_direct(mol, dm, hermi, opt)
+            ks._dm_lr_last = dm
+            ks._vk_lr_last = vk
+    finally:
+        mol.set_range_coulomb_(omega0)
+    return vk
+
+
+def _get_k_direct(mol, dm, hermi=1, vhfopt=None):
+    '''K matrix with the integral-direct algorithm, without building the
+    J matrix'''
+    dm = numpy.asarray(dm, order='C')
+    if hermi == 1:
+        descr = 'li->s2kj'
+    else:
+        descr = 'li->s1kj'
+    vk = _vhf.direct_mapdm('cint2e_sph', 's8', descr, dm, 1,
+                           mol._atm, mol._bas, mol._env, vhfopt,
+                           mol.max_memory)
+    vk = vk.reshape(dm.shape)
+    if hermi != 0:
+        if vk.ndim == 2:
+            vk = pyscf.lib.hermi_triu_(vk, hermi)
+        else:
+            vk = numpy.array([pyscf.lib.hermi_triu_(v, hermi) for v in vk])
+    return vk
+
+
+def _is_mem_enough_lr(ks):
+    '''Whether the long-range integrals fit in memory together with the
+    regular integrals of the hybrid exchange, which are (or will be) held in
+    ks._eri if ks._is_mem_enough().'''
+    nao = ks.mol.nao_nr()
+    size = nao**4/1e6
+    if ks._eri is None and ks._is_mem_enough():
+        size *= 2
+    size += pyscf.lib.current_memory()[0]
+    if ks._eri_lr is not None:  # to be replaced
+        size -= ks._eri_lr[1].nbytes/1e6
+    return size < ks.max_memory*.95
+
 def energy_elec(ks, dm, h1e):
     r'''Electronic part of RKS energy.
 
@@ -164,6 +273,9 @@ class RKS(pyscf.scf.hf.RHF):
         self._ecoul = 0
         self._exc = 0
         self._numint = numint._NumInt()
+        self._eri_lr = None
+        self._opt_lr = None
+        self._dm_lr_last = None
         self._keys = self._keys.union(['xc', 'grids'])
 
     def dump_flags(self):
@@ -193,6 +305,9 @@ class ROKS(pyscf.scf.rohf.ROHF):
         self._ecoul = 0
         self._exc = 0
         self._numint = numint._NumInt()
+        self._eri_lr = None
+        self._opt_lr = None
+        self._dm_lr_last = None
         self._keys = self._keys.union(['xc', 'grids'])
 
     def dump_flags(self):
@@ -36,6 +36,46 @@ class KnowValues(unittest.TestCase):
         coord, weight = grid.setup_grids()
         self.assertAlmostEqual(numpy.linalg.norm(weight), 1730.3692983091271, 9)
 
+    def test_becke_partition(self):
+        mol = gto.M(atom=[['C', (i*1.5, (i%2)*.8, 0)] for i in range(12)],
+                    basis='sto3g')
+        atom_grids_tab = gen_grid.gen_atomic_grids(mol, {'C': (20, 50)})
+        fadjust = radi.treutler_atomic_radii_adjust(mol, radi.BRAGG_RADII)
+        for scheme in (gen_grid.original_becke, gen_grid.stratmann):
+            coord0, weight0 = gen_grid.gen_partition(mol, atom_grids_tab,
+                                                     fadjust, scheme)
+            # python implementation
+            coord1, weight1 = gen_grid.gen_partition(mol, atom_grids_tab,
+                    lambda i,j,g: fadjust(i,j,g), lambda g: scheme(g))
+            self.assertTrue(numpy.allclose(coord0, coord1))
+            self.assertTrue(numpy.allclose(weight0, weight1, atol=1e-12))
+
+    def test_cutoff_and_sort(self):
+        grid = gen_grid.Grids(h2o)
+        grid.sort_grids = False
+        coord0, weight0 = grid.setup_grids()
+        grid.sort_grids = True
+        grid.cutoff = 1e-15
+        coord1, weight1 = grid.setup_grids()
+        idx = weight0 > 1e-15
+        self.assertEqual(len(weight1), idx.sum())
+        self.assertAlmostEqual(weight1.sum(), weight0.sum(), 9)
+        self.assertAlmostEqual(numpy.linalg.norm(coord1),
+                               numpy.linalg.norm(coord0[idx]), 9)
+
+        grid.dtype = numpy.float32
+        grid.columnar = True
+        coord2, weight2 = grid.setup_grids()
+        self.assertEqual(coord2.shape, coord1.shape)
+        self.assertTrue(coord2.T.flags.c_contiguous)
+        self.assertTrue(numpy.allclose(coord2, coord1, atol=1e-5))
+        mf = dft.RKS(h2o)
+        mf.grids = grid
+        e1 = mf.scf()
+        mf = dft.RKS(h2o)
+        e0 = mf.scf()
+        self.assertAlmostEqual(e1, e0, 5)
+
     def test_radi(self):
         grid = gen_grid.Grids(h2o)
         grid.prune_scheme = None
@@ -63,6 +103,25 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(numpy.linalg.norm(coord), 151.01253616288849, 9)
         self.assertAlmostEqual(numpy.linalg.norm(weight), 586.59843503169827, 9)
 
+    def test_atomic_grids_cache(self):
+        gen_grid.clear_atomic_grids_cache()
+        tab0 = gen_grid.gen_atomic_grids(h2o, radi_method=radi.treutler)
+        nang, natm_grids = gen_grid.atomic_grids_cache_info()[:2]
+        self.assertEqual(natm_grids, 2)
+        mol = gto.M(atom='C 0 0 0; H 0 0 1.1', basis='sto3g')
+        tab1 = gen_grid.gen_atomic_grids(mol, radi_method=radi.treutler)
+        self.assertEqual(gen_grid.atomic_grids_cache_info()[1], 3)
+        self.assertTrue(tab0['H'][0] is tab1['H'][0])
+        self.assertFalse(tab1['C'][1].flags.writeable)
+
+        gen_grid.clear_atomic_grids_cache()
+        tab2 = gen_grid.gen_atomic_grids(mol, radi_method=radi.treutler)
+        self.assertTrue(numpy.allclose(tab1['C'][0], tab2['C'][0]))
+        self.assertTrue(numpy.allclose(tab1['C'][1], tab2['C'][1]))
+        tab2 = gen_grid.gen_atomic_grids(mol, radi_method=radi.treutler,
+                                         prune_scheme=None)
+        self.assertTrue(len(tab2['C'][1]) > len(tab1['C'][1]))
+
 
 if __name__ == "__main__":
     print("Test Grids")
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import unittest
+import numpy
 from pyscf import gto
 from pyscf import lib
 from pyscf import dft
@@ -262,6 +263,47 @@ class KnowValues(unittest.TestCase):
         method.grids.atom_grid = {"H": (50, 194), "O": (50, 194),}
         self.assertAlmostEqual(method.scf(), -75.926526046608529, 9)
 
+    def test_k_lr(self):
+        numpy.random.seed(1)
+        nao = h2o.nao_nr()
+        dm = numpy.random.random((nao,nao))
+        dm = dm + dm.T
+        mf = dft.RKS(h2o)
+        vk = mf.get_k(h2o, dm)
+        vk1 = dft.rks.get_k_lr(mf, h2o, dm, 1e4)
+        self.assertTrue(numpy.allclose(vk, vk1, atol=1e-6))
+        self.assertEqual(h2o._env[gto.mole.PTR_RANGE_OMEGA], 0)
+        vk1 = dft.rks.get_k_lr(mf, h2o, dm, .33)
+        mf.max_memory = 0
+        mf.direct_scf = True
+        vk2 = dft.rks.get_k_lr(mf, h2o, dm, .33)
+        self.assertTrue(numpy.allclose(vk1, vk2))
+        self.assertTrue(abs(vk1).max() < abs(vk).max())
+
+        # memory for the regular ERIs but not for the long-range ERIs
+        mf = dft.RKS(h2o)
+        mf.max_memory = (lib.current_memory()[0] + nao**4/1e6*1.5) / .95
+        self.assertTrue(mf._is_mem_enough())
+        vk2 = dft.rks.get_k_lr(mf, h2o, dm, .33)
+        self.assertTrue(mf._eri_lr is None)
+        self.assertTrue(numpy.allclose(vk1, vk2))
+
+    def test_nr_rsh(self):
+        method = dft.RKS(h2o)
+        method.xc = 'cam_b3lyp'
+        method.grids.atom_grid = {"H": (50, 194), "O": (50, 194),}
+        e0 = method.scf()
+        method = dft.RKS(h2o)
+        method.xc = 'cam_b3lyp'
+        method.max_memory = 0
+        method.direct_scf = True
+        method.grids.atom_grid = {"H": (50, 194), "O": (50, 194),}
+        self.assertAlmostEqual(method.scf(), e0, 8)
+        method = dft.UKS(h2o)
+        method.xc = 'cam_b3lyp'
+        method.grids.atom_grid = {"H": (50, 194), "O": (50, 194),}
+        self.assertAlmostEqual(method.scf(), e0, 8)
+
 
 if __name__ == "__main__":
     print("Full Tests for H2O")
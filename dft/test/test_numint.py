@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import os
 import unittest
 import numpy
 from pyscf import gto
@@ -7,7 +8,13 @@ from pyscf import dft
 from pyscf import lib
 from pyscf.dft import gen_grid
 from pyscf.dft import radi
-dft.numint.BLKSIZE = 12
+
+def setUpModule():
+    global blksize_bak
+    blksize_bak, dft.numint.BLKSIZE = dft.numint.BLKSIZE, 12
+
+def tearDownModule():
+    dft.numint.BLKSIZE = blksize_bak
 
 mol = gto.Mole()
 mol.verbose = 0
@@ -22,7 +29,12 @@ nao = mol.nao_nr()
 
 class KnowValues(unittest.TestCase):
     def test_make_mask(self):
-        non0 = dft.numint.make_mask(mol, mf.grids.coords)
+        # reference values of the grids in the original (unsorted) order
+        grids = gen_grid.Grids(mol)
+        grids.atom_grid = {"H": (50, 110)}
+        grids.sort_grids = False
+        grids.setup_grids_()
+        non0 = dft.numint.make_mask(mol, grids.coords)
         self.assertEqual(non0.sum(), 181911)
         self.assertAlmostEqual(numpy.dot(non0.ravel(),
                                          numpy.cos(numpy.arange(non0.size))),
@@ -50,6 +62,215 @@ class KnowValues(unittest.TestCase):
                                      mf.grids.weights.size, non0tab)
         self.assertTrue(numpy.allclose(res0, res1))
 
+    def test_sparse_basis(self):
+        numpy.random.seed(1)
+        dm = numpy.random.random((nao,nao)) - .5
+        dm = dm + dm.T
+        ao_loc = numpy.asarray(mol.ao_loc_nr())
+        coords = mf.grids.coords[:96]
+        non0tab = dft.numint.make_mask(mol, coords)
+        submol, idx, non0 = dft.numint._sparse_basis(mol, ao_loc, non0tab)
+        self.assertTrue(len(idx) < nao)
+        ao0 = dft.numint.eval_ao(mol, coords)
+        ao1 = dft.numint.eval_ao(submol, coords)
+        self.assertTrue(numpy.allclose(ao0[:,idx], ao1))
+        self.assertTrue(abs(numpy.delete(ao0, idx, axis=1)).max() < 1e-10)
+
+    def test_nr_rks_sparse(self):
+        numpy.random.seed(1)
+        mo = numpy.random.random((nao,6))
+        dm = numpy.dot(mo, mo.T) * .1
+        # non0tab in nr_rks needs the BLKSIZE of eval_ao
+        dft.numint.BLKSIZE = 96
+        try:
+            self._check_nr_rks(dm)
+        finally:
+            dft.numint.BLKSIZE = 12
+
+    def test_eval_rho_mgga(self):
+        numpy.random.seed(1)
+        mo = numpy.random.random((nao,6))
+        mo_occ = numpy.array([2, 2, 1, 1, .5, -.2])
+        dm = numpy.dot(mo*mo_occ, mo.T)
+        coords = mf.grids.coords[:200]
+        ao = dft.numint.eval_ao(mol, coords, deriv=2)
+        rho1 = dft.numint.eval_rho(mol, ao, dm, xctype='MGGA')
+        rho2 = dft.numint.eval_rho2(mol, ao, mo, mo_occ, xctype='MGGA')
+        self.assertTrue(numpy.allclose(rho1, rho2))
+        tau = sum([numpy.einsum('pi,ij,pj->p', ao[i], dm, ao[i])
+                   for i in range(1, 4)]) * .5
+        self.assertTrue(numpy.allclose(rho1[5], tau))
+        # tau only from the first derivatives
+        rho3 = dft.numint.eval_rho(mol, ao[:4].copy(), dm, xctype='MGGA')
+        self.assertTrue(numpy.allclose(rho3[:4], rho1[:4]))
+        self.assertTrue(numpy.allclose(rho3[5], tau))
+
+        h = 1e-4
+        lapl = -6 * rho1[0]
+        for i in range(3):
+            dx = numpy.zeros(3)
+            dx[i] = h
+            for c in (coords+dx, coords-dx):
+                ao0 = dft.numint.eval_ao(mol, c)
+                lapl += dft.numint.eval_rho(mol, ao0, dm)
+        lapl /= h**2
+        self.assertTrue(numpy.allclose(rho1[4], lapl,
+                                       atol=1e-4*abs(lapl).max()))
+
+    def test_nr_uks_threads(self):
+        numpy.random.seed(1)
+        mo = numpy.random.random((nao,6))
+        dms = (numpy.dot(mo[:,:4], mo[:,:4].T) * .1,
+               numpy.dot(mo[:,4:], mo[:,4:].T) * .1)
+        x_id, c_id = dft.vxc.parse_xc_name('b88,p86')
+        dft.numint.BLKSIZE = 96
+        try:
+            ni = dft.numint._NumInt()
+            ni.nthreads = 1
+            n0, e0, v0 = ni.nr_uks(mol, mf.grids, x_id, c_id, dms,
+                                   max_memory=10)
+            ni.nthreads = 4
+            omp_threads = lib.num_threads()
+            n1, e1, v1 = ni.nr_uks(mol, mf.grids, x_id, c_id, dms,
+                                   max_memory=10)
+            self.assertEqual(lib.num_threads(), omp_threads)
+            self.assertTrue(numpy.allclose(n0, n1))
+            self.assertAlmostEqual(e0, e1, 9)
+            self.assertTrue(numpy.allclose(v0, v1))
+            n1, e1, v1 = dft.numint.nr_uks_vxc(ni, mol, mf.grids, x_id, c_id,
+                                               dms, max_memory=10)
+            self.assertAlmostEqual(e0, e1, 9)
+            self.assertTrue(numpy.allclose(v0, v1))
+        finally:
+            dft.numint.BLKSIZE = 12
+
+    def test_ao_cache(self):
+        numpy.random.seed(1)
+        mo = numpy.random.random((nao,6))
+        dm = numpy.dot(mo, mo.T) * .1
+        x_id, c_id = dft.vxc.parse_xc_name('b88,p86')
+        dft.numint.BLKSIZE = 96
+        try:
+            ni = dft.numint._NumInt()
+            self.assertFalse(ni.cache_ao)
+            n0, e0, v0 = ni.nr_rks(mol, mf.grids, x_id, c_id, dm)
+            self.assertTrue(ni._ao_cache is None)
+            ni.cache_ao = True
+            # the cache keeps its block size when max_memory changes
+            for max_memory in (2000, 2, 3000):
+                n1, e1, v1 = ni.nr_rks(mol, mf.grids, x_id, c_id, dm,
+                                       max_memory=max_memory)
+                self.assertAlmostEqual(e0, e1, 9)
+                self.assertTrue(numpy.allclose(v0, v1))
+                if max_memory == 2000:
+                    cache = ni._ao_cache
+                self.assertTrue(ni._ao_cache is cache)
+            self.assertTrue(ni._ao_cache.nbytes > 0)
+
+            ni.cache_ao = 'mmap'
+            for i in range(2):
+                n1, e1, v1 = ni.nr_rks(mol, mf.grids, x_id, c_id, dm,
+                                       max_memory=1)
+                self.assertAlmostEqual(e0, e1, 9)
+                self.assertTrue(numpy.allclose(v0, v1))
+            self.assertTrue(ni._ao_cache._offset > 0)
+            self.assertEqual(os.path.dirname(ni._ao_cache._file.name),
+                             os.path.abspath(lib.parameters.TMPDIR))
+        finally:
+            dft.numint.BLKSIZE = 12
+
+    def test_incremental_xc(self):
+        numpy.random.seed(1)
+        mo = numpy.random.random((nao,6))
+        x_id, c_id = dft.vxc.parse_xc_name('b88,p86')
+        dft.numint.BLKSIZE = 96
+        try:
+            ni0 = dft.numint._NumInt()
+            ni1 = dft.numint._NumInt()
+            ni1.incremental_xc = True
+            ni1.incremental_xc_tol = 0
+            ni2 = dft.numint._NumInt()
+            ni2.incremental_xc = True
+            ni2.incremental_xc_tol = 0
+            for i in range(3):
+                mo += numpy.random.random((nao,6)) * 10**(-i-2)
+                dm = numpy.dot(mo, mo.T) * .1
+                n0, e0, v0 = ni0.nr_rks(mol, mf.grids, x_id, c_id, dm)
+                n1, e1, v1 = ni1.nr_rks(mol, mf.grids, x_id, c_id, dm)
+                self.assertAlmostEqual(n0, n1, 9)
+                self.assertAlmostEqual(e0, e1, 9)
+                self.assertTrue(numpy.allclose(v0, v1))
+                dms = numpy.array((dm*.6, dm*.4))
+                n0, e0, v0 = ni0.nr_uks(mol, mf.grids, x_id, c_id, dms)
+                n1, e1, v1 = ni2.nr_uks(mol, mf.grids, x_id, c_id, dms)
+                self.assertAlmostEqual(e0, e1, 9)
+                self.assertTrue(numpy.allclose(v0, v1))
+            self.assertEqual(ni1._incr_xc.cycle, 3)
+            self.assertEqual(ni2._incr_xc.cycle, 3)
+            self.assertEqual(ni1._incr_xc.nskip, 0)
+        finally:
+            dft.numint.BLKSIZE = 12
+
+    def test_incremental_xc_skip(self):
+        numpy.random.seed(1)
+        mo = numpy.random.random((nao,6))
+        x_id, c_id = dft.vxc.parse_xc_name('b88,p86')
+        dft.numint.BLKSIZE = 96
+        try:
+            ni0 = dft.numint._NumInt()
+            ni1 = dft.numint._NumInt()
+            ni1.incremental_xc = True
+            ni1.incremental_xc_tol = 1e-8
+            ni2 = dft.numint._NumInt()
+            ni2.incremental_xc = True
+            ni2.incremental_xc_tol = 1e-8
+            # the density changes on the first two atoms only, the blocks far
+            # from them are skipped
+            nao1 = nao // 6
+            for i in range(3):
+                mo[:nao1] += numpy.random.random((nao1,6)) * 1e-3
+                dm = numpy.dot(mo, mo.T) * .1
+                n0, e0, v0 = ni0.nr_rks(mol, mf.grids, x_id, c_id, dm)
+                n1, e1, v1 = ni1.nr_rks(mol, mf.grids, x_id, c_id, dm)
+                self.assertAlmostEqual(n0, n1, 7)
+                self.assertAlmostEqual(e0, e1, 7)
+                self.assertTrue(abs(v1-v0).max() < 1e-6)
+                dms = numpy.array((dm*.6, dm*.4))
+                n0, e0, v0 = ni0.nr_uks(mol, mf.grids, x_id, c_id, dms)
+                n1, e1, v1 = ni2.nr_uks(mol, mf.grids, x_id, c_id, dms)
+                self.assertAlmostEqual(e0, e1, 7)
+                self.assertTrue(abs(v1-v0).max() < 1e-6)
+                if i > 0:
+                    nblk = len(ni1._incr_xc.excsum)
+                    self.assertTrue(0 < ni1._incr_xc.nskip < nblk)
+                    self.assertTrue(0 < ni2._incr_xc.nskip < nblk)
+        finally:
+            dft.numint.BLKSIZE = 12
+
+    def _check_nr_rks(self, dm):
+        for xc in ('lda,vwn', 'b88,p86', 'tpss,tpss'):
+            x_id, c_id = dft.vxc.parse_xc_name(xc)
+            xctype = dft.numint._xc_type(x_id, c_id)
+            deriv = 0 if xctype == 'LDA' else 1
+            ao = dft.numint.eval_ao(mol, mf.grids.coords, deriv=deriv)
+            rho = dft.numint.eval_rho(mol, ao, dm, xctype=xctype)
+            exc, vxc = dft.numint.eval_xc(x_id, c_id, rho, 0, 0, 1)[:2]
+            vmat0 = dft.numint.eval_mat(mol, ao, mf.grids.weights, rho,
+                                        vxc[0], vxc[1], xctype=xctype,
+                                        vtau=vxc[3])
+            if xctype == 'LDA':
+                den = rho * mf.grids.weights
+            else:
+                den = rho[0] * mf.grids.weights
+            ni = dft.numint._NumInt()
+            n, e, vmat1 = ni.nr_rks(mol, mf.grids, x_id, c_id, dm)
+            self.assertAlmostEqual(n, den.sum(), 9)
+            self.assertAlmostEqual(e, numpy.dot(den, exc), 9)
+            self.assertTrue(numpy.allclose(vmat0, vmat1))
+            n, e, vmat1 = dft.numint.nr_vxc(mol, mf.grids, x_id, c_id, dm)
+            self.assertAlmostEqual(e, numpy.dot(den, exc), 9)
+            self.assertTrue(numpy.allclose(vmat0, vmat1))
+
 if __name__ == "__main__":
     print("Test numint")
     unittest.main()
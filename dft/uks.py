@@ -9,11 +9,13 @@ Non-relativistic Unrestricted Kohn-Sham
 
 import time
 import numpy
+import pyscf.lib
 from pyscf.lib import logger
 import pyscf.scf
 from pyscf.dft import vxc
 from pyscf.dft import gen_grid
 from pyscf.dft import numint
+from pyscf.dft import rks
 
 
 def get_veff_(ks, mol, dm, dm_last=0, vhf_last=0, hermi=1):
@@ -28,11 +30,17 @@ def get_veff_(ks, mol, dm, dm_last=0, vhf_last=0, hermi=1):
         t0 = logger.timer(ks, 'seting up grids', *t0)
 
     x_code, c_code = vxc.parse_xc_name(ks.xc)
-    n, ks._exc, vx = ks._numint.nr_uks(mol, ks.grids, x_code, c_code, dm)
+    max_memory = ks.max_memory - pyscf.lib.current_memory()[0]
+    n, ks._exc, vx = ks._numint.nr_uks(mol, ks.grids, x_code, c_code, dm,
+                                       max_memory=max_memory)
     logger.debug(ks, 'nelec by numeric integration = %s', n)
     t0 = logger.timer(ks, 'vxc', *t0)
 
-    hyb = vxc.hybrid_coeff(x_code, spin=(mol.spin>0)+1)
+    omega, alpha, beta = vxc.rsh_coeff(x_code, spin=(mol.spin>0)+1)
+    if abs(omega) > 1e-10:
+        hyb = alpha + beta
+    else:
+        hyb = vxc.hybrid_coeff(x_code, spin=(mol.spin>0)+1)
 
     if abs(hyb) < 1e-10:
         vj = ks.get_j(mol, dm, hermi)
@@ -51,10 +59,17 @@ def get_veff_(ks, mol, dm, dm_last=0, vhf_last=0, hermi=1):
         ks._vj_last, ks._vk_last = vj, vk
 
     if abs(hyb) > 1e-10:
+        vk = vk * hyb
+    else:
+        vk = 0
+    if abs(omega) > 1e-10 and abs(beta) > 1e-10:
+        vk = vk - rks.get_k_lr(ks, mol, dm, omega, hermi, vhf_last) * beta
+
+    if isinstance(vk, numpy.ndarray):
         if nset == 1:
             ks._exc -=(numpy.einsum('ij,ji', dm[0], vk[0])
-                        +numpy.einsum('ij,ji', dm[1], vk[1])) * .5 * hyb
-        vhf = pyscf.scf.uhf._makevhf(vj, vk*hyb, nset)
+                        +numpy.einsum('ij,ji', dm[1], vk[1])) * .5
+        vhf = pyscf.scf.uhf._makevhf(vj, vk, nset)
     else:
         if nset == 1:
             vhf = vj[0] + vj[1]
@@ -85,6 +100,9 @@ class UKS(pyscf.scf.uhf.UHF):
         self._ecoul = 0
         self._exc = 0
         self._numint = numint._NumInt()
+        self._eri_lr = None
+        self._opt_lr = None
+        self._dm_lr_last = None
         self._keys = self._keys.union(['xc', 'grids'])
 
     def dump_flags(self):
@@ -9,6 +9,7 @@ XC functional, this is the interface to libxc
 
 import ctypes
 import re
+import numpy
 import pyscf.lib
 
 libdft = pyscf.lib.load_library('libdft')
@@ -232,17 +233,20 @@ XC_CODES = {
 'XC_HYB_GGA_XC_SB98_2B': 424,  # Schmider-Becke 98 parameterization 2b
 'XC_HYB_GGA_XC_SB98_2C': 425,  # Schmider-Becke 98 parameterization 2c
 'XC_HYB_GGA_X_SOGGA11_X': 426, # Hybrid based on SOGGA11 form
-#'XC_HYB_GGA_XC_HSE03':           427, # the 2003 version of the screened hybrid HSE
-#'XC_HYB_GGA_XC_HSE06':           428, # the 2006 version of the screened hybrid HSE
-#'XC_HYB_GGA_XC_HJS_PBE':         429, # HJS hybrid screened exchange PBE version
-#'XC_HYB_GGA_XC_HJS_PBE_SOL':     430, # HJS hybrid screened exchange PBE_SOL version
-#'XC_HYB_GGA_XC_HJS_B88':         431, # HJS hybrid screened exchange B88 version
-#'XC_HYB_GGA_XC_HJS_B97X':        432, # HJS hybrid screened exchange B97x version
-#'XC_HYB_GGA_XC_CAM_B3LYP':       433, # CAM version of B3LYP
-#'XC_HYB_GGA_XC_TUNED_CAM_B3LYP': 434, # CAM version of B3LYP tunes for excitations
-#'XC_HYB_GGA_XC_BHANDH':          435, # Becke half-and-half
-#'XC_HYB_GGA_XC_BHANDHLYP':       436, # Becke half-and-half with B88 exchange
-#'XC_HYB_GGA_XC_MB3LYP_RC04':     437, # B3LYP with RC04 LDA
+'XC_HYB_GGA_XC_HSE03':           427, # the 2003 version of the screened hybrid HSE
+'XC_HYB_GGA_XC_HSE06':           428, # the 2006 version of the screened hybrid HSE
+'XC_HYB_GGA_XC_HJS_PBE':         429, # HJS hybrid screened exchange PBE version
+'XC_HYB_GGA_XC_HJS_PBE_SOL':     430, # HJS hybrid screened exchange PBE_SOL version
+'XC_HYB_GGA_XC_HJS_B88':         431, # HJS hybrid screened exchange B88 version
+'XC_HYB_GGA_XC_HJS_B97X':        432, # HJS hybrid screened exchange B97x version
+'XC_HYB_GGA_XC_CAM_B3LYP':       433, # CAM version of B3LYP
+'XC_HYB_GGA_XC_TUNED_CAM_B3LYP': 434, # CAM version of B3LYP tunes for excitations
+'XC_HYB_GGA_XC_BHANDH':          435, # Becke half-and-half
+'XC_HYB_GGA_XC_BHANDHLYP':       436, # Becke half-and-half with B88 exchange
+'XC_HYB_GGA_XC_MB3LYP_RC04':     437, # B3LYP with RC04 LDA
+'XC_HYB_GGA_XC_WB97':            463, # Chai and Head-Gordon
+'XC_HYB_GGA_XC_WB97X':           464, # Chai and Head-Gordon
+'XC_HYB_GGA_XC_WB97X_D':         471, # Chai and Head-Gordon with dispersion correction
 'XC_MGGA_X_LTA':        201,   # Local tau approximation of Ernzerhof & Scuseria
 'XC_MGGA_X_TPSS':       202,   # Perdew, Tao, Staroverov & Scuseria exchange
 'XC_MGGA_X_M06L':       203,   # Zhao, Truhlar exchange
@@ -254,38 +258,38 @@ XC_CODES = {
 'XC_MGGA_X_RPP09':      209,   # Rasanen, Pittalis, and Proetto correction to Becke & Johnson
 'XC_MGGA_X_2D_PRHG07':  210,   # Pittalis, Rasanen, Helbig, Gross Exchange Functional
 'XC_MGGA_X_2D_PRHG07_PRP10': 211,# PRGH07 with PRP10 correction
-#'XC_MGGA_X_REVTPSS':    212, # revised Perdew, Tao, Staroverov & Scuseria exchange
-#'XC_MGGA_X_PKZB':       213, # Perdew, Kurth, Zupan, and Blaha
-#'XC_MGGA_X_M05':        214, # M05 functional of Minnesota
-#'XC_MGGA_X_M05_2X':     215, # M05-2X functional of Minnesota
-#'XC_MGGA_X_M06_HF':     216, # M06-HF functional of Minnesota
-#'XC_MGGA_X_M06':        217, # M06 functional of Minnesota
-#'XC_MGGA_X_M06_2X':     218, # M06-2X functional of Minnesota
-#'XC_MGGA_X_M08_HX':     219, # M08-HX functional of Minnesota
-#'XC_MGGA_X_M08_SO':     220, # M08-SO functional of Minnesota
+'XC_MGGA_X_REVTPSS':    212, # revised Perdew, Tao, Staroverov & Scuseria exchange
+'XC_MGGA_X_PKZB':       213, # Perdew, Kurth, Zupan, and Blaha
+'XC_MGGA_X_M05':        214, # M05 functional of Minnesota
+'XC_MGGA_X_M05_2X':     215, # M05-2X functional of Minnesota
+'XC_MGGA_X_M06_HF':     216, # M06-HF functional of Minnesota
+'XC_MGGA_X_M06':        217, # M06 functional of Minnesota
+'XC_MGGA_X_M06_2X':     218, # M06-2X functional of Minnesota
+'XC_MGGA_X_M08_HX':     219, # M08-HX functional of Minnesota
+'XC_MGGA_X_M08_SO':     220, # M08-SO functional of Minnesota
 'XC_MGGA_C_TPSS':       231, # Perdew, Tao, Staroverov & Scuseria correlation
 'XC_MGGA_C_VSXC':       232, # VSxc from Van Voorhis and Scuseria (correlation part)
-#'XC_MGGA_C_M06_L':      233, # M06-Local functional of Minnesota
-#'XC_MGGA_C_M06_HF':     234, # M06-HF functional of Minnesota
-#'XC_MGGA_C_M06':        235, # M06 functional of Minnesota
-#'XC_MGGA_C_M06_2X':     236, # M06-2X functional of Minnesota
-#'XC_MGGA_C_M05':        237, # M05 functional of Minnesota
-#'XC_MGGA_C_M05_2X':     238, # M05-2X functional of Minnesota
-#'XC_MGGA_C_PKZB':       239, # Perdew, Kurth, Zupan, and Blaha
-#'XC_MGGA_C_BC95':       240, # Becke correlation 95
-#'XC_HYB_MGGA_XC_M05':    438, # M05 functional of Minnesota
-#'XC_HYB_MGGA_XC_M05_2X': 439, # M05-2X functional of Minnesota
-#'XC_HYB_MGGA_XC_B88B95': 440, # Mixture of B88 with BC95 (B1B95)
-#'XC_HYB_MGGA_XC_B86B95': 441, # Mixture of B86 with BC95
-#'XC_HYB_MGGA_XC_PW86B95':442, # Mixture of PW86 with BC95
-#'XC_HYB_MGGA_XC_BB1K':   443, # Mixture of B88 with BC95 from Zhao and Truhlar
-#'XC_HYB_MGGA_XC_M06_HF': 444, # M06-HF functional of Minnesota
-#'XC_HYB_MGGA_XC_MPW1B95':445, # Mixture of mPW91 with BC95 from Zhao and Truhlar
-#'XC_HYB_MGGA_XC_MPWB1K': 446, # Mixture of mPW91 with BC95 for kinetics
-#'XC_HYB_MGGA_XC_X1B95':  447, # Mixture of X with BC95
-#'XC_HYB_MGGA_XC_XB1K':   448, # Mixture of X with BC95 for kinetics
-#'XC_HYB_MGGA_XC_M06':    449, # M06 functional of Minnesota
-#'XC_HYB_MGGA_XC_M06_2X': 450, # M06-2X functional of Minnesota
+'XC_MGGA_C_M06_L':      233, # M06-Local functional of Minnesota
+'XC_MGGA_C_M06_HF':     234, # M06-HF functional of Minnesota
+'XC_MGGA_C_M06':        235, # M06 functional of Minnesota
+'XC_MGGA_C_M06_2X':     236, # M06-2X functional of Minnesota
+'XC_MGGA_C_M05':        237, # M05 functional of Minnesota
+'XC_MGGA_C_M05_2X':     238, # M05-2X functional of Minnesota
+'XC_MGGA_C_PKZB':       239, # Perdew, Kurth, Zupan, and Blaha
+'XC_MGGA_C_BC95':       240, # Becke correlation 95
+'XC_HYB_MGGA_XC_M05':    438, # M05 functional of Minnesota
+'XC_HYB_MGGA_XC_M05_2X': 439, # M05-2X functional of Minnesota
+'XC_HYB_MGGA_XC_B88B95': 440, # Mixture of B88 with BC95 (B1B95)
+'XC_HYB_MGGA_XC_B86B95': 441, # Mixture of B86 with BC95
+'XC_HYB_MGGA_XC_PW86B95':442, # Mixture of PW86 with BC95
+'XC_HYB_MGGA_XC_BB1K':   443, # Mixture of B88 with BC95 from Zhao and Truhlar
+'XC_HYB_MGGA_XC_M06_HF': 444, # M06-HF functional of Minnesota
+'XC_HYB_MGGA_XC_MPW1B95':445, # Mixture of mPW91 with BC95 from Zhao and Truhlar
+'XC_HYB_MGGA_XC_MPWB1K': 446, # Mixture of mPW91 with BC95 for kinetics
+'XC_HYB_MGGA_XC_X1B95':  447, # Mixture of X with BC95
+'XC_HYB_MGGA_XC_XB1K':   448, # Mixture of X with BC95 for kinetics
+'XC_HYB_MGGA_XC_M06':    449, # M06 functional of Minnesota
+'XC_HYB_MGGA_XC_M06_2X': 450, # M06-2X functional of Minnesota
 }
 
 def is_lda(xc_code):
@@ -298,7 +302,7 @@ def is_hybrid_xc(xc_code):
         xc_code in (401, 402, 403, 404, 405, 406, 407, 408, 410, 411,
                     412, 413, 414, 415, 416, 417, 418, 419, 420, 421,
                     422, 423, 424, 425, 426, 427, 428, 429, 430, 431,
-                    432, 433, 434, 435, 436, 437,
+                    432, 433, 434, 435, 436, 437, 463, 464, 471,
                     438, 439, 440, 441, 442, 443, 444, 445, 446, 447,
                     448, 449, 450,)):
         return xc_code
@@ -307,10 +311,11 @@ def is_hybrid_xc(xc_code):
                      'MPW3PW' , 'B1LYP'  , 'B1PW91', 'mPW1PW'   , 'MPW1PW'    ,
                      'mPW3LYP', 'MPW3LYP', 'HSE03' , 'HSE06'    , 'CAM_B3LYP' ,
                      'TUNED_CAM_B3LYP'   , 'BHANDH', 'BHANDHLYP',
-                     'MB3LYP_RC04',):
+                     'MB3LYP_RC04', 'WB97' , 'WB97X', 'WB97X_D'  ,):
         return XC_CODES['XC_HYB_GGA_XC_'+xc_code]
     elif xc_code in ('B88B95', 'B86B95', 'PW86B95', 'BB1K', 'MPW1B95',
-                     'MPWB1K', 'X1B95' , 'XB1K'):
+                     'MPWB1K', 'X1B95' , 'XB1K'  , 'M05' , 'M05_2X' ,
+                     'M06_HF', 'M06'   , 'M06_2X'):
         return XC_CODES['XC_HYB_MGGA_XC_'+xc_code]
     else:
         return None
@@ -428,4 +433,20 @@ def hybrid_coeff(xc_code, spin=1):
     else:
         return 0
 
+def rsh_coeff(xc_code, spin=1):
+    '''Range-separation parameters (omega, alpha, beta) of the exact
+    exchange.  The exact exchange of the functional is
+
+        alpha * K + beta * K_SR = (alpha+beta) * K - beta * K_LR
+
+    where K_SR and K_LR are the exchange of the short range operator
+    erfc(omega r12)/r12 and the long range operator erf(omega r12)/r12.
+    omega = 0 for the functionals without range separation.
+    '''
+    rsh = numpy.zeros(3)
+    if is_hybrid_xc(xc_code):
+        libdft.VXCrsh_coeff(ctypes.c_int(xc_code), ctypes.c_int(spin),
+                            rsh.ctypes.data_as(ctypes.c_void_p))
+    return rsh[0], rsh[1], rsh[2]
+
 
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import numpy
+from pyscf import gto, scf, ao2mo, mp
+
+'''
+Generate the MO integrals in slabs (ij-block, all kl) on the fly.  No
+temporary file is used.  The slabs can be consumed immediately, eg to
+compute the MP2 energy on the nodes without scratch disk.
+'''
+
+mol = gto.Mole()
+mol.build(
+    atom = 'H 0 0 0; F 0 0 1.1',  # in Angstrom
+    basis = 'ccpvdz',
+)
+
+myhf = scf.RHF(mol)
+myhf.kernel()
+
+nocc = mol.nelectron // 2
+co = myhf.mo_coeff[:,:nocc]
+cv = myhf.mo_coeff[:,nocc:]
+nvir = cv.shape[1]
+eia = myhf.mo_energy[:nocc,None] - myhf.mo_energy[nocc:]
+
+# The rows of (ia|jb) are generated in blocks of i.  max_memory (in MB) bounds
+# the AO integrals, the half-transformed integrals and the slab.
+emp2 = 0
+for ij0, ij1, ovov in ao2mo.outcore.general_iter(mol, (co,cv,co,cv),
+                                                 max_memory=1):
+    print('slab (ia|jb) of ia = [%d:%d]' % (ij0, ij1))
+    for i in range(ij0//nvir, ij1//nvir):
+        gi = ovov[i*nvir-ij0:(i+1)*nvir-ij0].reshape(nvir,nocc,nvir)
+        t2i = gi / (eia[i][:,None,None] + eia[None,:,:])
+        emp2 += numpy.einsum('ajb,ajb', t2i, gi*2 - gi.transpose(2,1,0))
+print('E(MP2) = %.12g' % emp2)
+
+# The same in the MP2 module
+pt = mp.MP2(myhf)
+pt.iofree = True
+print('E(MP2) = %.12g' % pt.kernel()[0])
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+import os
+import time
+import numpy
+from pyscf import lib
+from pyscf import gto, scf
+from pyscf.dft import gen_grid
+from pyscf.scf import _vhf
+from pyscf.scf import cosxhf
+
+'''
+Cost and error of the seminumerical (COSX) exchange matrix against the
+analytical direct K build (without J) for the converged HF density matrix.
+The exchange energy error is -1/4 tr((K_cosx - K) D).
+'''
+
+log = lib.logger.Logger(verbose=5)
+with open('/proc/cpuinfo') as f:
+    for line in f:
+        if 'model name' in line:
+            log.note(line[:-1])
+            break
+with open('/proc/meminfo') as f:
+    log.note(f.readline()[:-1])
+log.note('OMP_NUM_THREADS=%s\n', os.environ.get('OMP_NUM_THREADS', None))
+
+mol = gto.M(atom=open(os.path.join(os.path.dirname(__file__), '..', 'scf',
+                                   'glycine.xyz')).read(),
+            basis='6-31g*', verbose=0)
+log.note('nao = %d', mol.nao_nr())
+
+mf = scf.RHF(mol)
+mf.kernel()
+dm = mf.make_rdm1()
+opt = mf.init_direct_scf(mol)
+
+t0 = time.time()
+vk0 = _vhf.direct_mapdm('cint2e_sph', 's8', 'li->s1kj', dm, 1,
+                        mol._atm, mol._bas, mol._env, opt)
+vk0 = lib.hermi_triu_(vk0, 1)
+t_direct = time.time() - t0
+log.note('direct K                       %8.2f s', t_direct)
+
+for level in (2, 3, 4):
+    grids = gen_grid.Grids(mol)
+    grids.level = level
+    grids.build_()
+    for cutoff in (0, cosxhf.CUTOFF):
+        t0 = time.time()
+        vk1 = cosxhf.get_k(mol, dm, grids, cutoff=cutoff)
+        t1 = time.time() - t0
+        ex_err = -.25 * numpy.einsum('ij,ji', vk1-vk0, dm)
+        log.note('COSX level %d cutoff %-6g %8.2f s  (x%.2f)  Ex error %.2e  '
+                 'max |dK| %.2e', level, cutoff, t1, t_direct/t1, ex_err,
+                 abs(vk1-vk0).max())
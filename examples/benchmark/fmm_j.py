@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+import time
+import numpy
+from pyscf import lib
+from pyscf import gto, scf
+from pyscf.scf import _vhf
+
+'''
+Cost of the Coulomb matrix of linear alkanes, integral-direct J (without K)
+vs the multipole accelerated J matrix (scf.fmm).
+'''
+
+def alkane(n):
+    '''Geometry of linear alkane CnH(2n+2) in zigzag conformation'''
+    atoms = []
+    for i in range(n):
+        x = i * 1.26
+        z = .44 * (i % 2)
+        sign = 1 - 2 * (i % 2)
+        atoms.append(['C', (x, 0., z)])
+        atoms.append(['H', (x, .89, z+sign*.63)])
+        atoms.append(['H', (x,-.89, z+sign*.63)])
+    atoms.append(['H', (-1.03, 0., -.36)])
+    x = n * 1.26 - .23
+    atoms.append(['H', (x, 0., .44*(n%2)+(1-2*(n%2))*.99)])
+    return atoms
+
+for n in (10, 20, 40, 80):
+    mol = gto.M(atom=alkane(n), basis='6-31g', verbose=0)
+    mf = scf.RHF(mol)
+    dm = mf.get_init_guess()
+    opt = mf.init_direct_scf(mol)
+
+    t0 = time.time()
+    vj0 = _vhf.direct_mapdm('cint2e_sph', 's8', 'ji->s2kl', dm, 1,
+                            mol._atm, mol._bas, mol._env, opt)
+    vj0 = lib.hermi_triu_(vj0, 1)
+    t1 = time.time()
+    mf = scf.fmm(scf.RHF(mol))
+    mf.get_j(mol, dm)  # build the tree
+    t2 = time.time()
+    vj1 = mf.get_j(mol, dm)
+    t3 = time.time()
+    print('C%dH%d nao = %d  direct %.2f s  fmm %.2f s (tree %.2f s)  err %.2e'
+          % (n, 2*n+2, mol.nao_nr(), t1-t0, t3-t2, t2-t1-(t3-t2),
+             abs(vj1-vj0).max()))
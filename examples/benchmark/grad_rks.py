@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+import os
+import time
+import numpy
+from pyscf import lib
+from pyscf import gto, dft, grad
+
+'''
+DFT nuclear gradients with and without the response of the grids, compared
+to the finite difference of the energy, and the cost of each gradient call.
+
+With grid_response = True, the XC gradients include the derivatives of the
+Becke weights and the displacement of the grids with the atoms.  The
+gradients are translationally invariant and agree with the finite
+difference on coarse grids.
+'''
+
+log = lib.logger.Logger(verbose=5)
+with open('/proc/cpuinfo') as f:
+    for line in f:
+        if 'model name' in line:
+            log.note(line[:-1])
+            break
+log.note('OMP_NUM_THREADS=%s\n', os.environ.get('OMP_NUM_THREADS', None))
+
+atoms = [['O' , (0. , 0.     , 0.)],
+         ['H' , (0. , -0.757 , 0.587)],
+         ['H' , (0. , 0.757  , 0.587)]]
+def energy(atoms, level):
+    mol = gto.M(atom=atoms, basis='6-31g*', verbose=0)
+    mf = dft.RKS(mol)
+    mf.xc = 'b3lyp'
+    mf.conv_tol = 1e-12
+    mf.grids.level = level
+    mf.scf()
+    return mf
+
+h = 1e-4
+for level in (0, 1, 3):
+    mf = energy(atoms, level)
+    fd = numpy.zeros((len(atoms),3))
+    for ia in range(len(atoms)):
+        for x in range(3):
+            a1 = [[a[0], list(a[1])] for a in atoms]
+            a2 = [[a[0], list(a[1])] for a in atoms]
+            a1[ia][1][x] += h
+            a2[ia][1][x] -= h
+            fd[ia,x] = (energy(a1, level).e_tot - energy(a2, level).e_tot) / (2*h)
+    fd *= lib.parameters.BOHR
+
+    for grid_response in (False, True):
+        g = grad.rks.RKS(mf)
+        g.verbose = 0
+        g.grid_response = grid_response
+        t0 = time.time()
+        de = g.grad()
+        t1 = time.time()
+        log.note('level %d  grid_response = %s  |de-fd| = %.3g  '
+                 '|sum(de)| = %.3g  %.2f s per gradient call',
+                 level, grid_response, abs(de-fd).max(),
+                 abs(de.sum(axis=0)).max(), t1-t0)
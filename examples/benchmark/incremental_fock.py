@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+import os
+import time
+import numpy
+from pyscf import lib
+from pyscf import gto, scf
+
+'''
+Cost of each SCF cycle for direct SCF with the incremental Fock build.
+
+rebuild_nsteps = 1 builds J and K with the full density matrix in every cycle.
+With the default settings, J and K are built with the density difference and
+the density based screening becomes more and more effective when the SCF
+approaches convergence.
+'''
+
+def alkane(n):
+    '''Geometry of linear alkane CnH(2n+2) in zigzag conformation'''
+    atoms = []
+    for i in range(n):
+        x = i * 1.26
+        z = .44 * (i % 2)
+        sign = 1 - 2 * (i % 2)
+        atoms.append(['C', (x, 0., z)])
+        atoms.append(['H', (x, .89, z+sign*.63)])
+        atoms.append(['H', (x,-.89, z+sign*.63)])
+    atoms.append(['H', (-1.03, 0., -.36)])
+    x = n * 1.26 - .23
+    atoms.append(['H', (x, 0., .44*(n%2)+(1-2*(n%2))*.99)])
+    return atoms
+
+log = lib.logger.Logger(verbose=5)
+with open('/proc/cpuinfo') as f:
+    for line in f:
+        if 'model name' in line:
+            log.note(line[:-1])
+            break
+with open('/proc/meminfo') as f:
+    log.note(f.readline()[:-1])
+log.note('OMP_NUM_THREADS=%s\n', os.environ.get('OMP_NUM_THREADS', None))
+
+mol = gto.M(atom=alkane(42), basis='cc-pvdz', verbose=0)
+log.note('nao = %d', mol.nao_nr())
+
+for rebuild_nsteps in (1, 8):
+    mf = scf.RHF(mol)
+    mf.max_memory = 0  # force direct SCF
+    mf.rebuild_nsteps = rebuild_nsteps
+    cycle_time = []
+    def timing(envs):
+        cycle_time.append(time.time())
+    mf.callback = timing
+    t0 = time.time()
+    e = mf.kernel()
+    cycle_time = numpy.diff([t0] + cycle_time)
+    log.note('rebuild_nsteps = %d  E = %.12g  cycles = %d  total time = %.2f s',
+             rebuild_nsteps, e, len(cycle_time), cycle_time.sum())
+    for i, t in enumerate(cycle_time):
+        log.note('    cycle %d  %.2f s  (%.2f of the first cycle)',
+                 i+1, t, t/cycle_time[0])
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+import os
+import time
+import numpy
+from pyscf import lib
+from pyscf import gto, scf
+from pyscf.scf import _vhf
+
+'''
+Cost of the direct J/K build for many density matrices (as in CPHF, NMR or
+state-averaged CASSCF).  For more than two density matrices, _vhf.direct
+evaluates each integral once and updates all J/K matrices in one pass.  The
+reference timings call _vhf.direct for each density matrix separately (for
+more than 8 densities, extrapolated from the first 8).
+'''
+
+log = lib.logger.Logger(verbose=5)
+with open('/proc/cpuinfo') as f:
+    for line in f:
+        if 'model name' in line:
+            log.note(line[:-1])
+            break
+with open('/proc/meminfo') as f:
+    log.note(f.readline()[:-1])
+log.note('OMP_NUM_THREADS=%s\n', os.environ.get('OMP_NUM_THREADS', None))
+
+mol = gto.M(atom=open(os.path.join(os.path.dirname(__file__), '..', 'scf',
+                                   'glycine.xyz')).read(),
+            basis='6-31g*', verbose=0)
+nao = mol.nao_nr()
+log.note('nao = %d', nao)
+
+mf = scf.RHF(mol)
+opt = mf.init_direct_scf(mol)
+numpy.random.seed(1)
+for n_dm in (1, 8, 32, 128):
+    dms = numpy.random.random((n_dm,nao,nao)) * .1
+    dms = dms + dms.transpose(0,2,1)
+    t0 = time.time()
+    vj, vk = _vhf.direct(dms, mol._atm, mol._bas, mol._env, opt, hermi=1)
+    t1 = time.time()
+    for dm in dms[:min(n_dm,8)]:
+        _vhf.direct(dm, mol._atm, mol._bas, mol._env, opt, hermi=1)
+    t2 = time.time()
+    t_ref = (t2 - t1) / min(n_dm,8) * n_dm
+    log.note('n_dm = %3d  batched %8.2f s  one-by-one (estimated) %8.2f s  (%.2f s per dm)',
+             n_dm, t1-t0, t_ref, (t1-t0)/n_dm)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+import os
+import time
+import numpy
+from pyscf import lib
+from pyscf import gto, dft
+
+'''
+Scaling of the XC matrix (nr_rks) with the number of threads which
+integrate the grid blocks (_NumInt.nthreads).  The OpenMP kernels and BLAS
+run with one thread in each thread.  nthreads = 1 is the single threaded
+loop over the grid blocks in which the OpenMP kernels use OMP_NUM_THREADS.
+The AO cache is switched off so that the AO values are evaluated in every
+call.
+'''
+
+log = lib.logger.Logger(verbose=5)
+with open('/proc/cpuinfo') as f:
+    for line in f:
+        if 'model name' in line:
+            log.note(line[:-1])
+            break
+with open('/proc/meminfo') as f:
+    log.note(f.readline()[:-1])
+log.note('OMP_NUM_THREADS=%s\n', os.environ.get('OMP_NUM_THREADS', None))
+
+mol = gto.M(atom=open(os.path.join(os.path.dirname(__file__), '..', 'scf',
+                                   'glycine.xyz')).read(),
+            basis='6-31g*', verbose=0)
+mf = dft.RKS(mol)
+mf.grids.build_()
+dm = mf.get_init_guess()
+x_id, c_id = dft.vxc.parse_xc_name('b88,p86')
+log.note('nao = %d  ngrids = %d', mol.nao_nr(), mf.grids.weights.size)
+
+ni = dft.numint._NumInt()
+ni.cache_ao = False
+nthreads = lib.num_threads()
+t_ref = None
+for n in sorted(set([1, 2, 4, 8, 16, nthreads])):
+    if n > nthreads:
+        break
+    ni.nthreads = n
+    t0 = time.time()
+    nelec, exc, vxc = ni.nr_rks(mol, mf.grids, x_id, c_id, dm)
+    t1 = time.time() - t0
+    if t_ref is None:
+        t_ref = t1
+        vxc_ref = vxc
+    log.note('nthreads %3d  %8.2f s  speedup %5.2f  max |dV| %.2e',
+             n, t1, t_ref/t1, abs(vxc-vxc_ref).max())
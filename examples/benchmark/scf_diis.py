@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+import os
+from pyscf import lib
+from pyscf import gto, scf, dft
+
+'''
+Number of SCF cycles of DIIS, EDIIS+DIIS and ADIIS+DIIS for a fixed set of
+hard cases (transition metal compounds and stretched bonds).
+'''
+
+def n2_stretched():
+    mol = gto.M(atom='N 0 0 0; N 0 0 2.2', basis='cc-pvdz', verbose=0)
+    return scf.RHF(mol)
+
+def h2o_stretched():
+    mol = gto.M(atom='O 0 0 0; H 0 -1.5 1.2; H 0 1.5 1.2', basis='6-31g*',
+                spin=2, verbose=0)
+    return scf.UHF(mol)
+
+def cr2():
+    mol = gto.M(atom='Cr 0 0 0; Cr 0 0 1.68', basis='def2-svp', verbose=0)
+    return scf.RHF(mol)
+
+def cr2_b3lyp():
+    mol = gto.M(atom='Cr 0 0 0; Cr 0 0 1.68', basis='def2-svp', verbose=0)
+    mf = dft.RKS(mol)
+    mf.xc = 'b3lyp'
+    return mf
+
+def feo_quintet():
+    mol = gto.M(atom='Fe 0 0 0; O 0 0 1.62', basis='def2-svp', spin=4,
+                verbose=0)
+    return scf.UHF(mol)
+
+def cucl2():
+    mol = gto.M(atom='Cu 0 0 0; Cl 0 0 2.05; Cl 0 0 -2.05', basis='def2-svp',
+                spin=1, verbose=0)
+    return scf.UHF(mol)
+
+log = lib.logger.Logger(verbose=5)
+log.note('OMP_NUM_THREADS=%s\n', os.environ.get('OMP_NUM_THREADS', None))
+log.note('%-16s %-8s %8s %10s %20s', 'case', 'DIIS', 'cycles', 'converged', 'E')
+for case in (n2_stretched, h2o_stretched, cr2, cr2_b3lyp, feo_quintet, cucl2):
+    for diis_class in (scf.diis.DIIS, scf.diis.EDIIS, scf.diis.ADIIS):
+        mf = case()
+        mf.max_cycle = 150
+        mf.DIIS = diis_class
+        cycles = []
+        mf.callback = lambda envs: cycles.append(envs['cycle'])
+        e = mf.kernel()
+        log.note('%-16s %-8s %8d %10s %20.12f', case.__name__,
+                 diis_class.__name__, len(cycles), mf.converged, e)
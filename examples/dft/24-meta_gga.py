@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+from pyscf import gto, dft
+
+'''
+meta-GGA functionals.  The kinetic energy density tau is evaluated with the
+AO gradients on the grids.  The functionals which depend on the Laplacian of
+density are not supported in the SCF.
+
+M05/M06 need libxc 2.x or newer.  SCAN is not available in the bundled
+libxc 2.2.0.
+'''
+
+mol = gto.M(atom='O 0 0 0; H 0 -.757 .587; H 0 .757 .587', basis='631g*')
+
+mf = dft.RKS(mol)
+mf.xc = 'tpss,tpss'
+mf.kernel()
+
+mf = dft.UKS(mol)
+mf.xc = 'm06'
+mf.kernel()
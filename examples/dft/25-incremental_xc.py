@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+from pyscf import gto, dft
+
+'''
+Incremental XC matrix.  In each SCF iteration, the density on the grids is
+updated with the density of dm - dm_last.  The grid blocks on which the
+change of density is smaller than incremental_xc_tol are skipped.  The XC
+matrix is rebuilt from scratch every incremental_xc_rebuild iterations.
+'''
+
+mol = gto.M(atom=open('glycine.xyz').read(), basis='6-31g*')
+
+mf = dft.RKS(mol)
+mf.xc = 'b3lyp'
+mf._numint.incremental_xc = True
+mf._numint.incremental_xc_tol = 1e-10
+mf._numint.incremental_xc_rebuild = 8
+mf.kernel()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+from pyscf import gto, scf, dft
+
+'''
+Range-separated hybrid functionals.  The exact exchange of CAM-B3LYP,
+wB97X, HSE06 etc. is split into the full-range exchange and the exchange of
+the long-range operator erf(omega r12)/r12.  The range-separation parameters
+(omega, alpha, beta) are read from libxc (dft.vxc.rsh_coeff).
+'''
+
+mol = gto.M(atom=open('glycine.xyz').read(), basis='6-31g*')
+
+mf = dft.RKS(mol)
+mf.xc = 'cam_b3lyp'
+mf.kernel()
+
+mf = dft.RKS(mol)
+mf.xc = 'wb97x'
+mf.kernel()
+
+#
+# The long-range exchange matrix for a given density matrix
+#
+dm = mf.make_rdm1()
+vk_lr = dft.rks.get_k_lr(mf, mol, dm, omega=.3)
+
+#
+# 2e integrals of the long-range operator
+#
+mol.set_range_coulomb_(.3)
+eri_lr = scf._vhf.int2e_sph(mol._atm, mol._bas, mol._env)
+mol.set_range_coulomb_(0)
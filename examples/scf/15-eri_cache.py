@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import tempfile
+from pyscf import gto, scf, dft, mp
+
+'''
+Reuse the 2-electron integrals of the same molecule across methods.
+
+When the ERI cache is enabled, the AO integrals are saved in the cache
+directory and shared by all methods (and all Python processes) which run on
+the same molecule (same geometry and basis).  max_size (in MB) limits the
+disk space of the cache.  The least recently used integrals are removed when
+the limit is reached.
+'''
+
+scf.eri_cache.enable(tempfile.gettempdir()+'/pyscf_eri_cache', max_size=2000)
+
+mol = gto.M(atom='O 0 0 0; H 0 -0.757 0.587; H 0 0.757 0.587',
+            basis='ccpvdz')
+
+# The integrals are computed and saved in the cache
+mf = scf.RHF(mol)
+mf.kernel()
+
+# MP2 reuses the integrals of mf._eri
+mp.MP2(mf).kernel()
+
+# The integrals are read from the cache
+mf = dft.RKS(mol)
+mf.xc = 'b3lyp'
+mf.kernel()
+
+# Spin does not change the integrals
+mol.spin = 2
+mol.build(False, False)
+scf.UHF(mol).kernel()
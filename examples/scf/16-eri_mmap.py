@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+from pyscf import gto, scf, ao2mo
+
+'''
+Keep the 2-electron integrals in a memory-mapped file.
+
+When the AO integrals do not fit in max_memory, SCF falls back to direct SCF
+by default.  With eri_mmap = True, the integrals are stored in a
+memory-mapped file under TMPDIR (or in the ERI cache if it is enabled) and
+the incore J/K algorithm streams over the file.  The OS page cache keeps as
+many integrals in memory as the system allows.  This is much cheaper than
+direct SCF if the integrals are only slightly bigger than max_memory.
+'''
+
+mol = gto.M(atom=open('glycine.xyz').read(), basis='6-31g*')
+
+mf = scf.RHF(mol)
+mf.max_memory = 500
+mf.eri_mmap = True
+mf.kernel()
+
+# ao2mo.incore functions accept the memory-mapped integrals
+eri_mo = ao2mo.incore.full(mf._eri, mf.mo_coeff[:,:20])
+print(eri_mo.shape)
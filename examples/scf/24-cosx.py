@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+from pyscf import gto
+from pyscf import scf
+from pyscf import dft
+
+'''
+Seminumerical exchange (COSX) by decorating the scf object with scf.cosx
+function.
+
+The exchange matrix is evaluated with one electron on the DFT mesh grids and
+the other electron analytically.  The Coulomb matrix is computed with the
+regular integral-direct algorithm.  The grids for the exchange integrals can
+be given as the second argument of scf.cosx.
+'''
+
+mol = gto.Mole()
+mol.build(
+    verbose = 0,
+    atom = '''8  0  0.     0
+              1  0  -0.757 0.587
+              1  0  0.757  0.587''',
+    basis = 'ccpvdz',
+)
+
+mf = scf.cosx(scf.RHF(mol))
+energy = mf.kernel()
+print('E = %.12f, ref = -76.026765673120' % energy)
+
+grids = dft.gen_grid.Grids(mol)
+grids.level = 3
+mf = scf.cosx(dft.RKS(mol), grids)
+mf.xc = 'b3lyp'
+energy = mf.kernel()
+print('E = %.12f' % energy)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+from pyscf import gto
+from pyscf import scf
+from pyscf import dft
+
+'''
+Multipole accelerated Coulomb matrix by decorating the scf object with scf.fmm
+function.
+
+The shell pairs are grouped in an octree.  The Coulomb interactions between
+the well separated boxes are computed with the Cartesian multipole expansion
+(up to the order given by the second argument of scf.fmm).  The rest is
+computed with the regular integral-direct algorithm.  The savings are notable
+for large and spatially extended molecules.
+'''
+
+mol = gto.Mole()
+mol.build(
+    verbose = 4,
+    atom = [['C', (i*2.5, 0., 0.)] for i in range(40)],
+    basis = '6-31g',
+)
+
+mf = scf.fmm(dft.RKS(mol))
+mf.xc = 'lda,vwn'
+energy = mf.kernel()
+
+# Smaller theta means more interactions are computed exactly
+mf = scf.fmm(dft.RKS(mol), theta=.3, order=12)
+mf.xc = 'lda,vwn'
+energy = mf.kernel()
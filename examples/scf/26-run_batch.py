@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import numpy
+from pyscf import gto
+from pyscf import scf
+
+'''
+SCF calculations of many small molecules in a pool of processes.
+
+The molecules can be given as Mole objects or the dicts of the keyword
+arguments of gto.M.  Basis sets are parsed once and shared by all molecules.
+Each process runs one molecule at a time with one OpenMP thread (see the
+argument nthreads).  The results are yielded in the order of completion.
+'''
+
+mols = [dict(atom='O 0 0 0; H 0 -.757 .587; H 0 .757 %g' % z, basis='631g')
+        for z in numpy.arange(.3, 1.5, .05)]
+
+for i, res in scf.run_batch(mols, 'RKS', xc='b3lyp', nproc=4):
+    print('mol %d E = %.12f  %.2f s' % (i, res['e_tot'], res['wall_time']))
+
+# SCF method can be given by a function
+def method(mol):
+    mf = scf.RHF(mol)
+    mf.conv_tol = 1e-8
+    return scf.density_fit(mf)
+results = dict(scf.run_batch(mols, method, verbose=0))
+e_tot = [results[i]['e_tot'] for i in range(len(mols))]
+print(e_tot)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+from pyscf import gto, scf, mp, mcscf, df
+
+'''
+Share the density fitting integrals in the DF-HF -> DF-MP2 -> DF-CASSCF chain.
+
+The DF object (mf.with_df) holds the Cholesky decomposed 3-center integrals.
+DF-MP2 and DF-CASSCF reuse the DF object of the mean-field if the auxiliary
+basis is the same, so the 3-center integrals are computed only once.
+'''
+
+mol = gto.M(atom='N 0 0 0; N 0 0 1.1', basis='ccpvdz', verbose=4)
+
+mf = scf.density_fit(scf.RHF(mol))
+mf.kernel()
+
+pt = mp.dfmp2.MP2(mf)
+pt.kernel()
+print('DF-MP2 uses the DF object of DF-HF: %s' % (pt.with_df is mf.with_df))
+
+mc = mcscf.density_fit(mcscf.CASSCF(mf, 6, 6))
+mc.kernel()
+print('DF-CASSCF uses the DF object of DF-HF: %s' % (mc.with_df is mf.with_df))
+
+# The DF object can be created and passed to another mean-field
+with_df = df.DF(mol, auxbasis='cc-pvdz-fit')
+mf1 = scf.density_fit(scf.UHF(mol), with_df=with_df)
+mf1.kernel()
+mf2 = scf.density_fit(scf.RKS(mol), with_df=with_df)
+mf2.kernel()
+
+# MO and half-transformed 3-index integrals (L|pq) and (L|p nu)
+nocc = mol.nelectron // 2
+Lov = with_df.ao2mo((mf2.mo_coeff[:,:nocc], mf2.mo_coeff[:,nocc:]))
+Lo_nu = with_df.ao2mo((mf2.mo_coeff[:,:nocc], None))
+print('(L|ia) %s, (L|i nu) %s' % (Lov.shape, Lo_nu.shape))
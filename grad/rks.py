@@ -8,10 +8,13 @@
 import time
 import numpy
 import scipy.linalg
+import pyscf.lib
 from pyscf.lib import logger
 from pyscf.scf import _vhf
+from pyscf.gto.mole import PTR_RANGE_OMEGA
 import pyscf.dft
 from pyscf.dft import numint
+from pyscf.dft import gen_grid
 import pyscf.grad.hf
 
 
@@ -33,7 +36,33 @@ def get_veff_(ks, mol, dm):
                    max_memory=mol.max_memory, verbose=ks.verbose)
     t0 = logger.timer(ks, 'vxc', *t0)
 
-    hyb = pyscf.dft.vxc.hybrid_coeff(x_code, spin=(mol.spin>0)+1)
+    vhf = _get_vhf(mol, dm, x_code)
+    return -(vhf + vxc)
+
+def get_veff_full_response(ks, mol, dm):
+    '''Coulomb + XC functional, and the XC contributions to the nuclear
+    gradients from the response of the grids (see :func:`get_vxc_full_response`)
+
+    Returns:
+        veff and the (natm,3) array of the grids response.
+    '''
+    t0 = (time.clock(), time.time())
+    assert(dm.ndim == 2)
+    x_code, c_code = pyscf.dft.vxc.parse_xc_name(ks.xc)
+    vxc, de_grids = get_vxc_full_response(ks._numint, mol, ks.grids, x_code,
+                                          c_code, dm, max_memory=mol.max_memory,
+                                          verbose=ks.verbose)
+    t0 = logger.timer(ks, 'vxc and grids response', *t0)
+
+    vhf = _get_vhf(mol, dm, x_code)
+    return -(vhf + vxc), de_grids
+
+def _get_vhf(mol, dm, x_code):
+    omega, alpha, beta = pyscf.dft.vxc.rsh_coeff(x_code, spin=(mol.spin>0)+1)
+    if abs(omega) > 1e-10:
+        hyb = alpha + beta
+    else:
+        hyb = pyscf.dft.vxc.hybrid_coeff(x_code, spin=(mol.spin>0)+1)
 
     if abs(hyb) < 1e-10:
         vj = _vhf.direct_mapdm('cint2e_ip1_sph',  # (nabla i,j|k,l)
@@ -50,112 +79,350 @@ def get_veff_(ks, mol, dm):
                                    mol._atm, mol._bas, mol._env)
         vhf = vj - vk * (hyb * .5)
 
-    return -(vhf + vxc)
+    if abs(omega) > 1e-10 and abs(beta) > 1e-10:
+        omega0 = mol._env[PTR_RANGE_OMEGA]
+        mol.set_range_coulomb_(omega)
+        try:
+            vk = _vhf.direct_mapdm('cint2e_ip1_sph', 's2kl', 'jk->s1il',
+                                   dm, 3, mol._atm, mol._bas, mol._env)
+        finally:
+            mol.set_range_coulomb_(omega0)
+        vhf += vk * (beta * .5)
+    return vhf
 
 
 def _get_vxc(ni, mol, grids, x_id, c_id, dms, relativity=0, hermi=1,
              max_memory=2000, verbose=None):
+    natocc, natorb = _natorbs(dms)
+    nao = natorb[0].shape[0]
+
+    xctype = numint._xc_type(x_id, c_id)
+    ngrids = len(grids.weights)
+    BLKSIZE = numint.BLKSIZE
+    blksize = min(int(max_memory/12*1e6/8/nao/BLKSIZE)*BLKSIZE,
+                  numint.SPARSE_BLKSIZE)
+    blksize = max(blksize, BLKSIZE)
+    ao_loc = numpy.asarray(mol.ao_loc_nr())
+    if ni.non0tab is None:
+        ni.non0tab = ni.make_mask(mol, grids.coords)
+
+    nset = len(natocc)
+    def block(ip0, ip1, buf, vmat):
+        coords = grids.coords[ip0:ip1]
+        weight = grids.weights[ip0:ip1]
+        non0tab = ni.non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+        idx, den, vs = _vxc_deriv_block(ni, mol, ao_loc, coords, weight,
+                                        non0tab, x_id, c_id, xctype, natorb,
+                                        natocc, relativity, verbose, buf)[:3]
+        for idm in range(nset):
+            _add_mat1(vmat[idm], idx, vs[idm])
+
+    vmat = numint._run_blocks(ni, block, ngrids, blksize,
+                              (10,blksize,nao), ((nset,3,nao,nao),),
+                              max_memory)[0]
+    if nset == 1:
+        vmat = vmat.reshape(3,nao,nao)
+    return vmat
+
+def get_vxc_full_response(ni, mol, grids, x_id, c_id, dm, relativity=0,
+                          max_memory=2000, verbose=None):
+    '''XC potential derivatives and the XC contributions to the nuclear
+    gradients from the response of the grids.  The grids move with their
+    atoms, the Becke partition and the atomic grids are those of
+    grids.becke_scheme, grids.atomic_radii etc.  The grids are regenerated
+    atom by atom, without the weight cutoff.
+
+    Returns:
+        vmat, de_grids.  vmat (3,nao,nao) is the same quantity as the one of
+        _get_vxc.  de_grids (natm,3) is the sum of the derivatives of the
+        grid weights and the derivatives due to the displacement of the grids.
+    '''
+    natocc, natorb = _natorbs(dm)
+    nao = dm.shape[0]
+    natm = mol.natm
+
+    xctype = numint._xc_type(x_id, c_id)
+    atom_grids_tab = grids.gen_atomic_grids(mol, grids.atom_grid,
+                                            grids.radi_method, grids.level,
+                                            grids.prune_scheme)
+    atm_coords = numpy.array([mol.atom_coord(i) for i in range(natm)])
+    coords_all = []
+    vol_all = []
+    owner = []
+    for ia in range(natm):
+        coords, vol = atom_grids_tab[mol.atom_symbol(ia)]
+        coords_all.append(coords + atm_coords[ia])
+        vol_all.append(vol)
+        owner.append(numpy.repeat(ia, len(vol)))
+    coords_all = numpy.vstack(coords_all)
+    vol_all = numpy.hstack(vol_all)
+    owner = numpy.hstack(owner)
+    ngrids = len(vol_all)
+    fpartition = _partition_deriv_fn(mol, atm_coords, grids.atomic_radii,
+                                     grids.becke_scheme)
+
+    blksize = _response_blksize(ni, nao, natm, max_memory)
+    ao_loc = numpy.asarray(mol.ao_loc_nr())
+
+    def block(ip0, ip1, buf, vmat, de):
+        coords = coords_all[ip0:ip1]
+        weight = numpy.empty(ip1-ip0)
+        dweight = numpy.empty((natm,3,ip1-ip0))
+        # Each segment has the grids of one atom
+        bounds = numpy.where(numpy.diff(owner[ip0:ip1]) != 0)[0] + 1
+        bounds = [0] + list(bounds) + [ip1-ip0]
+        for p0, p1 in zip(bounds[:-1], bounds[1:]):
+            p, dp = fpartition(coords[p0:p1], owner[ip0+p0])
+            weight[p0:p1] = vol_all[ip0+p0:ip0+p1] * p
+            dweight[:,:,p0:p1] = vol_all[ip0+p0:ip0+p1] * dp
+        non0tab = ni.make_mask(mol, coords)
+        idx, den, vs, vdm = _vxc_deriv_block(ni, mol, ao_loc, coords, weight,
+                                             non0tab, x_id, c_id, xctype,
+                                             natorb, natocc, relativity,
+                                             verbose, buf, dm)
+        _add_mat1(vmat, idx, vs[0])
+        # response of the grid weights
+        de += numpy.einsum('dxg,g->dx', dweight, den[0])
+        # the grids move with their owner atom
+        for p0, p1 in zip(bounds[:-1], bounds[1:]):
+            de[owner[ip0+p0]] += vdm[:,p0:p1].sum(axis=1) * 2
+
+    vmat, de = numint._run_blocks(ni, block, ngrids, blksize,
+                                  (10,blksize,nao),
+                                  ((3,nao,nao), (natm,3)), max_memory)
+    logger.debug(mol, 'grids response of XC functional\n%s', de)
+    return vmat, de
+
+def _response_blksize(ni, nao, natm, max_memory):
+    '''Number of grids in each block of get_vxc_full_response.  For each grid,
+    fpartition holds ~8 intermediates of (natm,natm) and the derivatives of
+    the weights (natm,3), besides the 10 AO components.  Each thread of
+    _run_blocks integrates one block at a time.'''
+    BLKSIZE = numint.BLKSIZE
+    nthreads = ni.nthreads
+    if nthreads is None:
+        nthreads = pyscf.lib.num_threads()
+    mem_per_grid = (natm*natm*8 + natm*3*3 + nao*10) * 8e-6
+    blksize = int(max_memory*.5/max(nthreads,1)/mem_per_grid)//BLKSIZE*BLKSIZE
+    return max(min(blksize, numint.SPARSE_BLKSIZE), BLKSIZE)
+
+def _natorbs(dms):
     natocc = []
     natorb = []
     if isinstance(dms, numpy.ndarray) and dms.ndim == 2:
         e, c = scipy.linalg.eigh(dms)
         natocc.append(e)
         natorb.append(c)
-        nao = dms.shape[0]
     else:
         for dm in dms:
             e, c = scipy.linalg.eigh(dm)
             natocc.append(e)
             natorb.append(c)
-        nao = dms[0].shape[0]
+    return natocc, natorb
 
-    xctype = numint._xc_type(x_id, c_id)
-    ngrids = len(grids.weights)
-    BLKSIZE = numint.BLKSIZE
-    blksize = min(int(max_memory/6*1e6/8/nao/BLKSIZE)*BLKSIZE, ngrids)
+def _add_mat1(vmat, idx, v):
+    for i in range(3):
+        numint._add_mat(vmat[i], idx, v[i])
 
-    nset = len(natocc)
-    nelec = numpy.zeros(nset)
-    excsum = numpy.zeros(nset)
-    vmat = numpy.zeros((nset,3,nao,nao))
+def _vxc_deriv_block(ni, mol, ao_loc, coords, weight, non0tab, x_id, c_id,
+                     xctype, natorb, natocc, relativity, verbose, buf,
+                     dm=None):
+    '''XC potential derivatives of one block of grids on the significant
+    shells of the block.
+
+    Returns:
+        idx, den, vmat, vdm.  idx is the indices of the significant AOs (see
+        numint._sparse_basis); den[i] is rho*exc (without the grid weights)
+        of the i-th density matrix; vmat[i] (3,len(idx),len(idx)) is the
+        <nabla i|vxc|j> type matrix.  If dm is given, vdm (3,ngrids) is the
+        contribution of each grid to einsum('xij,ij->x', vmat[0], dm).
+    '''
+    submol, idx, non0tab = numint._sparse_basis(mol, ao_loc, non0tab)
+    ngrids = len(weight)
+    den = []
+    vmat = []
+    vdm = None
+    if dm is not None:
+        dm = numint._take_dm(dm, idx)
+        vdm = numpy.empty((3,ngrids))
     if xctype == 'LDA':
-        buf = numpy.empty((4,blksize,nao))
-        for ip0, ip1 in numint.prange(0, ngrids, blksize):
-            coords = grids.coords[ip0:ip1]
-            weight = grids.weights[ip0:ip1]
-            non0tab = ni.non0tab[ip0//BLKSIZE:]
-            ao = ni.eval_ao(mol, coords, deriv=1, non0tab=non0tab, out=buf)
-            for idm in range(nset):
-                rho = ni.eval_rho2(mol, ao[0], natorb[idm], natocc[idm], non0tab, xctype)
-                exc, vxc = ni.eval_xc(x_id, c_id, rho, 0, relativity, 1, verbose)[:2]
-                vrho = vxc[0]
-                den = rho * weight
-                nelec[idm] += den.sum()
-                excsum[idm] += (den * exc).sum()
-                aow = numpy.einsum('pi,p->pi', ao[0], weight*vrho)
-                vmat[idm,0] += numint._dot_ao_ao(mol, ao[1], aow, nao, ip1-ip0, non0tab)
-                vmat[idm,1] += numint._dot_ao_ao(mol, ao[2], aow, nao, ip1-ip0, non0tab)
-                vmat[idm,2] += numint._dot_ao_ao(mol, ao[3], aow, nao, ip1-ip0, non0tab)
-                rho = exc = vxc = vrho = aow = None
+        ao = ni.eval_ao(submol, coords, deriv=1, non0tab=non0tab, out=buf)
+        nao = ao.shape[2]
+        for idm in range(len(natocc)):
+            rho = ni.eval_rho2(submol, ao[0], numint._take_orb(natorb[idm], idx),
+                               natocc[idm], non0tab, xctype)
+            exc, vxc = ni.eval_xc(x_id, c_id, rho, 0, relativity, 1, verbose)[:2]
+            vrho = vxc[0]
+            den.append(rho * exc)
+            aow = numpy.einsum('pi,p->pi', ao[0], weight*vrho)
+            v = numpy.empty((3,nao,nao))
+            for i in range(3):
+                v[i] = numint._dot_ao_ao(submol, ao[i+1], aow, nao, ngrids, non0tab)
+            if dm is not None and idm == 0:
+                for i in range(3):
+                    c = numint._dot_ao_dm(submol, ao[i+1], dm, nao, ngrids, non0tab)
+                    vdm[i] = numpy.einsum('pi,pi->p', c, aow)
+            vmat.append(v)
+            rho = exc = vxc = vrho = aow = None
     elif xctype == 'GGA':
-        buf = numpy.empty((10,blksize,nao))
+        ao = ni.eval_ao(submol, coords, deriv=2, non0tab=non0tab, out=buf)
+        nao = ao.shape[2]
         XX, XY, XZ = 4, 5, 6
         YX, YY, YZ = 5, 7, 8
         ZX, ZY, ZZ = 6, 8, 9
-        for ip0, ip1 in numint.prange(0, ngrids, blksize):
-            coords = grids.coords[ip0:ip1]
-            weight = grids.weights[ip0:ip1]
-            non0tab = ni.non0tab[ip0//BLKSIZE:]
-            ao = ni.eval_ao(mol, coords, deriv=2, non0tab=non0tab, out=buf)
-            for idm in range(nset):
-                rho = ni.eval_rho2(mol, ao, natorb[idm], natocc[idm], non0tab, xctype)
-                exc, vxc = ni.eval_xc(x_id, c_id, rho, 0, relativity, 1, verbose)[:2]
-                vrho, vsigma = vxc[:2]
-                den = rho[0] * weight
-                nelec[idm] += den.sum()
-                excsum[idm] += (den * exc).sum()
-                wv = numpy.empty_like(rho)
-                # *.5 because vmat + vmat.T implicitly
-                wv[0]  = weight * vrho * .5
-                wv[1:] = rho[1:] * (weight * vsigma * 2)
-
-                aow = numpy.einsum('npi,np->pi', ao[:4], wv)
-                vmat[idm,0] += numint._dot_ao_ao(mol, ao[1], aow, nao, ip1-ip0, non0tab)
-                vmat[idm,1] += numint._dot_ao_ao(mol, ao[2], aow, nao, ip1-ip0, non0tab)
-                vmat[idm,2] += numint._dot_ao_ao(mol, ao[3], aow, nao, ip1-ip0, non0tab)
-
-                aow = numpy.einsum('pi,p->pi', ao[1] , wv[0])
-                aow+= numpy.einsum('pi,p->pi', ao[XX], wv[1])
-                aow+= numpy.einsum('pi,p->pi', ao[XY], wv[2])
-                aow+= numpy.einsum('pi,p->pi', ao[XZ], wv[3])
-                vmat[idm,0] += numint._dot_ao_ao(mol, aow, ao[0], nao, ip1-ip0, non0tab)
-                aow = numpy.einsum('pi,p->pi', ao[2] , wv[0])
-                aow+= numpy.einsum('pi,p->pi', ao[YX], wv[1])
-                aow+= numpy.einsum('pi,p->pi', ao[YY], wv[2])
-                aow+= numpy.einsum('pi,p->pi', ao[YZ], wv[3])
-                vmat[idm,1] += numint._dot_ao_ao(mol, aow, ao[0], nao, ip1-ip0, non0tab)
-                aow = numpy.einsum('pi,p->pi', ao[3] , wv[0])
-                aow+= numpy.einsum('pi,p->pi', ao[ZX], wv[1])
-                aow+= numpy.einsum('pi,p->pi', ao[ZY], wv[2])
-                aow+= numpy.einsum('pi,p->pi', ao[ZZ], wv[3])
-                vmat[idm,2] += numint._dot_ao_ao(mol, aow, ao[0], nao, ip1-ip0, non0tab)
-                rho = exc = vxc = vrho = vsigma = wv = aow = None
+        for idm in range(len(natocc)):
+            rho = ni.eval_rho2(submol, ao, numint._take_orb(natorb[idm], idx),
+                               natocc[idm], non0tab, xctype)
+            exc, vxc = ni.eval_xc(x_id, c_id, rho, 0, relativity, 1, verbose)[:2]
+            vrho, vsigma = vxc[:2]
+            den.append(rho[0] * exc)
+            wv = numpy.empty_like(rho)
+            # *.5 because vmat + vmat.T implicitly
+            wv[0]  = weight * vrho * .5
+            wv[1:] = rho[1:] * (weight * vsigma * 2)
+
+            v = numpy.empty((3,nao,nao))
+            aow = numpy.einsum('npi,np->pi', ao[:4], wv)
+            for i in range(3):
+                v[i] = numint._dot_ao_ao(submol, ao[i+1], aow, nao, ngrids, non0tab)
+            if dm is not None and idm == 0:
+                for i in range(3):
+                    c = numint._dot_ao_dm(submol, ao[i+1], dm, nao, ngrids, non0tab)
+                    vdm[i] = numpy.einsum('pi,pi->p', c, aow)
+                c0 = numint._dot_ao_dm(submol, ao[0], dm, nao, ngrids, non0tab)
+
+            for i, (ix, iy, iz) in enumerate(((XX,XY,XZ), (YX,YY,YZ), (ZX,ZY,ZZ))):
+                aow = numpy.einsum('pi,p->pi', ao[i+1], wv[0])
+                aow+= numpy.einsum('pi,p->pi', ao[ix], wv[1])
+                aow+= numpy.einsum('pi,p->pi', ao[iy], wv[2])
+                aow+= numpy.einsum('pi,p->pi', ao[iz], wv[3])
+                v[i] += numint._dot_ao_ao(submol, aow, ao[0], nao, ngrids, non0tab)
+                if dm is not None and idm == 0:
+                    vdm[i] += numpy.einsum('pi,pi->p', aow, c0)
+            vmat.append(v)
+            rho = exc = vxc = vrho = vsigma = wv = aow = None
     else:
         raise NotImplementedError('meta-GGA')
+    return idx, den, vmat, vdm
 
-    if nset == 1:
-        vmat = vmat.reshape(3,nao,nao)
-    return vmat
+
+def _becke_deriv(g):
+    '''original_becke and its derivative'''
+    p1 = (3 - g**2) * g * .5
+    p2 = (3 - p1**2) * p1 * .5
+    p3 = (3 - p2**2) * p2 * .5
+    dp = 27./8 * (1-g**2) * (1-p1**2) * (1-p2**2)
+    return p3, dp
+
+def _stratmann_deriv(g):
+    '''stratmann and its derivative'''
+    a = .64
+    ma = g / a
+    ma2 = ma * ma
+    p = (1/16.)*(ma*(35 + ma2*(-35 + ma2*(21 - 5 *ma2))))
+    dp = (1/16./a)*(35 + ma2*(-105 + ma2*(105 - 35*ma2)))
+    p[g<=-a] = -1
+    p[g>= a] =  1
+    dp[abs(g)>=a] = 0
+    return p, dp
+
+def _partition_deriv_fn(mol, atm_coords, atomic_radii_adjust, becke_scheme):
+    '''Returns a function fpartition(coords, ia) which computes the Becke
+    partition P_ia/sum_k P_k of the grids of atom ia and its derivatives wrt
+    the atom coordinates.  The grids move with atom ia.
+    '''
+    if becke_scheme is gen_grid.original_becke:
+        fbecke = _becke_deriv
+    elif becke_scheme is gen_grid.stratmann:
+        fbecke = _stratmann_deriv
+    else:
+        raise NotImplementedError('Grids response for Becke scheme %s' %
+                                  becke_scheme)
+    natm = len(atm_coords)
+    if atomic_radii_adjust is None:
+        a = numpy.zeros((natm,natm))
+    elif hasattr(atomic_radii_adjust, 'radii_table'):
+        a = numpy.asarray(atomic_radii_adjust.radii_table)
+    else:
+        raise NotImplementedError('Grids response for atomic radii adjust '
+                                  'function %s' % atomic_radii_adjust)
+    rab = atm_coords[:,None] - atm_coords
+    atm_dist = numpy.sqrt(numpy.einsum('abx,abx->ab', rab, rab))
+    atm_dist[numpy.diag_indices(natm)] = 1
+    uab = rab / atm_dist[:,:,None]
+    rinv = 1 / atm_dist
+    rinv[numpy.diag_indices(natm)] = 0
+
+    def fpartition(coords, ia):
+        # e[b] = (r - R_b) / |r - R_b|
+        e = coords.T - atm_coords[:,:,None]
+        dist = numpy.sqrt(numpy.einsum('bxg,bxg->bg', e, e)) + 1e-200
+        e /= dist[:,None]
+# mu_bc = (|r-R_b| - |r-R_c|) / R_bc,  nu_bc = mu_bc + a_bc (1-mu_bc^2)
+        mu = (dist[:,None] - dist) * rinv[:,:,None]
+        g, dg = fbecke(mu + a[:,:,None] * (1 - mu**2))
+        s = .5 * (1 - g)
+        s[numpy.diag_indices(natm)] = 1
+        # d ln(s_bc) / d mu_bc / R_bc
+        dg *= (1 - 2 * a[:,:,None] * mu) * rinv[:,:,None] * -.5
+        q = numpy.zeros_like(dg)
+        mask = s > 0
+        q[mask] = dg[mask] / s[mask]
+        pbecke = numpy.prod(s, axis=1)
+        z = pbecke.sum(axis=0)
+        z[z==0] = 1
+        p = pbecke[ia] / z
+# d ln P_b / dR_d = sum_c q_bc (dmu_bc/dR_d * R_bc), contracted with
+# h_b = delta_{b,ia} - P_b/Z to get d (P_ia/Z) / dR_d / (P_ia/Z)
+        h = -pbecke / z
+        h[ia] += 1
+        k = numpy.einsum('bg,bcg->cg', h, q)
+        v = h * q.sum(axis=1) - k
+        qmu = q * mu
+        dp = numpy.einsum('bg,bdg,bdx->dxg', h, qmu, uab)
+        dp-= numpy.einsum('dg,dcg,dcx->dxg', h, qmu, uab)
+        dp-= v[:,None] * e
+        dp[ia] += numpy.einsum('bg,bxg->xg', v, e)
+        dp *= p
+        return p, dp
+    return fpartition
 
 
 class RKS(pyscf.grad.hf.RHF):
+    '''Non-relativistic restricted Kohn-Sham gradients
+
+    Attributes:
+        grid_response : bool
+            Whether to include the response of the grids (the derivatives of
+            the Becke weights and the displacement of the grids with the
+            atoms) in the XC gradients.  It removes the grid errors of the
+            gradients (e.g. translational variance) for coarse grids.
+            Default is False.
+    '''
     def __init__(self, scf_method):
         pyscf.grad.hf.RHF.__init__(self, scf_method)
+        self.grid_response = False
+        self._de_grids = None
 
     def get_veff(self, mol=None, dm=None):
         if mol is None: mol = self.mol
         if dm is None: dm = self._scf.make_rdm1()
-        return get_veff_(self._scf, mol, dm)
+        if self.grid_response:
+            veff, self._de_grids = get_veff_full_response(self._scf, mol, dm)
+            return veff
+        else:
+            self._de_grids = None
+            return get_veff_(self._scf, mol, dm)
+
+    def grad_elec(self, mo_energy=None, mo_coeff=None, mo_occ=None,
+                  atmlst=None):
+        de = pyscf.grad.hf.RHF.grad_elec(self, mo_energy, mo_coeff, mo_occ,
+                                         atmlst)
+        if self._de_grids is not None:
+            if atmlst is None:
+                atmlst = range(self.mol.natm)
+            de += self._de_grids[list(atmlst)]
+        return de
 
 
 if __name__ == '__main__':
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 
 import unittest
+import numpy
 from pyscf import scf
+from pyscf import dft
 from pyscf import gto
 from pyscf import grad
+from pyscf import lib
 
 h2o = gto.Mole()
 h2o.verbose = 0
@@ -46,6 +49,48 @@ class KnowValues(unittest.TestCase):
         g = grad.hf.RHF(rhf)
         self.assertAlmostEqual(finger(g.grad_nuc()), 10.086972893020102, 9)
 
+    def test_rks_grid_response(self):
+        def make_mf(dz):
+            mol = gto.M(atom=[["O" , (0. , 0.     , dz)],
+                              [1   , (0. , -0.757 , 0.587)],
+                              [1   , (0. , 0.757  , 0.587)]],
+                        basis='6-31g', verbose=0)
+            mf = dft.RKS(mol)
+            mf.xc = 'b88,p86'
+            mf.conv_tol = 1e-13
+            # coarse grids to amplify the grid errors
+            mf.grids.atom_grid = {"H": (20, 50), "O": (30, 86)}
+            mf.grids.prune_scheme = None
+            return mf
+        mf = make_mf(0)
+        mf.scf()
+        g = grad.rks.RKS(mf)
+        g.grid_response = True
+        de = g.grad()
+        self.assertAlmostEqual(abs(de.sum(axis=0)).max(), 0, 8)
+        h = 1e-4
+        e1 = make_mf( h).scf()
+        e2 = make_mf(-h).scf()
+        self.assertAlmostEqual(de[0,2], (e1-e2)/(2*h/lib.parameters.BOHR), 6)
+
+        mf._numint.nthreads = 1
+        de1 = g.grad()
+        self.assertTrue(numpy.allclose(de, de1))
+        g.grid_response = False
+        de1 = g.grad()
+        self.assertTrue(abs(de1-de).max() > 1e-6)
+
+    def test_grid_response_blksize(self):
+        ni = dft.numint._NumInt()
+        ni.nthreads = 4
+        natm, nao = 200, 1000
+        blksize = grad.rks._response_blksize(ni, nao, natm, 4000)
+        self.assertEqual(blksize % dft.numint.BLKSIZE, 0)
+        # the intermediates of all threads fit in max_memory
+        mem = (natm*natm*8 + natm*3*3 + nao*10) * 8e-6 * blksize * 4
+        self.assertTrue(mem < 4000)
+        self.assertTrue(grad.rks._response_blksize(ni, nao, 20, 4000) > blksize)
+
     def test_ccsd(self):
         from pyscf import cc
         rhf = scf.RHF(h2o)
@@ -1026,6 +1026,12 @@ PTR_RINV_ORIG   = 4
 PTR_RINV_ZETA   = 7
 PTR_ECPBAS_OFFSET = 8
 PTR_NECPBAS     = 9
+# omega of the long-range operator erf(omega r12)/r12 for 2e integrals.  0
+# for the regular Coulomb operator
+PTR_RANGE_OMEGA = 10
+# libcint reads omega from slot 8.  The slot is shared with PTR_ECPBAS_OFFSET
+# which is only assigned in the temporary env of the ECP integrals
+_CINT_RANGE_OMEGA = 8
 PTR_ENV_START   = 20
 # parameters from libcint
 NUC_POINT = 1
@@ -1531,6 +1537,20 @@ Note when symmetry attributes is assigned, the molecule needs to be put in the p
     def set_rinv_orig_(self, coord):
         self.set_rinv_origin_(coord)
 
+    def set_range_coulomb_(self, omega):
+        r'''Switch the operator of the 2e integrals to the long-range part of
+        Coulomb :math:`\frac{erf(\omega r_{12})}{r_{12}}`.  omega = 0 to
+        restore the regular Coulomb operator.
+
+        Examples:
+
+        >>> mol.set_range_coulomb_(.33)
+        >>> eri_lr = scf._vhf.int2e_sph(mol._atm, mol._bas, mol._env)
+        >>> mol.set_range_coulomb_(0)
+        '''
+        self._env[PTR_RANGE_OMEGA] = omega
+        self._env[_CINT_RANGE_OMEGA] = omega
+
     def set_nuc_mod_(self, atm_id, zeta):
         '''Change the nuclear charge distribution of the given atom ID.  The charge
         distribution is defined as: rho(r) = nuc_charge * Norm * exp(-zeta * r^2).
@@ -1864,13 +1884,15 @@ Note when symmetry attributes is assigned, the molecule needs to be put in the p
         if 'ECP' in intor:
             assert(self._ecp is not None)
             bas = numpy.vstack((self._bas, self._ecpbas))
-            self._env[PTR_ECPBAS_OFFSET] = len(self._bas)
-            self._env[PTR_NECPBAS] = len(self._ecpbas)
+            env = self._env.copy()
+            env[PTR_ECPBAS_OFFSET] = len(self._bas)
+            env[PTR_NECPBAS] = len(self._ecpbas)
             if bras is None: bras = numpy.arange(self.nbas, dtype=numpy.int32)
             if kets is None: kets = numpy.arange(self.nbas, dtype=numpy.int32)
         else:
             bas = self._bas
-        return moleintor.getints(intor, self._atm, bas, self._env,
+            env = self._env
+        return moleintor.getints(intor, self._atm, bas, env,
                                  bras=bras, kets=kets, comp=comp, hermi=hermi,
                                  aosym=aosym, out=out)
 
@@ -27,6 +27,25 @@ class KnowValues(unittest.TestCase):
         mf = scf.RHF(mol)
         self.assertAlmostEqual(mf.kernel(), -0.45002315562861461, 10)
 
+    def test_ecp_env_slots(self):
+        mol = gto.M(atom='Na 0. 0. 0.;  H  0.  0.  1.',
+                    basis={'Na':'lanl2dz', 'H':'sto3g'},
+                    ecp = {'Na':'lanl2dz'},
+                    verbose=0)
+        self.assertEqual(gto.mole.PTR_ECPBAS_OFFSET, 8)
+        self.assertEqual(gto.mole.PTR_NECPBAS, 9)
+        env = mol._env.copy()
+        mol.intor('ECPscalar_sph')
+        # the ECP pointers are not left in mol._env where the 2e integrals
+        # would read them as the range-separation parameter
+        self.assertTrue(numpy.array_equal(mol._env, env))
+        eri0 = mol.intor('cint2e_sph')
+        mol.set_range_coulomb_(.5)
+        eri1 = mol.intor('cint2e_sph')
+        mol.set_range_coulomb_(0)
+        self.assertTrue(abs(eri1).max() < abs(eri0).max())
+        self.assertTrue(numpy.array_equal(mol._env, env))
+
 
 if __name__ == '__main__':
     print("Full Tests for H2O")
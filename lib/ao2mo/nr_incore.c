@@ -5,6 +5,7 @@
  */
 
 #include <stdlib.h>
+#include <string.h>
 #include <assert.h>
 //#include <omp.h>
 #include "config.h"
@@ -13,6 +14,7 @@
 #include "nr_ao2mo.h"
 #define OUTPUTIJ        1
 #define INPUT_IJ        2
+#define MIN(X,Y)        ((X) < (Y) ? (X) : (Y))
 
 
 void AO2MOtranse1_incore_s4(int (*fmmm)(), int row_id,
@@ -44,6 +46,39 @@ void AO2MOtranse1_incore_s8(int (*fmmm)(), int row_id,
         free(buf0);
 }
 
+/*
+ * Unpack the rows [row_start, row_start+row_count) of the 8-fold symmetric
+ * eri_ao to 4-fold symmetric storage.  Unlike NPdunpack_row, the elements
+ * of the upper triangular part are read in runs of row_count contiguous
+ * elements, so that eri_ao can be a memory-mapped file.
+ */
+void AO2MOunpack_s8_rows(double *out, double *eri_ao,
+                         int row_start, int row_count, int npair)
+{
+        const size_t r0 = row_start;
+        const size_t r1 = row_start + row_count;
+        const size_t n = npair;
+
+#pragma omp parallel
+        {
+                size_t r, c, rend;
+                double *peri;
+#pragma omp for schedule(static)
+                for (r = r0; r < r1; r++) {
+                        peri = eri_ao + r*(r+1)/2;
+                        memcpy(out+(r-r0)*n, peri, sizeof(double)*(r+1));
+                }
+#pragma omp for schedule(dynamic, 64)
+                for (c = r0+1; c < n; c++) {
+                        peri = eri_ao + c*(c+1)/2;
+                        rend = MIN(c, r1);
+                        for (r = r0; r < rend; r++) {
+                                out[(r-r0)*n+c] = peri[r];
+                        }
+                }
+        }
+}
+
 // ij_start and ij_count for the ij-AO-pair in eri_ao
 void AO2MOnr_e1incore_drv(void (*ftranse2_like)(), int (*fmmm)(),
                           double *vout, double *eri_ao, double *mo_coeff,
@@ -0,0 +1,222 @@
+/*
+ * Author: Qiming Sun <osirpt.sun@gmail.com>
+ *
+ * Becke partition of the atomic grids.  The cell function of an atom pair
+ * is saturated (equals 0 or 1) when the adjusted elliptical coordinate
+ * |nu_ij| is larger than a cutoff.  For each block of grids, the bounds of
+ * nu_ij are estimated from the min/max distances between the grids and the
+ * atoms, then
+ *   - atom i is dropped if s(nu_ij) = 0 for any j (Becke weight P_i = 0)
+ *   - pair (i,j) is skipped if s(nu_ij) = 1
+ * Stratmann, Scuseria, Frisch. CPL, 257, 213 (1996)
+ */
+
+#include <stdlib.h>
+#include <math.h>
+
+#define BLKSIZE         128
+// Beyond |nu| > 0.99, 1-|g(nu)| < 2e-15 for the original Becke scheme
+#define BECKE_CUTOFF    .99
+// Stratmann, Scuseria, Frisch. CPL, 257, 213 (1996), eq. 14
+#define STRATMANN_A     .64
+#define MIN(X,Y)        ((X)<(Y)?(X):(Y))
+#define MAX(X,Y)        ((X)>(Y)?(X):(Y))
+
+static double original_becke(double g)
+{
+        g = (3 - g*g) * g * .5;
+        g = (3 - g*g) * g * .5;
+        g = (3 - g*g) * g * .5;
+        return g;
+}
+
+static double stratmann(double g)
+{
+        double ma, ma2;
+        if (g <= -STRATMANN_A) {
+                return -1;
+        } else if (g >= STRATMANN_A) {
+                return 1;
+        } else {
+                ma = g / STRATMANN_A;
+                ma2 = ma * ma;
+                return (1/16.)*(ma*(35 + ma2*(-35 + ma2*(21 - 5 *ma2))));
+        }
+}
+
+/* mu_ij -> nu_ij, see radi.becke_atomic_radii_adjust.  The adjustment is
+ * monotonic in [-1,1] since |a_ij| <= 1/2 */
+static double radii_adjust(double mu, double a)
+{
+        return mu + a * (1 - mu*mu);
+}
+
+/*
+ * Becke weights of one block of grids, scaled by the partition of the owner
+ * atom:  weights[i] *= P_owner(r_i) / sum_k P_k(r_i)
+ *
+ * buf holds natm*(BLKSIZE*2+2) doubles followed by natm*natm+natm*3 ints,
+ * see BECKE_BUFSIZE
+ */
+// the int region is rounded up to whole doubles
+#define BECKE_BUFSIZE(natm)     ((size_t)(natm) * (BLKSIZE*2+2) + \
+                                 ((size_t)(natm) * ((natm)+3) + 1) / 2)
+
+static void partition_blk(double *weights, double *coords, int ngrids,
+                          int owner, double *atm_coords, double *rinv,
+                          double *radii_table, int natm, int scheme,
+                          double *buf)
+{
+        const double cutoff = scheme == 0 ? BECKE_CUTOFF : STRATMANN_A;
+        double (*fbecke)(double) = scheme == 0 ? original_becke : stratmann;
+        double *grid_dist = buf;
+        double *pbecke = grid_dist + natm * BLKSIZE;
+        double *dmin = pbecke + natm * BLKSIZE;
+        double *dmax = dmin + natm;
+        int *atm_idx = (int *)(dmax + natm);
+        int *pair_idx = atm_idx + natm;
+        int *npair = pair_idx + natm * natm;
+        int *kept = npair + natm;
+        int i, j, k, n, kk, nj, nk;
+        double dx, dy, dz, lo, hi, a, mu, g, tot;
+        double *pc, *pk, *pj;
+
+        for (k = 0; k < natm; k++) {
+                pc = atm_coords + k * 3;
+                pk = grid_dist + k * BLKSIZE;
+                dmin[k] = 1e200;
+                dmax[k] = 0;
+                for (n = 0; n < ngrids; n++) {
+                        dx = coords[n*3+0] - pc[0];
+                        dy = coords[n*3+1] - pc[1];
+                        dz = coords[n*3+2] - pc[2];
+                        pk[n] = sqrt(dx*dx + dy*dy + dz*dz);
+                        dmin[k] = MIN(dmin[k], pk[n]);
+                        dmax[k] = MAX(dmax[k], pk[n]);
+                }
+        }
+
+        // atoms of non-zero Becke weights and the pairs to compute
+        nk = 0;
+        for (k = 0; k < natm; k++) {
+                nj = 0;
+                for (j = 0; j < natm; j++) {
+                        if (j == k) {
+                                continue;
+                        }
+                        a = radii_table == NULL ? 0 : radii_table[k*natm+j];
+                        lo = radii_adjust(MAX((dmin[k]-dmax[j])*rinv[k*natm+j], -1), a);
+                        if (lo >= cutoff) {
+                                goto next_atm;
+                        }
+                        hi = radii_adjust(MIN((dmax[k]-dmin[j])*rinv[k*natm+j], 1), a);
+                        if (hi > -cutoff) {
+                                pair_idx[k*natm+nj] = j;
+                                nj++;
+                        }
+                }
+                atm_idx[nk] = k;
+                npair[nk] = nj;
+                nk++;
+next_atm:;
+        }
+
+        for (k = 0; k < natm; k++) {
+                kept[k] = 0;
+        }
+        for (kk = 0; kk < nk; kk++) {
+                k = atm_idx[kk];
+                kept[k] = 1;
+                for (n = 0; n < ngrids; n++) {
+                        pbecke[k*BLKSIZE+n] = 1;
+                }
+        }
+        if (!kept[owner]) {
+                for (n = 0; n < ngrids; n++) {
+                        pbecke[owner*BLKSIZE+n] = 0;
+                }
+        }
+
+        for (kk = 0; kk < nk; kk++) {
+                k = atm_idx[kk];
+                pk = grid_dist + k * BLKSIZE;
+                for (i = 0; i < npair[kk]; i++) {
+                        j = pair_idx[k*natm+i];
+                        if (kept[j] && j > k) {
+                                // computed with pair (j,k)
+                                continue;
+                        }
+                        a = radii_table == NULL ? 0 : radii_table[k*natm+j];
+                        pj = grid_dist + j * BLKSIZE;
+                        if (kept[j]) {
+                                for (n = 0; n < ngrids; n++) {
+                                        mu = (pk[n] - pj[n]) * rinv[k*natm+j];
+                                        g = fbecke(radii_adjust(mu, a));
+                                        pbecke[k*BLKSIZE+n] *= .5 * (1 - g);
+                                        pbecke[j*BLKSIZE+n] *= .5 * (1 + g);
+                                }
+                        } else {
+                                for (n = 0; n < ngrids; n++) {
+                                        mu = (pk[n] - pj[n]) * rinv[k*natm+j];
+                                        g = fbecke(radii_adjust(mu, a));
+                                        pbecke[k*BLKSIZE+n] *= .5 * (1 - g);
+                                }
+                        }
+                }
+        }
+
+        for (n = 0; n < ngrids; n++) {
+                tot = 0;
+                for (kk = 0; kk < nk; kk++) {
+                        tot += pbecke[atm_idx[kk]*BLKSIZE+n];
+                }
+                if (tot > 0) {
+                        weights[n] *= pbecke[owner*BLKSIZE+n] / tot;
+                } else {
+                        weights[n] = 0;
+                }
+        }
+}
+
+/*
+ * weights: on input, the volume of the atomic grids; on output, the
+ *          volume scaled by the Becke partition of the owner atom
+ * radii_table: a_ij of the atomic size adjustment, can be NULL
+ * scheme: 0 for original Becke, 1 for Stratmann
+ */
+void VXCbecke_partition(double *weights, double *coords, int ngrids,
+                        int owner, double *atm_coords, double *radii_table,
+                        int natm, int scheme)
+{
+        double *rinv = malloc(sizeof(double) * natm*natm);
+        int nblk = (ngrids+BLKSIZE-1) / BLKSIZE;
+        size_t bufsize = BECKE_BUFSIZE(natm);
+        int i, j;
+        double dx, dy, dz;
+        for (i = 0; i < natm; i++) {
+                rinv[i*natm+i] = 0;
+                for (j = 0; j < i; j++) {
+                        dx = atm_coords[i*3+0] - atm_coords[j*3+0];
+                        dy = atm_coords[i*3+1] - atm_coords[j*3+1];
+                        dz = atm_coords[i*3+2] - atm_coords[j*3+2];
+                        rinv[i*natm+j] = 1 / sqrt(dx*dx + dy*dy + dz*dz);
+                        rinv[j*natm+i] = rinv[i*natm+j];
+                }
+        }
+
+#pragma omp parallel default(none) \
+        shared(weights, coords, ngrids, owner, atm_coords, radii_table, \
+               natm, scheme, rinv, bufsize, nblk) private(i)
+{
+        double *buf = malloc(sizeof(double) * bufsize);
+#pragma omp for nowait schedule(dynamic)
+        for (i = 0; i < nblk; i++) {
+                partition_blk(weights+i*BLKSIZE, coords+i*BLKSIZE*3,
+                              MIN(ngrids-i*BLKSIZE, BLKSIZE), owner,
+                              atm_coords, rinv, radii_table, natm, scheme,
+                              buf);
+        }
+        free(buf);
+}
+        free(rinv);
+}
@@ -34,6 +34,34 @@ double VXChybrid_coeff(int xc_id, int spin)
         return factor;
 }
 
+/*
+ * Range-separation parameters of the exact exchange.  In libxc convention
+ * the exact exchange is  cam_alpha * K + cam_beta * K_SR(omega)
+ * rsh = (cam_omega, cam_alpha, cam_beta)
+ */
+void VXCrsh_coeff(int xc_id, int spin, double *rsh)
+{
+        xc_func_type func;
+        if(xc_func_init(&func, xc_id, spin) != 0){
+                fprintf(stderr, "XC functional %d not found\n", xc_id);
+                exit(1);
+        }
+        switch(func.info->family)
+        {
+                case XC_FAMILY_HYB_GGA:
+                case XC_FAMILY_HYB_MGGA:
+                        rsh[0] = func.cam_omega;
+                        rsh[1] = func.cam_alpha;
+                        rsh[2] = func.cam_beta;
+                        break;
+                default:
+                        rsh[0] = 0;
+                        rsh[1] = 0;
+                        rsh[2] = 0;
+        }
+        xc_func_end(&func);
+}
+
 /* Extracted from comments of libxc:gga.c
  
     sigma_st          = grad rho_s . grad rho_t
@@ -9,13 +9,16 @@ DIIS
 
 import sys
 import tempfile
+import threading
 import numpy
 import scipy.linalg
 import h5py
 from pyscf.lib import logger
 
 
-INCORE_SIZE = 1e7
+# Max memory (in MB) of the DIIS subspace.  Beyond it, the DIIS vectors are
+# saved on disk.
+MAX_MEMORY = 2000
 BLOCK_SIZE  = int(20e6) # ~ 160/320 MB
 # PCCP, 4, 11
 # GEDIIS, JCTC, 2, 835
@@ -29,6 +32,10 @@ class DIIS(object):
             DIIS subspace size. The maximum number of the vectors to be stored.
         min_space
             The minimal size of subspace before DIIS extrapolation.
+        max_memory : float
+            Max memory (in MB) for the vectors of DIIS subspace.  If the
+            subspace needs more memory, the vectors are stored on disk.
+            Default is 2000 MB.
 
     Functions:
         update(x, xerr=None) :
@@ -91,16 +98,19 @@ class DIIS(object):
             self.stdout = sys.stdout
         self.space = 6
         self.min_space = 1
+        self.max_memory = MAX_MEMORY
 
 ##################################################
 # don't modify the following private variables, they are not input options
         self.filename = filename
+        self._tmpfile = None
         if isinstance(filename, str):
             self._diisfile = h5py.File(filename, 'w')
         else:
-            self._tmpfile = tempfile.NamedTemporaryFile()
-            self._diisfile = h5py.File(self._tmpfile.name, 'w')
+            self._diisfile = None
         self._buffer = {}
+        self._incore = None
+        self._writer = None
         self._bookkeep = [] # keep the ordering of input vectors
         self._head = 0
         self._H = None
@@ -108,22 +118,45 @@ class DIIS(object):
         self._err_vec_touched = False
 
     def __del__(self):
-        self._diisfile.close()
+        self._sync()
+        if self._diisfile is not None:
+            self._diisfile.close()
         self._tmpfile = None
 
+    def _sync(self):
+        '''Wait for the background writer'''
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
     def _store(self, key, value):
-        if value.size < INCORE_SIZE:
-            self._buffer[key] = value
-
-        # save the error vector if filename is given, this file can be used to
-        # restore the DIIS state
-        if value.size >= INCORE_SIZE or isinstance(self.filename, str):
-            if key in self._diisfile:
-                self._diisfile[key][:] = value
-            else:
-                self._diisfile[key] = value
-# to avoid "Unable to find a valid file signature" error when reopen from crash
-            self._diisfile.flush()
+        if self._incore is None:
+            nbytes = value.size * value.itemsize * self.space * 2
+            self._incore = nbytes/1e6 < self.max_memory
+            if not self._incore:
+                logger.debug(self, 'DIIS vectors (%.f MB) are saved on disk',
+                             nbytes/1e6)
+                if self._diisfile is None:
+                    self._tmpfile = tempfile.NamedTemporaryFile()
+                    self._diisfile = h5py.File(self._tmpfile.name, 'w')
+
+# The pending write may read the ring buffer or the HDF5 file
+        self._sync()
+        if self._incore:
+            kind, idx = key[0], int(key[1:])
+            if kind not in self._buffer:
+                self._buffer[kind] = numpy.empty((self.space,value.size),
+                                                 value.dtype)
+            self._buffer[kind][idx] = value
+            value = self._buffer[kind][idx]
+
+        # Out-of-core vectors and the vectors to restore the DIIS state (if
+        # filename is given) are written to the HDF5 file in background
+        if self._diisfile is not None:
+            self._writer = threading.Thread(target=_write_h5dat,
+                                            args=(self._diisfile, key, value,
+                                                  list(self._bookkeep)))
+            self._writer.start()
 
     def push_err_vec(self, xerr):
         self._err_vec_touched = True
@@ -157,30 +190,22 @@ class DIIS(object):
             if self._head >= self.space:
                 self._head = 0
             self._bookkeep.append(self._head)
-            ekey = 'e%d'%self._head
-            xkey = 'x%d'%self._head
-            self._store(xkey, x)
-            if x.size < INCORE_SIZE:
-                self._buffer[ekey] = x - self._xprev
-                if isinstance(self.filename, str):
-                    self._store(ekey, self._buffer[ekey])
-            else:
-                if ekey not in self._diisfile:
-                    self._diisfile.create_dataset(ekey, (x.size,), x.dtype)
-                for p0,p1 in prange(0, x.size, BLOCK_SIZE):
-                    self._diisfile[ekey][p0:p1] = x[p0:p1] - self._xprev[p0:p1]
+            self._store('x%d'%self._head, x)
+            self._store('e%d'%self._head, x - self._xprev)
             self._head += 1
 
     def get_err_vec(self, idx):
-        if self._buffer:
-            return self._buffer['e%d'%idx]
+        if self._incore:
+            return self._buffer['e'][idx]
         else:
+            self._sync()
             return self._diisfile['e%d'%idx]
 
     def get_vec(self, idx):
-        if self._buffer:
-            return self._buffer['x%d'%idx]
+        if self._incore:
+            return self._buffer['x'][idx]
         else:
+            self._sync()
             return self._diisfile['x%d'%idx]
 
     def get_num_vec(self):
@@ -195,6 +220,10 @@ class DIIS(object):
         * If xerr is None, this function will take the difference between
         the current given vector and the last given vector as the error
         vector to extrapolate the vector.
+
+        The input vector is written to disk in background if the DIIS
+        subspace is stored on disk.  Do not modify x in place before the next
+        call to update.
         '''
         if xerr is not None:
             self.push_err_vec(xerr)
@@ -204,17 +233,30 @@ class DIIS(object):
         if nd < self.min_space:
             return x
 
-        dt = numpy.array(self.get_err_vec(self._head-1), copy=False)
+        xnew = self.extrapolate(nd)
+        return xnew.reshape(x.shape)
+
+    def _update_H(self, k, nd):
+        '''Update the row of the B matrix (_H) which corresponds to the k-th
+        error vector'''
+        dt = numpy.asarray(self.get_err_vec(k))
         for i in range(nd):
             tmp = 0
             dti = self.get_err_vec(i)
             for p0,p1 in prange(0, dt.size, BLOCK_SIZE):
                 tmp += numpy.dot(dt[p0:p1].conj(), dti[p0:p1])
-            self._H[self._head,i+1] = tmp
-            self._H[i+1,self._head] = tmp.conjugate()
-        dt = None
+            self._H[k+1,i+1] = tmp
+            self._H[i+1,k+1] = tmp.conjugate()
+
+    def extrapolate(self, nd):
+        '''Update the last row of the B matrix (_H) and extrapolate with the
+        nd vectors in the DIIS subspace'''
+        self._update_H(self._head-1, nd)
+        return self._extrapolate(nd)
+
+    def _extrapolate(self, nd):
         h = self._H[:nd+1,:nd+1]
-        g = numpy.zeros(nd+1, x.dtype)
+        g = numpy.zeros(nd+1, h.dtype)
         g[0] = 1
 
         try:
@@ -226,17 +268,55 @@ class DIIS(object):
             c = numpy.dot(v[:,idx]*(1/w[idx]), numpy.dot(v[:,idx].T.conj(), g))
         logger.debug1(self, 'diis-c %s', c)
 
+        x0 = self.get_vec(0)
         if self._xprev is None:
-            xnew = numpy.zeros_like(x.ravel())
+            xnew = numpy.zeros(x0.shape, x0.dtype)
         else:
             self._xprev = None # release memory first
-            self._xprev = xnew = numpy.zeros_like(x.ravel())
+            self._xprev = xnew = numpy.zeros(x0.shape, x0.dtype)
 
         for i, ci in enumerate(c[1:]):
             xi = self.get_vec(i)
-            for p0,p1 in prange(0, x.size, BLOCK_SIZE):
+            for p0,p1 in prange(0, xnew.size, BLOCK_SIZE):
                 xnew[p0:p1] += xi[p0:p1] * ci
-        return xnew.reshape(x.shape)
+        return xnew
+
+    def restore(self, filename):
+        '''Read the vectors and error vectors saved in filename (given by the
+        attribute filename of an interrupted calculation) to restore the
+        DIIS subspace.  Returns the extrapolated vector, or None if the file
+        has no DIIS vectors.
+        '''
+        with h5py.File(filename, 'r') as fdiis:
+            if 'bookkeep' in fdiis.attrs:  # from the oldest to the latest
+                idx = list(fdiis.attrs['bookkeep'])
+            else:
+                idx = sorted([int(k[1:]) for k in fdiis.keys()
+                              if k[0] == 'x' and 'e'+k[1:] in fdiis])
+            if not idx:
+                return None
+            for i in idx:
+                self.push_err_vec(numpy.asarray(fdiis['e%d'%i]))
+                self.push_vec(numpy.asarray(fdiis['x%d'%i]))
+
+        nd = self.get_num_vec()
+        for k in range(nd):
+            self._update_H(k, nd)
+        xnew = self._extrapolate(nd)
+# Following calls of update(x) without the error vector generate the error
+# vector wrt the restored extrapolation
+        self._err_vec_touched = False
+        self._xprev = xnew
+        return xnew
+
+def _write_h5dat(fh5, key, value, bookkeep):
+    if key in fh5:
+        fh5[key][:] = value
+    else:
+        fh5[key] = value
+    fh5.attrs['bookkeep'] = bookkeep
+# to avoid "Unable to find a valid file signature" error when reopen from crash
+    fh5.flush()
 
 #class CDIIS
 #class EDIIS
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+HDF5 storage layout for the large integral arrays (MO integrals, Cholesky
+decomposed ERIs and the intermediates of the out-of-core transformations).
+
+The chunk shape of a dataset is derived from the way the consumer reads it.
+Most consumers (CCSD, MP2, DF-JK, the second pass of ao2mo) load the
+integrals in blocks of rows, e.g. ij-blocks of (ij|kl) or the aux-blocks of
+(L|ij).  A chunk then covers whole rows, so that a row block is read from a
+small number of contiguous chunks.
+
+Optional lossless compression (shuffle filter + lzf or gzip) and float32
+storage for the small intermediates can reduce the I/O volume, which is the
+bottleneck on the shared network scratch.
+'''
+
+import numpy
+
+# Target size of one chunk (in bytes).  HDF5 reads and decompresses whole
+# chunks, small chunks have large overhead in the metadata and the filters.
+CHUNK_BYTES = 1e6
+# Lossless compression filter for the integral datasets.  None to switch off.
+# 'lzf' is fast and always available in h5py.  'gzip' compresses better but
+# is several times slower.
+COMPRESSION = None
+# Compression level for 'gzip' (0 - 9)
+COMPRESSION_OPTS = None
+# Byte shuffle before compression.  It groups the exponent bytes of the
+# floating numbers, which often doubles the compression ratio.
+SHUFFLE = True
+# The intermediate blocks whose largest magnitude is below this threshold are
+# stored in float32.  The absolute rounding error is then less than
+# FLOAT32_THRESHOLD * 2**-24.  0 to always store float64.
+FLOAT32_THRESHOLD = 0
+
+def chunk_shape(shape, itemsize=8, access='row', blksize=None,
+                chunk_bytes=None):
+    '''Chunk shape for the given access pattern of the consumer.
+
+    Args:
+        shape : tuple
+            Dataset shape.  The leading dimensions of a 3D dataset (eg the
+            components of the integrals) get chunk size 1.
+
+    Kwargs:
+        access : str
+            'row' if the consumer reads blocks of rows, 'col' if it reads
+            blocks of columns.
+        blksize : int
+            The number of rows (or columns) the consumer reads at a time.
+            The chunks are fitted into the block when possible.
+
+    Returns:
+        A tuple for the chunks argument of h5py create_dataset, or None if the
+        dataset is empty.
+
+    Examples:
+
+    >>> chunk_shape((20000, 3000), access='row')
+    (41, 3000)
+    >>> chunk_shape((20000, 3000), access='col', blksize=100)
+    (20000, 6)
+    '''
+    if chunk_bytes is None:
+        chunk_bytes = CHUNK_BYTES
+    shape = tuple(shape)
+    if len(shape) == 0 or min(shape) == 0:
+        return None
+    if len(shape) == 1:
+        return (int(min(shape[0], max(1, chunk_bytes//itemsize))),)
+    nrow, ncol = shape[-2:]
+    if access == 'col':
+        chunks = chunk_shape((ncol,nrow), itemsize, 'row', blksize, chunk_bytes)
+        return (1,) * (len(shape)-2) + chunks[::-1]
+
+    words = max(1, int(chunk_bytes // itemsize))
+    if ncol > words:
+        # One row is larger than the chunk.  Split the columns.
+        return (1,) * (len(shape)-1) + (words,)
+    rows = max(1, min(nrow, words // ncol))
+    if blksize is not None and 0 < blksize < nrow:
+        # Evenly divide the blocks of the consumer
+        rows = min(rows, blksize)
+        rows = -(-blksize // (-(-blksize // rows)))
+    return (1,) * (len(shape)-2) + (int(rows), int(ncol))
+
+def create_dataset(h5group, key, shape, dtype='f8', access='row',
+                   blksize=None, chunks=None, data=None):
+    '''Create a dataset with the chunk shape of the given access pattern and
+    the compression filters of COMPRESSION and SHUFFLE.
+
+    Kwargs:
+        access, blksize :
+            See :func:`chunk_shape`
+        chunks : tuple
+            To overwrite the chunk shape
+        data : ndarray
+            To initialize the dataset
+    '''
+    dtype = numpy.dtype(dtype)
+    if chunks is None:
+        chunks = chunk_shape(shape, dtype.itemsize, access, blksize)
+    kwargs = {}
+    if COMPRESSION and chunks is not None:
+        kwargs['compression'] = COMPRESSION
+        if COMPRESSION_OPTS is not None:
+            kwargs['compression_opts'] = COMPRESSION_OPTS
+        kwargs['shuffle'] = SHUFFLE
+    return h5group.create_dataset(key, shape, dtype, data=data,
+                                  chunks=chunks, **kwargs)
+
+def block_dtype(dat):
+    '''Storage type of an intermediate block.  float32 if the magnitude of
+    the block is below FLOAT32_THRESHOLD, otherwise the type of the block.
+    '''
+    if (FLOAT32_THRESHOLD > 0 and dat.dtype == numpy.double and dat.size > 0
+        and abs(dat).max() < FLOAT32_THRESHOLD):
+        return numpy.float32
+    else:
+        return dat.dtype
+
+def store_block(h5group, key, dat, access='row', blksize=None):
+    '''Save an intermediate block.  It may be stored in float32, see
+    :func:`block_dtype`.  Reading the block into a float64 buffer (eg
+    buf[:] = dset[row0:row1]) restores the type.
+    '''
+    return create_dataset(h5group, key, dat.shape, block_dtype(dat), access,
+                          blksize, data=dat)
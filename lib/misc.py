@@ -52,6 +52,34 @@ def current_memory():
     else:
         return 0, 0
 
+def num_threads(n=None):
+    '''The max number of OpenMP threads of the calling thread.  If n is
+    given, the OpenMP threads of the calling thread are set to n and the
+    previous value is returned.'''
+    from pyscf.lib.numpy_helper import _np_helper
+    _np_helper.omp_get_max_threads.restype = ctypes.c_int
+    nthreads = _np_helper.omp_get_max_threads()
+    if n is not None:
+        _np_helper.omp_set_num_threads(ctypes.c_int(n))
+    return nthreads
+
+def blas_threads(n=None):
+    '''The number of threads of the BLAS library linked to the C libraries
+    (OpenBLAS or MKL), None if it cannot be queried.  If n is given, the
+    BLAS threads are set to n and the previous value is returned.  The
+    setting is global for all threads of the process.'''
+    from pyscf.lib.numpy_helper import _np_helper
+    for fget, fset in (('openblas_get_num_threads',
+                        'openblas_set_num_threads'),
+                       ('mkl_get_max_threads', 'mkl_set_num_threads')):
+        if hasattr(_np_helper, fget) and hasattr(_np_helper, fset):
+            getattr(_np_helper, fget).restype = ctypes.c_int
+            nthreads = getattr(_np_helper, fget)()
+            if n is not None:
+                getattr(_np_helper, fset)(ctypes.c_int(n))
+            return nthreads
+    return None
+
 def c_int_arr(m):
     npm = numpy.array(m).flatten('C')
     arr = (ctypes.c_int * npm.size)(*npm)
@@ -202,6 +230,31 @@ class quite_run(object):
         os.chdir(self.dirnow)
 
 
+class with_omp_threads(object):
+    '''Limit the OpenMP threads of the calling thread and the (process-wide)
+    BLAS threads to nthreads in the context.  Python threads which call the
+    OpenMP kernels concurrently should limit their own OpenMP threads with
+    num_threads, since the OpenMP setting is not inherited by new threads.
+
+    Examples
+    --------
+    with with_omp_threads(1):
+        ...
+    '''
+    def __init__(self, nthreads=1):
+        self.nthreads = nthreads
+        self.omp_threads = None
+        self.blas_threads = None
+    def __enter__(self):
+        self.omp_threads = num_threads(self.nthreads)
+        self.blas_threads = blas_threads(self.nthreads)
+        return self
+    def __exit__(self, type, value, traceback):
+        num_threads(self.omp_threads)
+        if self.blas_threads is not None:
+            blas_threads(self.blas_threads)
+
+
 # from pygeocoder
 # this decorator lets me use methods as both static and instance methods
 # In contrast to classmethod, when obj.function() is called, the first
@@ -2,8 +2,13 @@
 # Author: Qiming Sun <osirpt.sun@gmail.com>
 #
 
+import os
+import tempfile
+
 L_MAX      = 8
 MEMORY_MAX = 4000 # MB
+# Directory of the scratch files
+TMPDIR = os.environ.get('TMPDIR', tempfile.gettempdir())
 
 #LIGHTSPEED = 137.035 999 679 94    #http://physics.nist.gov/cgi-bin/cuu/Value?alph
 LIGHTSPEED = 137.0359895
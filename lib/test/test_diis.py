@@ -0,0 +1,63 @@
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import unittest
+import tempfile
+import numpy
+from pyscf import lib
+
+numpy.random.seed(1)
+xs = numpy.random.random((10,50))
+errs = numpy.random.random((10,50))
+
+def run_diis(adiis, with_err=True):
+    adiis.space = 5
+    xnew = []
+    for x, e in zip(xs, errs):
+        if with_err:
+            xnew.append(adiis.update(x, e))
+        else:
+            xnew.append(adiis.update(x))
+    return numpy.array(xnew)
+
+class KnowValues(unittest.TestCase):
+    def test_outcore(self):
+        ref = run_diis(lib.diis.DIIS())
+        adiis = lib.diis.DIIS()
+        adiis.max_memory = 0
+        self.assertTrue(numpy.allclose(run_diis(adiis), ref))
+        self.assertFalse(adiis._incore)
+
+        ref = run_diis(lib.diis.DIIS(), False)
+        adiis = lib.diis.DIIS()
+        adiis.max_memory = 0
+        self.assertTrue(numpy.allclose(run_diis(adiis, False), ref))
+
+    def test_restore(self):
+        ftmp = tempfile.NamedTemporaryFile()
+        adiis = lib.diis.DIIS(filename=ftmp.name)
+        adiis.space = 5
+        for x in xs[:8]:
+            xlast = adiis.update(x)
+        adiis._sync()
+
+        adiis1 = lib.diis.DIIS()
+        adiis1.space = 5
+        self.assertTrue(numpy.allclose(adiis1.restore(ftmp.name), xlast))
+        self.assertTrue(numpy.allclose(adiis1.update(xs[8]),
+                                       adiis.update(xs[8])))
+
+    def test_restore_empty(self):
+        ftmp = tempfile.NamedTemporaryFile()
+        lib.diis.DIIS(filename=ftmp.name)._diisfile.close()
+        adiis = lib.diis.DIIS()
+        self.assertTrue(adiis.restore(ftmp.name) is None)
+        self.assertTrue(adiis._xprev is None)
+        self.assertTrue(numpy.allclose(run_diis(adiis, False),
+                                       run_diis(lib.diis.DIIS(), False)))
+
+
+if __name__ == "__main__":
+    print("Full Tests for diis")
+    unittest.main()
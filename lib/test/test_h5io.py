@@ -0,0 +1,54 @@
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import unittest
+import tempfile
+import numpy
+import h5py
+from pyscf import lib
+from pyscf.lib import h5io
+
+class KnowValues(unittest.TestCase):
+    def test_chunk_shape(self):
+        self.assertEqual(h5io.chunk_shape((20000,3000)), (41,3000))
+        self.assertEqual(h5io.chunk_shape((20000,3000), access='col',
+                                          blksize=100), (20000,6))
+        self.assertEqual(h5io.chunk_shape((1000,10), blksize=160), (160,10))
+        self.assertEqual(h5io.chunk_shape((3,50,400000)), (1,1,125000))
+        self.assertEqual(h5io.chunk_shape((0,10)), None)
+
+    def test_compression(self):
+        ftmp = tempfile.NamedTemporaryFile()
+        numpy.random.seed(1)
+        dat = numpy.random.random((300,200)) * 1e-3
+        try:
+            h5io.COMPRESSION = 'lzf'
+            with h5py.File(ftmp.name, 'w') as f:
+                dset = h5io.create_dataset(f, 'x', dat.shape, data=dat)
+                self.assertEqual(dset.compression, 'lzf')
+                self.assertTrue(dset.shuffle)
+                self.assertTrue(numpy.array_equal(dset[:], dat))
+        finally:
+            h5io.COMPRESSION = None
+
+    def test_float32(self):
+        ftmp = tempfile.NamedTemporaryFile()
+        numpy.random.seed(1)
+        dat = numpy.random.random((300,200)) * 1e-3
+        try:
+            h5io.FLOAT32_THRESHOLD = 1e-2
+            with h5py.File(ftmp.name, 'w') as f:
+                dset = h5io.store_block(f, 'x', dat)
+                self.assertEqual(dset.dtype, numpy.float32)
+                buf = numpy.empty((10,200))
+                buf[:] = dset[5:15]
+                self.assertTrue(abs(buf-dat[5:15]).max() < 1e-2*2**-24)
+                dset = h5io.store_block(f, 'y', dat*100)
+                self.assertEqual(dset.dtype, numpy.double)
+        finally:
+            h5io.FLOAT32_THRESHOLD = 0
+
+if __name__ == "__main__":
+    print("Full Tests for h5io")
+    unittest.main()
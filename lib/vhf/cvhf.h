@@ -21,6 +21,9 @@ typedef struct CVHFOpt_struct {
     int (*r_vkscreen)(int *shls, struct CVHFOpt_struct *opt,
                       double **dms_cond, int n_dm, double *dm_at_least,
                       int *atm, int *bas, double *env);
+    int nbox;
+    int *pair_box;
+    char *box_near;
 } CVHFOpt;
 #endif
 
@@ -39,6 +39,7 @@ void CVHFdot_nrs1(int (*intor)(), void (**fjk)(), double **dms, double *vjk,
         double *pv;
         void (*pf)();
         int (*fprescreen)();
+        const char *pair_mask = envs->pair_mask;
 
         if (vhfopt) {
                 fprescreen = vhfopt->fprescreen;
@@ -51,6 +52,9 @@ void CVHFdot_nrs1(int (*intor)(), void (**fjk)(), double **dms, double *vjk,
 
         for (ksh = 0; ksh < envs->nbas; ksh++) {
         for (lsh = 0; lsh < envs->nbas; lsh++) {
+                if (pair_mask && !pair_mask[ksh*envs->nbas+lsh]) {
+                        continue;
+                }
                 k0 = ao_loc[ksh];
                 l0 = ao_loc[lsh];
                 k1 = ao_loc[ksh+1];
@@ -102,6 +106,7 @@ static void dot_nrs2sub(int (*intor)(), void (**fjk)(), double **dms, double *vj
         double *pv;
         void (*pf)();
         int (*fprescreen)();
+        const char *pair_mask = envs->pair_mask;
 
         if (vhfopt) {
                 fprescreen = vhfopt->fprescreen;
@@ -114,6 +119,9 @@ static void dot_nrs2sub(int (*intor)(), void (**fjk)(), double **dms, double *vj
 
         for (ksh = 0; ksh < envs->nbas; ksh++) {
         for (lsh = 0; lsh <= ksh; lsh++) {
+                if (pair_mask && !pair_mask[ksh*envs->nbas+lsh]) {
+                        continue;
+                }
                 k0 = ao_loc[ksh];
                 l0 = ao_loc[lsh];
                 k1 = ao_loc[ksh+1];
@@ -193,6 +201,7 @@ void CVHFdot_nrs8(int (*intor)(), void (**fjk)(), double **dms, double *vjk,
         double *pv;
         void (*pf)();
         int (*fprescreen)();
+        const char *pair_mask = envs->pair_mask;
 
         if (vhfopt) {
                 fprescreen = vhfopt->fprescreen;
@@ -213,6 +222,9 @@ void CVHFdot_nrs8(int (*intor)(), void (**fjk)(), double **dms, double *vjk,
                 if ((ksh == ish) && (lsh > jsh)) {
                         break;
                 }
+                if (pair_mask && !pair_mask[ksh*envs->nbas+lsh]) {
+                        continue;
+                }
                 k0 = ao_loc[ksh];
                 l0 = ao_loc[lsh];
                 k1 = ao_loc[ksh+1];
@@ -248,45 +260,267 @@ void CVHFdot_nrs8(int (*intor)(), void (**fjk)(), double **dms, double *vjk,
  * 
  * n_dm is the number of dms for one [array(ij|kl)],
  * ncomp is the number of components that produced by intor
+ *
+ * Each thread holds a private copy of vjk.  The caller (_vhf.direct_mapdm,
+ * _vhf.direct_bindm) splits the dms so that the copies fit in memory.
+ * Returns 0 on success, -1 if the buffers cannot be allocated.
  */
-void CVHFnr_direct_drv(int (*intor)(), void (*fdot)(), void (**fjk)(),
-                       double **dms, double *vjk,
-                       int n_dm, int ncomp, CINTOpt *cintopt, CVHFOpt *vhfopt,
-                       int *atm, int natm, int *bas, int nbas, double *env)
+int CVHFnr_direct_drv(int (*intor)(), void (*fdot)(), void (**fjk)(),
+                      double **dms, double *vjk,
+                      int n_dm, int ncomp, CINTOpt *cintopt, CVHFOpt *vhfopt,
+                      int *atm, int natm, int *bas, int nbas, double *env)
 {
         const int nao = CINTtot_cgto_spheric(bas, nbas);
+        const size_t nv = (size_t)nao * nao * n_dm * ncomp;
         double *v_priv;
-        int i, j, ij;
+        int i, j, ij, n, npair;
+        size_t k;
+        int failed = 0;
         int *ao_loc = malloc(sizeof(int)*(nbas+1));
+        int *ijlist = malloc(sizeof(int)*nbas*nbas);
+        char *pair_mask = malloc(sizeof(char)*nbas*nbas);
         struct _VHFEnvs envs = {natm, nbas, atm, bas, env, nao, ao_loc};
 
-        memset(vjk, 0, sizeof(double)*nao*nao*n_dm*ncomp);
+        if (ao_loc == NULL || ijlist == NULL || pair_mask == NULL) {
+                free(ao_loc);
+                free(ijlist);
+                free(pair_mask);
+                return -1;
+        }
+        memset(vjk, 0, sizeof(double)*nv);
         CINTshells_spheric_offset(ao_loc, bas, nbas);
         ao_loc[nbas] = nao;
+        npair = CVHFnr_significant_pairs(ijlist, pair_mask, vhfopt, nbas);
+        envs.pair_mask = pair_mask;
 
 #pragma omp parallel default(none) \
-        shared(intor, fdot, fjk, \
-               dms, vjk, n_dm, ncomp, nbas, cintopt, vhfopt, envs) \
-        private(ij, i, j, v_priv)
+        shared(intor, fdot, fjk, dms, vjk, n_dm, ncomp, nbas, \
+               cintopt, vhfopt, envs, ijlist, npair, failed) \
+        private(n, ij, i, j, k, v_priv)
         {
-                v_priv = malloc(sizeof(double)*nao*nao*n_dm*ncomp);
-                memset(v_priv, 0, sizeof(double)*nao*nao*n_dm*ncomp);
-#pragma omp for nowait schedule(dynamic, 2)
-                for (ij = 0; ij < nbas*nbas; ij++) {
-                        i = ij / nbas;
-                        j = ij - i * nbas;
-                        (*fdot)(intor, fjk, dms, v_priv, n_dm, ncomp, i, j,
-                                cintopt, vhfopt, &envs);
+                v_priv = malloc(sizeof(double)*nv);
+                if (v_priv == NULL) {
+#pragma omp atomic
+                        failed++;
                 }
+// all threads have to skip the worksharing loop together
+#pragma omp barrier
+                if (!failed) {
+                        memset(v_priv, 0, sizeof(double)*nv);
+#pragma omp for nowait schedule(dynamic, 2)
+                        for (n = 0; n < npair; n++) {
+                                ij = ijlist[n];
+                                i = ij / nbas;
+                                j = ij - i * nbas;
+                                (*fdot)(intor, fjk, dms, v_priv, n_dm, ncomp,
+                                        i, j, cintopt, vhfopt, &envs);
+                        }
 #pragma omp critical
-                {
-                        for (i = 0; i < nao*nao*n_dm*ncomp; i++) {
-                                vjk[i] += v_priv[i];
+                        {
+                                for (k = 0; k < nv; k++) {
+                                        vjk[k] += v_priv[k];
+                                }
                         }
                 }
                 free(v_priv);
         }
 
         free(ao_loc);
+        free(ijlist);
+        free(pair_mask);
+        if (failed) {
+                return -1;
+        }
+        return 0;
+}
+
+
+
+/*
+ * Batched J/K contraction for many density matrices.
+ *
+ * The density matrices and the J/K matrices are stored as dms[nao,nao,n_dm]
+ * and vjk[2,nao,nao,n_dm] so that the n_dm densities for the same AO pair
+ * are contiguous.  Each integral of the s8 shell quartet is evaluated once
+ * and scattered into all n_dm J and K matrices with contiguous axpy
+ * operations.  The outputs are J[k,l] = (ij|kl) D[j,i] and
+ * K[k,j] = (ij|kl) D[l,i] in s1 storage (no symmetrization needed).
+ */
+#define MDM(p, q)       (nao*(p)+(q))*n_dm
+
+static void mdm_axpy(double *v, double a, double *dm, int n_dm)
+{
+        int n;
+        for (n = 0; n < n_dm; n++) {
+                v[n] += a * dm[n];
+        }
+}
+
+/*
+ * sij, skl, spair indicate whether ish != jsh, ksh != lsh and
+ * (ish,jsh) != (ksh,lsh).  They determine which of the 8 permutations of
+ * the shell quartet are distinct.
+ */
+static void nrs8_mdm_jk(double *eri, double *dms, double *vj, double *vk,
+                        int n_dm, int i0, int i1, int j0, int j1,
+                        int k0, int k1, int l0, int l1, int nao,
+                        int sij, int skl, int spair)
+{
+        int i, j, k, l, ijkl;
+        double v;
+
+        ijkl = 0;
+        for (l = l0; l < l1; l++) {
+        for (k = k0; k < k1; k++) {
+        for (j = j0; j < j1; j++) {
+        for (i = i0; i < i1; i++, ijkl++) {
+                v = eri[ijkl];
+                if (v == 0) {
+                        continue;
+                }
+                // (ij|kl)
+                mdm_axpy(vj+MDM(k,l), v, dms+MDM(j,i), n_dm);
+                mdm_axpy(vk+MDM(k,j), v, dms+MDM(l,i), n_dm);
+                if (sij) { // (ji|kl)
+                        mdm_axpy(vj+MDM(k,l), v, dms+MDM(i,j), n_dm);
+                        mdm_axpy(vk+MDM(k,i), v, dms+MDM(l,j), n_dm);
+                }
+                if (skl) { // (ij|lk)
+                        mdm_axpy(vj+MDM(l,k), v, dms+MDM(j,i), n_dm);
+                        mdm_axpy(vk+MDM(l,j), v, dms+MDM(k,i), n_dm);
+                }
+                if (sij && skl) { // (ji|lk)
+                        mdm_axpy(vj+MDM(l,k), v, dms+MDM(i,j), n_dm);
+                        mdm_axpy(vk+MDM(l,i), v, dms+MDM(k,j), n_dm);
+                }
+                if (spair) {
+                        // (kl|ij)
+                        mdm_axpy(vj+MDM(i,j), v, dms+MDM(l,k), n_dm);
+                        mdm_axpy(vk+MDM(i,l), v, dms+MDM(j,k), n_dm);
+                        if (skl) { // (lk|ij)
+                                mdm_axpy(vj+MDM(i,j), v, dms+MDM(k,l), n_dm);
+                                mdm_axpy(vk+MDM(i,k), v, dms+MDM(j,l), n_dm);
+                        }
+                        if (sij) { // (kl|ji)
+                                mdm_axpy(vj+MDM(j,i), v, dms+MDM(l,k), n_dm);
+                                mdm_axpy(vk+MDM(j,l), v, dms+MDM(i,k), n_dm);
+                        }
+                        if (sij && skl) { // (lk|ji)
+                                mdm_axpy(vj+MDM(j,i), v, dms+MDM(k,l), n_dm);
+                                mdm_axpy(vk+MDM(j,k), v, dms+MDM(i,l), n_dm);
+                        }
+                }
+        } } } }
 }
 
+/*
+ * The integrals are screened with the combined dm_cond of vhfopt, which
+ * holds the max of all n_dm density matrices for each shell pair.
+ * Returns 0 on success, -1 if the buffers cannot be allocated.
+ */
+int CVHFnr_direct_mdm_drv(int (*intor)(), double *dms, double *vjk,
+                          int n_dm, CINTOpt *cintopt, CVHFOpt *vhfopt,
+                          int *atm, int natm, int *bas, int nbas, double *env)
+{
+        const int nao = CINTtot_cgto_spheric(bas, nbas);
+        const size_t nv = (size_t)nao * nao * n_dm;
+        int *ao_loc = malloc(sizeof(int)*(nbas+1));
+        int *ijlist = malloc(sizeof(int)*nbas*nbas);
+        char *pair_mask = malloc(sizeof(char)*nbas*nbas);
+        int (*fprescreen)();
+        int ish, dmax, npair;
+        int failed = 0;
+
+        if (ao_loc == NULL || ijlist == NULL || pair_mask == NULL) {
+                free(ao_loc);
+                free(ijlist);
+                free(pair_mask);
+                return -1;
+        }
+        if (vhfopt) {
+                fprescreen = vhfopt->fprescreen;
+        } else {
+                fprescreen = CVHFnoscreen;
+        }
+
+        memset(vjk, 0, sizeof(double)*nv*2);
+        CINTshells_spheric_offset(ao_loc, bas, nbas);
+        ao_loc[nbas] = nao;
+        dmax = 0;
+        for (ish = 0; ish < nbas; ish++) {
+                if (ao_loc[ish+1] - ao_loc[ish] > dmax) {
+                        dmax = ao_loc[ish+1] - ao_loc[ish];
+                }
+        }
+        npair = CVHFnr_significant_pairs(ijlist, pair_mask, vhfopt, nbas);
+
+#pragma omp parallel
+        {
+                int i, j, k, l, ij, ip;
+                int shls[4];
+                size_t n;
+                double *v_priv = malloc(sizeof(double)*nv*2);
+                double *buf = malloc(sizeof(double)*dmax*dmax*dmax*dmax);
+                if (v_priv == NULL || buf == NULL) {
+#pragma omp atomic
+                        failed++;
+                }
+// all threads have to skip the worksharing loop together
+#pragma omp barrier
+                if (!failed) {
+                        memset(v_priv, 0, sizeof(double)*nv*2);
+#pragma omp for nowait schedule(dynamic, 2)
+                        for (ip = 0; ip < npair; ip++) {
+                                ij = ijlist[ip];
+                                i = ij / nbas;
+                                j = ij - i * nbas;
+                                if (i < j) {
+                                        continue;
+                                }
+                                shls[0] = i;
+                                shls[1] = j;
+                                for (k = 0; k <= i; k++) {
+                                for (l = 0; l <= k; l++) {
+                                        if ((k == i) && (l > j)) {
+                                                break;
+                                        }
+                                        if (!pair_mask[k*nbas+l]) {
+                                                continue;
+                                        }
+                                        shls[2] = k;
+                                        shls[3] = l;
+                                        if ((*fprescreen)(shls, vhfopt,
+                                                          atm, bas, env)
+                                            && (*intor)(buf, shls, atm, natm,
+                                                        bas, nbas, env,
+                                                        cintopt)) {
+                                                nrs8_mdm_jk(buf, dms, v_priv,
+                                                            v_priv+nv, n_dm,
+                                                            ao_loc[i], ao_loc[i+1],
+                                                            ao_loc[j], ao_loc[j+1],
+                                                            ao_loc[k], ao_loc[k+1],
+                                                            ao_loc[l], ao_loc[l+1],
+                                                            nao, i != j, k != l,
+                                                            (i != k || j != l));
+                                        }
+                                } }
+                        }
+#pragma omp critical
+                        {
+                                for (n = 0; n < nv*2; n++) {
+                                        vjk[n] += v_priv[n];
+                                }
+                        }
+                }
+                free(buf);
+                free(v_priv);
+        }
+
+        free(ao_loc);
+        free(ijlist);
+        free(pair_mask);
+        if (failed) {
+                return -1;
+        }
+        return 0;
+}
@@ -16,6 +16,7 @@ struct _VHFEnvs {
         int *tao; // time reversal mappings, index start from 1
         CVHFOpt *vhfopt;
         CINTOpt *cintopt;
+        char *pair_mask; // nbas*nbas, 0 for negligible shell pairs
 };
 
 void CVHFdot_nrs1(int (*intor)(), void (**fjk)(), double **dms, double *vjk,
@@ -38,7 +39,11 @@ void CVHFdot_nrs8(int (*intor)(), void (**fjk)(), double **dms, double *vjk,
                   int n_dm, int ncomp, int ish, int jsh,
                   CINTOpt *cintopt, CVHFOpt *vhfopt, struct _VHFEnvs *envs);
 
-void CVHFnr_direct_drv(int (*intor)(), void (*fdot)(), void (**fjk)(),
-                       double **dms, double *vjk,
-                       int n_dm, int ncomp, CINTOpt *cintopt, CVHFOpt *vhfopt,
-                       int *atm, int natm, int *bas, int nbas, double *env);
+int CVHFnr_direct_drv(int (*intor)(), void (*fdot)(), void (**fjk)(),
+                      double **dms, double *vjk,
+                      int n_dm, int ncomp, CINTOpt *cintopt, CVHFOpt *vhfopt,
+                      int *atm, int natm, int *bas, int nbas, double *env);
+
+int CVHFnr_direct_mdm_drv(int (*intor)(), double *dms, double *vjk,
+                          int n_dm, CINTOpt *cintopt, CVHFOpt *vhfopt,
+                          int *atm, int natm, int *bas, int nbas, double *env);
@@ -639,6 +639,48 @@ void CVHFnrs8_incore_drv(double *eri, double *dmj, double *vj,
         }
 }
 
+/*
+ * Contract the rows [ij_start, ij_start+ij_count) of the 8-fold symmetric
+ * eri with the density matrices.  vj and vk are accumulated, not
+ * initialized.  Calling this function for consecutive blocks of rows reads
+ * eri sequentially, so that eri can be a memory-mapped file.
+ */
+void CVHFnrs8_incore_blk_drv(double *eri, double *dmj, double *vj,
+                             double *dmk, double *vk, int n,
+                             int ij_start, int ij_count,
+                             void (*const fvj)(), void (*const fvk)())
+{
+        const size_t ij0 = ij_start;
+        const size_t ij1 = ij_start + ij_count;
+
+#pragma omp parallel
+        {
+                int i, j;
+                size_t ij, off;
+                double *vj_priv = malloc(sizeof(double)*n*n);
+                double *vk_priv = malloc(sizeof(double)*n*n);
+                memset(vj_priv, 0, sizeof(double)*n*n);
+                memset(vk_priv, 0, sizeof(double)*n*n);
+#pragma omp for nowait schedule(dynamic, 4)
+                for (ij = ij0; ij < ij1; ij++) {
+                        i = (int)(sqrt(2*ij+.25) - .5 + 1e-7);
+                        j = ij - i*(i+1)/2;
+                        off = ij*(ij+1)/2;
+                        (*fvj)(eri+off, dmj, vj_priv, n, i, j);
+                        (*fvk)(eri+off, dmk, vk_priv, n, i, j);
+                }
+#pragma omp critical
+                {
+                        for (i = 0; i < n*n; i++) {
+                                vj[i] += vj_priv[i];
+                                vk[i] += vk_priv[i];
+                        }
+                }
+                free(vj_priv);
+                free(vk_priv);
+        }
+}
+
 void CVHFnrs4_incore_drv(double *eri, double *dmj, double *vj,
                          double *dmk, double *vk,
                          int n, void (*const fvj)(), void (*const fvk)())
@@ -11,6 +11,7 @@
 #include "optimizer.h"
 
 #define MAX(I,J)        ((I) > (J) ? (I) : (J))
+#define MIN(I,J)        ((I) < (J) ? (I) : (J))
 
 
 void CVHFinit_optimizer(CVHFOpt **opt, int *atm, int natm,
@@ -23,6 +24,9 @@ void CVHFinit_optimizer(CVHFOpt **opt, int *atm, int natm,
         opt0->dm_cond = NULL;
         opt0->fprescreen = &CVHFnoscreen;
         opt0->r_vkscreen = &CVHFr_vknoscreen;
+        opt0->nbox = 0;
+        opt0->pair_box = NULL;
+        opt0->box_near = NULL;
         *opt = opt0;
 }
 
@@ -33,11 +37,11 @@ void CVHFdel_optimizer(CVHFOpt **opt)
                 return;
         }
 
-        if (!opt0->q_cond) {
+        if (opt0->q_cond) {
                 free(opt0->q_cond);
                 opt0->q_cond = NULL;
         }
-        if (!opt0->dm_cond) {
+        if (opt0->dm_cond) {
                 free(opt0->dm_cond);
                 opt0->dm_cond = NULL;
         }
@@ -99,6 +103,24 @@ int CVHFnrs8_prescreen(int *shls, CVHFOpt *opt,
             || (  opt->dm_cond[i*n+l] > dmin);
 }
 
+/*
+ * Only the integrals between the shell pairs in near-field boxes are
+ * evaluated.  The far-field is handled by the multipole expansion (see
+ * pyscf.scf.fmmhf).  pair_box and box_near are owned by the caller.
+ */
+int CVHFnrs8_nf_prescreen(int *shls, CVHFOpt *opt,
+                          int *atm, int *bas, double *env)
+{
+        if (!opt) {
+                return 1;
+        }
+        int n = opt->nbas;
+        int bij = opt->pair_box[shls[0]*n+shls[1]];
+        int bkl = opt->pair_box[shls[2]*n+shls[3]];
+        return opt->box_near[bij*opt->nbox+bkl]
+            && CVHFnrs8_prescreen(shls, opt, atm, bas, env);
+}
+
 // return flag to decide whether transpose01324
 int CVHFr_vknoscreen(int *shls, CVHFOpt *opt,
                      double **dms_cond, int n_dm, double *dm_atleast,
@@ -122,6 +144,29 @@ double CVHFget_direct_scf_cutoff(CVHFOpt *opt)
 }
 
 
+static double nr_qcond(int ish, int jsh,
+                       int *atm, int natm, int *bas, int nbas, double *env)
+{
+        int di = CINTcgto_spheric(ish, bas);
+        int dj = CINTcgto_spheric(jsh, bas);
+        double *buf = (double *)malloc(sizeof(double) * di*dj*di*dj);
+        double qtmp = 0;
+        int i, j;
+        int shls[4];
+        shls[0] = ish;
+        shls[1] = jsh;
+        shls[2] = ish;
+        shls[3] = jsh;
+        if (0 != cint2e_sph(buf, shls, atm, natm, bas, nbas, env, NULL)) {
+                for (i = 0; i < di; i++) {
+                for (j = 0; j < dj; j++) {
+                        qtmp = MAX(qtmp, fabs(buf[i+di*j+di*dj*i+di*dj*di*j]));
+                } }
+        }
+        free(buf);
+        return 1./sqrt(qtmp);
+}
+
 void CVHFsetnr_direct_scf(CVHFOpt *opt, int *atm, int natm,
                           int *bas, int nbas, double *env)
 {
@@ -132,35 +177,53 @@ void CVHFsetnr_direct_scf(CVHFOpt *opt, int *atm, int natm,
         }
         opt->q_cond = (double *)malloc(sizeof(double) * nbas*nbas);
 
-        double *buf;
-        double qtmp;
-        int i, j, di, dj, ish, jsh;
-        int shls[4];
-        for (ish = 0; ish < nbas; ish++) {
-                di = CINTcgto_spheric(ish, bas);
-                for (jsh = 0; jsh <= ish; jsh++) {
-                        dj = CINTcgto_spheric(jsh, bas);
-                        buf = (double *)malloc(sizeof(double) * di*dj*di*dj);
-                        shls[0] = ish;
-                        shls[1] = jsh;
-                        shls[2] = ish;
-                        shls[3] = jsh;
-                        qtmp = 0;
-                        if (0 != cint2e_sph(buf, shls, atm, natm, bas, nbas, env, NULL)) {
-                                for (i = 0; i < di; i++) {
-                                for (j = 0; j < dj; j++) {
-                                        qtmp = MAX(qtmp, fabs(buf[i+di*j+di*dj*i+di*dj*di*j]));
-                                } }
-                        }
-                        qtmp = 1./sqrt(qtmp);
-                        opt->q_cond[ish*nbas+jsh] = qtmp;
-                        opt->q_cond[jsh*nbas+ish] = qtmp;
-                        free(buf);
+        int ij;
+#pragma omp parallel for schedule(dynamic, 4)
+        for (ij = 0; ij < nbas*(nbas+1)/2; ij++) {
+                int ish = (int)(sqrt(2*ij+.25) - .5 + 1e-7);
+                int jsh = ij - ish*(ish+1)/2;
+                double qtmp = nr_qcond(ish, jsh, atm, natm, bas, nbas, env);
+                opt->q_cond[ish*nbas+jsh] = qtmp;
+                opt->q_cond[jsh*nbas+ish] = qtmp;
+        }
+}
 
-                }
+/*
+ * Update the Schwarz conditions of the given shell pairs.  pairs[2*n] and
+ * pairs[2*n+1] are the two shell indices of the n-th pair.  opt->q_cond
+ * needs to be initialized with CVHFsetnr_direct_scf or CVHFset_q_cond.
+ */
+void CVHFsetnr_direct_scf_pairs(CVHFOpt *opt, int *pairs, int npair,
+                                int *atm, int natm, int *bas, int nbas,
+                                double *env)
+{
+        assert(opt->q_cond);
+        int n;
+#pragma omp parallel for schedule(dynamic, 4)
+        for (n = 0; n < npair; n++) {
+                int ish = pairs[n*2  ];
+                int jsh = pairs[n*2+1];
+                double qtmp = nr_qcond(ish, jsh, atm, natm, bas, nbas, env);
+                opt->q_cond[ish*nbas+jsh] = qtmp;
+                opt->q_cond[jsh*nbas+ish] = qtmp;
         }
 }
 
+void CVHFset_q_cond(CVHFOpt *opt, double *q_cond, int nbas)
+{
+        if (opt->q_cond) {
+                free(opt->q_cond);
+        }
+        opt->q_cond = (double *)malloc(sizeof(double) * nbas*nbas);
+        memcpy(opt->q_cond, q_cond, sizeof(double) * nbas*nbas);
+}
+
+void CVHFget_q_cond(CVHFOpt *opt, double *q_cond, int nbas)
+{
+        assert(opt->q_cond);
+        memcpy(q_cond, opt->q_cond, sizeof(double) * nbas*nbas);
+}
+
 void CVHFsetnr_direct_scf_dm(CVHFOpt *opt, double *dm, int nset,
                              int *atm, int natm, int *bas, int nbas, double *env)
 {
@@ -195,6 +258,51 @@ void CVHFsetnr_direct_scf_dm(CVHFOpt *opt, double *dm, int nset,
 }
 
 
+/*
+ * Shell pairs which may produce integrals above the cutoff of
+ * CVHFnrs8_prescreen.  A pair ij is negligible if even the largest integral
+ * (ij|kl) contracted with the largest density matrix element is below the
+ * cutoff.  The screening on ij is symmetric to the screening on kl, so any
+ * shell quartet which involves a negligible pair is skipped by
+ * CVHFnrs8_prescreen (and CVHFnrs8_nf_prescreen).  On return, mask[i*nbas+j] = 1 for significant pairs,
+ * ijlist holds the significant pairs i*nbas+j, and the number of significant
+ * pairs is returned.  If the density based screening is not used, all pairs
+ * are significant.
+ */
+int CVHFnr_significant_pairs(int *ijlist, char *mask, CVHFOpt *opt, int nbas)
+{
+        int ij, npair;
+        if (!opt || !opt->q_cond || !opt->dm_cond ||
+            (opt->fprescreen != &CVHFnrs8_prescreen &&
+             opt->fprescreen != &CVHFnrs8_nf_prescreen)) {
+                for (ij = 0; ij < nbas*nbas; ij++) {
+                        ijlist[ij] = ij;
+                        mask[ij] = 1;
+                }
+                return nbas*nbas;
+        }
+
+        double qmin = opt->q_cond[0];
+        double dmax = 0;
+        for (ij = 0; ij < nbas*nbas; ij++) {
+                qmin = MIN(qmin, opt->q_cond[ij]);
+                dmax = MAX(dmax, opt->dm_cond[ij]);
+        }
+        const double cutoff = opt->direct_scf_cutoff * qmin;
+
+        npair = 0;
+        for (ij = 0; ij < nbas*nbas; ij++) {
+                if (4*dmax > cutoff * opt->q_cond[ij]) {
+                        mask[ij] = 1;
+                        ijlist[npair] = ij;
+                        npair++;
+                } else {
+                        mask[ij] = 0;
+                }
+        }
+        return npair;
+}
+
 
 /*
  *************************************************
@@ -15,6 +15,10 @@ typedef struct CVHFOpt_struct {
     int (*r_vkscreen)(int *shls, struct CVHFOpt_struct *opt,
                       double **dms_cond, int n_dm, double *dm_atleast,
                       int *atm, int *bas, double *env);
+    // near-field screening of multipole accelerated J: box_near[box_ij*nbox+box_kl]
+    int nbox;
+    int *pair_box;
+    char *box_near;
 } CVHFOpt;
 #endif
 
@@ -30,14 +34,24 @@ int CVHFnr_schwarz_cond(int *shls, CVHFOpt *opt,
 int CVHFnrs8_prescreen(int *shls, CVHFOpt *opt,
                        int *atm, int *bas, double *env);
 
+int CVHFnrs8_nf_prescreen(int *shls, CVHFOpt *opt,
+                          int *atm, int *bas, double *env);
+
 int CVHFr_vknoscreen(int *shls, CVHFOpt *opt,
                      double **dms_cond, int n_dm, double *dm_atleast,
                      int *atm, int *bas, double *env);
 
 void CVHFsetnr_direct_scf(CVHFOpt *opt, int *atm, int natm,
                           int *bas, int nbas, double *env);
+void CVHFsetnr_direct_scf_pairs(CVHFOpt *opt, int *pairs, int npair,
+                                int *atm, int natm, int *bas, int nbas,
+                                double *env);
+void CVHFset_q_cond(CVHFOpt *opt, double *q_cond, int nbas);
+void CVHFget_q_cond(CVHFOpt *opt, double *q_cond, int nbas);
 void CVHFsetnr_direct_scf_dm(CVHFOpt *opt, double *dm, int nset,
                              int *atm, int natm, int *bas, int nbas, double *env);
 
+int CVHFnr_significant_pairs(int *ijlist, char *mask, CVHFOpt *opt, int nbas);
+
 void CVHFnr_optimizer(CVHFOpt **vhfopt, int *atm, int natm,
                       int *bas, int nbas, double *env);
@@ -494,7 +494,8 @@ class CASCI(object):
                 eri = pyscf.ao2mo.incore.full(self._scf._eri, mo_coeff)
             else:
                 eri = pyscf.ao2mo.outcore.full_iofree(self.mol, mo_coeff,
-                                                      verbose=self.verbose)
+                                                      verbose=self.verbose,
+                                                      max_memory=self.max_memory)
         return eri
 
     def get_h1cas(self, mo_coeff=None, ncas=None, ncore=None):
@@ -59,10 +59,14 @@ def density_fit(casscf, auxbasis='weigend'):
             #self.grad_update_dep = 0
             if hasattr(self._scf, '_cderi') and self._scf.auxbasis == auxbasis:
                 self._cderi = self._scf._cderi
+# Share the DF object, the integrals are generated only once if neither of
+# the mean-field and CASSCF has generated them.
+                self.with_df = getattr(self._scf, 'with_df', None)
             else:
                 self._cderi = None
+                self.with_df = None
             self._naoaux = None
-            self._keys = self._keys.union(['auxbasis'])
+            self._keys = self._keys.union(['auxbasis', 'with_df'])
 
         def ao2mo(self, mo):
             return ao2mo_(self, mo)
@@ -269,8 +269,8 @@ class _ERIS(object):
             (mem_incore+mem_now < casscf.max_memory*.9) or
             mol.incore_anyway):
             if eri is None:
-                from pyscf.scf import _vhf
-                eri = _vhf.int2e_sph(mol._atm, mol._bas, mol._env)
+                from pyscf.scf import eri_cache
+                eri = eri_cache.get_eri(mol)
             self.j_pc, self.k_pc, self.ppaa, self.papa = \
                     trans_e1_incore(eri, mo, casscf.ncore, casscf.ncas)
         else:
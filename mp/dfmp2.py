@@ -12,6 +12,7 @@ import numpy
 from pyscf import lib
 from pyscf.lib import logger
 from pyscf import df
+from pyscf.scf import dfhf
 
 
 # the MO integral for MP2 is (ov|ov). The most efficient integral
@@ -58,6 +59,8 @@ class MP2(object):
             self.auxbasis = mf.auxbasis
         else:
             self.auxbasis = 'weigend'
+# The DF object of the DF mean-field is reused if auxbasis is not changed
+        self.with_df = getattr(mf, 'with_df', None)
         self._cderi = None
         self.ioblk = 256
 
@@ -82,11 +85,18 @@ class MP2(object):
     def ao2mo(self, mo_coeff, nocc):
         time0 = (time.clock(), time.time())
         log = logger.Logger(self.stdout, self.verbose)
-        cderi_file = tempfile.NamedTemporaryFile()
-        df.outcore.general(self.mol, (mo_coeff[:,:nocc], mo_coeff[:,nocc:]),
-                           cderi_file.name, auxbasis=self.auxbasis, verbose=log)
+        with_df = dfhf.get_df(self).build()
+
+        nvir = mo_coeff.shape[1] - nocc
+        mo_pair = (mo_coeff[:,:nocc], mo_coeff[:,nocc:])
+        if (with_df.get_naoaux()*nocc*nvir*8/1e6+lib.current_memory()[0]
+            < self.max_memory*.8):
+            fov = with_df.ao2mo(mo_pair, compact=False)
+        else:
+            fov = tempfile.NamedTemporaryFile()
+            with_df.ao2mo(mo_pair, compact=False, erifile=fov.name)
         time1 = log.timer('Integral transformation (P|ia)', *time0)
-        return df.load(cderi_file)
+        return df.load(fov)
 
 def prange(start, end, step):
     for i in range(start, end, step):
@@ -29,17 +29,38 @@ def kernel(mp, mo_energy, mo_coeff, verbose=logger.NOTE):
     t2 = numpy.empty((nocc,nocc,nvir,nvir))
     emp2 = 0
 
-    with mp.ao2mo(mo_coeff) as ovov:
-        for i in range(nocc):
-            gi = numpy.asarray(ovov[i*nvir:(i+1)*nvir])
-            gi = gi.reshape(nvir,nocc,nvir).transpose(1,0,2)
-            t2[i] = gi/pyscf.lib.direct_sum('jb+a->jba', eia, eia[i])
-            # 2*ijab-ijba
-            theta = gi*2 - gi.transpose(0,2,1)
-            emp2 += numpy.einsum('jab,jab', t2[i], theta)
+    for i, gi in _ovov_iter(mp, mo_coeff):
+        gi = gi.reshape(nvir,nocc,nvir).transpose(1,0,2)
+        t2[i] = gi/pyscf.lib.direct_sum('jb+a->jba', eia, eia[i])
+        # 2*ijab-ijba
+        theta = gi*2 - gi.transpose(0,2,1)
+        emp2 += numpy.einsum('jab,jab', t2[i], theta)
 
     return emp2, t2
 
+def _ovov_iter(mp, mo_coeff):
+    '''Yield i, (ia|jb) of the i-th occupied orbital as the array [nvir,nocc*nvir].
+    If mp.iofree is set, the integrals are computed on the fly in blocks of i
+    by ao2mo.outcore.general_iter, without any temporary file.
+    '''
+    nocc = mp.nocc
+    nvir = mp.nmo - nocc
+    if mp.iofree:
+        co = mo_coeff[:,:nocc]
+        cv = mo_coeff[:,nocc:]
+        mem_basic = _mem_usage(nocc, nvir)[2]
+        mem_now = pyscf.lib.current_memory()[0]
+        max_memory = max(2000, mp.max_memory*.9-mem_now) - mem_basic
+        for ij0, ij1, eri in ao2mo.outcore.general_iter(mp.mol, (co,cv,co,cv),
+                                                        max_memory=max_memory,
+                                                        verbose=mp.verbose):
+            for i in range(ij0//nvir, ij1//nvir):
+                yield i, eri[i*nvir-ij0:(i+1)*nvir-ij0]
+    else:
+        with mp.ao2mo(mo_coeff) as ovov:
+            for i in range(nocc):
+                yield i, numpy.asarray(ovov[i*nvir:(i+1)*nvir])
+
 # Need less memory
 def make_rdm1_ao(mp, mo_energy, mo_coeff, verbose=logger.NOTE):
     nmo = mp.nmo
@@ -49,21 +70,19 @@ def make_rdm1_ao(mp, mo_energy, mo_coeff, verbose=logger.NOTE):
     dm1vir = numpy.zeros((nvir,nvir))
     eia = mo_energy[:nocc,None] - mo_energy[None,nocc:]
     emp2 = 0
-    with mp.ao2mo(mo_coeff) as ovov:
-        for i in range(nocc):
-            dajb = (eia[i].reshape(-1,1) +
-                    eia.reshape(1,-1)).reshape(nvir,nocc,nvir)
-            gi = numpy.asarray(ovov[i*nvir:(i+1)*nvir])
-            gi = gi.reshape(nvir,nocc,nvir).transpose(1,0,2)
-            t2i = (gi/dajb.transpose(1,0,2)).reshape(nocc,nvir,nvir)
-            # 2*ijab-ijba
-            theta = gi*2 - gi.transpose(0,2,1)
-            emp2 += numpy.einsum('jab,jab', t2i, theta)
-
-            dm1vir += numpy.einsum('jca,jcb->ab', t2i, t2i) * 2 \
-                    - numpy.einsum('jca,jbc->ab', t2i, t2i)
-            dm1occ += numpy.einsum('iab,jab->ij', t2i, t2i) * 2 \
-                    - numpy.einsum('iab,jba->ij', t2i, t2i)
+    for i, gi in _ovov_iter(mp, mo_coeff):
+        dajb = (eia[i].reshape(-1,1) +
+                eia.reshape(1,-1)).reshape(nvir,nocc,nvir)
+        gi = gi.reshape(nvir,nocc,nvir).transpose(1,0,2)
+        t2i = (gi/dajb.transpose(1,0,2)).reshape(nocc,nvir,nvir)
+        # 2*ijab-ijba
+        theta = gi*2 - gi.transpose(0,2,1)
+        emp2 += numpy.einsum('jab,jab', t2i, theta)
+
+        dm1vir += numpy.einsum('jca,jcb->ab', t2i, t2i) * 2 \
+                - numpy.einsum('jca,jbc->ab', t2i, t2i)
+        dm1occ += numpy.einsum('iab,jab->ij', t2i, t2i) * 2 \
+                - numpy.einsum('iab,jba->ij', t2i, t2i)
 
     rdm1 = numpy.zeros((nmo,nmo))
 # *2 for beta electron
@@ -120,6 +139,9 @@ class MP2(object):
         self.verbose = self.mol.verbose
         self.stdout = self.mol.stdout
         self.max_memory = mf.max_memory
+# If iofree is set, (ia|jb) are generated on the fly in blocks and consumed
+# immediately.  No temporary file is created.
+        self.iofree = False
 
         self.nocc = self.mol.nelectron // 2
         self.nmo = len(mf.mo_energy)
@@ -158,8 +180,8 @@ class MP2(object):
             mem_incore+mem_now < self.max_memory or
             self.mol.incore_anyway):
             if self._scf._eri is None:
-                from pyscf.scf import _vhf
-                eri = _vhf.int2e_sph(mol._atm, mol._bas, mol._env)
+                from pyscf.scf import eri_cache
+                eri = eri_cache.get_eri(self.mol)
             else:
                 eri = self._scf._eri
             eri = ao2mo.incore.general(eri, (co,cv,co,cv))
@@ -223,6 +245,8 @@ if __name__ == '__main__':
     print('incore', numpy.allclose(t2, t2ref0))
     pt.max_memory = 1
     print('direct', numpy.allclose(pt.kernel()[1], t2ref0))
+    pt.iofree = True
+    print('iofree', numpy.allclose(pt.kernel()[1], t2ref0))
 
     rdm1 = make_rdm1_ao(pt, mf.mo_energy, mf.mo_coeff)
     print(numpy.allclose(reduce(numpy.dot, (mf.mo_coeff, pt.make_rdm1(),
@@ -48,6 +48,27 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(e, -0.20401996728747132, 11)
         self.assertAlmostEqual(numpy.linalg.norm(t2), 0.19379397642098622, 9)
 
+    def test_mp2_iofree(self):
+        # _ovov_iter takes at least 2000 MB.  Pass a small max_memory to
+        # general_iter so that the integrals are generated in several slabs
+        general_iter = ao2mo.outcore.general_iter
+        slabs = []
+        def small_iter(mol, mo_coeffs, **kwargs):
+            kwargs['max_memory'] = .05
+            for ij0, ij1, eri in general_iter(mol, mo_coeffs, **kwargs):
+                slabs.append((ij0, ij1))
+                yield ij0, ij1, eri
+        pt = mp.mp2.MP2(mf)
+        pt.iofree = True
+        try:
+            ao2mo.outcore.general_iter = small_iter
+            e, t2 = pt.kernel()
+        finally:
+            ao2mo.outcore.general_iter = general_iter
+        self.assertTrue(len(slabs) > 1)
+        self.assertAlmostEqual(e, -0.20401996728747132, 11)
+        self.assertAlmostEqual(numpy.linalg.norm(t2), 0.19379397642098622, 9)
+
     def test_mp2_dm(self):
         nocc = mol.nelectron//2
         nmo = mf.mo_energy.size
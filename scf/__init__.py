@@ -29,6 +29,8 @@ to control the SCF method.
         Default is 'minao'
     DIIS : class listed in :mod:`scf.diis`
         Default is :class:`diis.SCF_DIIS`. Set it to None/False to turn off DIIS.
+        :class:`diis.EDIIS` or :class:`diis.ADIIS` may converge faster
+        for difficult systems.
     diis : bool
         whether to do DIIS.  Default is True.
     diis_space : int
@@ -65,6 +67,22 @@ to control the SCF method.
 
         Density fitting can be applied to all non-relativistic HF class.
 
+    cosx_grids : Grids, for seminumerical exchange SCF only
+        Mesh grids to evaluate the exchange matrix.  It is effective when the
+        SCF class is decorated by :func:`cosx`::
+
+        >>> mf = scf.cosx(dft.RKS(mol))
+        >>> mf.scf()
+
+    fmm_theta, fmm_order : for multipole accelerated J matrix only
+        Well-separated parameter and the max order of the multipole
+        expansion.  They are effective when the SCF class is decorated by
+        :func:`fmm`::
+
+        >>> mf = scf.fmm(dft.RKS(mol))
+        >>> mf.fmm_order = 12
+        >>> mf.scf()
+
     with_ssss : bool, for Dirac-Hartree-Fock only
         If False, ignore small component integrals (SS|SS).  Default is True.
     with_gaunt : bool, for Dirac-Hartree-Fock only
@@ -94,6 +112,7 @@ from pyscf.scf import uhf
 from pyscf.scf import uhf_symm
 from pyscf.scf import dhf
 from pyscf.scf import chkfile
+from pyscf.scf import eri_cache
 from pyscf.scf import addons
 from pyscf.scf.uhf import spin_square
 from pyscf.scf.hf import get_init_guess
@@ -101,6 +120,7 @@ from pyscf.scf.addons import *
 from pyscf.scf import x2c
 from pyscf.scf.x2c import sfx2c1e, sfx2c
 from pyscf.scf import newton_ah
+from pyscf.scf.batch import run_batch
 
 
 
@@ -157,8 +177,14 @@ def DHF(mol, *args):
 def X2C(mol, *args):
     return x2c.UHF(mol, *args)
 
-def density_fit(mf, auxbasis='weigend'):
-    return mf.density_fit(auxbasis)
+def density_fit(mf, auxbasis='weigend', with_df=None):
+    return mf.density_fit(auxbasis, with_df)
+
+def cosx(mf, grids=None):
+    return mf.cosx(grids)
+
+def fmm(mf, theta=None, order=None):
+    return mf.fmm(theta, order)
 
 def newton(mf):
     '''augmented hessian for Newton Raphson'''
@@ -175,6 +201,7 @@ def fast_newton(mf, mo_coeff=None, mo_occ=None, dm0=None):
         if mf0.level_shift == 0:
             mf0.level_shift = .2
         mf0.kernel()
+        mf1.with_df = mf0.with_df
         mf1._cderi = mf0._cderi
         mf1._naoaux = mf0._naoaux
         mo_coeff, mo_occ = mf0.mo_coeff, mf0.mo_occ
@@ -5,6 +5,7 @@ import ctypes
 import _ctypes
 import numpy
 import pyscf.lib
+from pyscf.gto.mole import PTR_COORD, CHARGE_OF, ATOM_OF
 
 libcvhf = pyscf.lib.load_library('libcvhf')
 def _fpointer(name):
@@ -43,11 +44,14 @@ class VHFOpt(object):
         self._this.contents.fprescreen = _fpointer(prescreen)
 
         if prescreen != 'CVHFnoscreen':
-            fsetqcond = getattr(libcvhf, qcondname)
-            fsetqcond(self._this,
-                      c_atm.ctypes.data_as(ctypes.c_void_p), natm,
-                      c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
-                      c_env.ctypes.data_as(ctypes.c_void_p))
+            if qcondname in _QCOND_PAIRS and SCHWARZ_CACHE_SIZE > 0:
+                _set_cached_qcond(self._this, qcondname, c_atm, c_bas, c_env)
+            else:
+                fsetqcond = getattr(libcvhf, qcondname)
+                fsetqcond(self._this,
+                          c_atm.ctypes.data_as(ctypes.c_void_p), natm,
+                          c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
+                          c_env.ctypes.data_as(ctypes.c_void_p))
 
     @property
     def direct_scf_tol(self):
@@ -75,6 +79,77 @@ class VHFOpt(object):
                    c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
                    c_env.ctypes.data_as(ctypes.c_void_p))
 
+################################################
+# Cache of the Schwarz conditions (q_cond)
+#
+# The Schwarz condition of a shell pair only depends on the basis functions
+# of the two shells and their relative position.  The tables of the recently
+# used basis sets are cached.  When a new VHFOpt is created for a molecule
+# with the same basis, the cached table is reused for all shell pairs whose
+# relative position changed by less than SCHWARZ_REUSE_TOL (in Bohr).  Only
+# the other shell pairs are recomputed.  This saves the Schwarz integrals
+# for the SCF objects of the same molecule and for the small geometry steps
+# of geometry optimization and potential energy scan.
+################################################
+# Number of tables to keep.  0 to switch off the cache
+SCHWARZ_CACHE_SIZE = 4
+SCHWARZ_REUSE_TOL = 1e-3
+# qcondname -> the function to update q_cond for given shell pairs
+_QCOND_PAIRS = {'CVHFsetnr_direct_scf': 'CVHFsetnr_direct_scf_pairs'}
+# [(key, atom-pair vectors of the cached q_cond, q_cond)], recent one first
+_schwarz_cache = []
+
+def _set_cached_qcond(opt, qcondname, atm, bas, env):
+    natm = atm.shape[0]
+    nbas = bas.shape[0]
+    ptr_coord = atm[:,PTR_COORD]
+    coords = numpy.asarray([env[p:p+3] for p in ptr_coord]).reshape(natm,3)
+    rvec = coords.reshape(-1,1,3) - coords
+    env1 = env.copy()
+    for p in ptr_coord:
+        env1[p:p+3] = 0
+    key = (qcondname, atm[:,CHARGE_OF].tobytes(), bas.tobytes(), env1.tobytes())
+
+    for i, entry in enumerate(_schwarz_cache):
+        if entry[0] == key:
+            rvec0, q_cond = entry[1:]
+            _schwarz_cache.pop(i)
+            break
+    else:
+        q_cond = None
+
+    c_atm = atm.ctypes.data_as(ctypes.c_void_p)
+    c_bas = bas.ctypes.data_as(ctypes.c_void_p)
+    c_env = env.ctypes.data_as(ctypes.c_void_p)
+    if q_cond is None:
+        getattr(libcvhf, qcondname)(opt, c_atm, ctypes.c_int(natm),
+                                    c_bas, ctypes.c_int(nbas), c_env)
+        q_cond = numpy.empty((nbas,nbas))
+        rvec0 = rvec
+    else:
+        libcvhf.CVHFset_q_cond(opt, q_cond.ctypes.data_as(ctypes.c_void_p),
+                               ctypes.c_int(nbas))
+        moved = numpy.linalg.norm(rvec-rvec0, axis=2) > SCHWARZ_REUSE_TOL
+        if moved.any():
+            atm_of = bas[:,ATOM_OF]
+            mask = numpy.tril(moved[atm_of[:,None],atm_of])
+            pairs = numpy.asarray(numpy.argwhere(mask), dtype=numpy.int32, order='C')
+            getattr(libcvhf, _QCOND_PAIRS[qcondname])(
+                opt, pairs.ctypes.data_as(ctypes.c_void_p),
+                ctypes.c_int(len(pairs)),
+                c_atm, ctypes.c_int(natm), c_bas, ctypes.c_int(nbas), c_env)
+            rvec0 = rvec0.copy()
+            rvec0[moved] = rvec[moved]
+    libcvhf.CVHFget_q_cond(opt, q_cond.ctypes.data_as(ctypes.c_void_p),
+                           ctypes.c_int(nbas))
+
+    _schwarz_cache.insert(0, (key, rvec0, q_cond))
+    del(_schwarz_cache[SCHWARZ_CACHE_SIZE:])
+
+def clear_schwarz_cache():
+    del(_schwarz_cache[:])
+
+
 class _CVHFOpt(ctypes.Structure):
     _fields_ = [('nbas', ctypes.c_int),
                 ('_padding', ctypes.c_int),
@@ -82,7 +157,10 @@ class _CVHFOpt(ctypes.Structure):
                 ('q_cond', ctypes.c_void_p),
                 ('dm_cond', ctypes.c_void_p),
                 ('fprescreen', ctypes.c_void_p),
-                ('r_vkscreen', ctypes.c_void_p)]
+                ('r_vkscreen', ctypes.c_void_p),
+                ('nbox', ctypes.c_int),
+                ('pair_box', ctypes.c_void_p),
+                ('box_near', ctypes.c_void_p)]
 
 def make_cintopt(atm, bas, env, intor):
     c_atm = numpy.asarray(atm, dtype=numpy.int32, order='C')
@@ -104,7 +182,11 @@ def make_cintopt(atm, bas, env, intor):
 # hermi = 1 : hermitian
 # hermi = 2 : anti-hermitian
 ################################################
+# Number of integrals to read in each block when eri is a numpy.memmap
+MMAP_BLKSIZE = 4000000
+
 def incore(eri, dm, hermi=0):
+    mmap = isinstance(eri, numpy.memmap)
     eri = numpy.ascontiguousarray(eri)
     dm = numpy.ascontiguousarray(dm)
     nao = dm.shape[0]
@@ -137,12 +219,15 @@ def incore(eri, dm, hermi=0):
     else:
         raise RuntimeError('Array shape not consistent: DM %s, eri %s'
                            % (dm.shape, eri.shape))
-    fdrv(eri.ctypes.data_as(ctypes.c_void_p),
-         tridm.ctypes.data_as(ctypes.c_void_p),
-         vj.ctypes.data_as(ctypes.c_void_p),
-         dm.ctypes.data_as(ctypes.c_void_p),
-         vk.ctypes.data_as(ctypes.c_void_p),
-         ctypes.c_int(nao), fvj, fvk)
+    if mmap and eri.ndim == 1:
+        _incore_s8_blocks(eri, tridm, vj, dm, vk, nao, fvj, fvk)
+    else:
+        fdrv(eri.ctypes.data_as(ctypes.c_void_p),
+             tridm.ctypes.data_as(ctypes.c_void_p),
+             vj.ctypes.data_as(ctypes.c_void_p),
+             dm.ctypes.data_as(ctypes.c_void_p),
+             vk.ctypes.data_as(ctypes.c_void_p),
+             ctypes.c_int(nao), fvj, fvk)
     if hermi != 0:
         vj = pyscf.lib.hermi_triu_(vj, hermi)
         vk = pyscf.lib.hermi_triu_(vk, hermi)
@@ -150,9 +235,49 @@ def incore(eri, dm, hermi=0):
         vj = pyscf.lib.hermi_triu_(vj, 1)
     return vj, vk
 
+# Read the memory-mapped 8-fold symmetric eri sequentially, about
+# MMAP_BLKSIZE integrals at a time, and let the OS page cache decide what
+# stays in memory.
+def _incore_s8_blocks(eri, tridm, vj, dm, vk, nao, fvj, fvk):
+    fdrv = getattr(libcvhf, 'CVHFnrs8_incore_blk_drv')
+    npair = nao*(nao+1)//2
+    vj[:] = 0
+    vk[:] = 0
+    ij0 = 0
+    while ij0 < npair:
+# row ij of eri has ij+1 elements
+        ij1 = int(numpy.sqrt(ij0*(ij0+1)+2*MMAP_BLKSIZE+.25) - .5)
+        ij1 = min(max(ij1, ij0+1), npair)
+        fdrv(eri.ctypes.data_as(ctypes.c_void_p),
+             tridm.ctypes.data_as(ctypes.c_void_p),
+             vj.ctypes.data_as(ctypes.c_void_p),
+             dm.ctypes.data_as(ctypes.c_void_p),
+             vk.ctypes.data_as(ctypes.c_void_p),
+             ctypes.c_int(nao), ctypes.c_int(ij0), ctypes.c_int(ij1-ij0),
+             fvj, fvk)
+        ij0 = ij1
+
+# The C drivers hold a private copy of the J/K matrices in each OpenMP thread.
+# The number of density matrices passed to the drivers in one call is chosen
+# so that the copies (plus the output) fit in max_memory (MB).
+def _dm_blksize(nao, nvs_per_dm, max_memory=None):
+    if max_memory is None:
+        max_memory = pyscf.lib.parameters.MEMORY_MAX
+    libcvhf.omp_get_max_threads.restype = ctypes.c_int
+    nthreads = libcvhf.omp_get_max_threads()
+    mem_avail = max_memory - pyscf.lib.current_memory()[0]
+    unit = nao * nao * nvs_per_dm * 8e-6 * (nthreads+1)
+    return max(1, int(mem_avail/unit))
+
+def _check_status(status):
+    if status != 0:
+        raise MemoryError('Not enough memory for the thread-private J/K '
+                          'buffers.  Reduce max_memory or the number of '
+                          'OpenMP threads')
+
 # use cint2e_sph as cintor, CVHFnrs8_ij_s2kl, CVHFnrs8_jk_s2il as fjk to call
 # direct_mapdm
-def direct(dms, atm, bas, env, vhfopt=None, hermi=0):
+def direct(dms, atm, bas, env, vhfopt=None, hermi=0, max_memory=None):
     c_atm = numpy.asarray(atm, dtype=numpy.int32, order='C')
     c_bas = numpy.asarray(bas, dtype=numpy.int32, order='C')
     c_env = numpy.asarray(env, dtype=numpy.double, order='C')
@@ -168,6 +293,13 @@ def direct(dms, atm, bas, env, vhfopt=None, hermi=0):
         nao = dms[0].shape[0]
         dms = numpy.asarray(dms, order='C')
 
+    blksize = _dm_blksize(nao, 2, max_memory)
+    if n_dm > blksize:
+        vjk = [direct(dms[p0:p1], atm, bas, env, vhfopt, hermi, max_memory)
+               .reshape(2,-1,nao,nao)
+               for p0, p1 in pyscf.lib.prange(0, n_dm, blksize)]
+        return numpy.concatenate(vjk, axis=1)
+
     if vhfopt is None:
         cintor = _fpointer('cint2e_sph')
         cintopt = make_cintopt(c_atm, c_bas, c_env, 'cint2e_sph')
@@ -178,6 +310,15 @@ def direct(dms, atm, bas, env, vhfopt=None, hermi=0):
         cintopt = vhfopt._cintopt
         cintor = vhfopt._intor
 
+    if n_dm > 2:
+        try:
+            vjk = _direct_mdm(dms, cintor, cintopt, cvhfopt,
+                              c_atm, natm, c_bas, nbas, c_env)
+        finally:
+            if vhfopt is None:
+                libcvhf.CINTdel_optimizer(ctypes.byref(cintopt))
+        return vjk
+
     fdrv = getattr(libcvhf, 'CVHFnr_direct_drv')
     fdot = _fpointer('CVHFdot_nrs8')
     fvj = _fpointer('CVHFnrs8_ji_s2kl')
@@ -196,16 +337,17 @@ def direct(dms, atm, bas, env, vhfopt=None, hermi=0):
         fjk[n_dm+i] = fvk
     vjk = numpy.empty((2,n_dm,nao,nao))
 
-    fdrv(cintor, fdot, fjk, dm1,
-         vjk.ctypes.data_as(ctypes.c_void_p),
-         ctypes.c_int(n_dm*2), ctypes.c_int(1),
-         cintopt, cvhfopt,
-         c_atm.ctypes.data_as(ctypes.c_void_p), natm,
-         c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
-         c_env.ctypes.data_as(ctypes.c_void_p))
+    status = fdrv(cintor, fdot, fjk, dm1,
+                  vjk.ctypes.data_as(ctypes.c_void_p),
+                  ctypes.c_int(n_dm*2), ctypes.c_int(1),
+                  cintopt, cvhfopt,
+                  c_atm.ctypes.data_as(ctypes.c_void_p), natm,
+                  c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
+                  c_env.ctypes.data_as(ctypes.c_void_p))
 
     if vhfopt is None:
         libcvhf.CINTdel_optimizer(ctypes.byref(cintopt))
+    _check_status(status)
 
     # vj must be symmetric
     for idm in range(n_dm):
@@ -217,10 +359,29 @@ def direct(dms, atm, bas, env, vhfopt=None, hermi=0):
         vjk = vjk.reshape(2,nao,nao)
     return vjk
 
+# Many density matrices are contracted with each integral in one pass.  The
+# density matrices are transposed to (nao,nao,n_dm) so that the updates for
+# all densities are contiguous.  J and K are returned in full (s1) storage.
+def _direct_mdm(dms, cintor, cintopt, cvhfopt,
+                c_atm, natm, c_bas, nbas, c_env):
+    n_dm, nao = dms.shape[:2]
+    dms = numpy.asarray(dms.transpose(1,2,0), order='C')
+    vjk = numpy.empty((2,nao,nao,n_dm))
+    fdrv = libcvhf.CVHFnr_direct_mdm_drv
+    status = fdrv(cintor,
+                  dms.ctypes.data_as(ctypes.c_void_p),
+                  vjk.ctypes.data_as(ctypes.c_void_p),
+                  ctypes.c_int(n_dm), cintopt, cvhfopt,
+                  c_atm.ctypes.data_as(ctypes.c_void_p), natm,
+                  c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
+                  c_env.ctypes.data_as(ctypes.c_void_p))
+    _check_status(status)
+    return numpy.asarray(vjk.transpose(0,3,1,2), order='C')
+
 # call all fjk for each dm, the return array has len(dms)*len(jkdescript)*ncomp components
 # jkdescript: 'ij->s1kl', 'kl->s2ij', ...
 def direct_mapdm(intor, intsymm, jkdescript,
-                 dms, ncomp, atm, bas, env, vhfopt=None):
+                 dms, ncomp, atm, bas, env, vhfopt=None, max_memory=None):
     assert(intsymm in ('s8', 's4', 's2ij', 's2kl', 's1',
                        'a4ij', 'a4kl', 'a2ij', 'a2kl'))
     c_atm = numpy.asarray(atm, dtype=numpy.int32, order='C')
@@ -243,6 +404,17 @@ def direct_mapdm(intor, intsymm, jkdescript,
     else:
         njk = len(jkdescript)
 
+    blksize = _dm_blksize(nao, njk*ncomp, max_memory)
+    if n_dm > blksize:
+        vjk = [direct_mapdm(intor, intsymm, jkdescript, dms[p0:p1], ncomp,
+                            atm, bas, env, vhfopt, max_memory)
+               .reshape(njk,-1,nao,nao)
+               for p0, p1 in pyscf.lib.prange(0, n_dm, blksize)]
+        vjk = numpy.concatenate(vjk, axis=1)
+        if njk == 1:
+            vjk = vjk[0]
+        return vjk
+
     if vhfopt is None:
         cintor = _fpointer(intor)
         cintopt = make_cintopt(c_atm, c_bas, c_env, intor)
@@ -273,16 +445,17 @@ def direct_mapdm(intor, intsymm, jkdescript,
             fjk[i*n_dm+j] = f1
     vjk = numpy.empty((njk,n_dm*ncomp,nao,nao))
 
-    fdrv(cintor, fdot, fjk, dm1,
-         vjk.ctypes.data_as(ctypes.c_void_p),
-         ctypes.c_int(njk*n_dm), ctypes.c_int(ncomp),
-         cintopt, cvhfopt,
-         c_atm.ctypes.data_as(ctypes.c_void_p), natm,
-         c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
-         c_env.ctypes.data_as(ctypes.c_void_p))
+    status = fdrv(cintor, fdot, fjk, dm1,
+                  vjk.ctypes.data_as(ctypes.c_void_p),
+                  ctypes.c_int(njk*n_dm), ctypes.c_int(ncomp),
+                  cintopt, cvhfopt,
+                  c_atm.ctypes.data_as(ctypes.c_void_p), natm,
+                  c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
+                  c_env.ctypes.data_as(ctypes.c_void_p))
 
     if vhfopt is None:
         libcvhf.CINTdel_optimizer(ctypes.byref(cintopt))
+    _check_status(status)
 
     if n_dm * ncomp == 1:
         vjk = vjk.reshape(njk,nao,nao)
@@ -293,7 +466,7 @@ def direct_mapdm(intor, intsymm, jkdescript,
 # for density matrices in dms, bind each dm to a jk operator
 # jkdescript: 'ij->s1kl', 'kl->s2ij', ...
 def direct_bindm(intor, intsymm, jkdescript,
-                 dms, ncomp, atm, bas, env, vhfopt=None):
+                 dms, ncomp, atm, bas, env, vhfopt=None, max_memory=None):
     assert(intsymm in ('s8', 's4', 's2ij', 's2kl', 's1',
                        'a4ij', 'a4kl', 'a2ij', 'a2kl'))
     c_atm = numpy.asarray(atm, dtype=numpy.int32, order='C')
@@ -317,6 +490,17 @@ def direct_bindm(intor, intsymm, jkdescript,
         njk = len(jkdescript)
     assert(njk == n_dm)
 
+    blksize = _dm_blksize(nao, ncomp, max_memory)
+    if n_dm > blksize:
+        vjk = [direct_bindm(intor, intsymm, jkdescript[p0:p1], dms[p0:p1],
+                            ncomp, atm, bas, env, vhfopt, max_memory)
+               .reshape(-1,ncomp,nao,nao)
+               for p0, p1 in pyscf.lib.prange(0, n_dm, blksize)]
+        vjk = numpy.concatenate(vjk, axis=0)
+        if ncomp == 1:
+            vjk = vjk.reshape(njk,nao,nao)
+        return vjk
+
     if vhfopt is None:
         cintor = _fpointer(intor)
         cintopt = make_cintopt(c_atm, c_bas, c_env, intor)
@@ -343,16 +527,17 @@ def direct_bindm(intor, intsymm, jkdescript,
         fjk[i] = f1
     vjk = numpy.empty((njk,ncomp,nao,nao))
 
-    fdrv(cintor, fdot, fjk, dm1,
-         vjk.ctypes.data_as(ctypes.c_void_p),
-         ctypes.c_int(n_dm), ctypes.c_int(ncomp),
-         cintopt, cvhfopt,
-         c_atm.ctypes.data_as(ctypes.c_void_p), natm,
-         c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
-         c_env.ctypes.data_as(ctypes.c_void_p))
+    status = fdrv(cintor, fdot, fjk, dm1,
+                  vjk.ctypes.data_as(ctypes.c_void_p),
+                  ctypes.c_int(n_dm), ctypes.c_int(ncomp),
+                  cintopt, cvhfopt,
+                  c_atm.ctypes.data_as(ctypes.c_void_p), natm,
+                  c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
+                  c_env.ctypes.data_as(ctypes.c_void_p))
 
     if vhfopt is None:
         libcvhf.CINTdel_optimizer(ctypes.byref(cintopt))
+    _check_status(status)
 
     if ncomp == 1:
         vjk = vjk.reshape(njk,nao,nao)
@@ -362,7 +547,7 @@ def direct_bindm(intor, intsymm, jkdescript,
 
 
 # 8-fold permutation symmetry
-def int2e_sph(atm, bas, env):
+def int2e_sph(atm, bas, env, out=None):
     c_atm = numpy.asarray(atm, dtype=numpy.int32, order='C')
     c_bas = numpy.asarray(bas, dtype=numpy.int32, order='C')
     c_env = numpy.asarray(env, dtype=numpy.double, order='C')
@@ -371,7 +556,11 @@ def int2e_sph(atm, bas, env):
     libcvhf.CINTtot_cgto_spheric.restype = ctypes.c_int
     nao = libcvhf.CINTtot_cgto_spheric(c_bas.ctypes.data_as(ctypes.c_void_p), nbas)
     nao_pair = nao*(nao+1)//2
-    eri = numpy.empty((nao_pair*(nao_pair+1)//2))
+    if out is None:
+        eri = numpy.empty((nao_pair*(nao_pair+1)//2))
+    else:
+        eri = out
+        assert(eri.size == nao_pair*(nao_pair+1)//2)
     libcvhf.int2e_sph(eri.ctypes.data_as(ctypes.c_void_p),
                       c_atm.ctypes.data_as(ctypes.c_void_p), natm,
                       c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
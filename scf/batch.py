@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Run the SCF calculations of many molecules in a pool of processes.
+
+The basis sets are parsed once in the parent process and shared by all
+molecules.  The worker processes are started with the spawn method, since the
+OpenMP runtime of the current process may not survive fork.  The molecules
+and the parsed basis are sent to each worker once when it is started, then
+only the molecule index is sent for each task.  The SCF method (if it is a
+function) has to be picklable for nproc > 1.  Each worker holds its own
+scratch directory for the temporary files of DIIS, chkfile etc., and runs
+the OpenMP kernels with ``nthreads`` threads (1 by default), so that the
+throughput scales with the number of processes.
+
+The results are yielded as soon as they are available, in the order of
+completion.
+
+Examples:
+
+>>> from pyscf import gto, scf
+>>> mols = [gto.M(atom='H 0 0 0; F 0 0 %g' % r, basis='ccpvdz')
+...         for r in (.8, .9, 1., 1.1)]
+>>> for i, res in scf.run_batch(mols, 'RHF', nproc=4):
+...     print(i, res['e_tot'], res['wall_time'])
+'''
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import traceback
+import multiprocessing
+import ctypes
+from pyscf import gto
+from pyscf.lib import logger
+from pyscf.scf import _vhf
+
+METHODS = ('RHF', 'ROHF', 'UHF', 'RKS', 'ROKS', 'UKS')
+
+def run_batch(mols, method='RHF', nproc=None, nthreads=1, verbose=logger.NOTE,
+              stdout=sys.stdout, with_mo=False, **kwargs):
+    '''SCF calculations for a list of molecules in a process pool.  This
+    function is a generator which yields (index, result) in the order of
+    completion.
+
+    Args:
+        mols : list
+            :class:`Mole` objects (built or not), or dicts of the keyword
+            arguments of :func:`gto.M`.
+        method : str or function
+            One of 'RHF', 'ROHF', 'UHF', 'RKS', 'ROKS', 'UKS', or a function
+            which takes a :class:`Mole` object and returns an SCF object.
+
+    Kwargs:
+        nproc : int
+            Number of processes.  Default is the number of CPUs.  If nproc is
+            1, the calculations are executed in the current process.
+            Multiple processes need the spawn start method of Python 3.4+.
+        nthreads : int
+            Number of OpenMP threads in each process.
+        verbose : int
+            Print level of the batch driver.  The SCF objects are executed
+            silently (mol.verbose = 0) unless verbose > logger.DEBUG.
+        with_mo : bool
+            Whether to return mo_coeff in the results.
+        kwargs :
+            Attributes of the SCF objects, eg xc='b3lyp', conv_tol=1e-9.
+
+    Returns:
+        An iterator of (index, result).  result is a dict of e_tot,
+        converged, mo_energy, mo_occ, (mo_coeff,) build_time (the time to
+        build the molecule), wall_time, cpu_time (the time of SCF) and pid.
+        If the calculation fails, result has a key 'error' with the
+        traceback message.
+
+    Examples:
+
+    >>> mols = [dict(atom='O 0 0 0; H 0 0 1; H 0 1 %g' % y, basis='631g')
+    ...         for y in numpy.arange(0, 2, .1)]
+    >>> results = dict(scf.run_batch(mols, 'RKS', xc='b3lyp'))
+    '''
+    if not (callable(method) or method.upper() in METHODS):
+        raise KeyError('Unknown SCF method %s' % method)
+    if nproc is None:
+        nproc = multiprocessing.cpu_count()
+    log = logger.Logger(stdout, verbose)
+    t0 = (time.clock(), time.time())
+
+    basis_cache = {}
+    moldics = [_share_basis(_pack(mol), basis_cache) for mol in mols]
+    nmol = len(moldics)
+    nproc = max(1, min(nproc, nmol))
+    if nproc > 1 and not hasattr(multiprocessing, 'get_context'):
+        log.warn('run_batch needs the spawn start method of Python 3.4+.  '
+                 'Fork after OpenMP may deadlock.  nproc = 1')
+        nproc = 1
+    log.info('run_batch: %d molecules, method = %s, %d processes, '
+             '%d threads per process', nmol, method, nproc, nthreads)
+
+    scratch = tempfile.mkdtemp(prefix='pyscf_batch')
+    args = (moldics, method, kwargs, with_mo, nthreads, verbose, scratch)
+    pool = None
+    tempdir_save = tempfile.tempdir
+    try:
+        if nproc == 1:
+            # Keep the OpenMP threads of the current process
+            _init_worker(*(args[:4] + (None,) + args[5:]))
+            results = (_run_one(i) for i in range(nmol))
+        else:
+            ctx = multiprocessing.get_context('spawn')
+            pool = ctx.Pool(nproc, _init_worker, args)
+            results = pool.imap_unordered(_run_one, range(nmol))
+
+        wall_tot = 0
+        for i, res in results:
+            if 'error' in res:
+                log.warn('mol %d failed\n%s', i, res['error'])
+            else:
+                wall_tot += res['wall_time']
+                log.info('mol %d  E = %.15g  converged = %s  '
+                         'build %.2f s  SCF %.2f s  (pid %d)',
+                         i, res['e_tot'], res['converged'],
+                         res['build_time'], res['wall_time'], res['pid'])
+            yield i, res
+
+        wall = time.time() - t0[1]
+        log.note('run_batch: %d molecules in %.2f s, %.2f mol/s, '
+                 'parallel efficiency %.2f',
+                 nmol, wall, nmol/wall, wall_tot/(wall*nproc))
+        if pool is not None:
+            pool.close()
+            pool.join()
+            pool = None
+    finally:
+        # The iteration was interrupted
+        if pool is not None:
+            pool.terminate()
+        tempfile.tempdir = tempdir_save
+        shutil.rmtree(scratch, True)
+
+def _pack(mol):
+    if isinstance(mol, gto.Mole):
+        moldic = gto.mole.pack(mol)
+        moldic['ecp'] = mol.ecp
+    else:
+        moldic = dict(mol)
+    return moldic
+
+def _share_basis(moldic, basis_cache):
+    '''Replace the basis names by the parsed basis.  The parsed basis of the
+    same (element, basis name) is shared by all molecules.'''
+    basis = moldic.get('basis', 'sto-3g')
+    if isinstance(basis, str):
+        atoms = gto.mole.format_atom(moldic['atom'],
+                                     unit=moldic.get('unit', 'angstrom'))
+        basis = dict([(a[0], basis) for a in atoms])
+    parsed = {}
+    for symb, bas in basis.items():
+        if isinstance(bas, str):
+            key = (symb, bas)
+            if key not in basis_cache:
+                basis_cache[key] = gto.mole.format_basis({symb: bas})[symb]
+            parsed[symb] = basis_cache[key]
+        else:
+            parsed[symb] = bas
+    moldic = moldic.copy()
+    moldic['basis'] = parsed
+    return moldic
+
+
+# Per-process states of the workers
+_worker = {}
+
+def _init_worker(moldics, method, kwargs, with_mo, nthreads, verbose, scratch):
+    tmpdir = tempfile.mkdtemp(prefix='%d_' % os.getpid(), dir=scratch)
+    tempfile.tempdir = tmpdir
+    if nthreads is not None:
+        _vhf.libcvhf.omp_set_num_threads(ctypes.c_int(nthreads))
+    _worker.update(moldics=moldics, method=method, kwargs=kwargs,
+                   with_mo=with_mo, verbose=verbose, tmpdir=tmpdir)
+
+def _run_one(i):
+    t0 = (time.clock(), time.time())
+    try:
+        mol = gto.Mole()
+        mol.build(False, False, **_worker['moldics'][i])
+        if _worker['verbose'] > logger.DEBUG:
+            mol.verbose = _worker['verbose']
+        else:
+            mol.verbose = 0
+        t1 = (time.clock(), time.time())
+
+        mf = _new_scf(mol, _worker['method'])
+        # hf.kernel always writes mol to chkfile.  Keep it in the scratch
+        # directory of the worker unless chkfile is given in kwargs.
+        chkfile = os.path.join(_worker['tmpdir'], 'mol%d.chk' % i)
+        mf.chkfile = chkfile
+        for key, val in _worker['kwargs'].items():
+            setattr(mf, key, val)
+        try:
+            mf.kernel()
+        finally:
+            if os.path.isfile(chkfile):
+                os.remove(chkfile)
+        t2 = (time.clock(), time.time())
+
+        res = {'e_tot'     : mf.e_tot,
+               'converged' : mf.converged,
+               'mo_energy' : mf.mo_energy,
+               'mo_occ'    : mf.mo_occ,
+               'build_time': t1[1] - t0[1],
+               'cpu_time'  : t2[0] - t1[0],
+               'wall_time' : t2[1] - t1[1],
+               'pid'       : os.getpid()}
+        if _worker['with_mo']:
+            res['mo_coeff'] = mf.mo_coeff
+    except Exception:
+        res = {'error': traceback.format_exc(), 'pid': os.getpid()}
+    return i, res
+
+def _new_scf(mol, method):
+    if callable(method):
+        return method(mol)
+    method = method.upper()
+    if method.endswith('KS'):
+        from pyscf import dft
+        return getattr(dft, method)(mol)
+    else:
+        from pyscf import scf
+        return getattr(scf, method)(mol)
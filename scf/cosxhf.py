@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+r'''
+Seminumerical exchange (chain-of-spheres, COSX)
+
+The exchange integrals are evaluated with one electron on the DFT mesh grids
+and the other electron analytically
+
+    (ij|kl) ~ \sum_g w_g i(r_g) j(r_g) A_kl(r_g),
+    A_kl(r_g) = \int k(r) l(r) / |r-r_g| dr
+
+A_kl(r_g) are the 3-center integrals of the AO pair kl and a unit point
+charge on grid g.  The numerical quadrature is corrected by the overlap
+fitting, K = S S_num^{-1} K_num, where S_num is the overlap matrix computed
+on the same mesh grids.
+
+On each block of grids, the shells whose AO values (for index i) or
+contracted values F_gk = \sum_j j(r_g) D_jk (for index k), scaled by
+sqrt(w_g), are below the cutoff are skipped.  A_kl(r_g) are computed only for the shells l which
+overlap with the remaining shells k.  The overlap is estimated with the
+most diffuse primitive Gaussians of the two shells.
+
+Ref: F. Neese, F. Wennmohs, A. Hansen, U. Becker, Chem. Phys. 356, 98 (2009)
+'''
+
+import time
+import copy
+import numpy
+import scipy.linalg
+import pyscf.lib
+from pyscf.lib import logger
+from pyscf import gto
+from pyscf.scf import _vhf
+
+
+# Threshold of the AO values, the contracted density and the overlap
+# estimation of the shell pairs in the screening
+CUTOFF = 1e-10
+
+def cosx(mf, grids=None):
+    '''For the given SCF object, update the K matrix constructor with the
+    seminumerical exchange (COSX).  The J matrix is computed analytically.
+
+    Args:
+        mf : an SCF object (RHF, UHF, RKS, UKS)
+
+    Kwargs:
+        grids : an instance of :class:`dft.gen_grid.Grids`
+            Mesh grids for the exchange integrals.  By default, the grids of
+            level 3 are used, for which the error in the total energy is
+            below 1e-5 Eh for small molecules.
+
+    Returns:
+        An SCF object with a modified K matrix constructor
+
+    Examples:
+
+    >>> mol = gto.M(atom='O 0 0 0; H 0 0 1; H 0 1 0', basis='ccpvdz', verbose=0)
+    >>> mf = scf.cosx(scf.RHF(mol))
+    >>> mf.scf()
+
+    >>> mf = scf.cosx(dft.RKS(mol))
+    >>> mf.xc = 'b3lyp'
+    >>> mf.scf()
+    '''
+    if grids is None:
+        from pyscf.dft import gen_grid
+        grids = gen_grid.Grids(mf.mol)
+        grids.level = 3
+
+    class HF(mf.__class__):
+        def __init__(self):
+            self.__dict__.update(mf.__dict__)
+            self.cosx_grids = grids
+            self.cosx_cutoff = CUTOFF
+            self._keys = self._keys.union(['cosx_grids', 'cosx_cutoff'])
+
+        def get_jk(self, mol=None, dm=None, hermi=1):
+            return self.get_j(mol, dm, hermi), self.get_k(mol, dm, hermi)
+
+        def get_j(self, mol=None, dm=None, hermi=1):
+            if mol is None: mol = self.mol
+            if dm is None: dm = self.make_rdm1()
+            if self.direct_scf and self.opt is None:
+                self.opt = self.init_direct_scf(mol)
+            return get_j(mol, dm, hermi, self.opt)
+
+        def get_k(self, mol=None, dm=None, hermi=1):
+            if mol is None: mol = self.mol
+            if dm is None: dm = self.make_rdm1()
+            return get_k(mol, dm, self.cosx_grids, hermi,
+                         self.max_memory-pyscf.lib.current_memory()[0],
+                         logger.Logger(self.stdout, self.verbose),
+                         self.cosx_cutoff)
+
+    return HF()
+
+
+def get_j(mol, dm, hermi=1, vhfopt=None):
+    '''Coulomb matrix with the integral-direct algorithm, without building
+    the exchange matrix'''
+    vj = _vhf.direct_mapdm('cint2e_sph', 's8', 'ji->s2kl',
+                           numpy.asarray(dm, order='C'), 1,
+                           mol._atm, mol._bas, mol._env, vhfopt)
+    if vj.ndim == 2:
+        return pyscf.lib.hermi_triu_(vj, 1)
+    else:
+        return numpy.array([pyscf.lib.hermi_triu_(v, 1) for v in vj])
+
+def get_k(mol, dm, grids, hermi=1, max_memory=2000, verbose=None,
+          cutoff=CUTOFF):
+    '''Exchange matrix with the seminumerical (COSX) algorithm
+
+    Args:
+        mol : an instance of :class:`Mole`
+
+        dm : ndarray or list of ndarrays
+            A density matrix or a list of density matrices
+
+        grids : an instance of :class:`dft.gen_grid.Grids`
+
+    Kwargs:
+        hermi : int
+            Whether K matrix is hermitian
+        max_memory : float
+            Memory (in MB) for the intermediates on a block of grids
+        cutoff : float
+            Threshold to screen the shells and the shell pairs
+
+    Returns:
+        K matrix (or a list of K matrices) for the given density matrix
+        (matrices)
+    '''
+    from pyscf.df import incore
+    from pyscf.dft import numint
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(mol.stdout, verbose)
+    t0 = (time.clock(), time.time())
+    if grids.coords is None:
+        grids.setup_grids_()
+
+    dm = numpy.asarray(dm)
+    nao = dm.shape[-1]
+    dms = dm.reshape(-1,nao,nao)
+    nset = dms.shape[0]
+    ngrids = grids.weights.size
+
+    blksize = int(max(max_memory*.8, 100)*1e6/8/(nao*nao+nao*(nset+3)))
+    # small blocks of the (sorted) grids for the shell screening
+    blksize = max(1, min(blksize, ngrids, numint.BLKSIZE*8))
+    ao_loc = numpy.asarray(mol.ao_loc_nr())
+    pair_mask = _overlap_mask(mol, cutoff)
+    sn = numpy.zeros((nao,nao))
+    vk = numpy.zeros((nset,nao,nao))
+    nlk = 0
+    for p0, p1 in prange(0, ngrids, blksize):
+        coords = grids.coords[p0:p1]
+        weights = grids.weights[p0:p1]
+        ao = numint.eval_ao(mol, coords)
+        wao = ao * weights.reshape(-1,1)
+        sn += numpy.dot(ao.T, wao)
+        fg = [numpy.dot(ao, dms[i]) for i in range(nset)]
+
+        # shells i of significant AO values, shells k of significant F_gk, and
+        # shells l which overlap with shells k
+        sw = numpy.sqrt(abs(weights)).reshape(-1,1)
+        aomax = numpy.maximum.reduceat(abs(ao*sw).max(axis=0), ao_loc[:-1])
+        fmax = numpy.maximum.reduceat(numpy.max([abs(f*sw).max(axis=0)
+                                                 for f in fg], axis=0),
+                                      ao_loc[:-1])
+        ishls = numpy.where(aomax > cutoff)[0]
+        kshls = numpy.where(fmax > cutoff)[0]
+        lshls = numpy.where(pair_mask[kshls].any(axis=0))[0]
+        if len(ishls) == 0 or len(kshls) == 0:
+            continue
+        iidx = _shls_to_aoidx(ao_loc, ishls)
+        kidx = _shls_to_aoidx(ao_loc, kshls)
+        lidx = _shls_to_aoidx(ao_loc, lshls)
+        nlk += len(kidx) * len(lidx) * (p1-p0)
+
+        fakemol = _make_fakemol(coords)
+        v3c = incore.aux_e2(_sub_mol(mol, kshls), fakemol,
+                            intor='cint3c2e_sph', aosym='s1',
+                            mol1=_sub_mol(mol, lshls))
+        v3c = pyscf.lib.transpose(v3c)
+        v3c = v3c.reshape(p1-p0,len(kidx),len(lidx))
+        wao = wao[:,iidx]
+        for i in range(nset):
+            gv = numpy.einsum('gk,gkl->gl', fg[i][:,kidx], v3c)
+            vk[i][iidx[:,None],lidx] += numpy.dot(wao.T, gv)
+        v3c = fg = None
+    log.debug('COSX screening, %d of %d 3-center integrals computed',
+              nlk, nao*nao*ngrids)
+    t0 = log.timer('COSX exchange on %d grids'%ngrids, *t0)
+
+    # overlap fitting
+    ovlp = mol.intor_symmetric('cint1e_ovlp_sph')
+    fit = scipy.linalg.solve(sn, ovlp).T
+    for i in range(nset):
+        vk[i] = numpy.dot(fit, vk[i])
+        if hermi == 1:
+            vk[i] = (vk[i] + vk[i].T) * .5
+    return vk.reshape(dm.shape)
+
+def _overlap_mask(mol, cutoff):
+    '''Shell pairs of which the overlap of the most diffuse primitive
+    Gaussians exp(-ab/(a+b) R^2) is larger than cutoff'''
+    amin = numpy.array([mol.bas_exp(i).min() for i in range(mol.nbas)])
+    coords = numpy.array([mol.bas_coord(i) for i in range(mol.nbas)])
+    rr = numpy.linalg.norm(coords[:,None]-coords, axis=2)**2
+    aij = amin[:,None] * amin / (amin[:,None] + amin)
+    return numpy.exp(-aij * rr) > cutoff
+
+def _shls_to_aoidx(ao_loc, shls):
+    return numpy.hstack([numpy.arange(ao_loc[i], ao_loc[i+1]) for i in shls])
+
+def _sub_mol(mol, shls):
+    '''A shallow copy of mol which holds only the given shells'''
+    pmol = copy.copy(mol)
+    pmol._bas = numpy.asarray(mol._bas)[shls]
+    pmol.nbas = len(shls)
+    return pmol
+
+def _make_fakemol(coords, expnt=1e16):
+    '''A Mole-like object which holds a unit point charge (a very tight
+    normalized s-type Gaussian) on each of the given coordinates'''
+    ncharge = len(coords)
+    fakeatm = numpy.zeros((ncharge,gto.ATM_SLOTS), dtype=numpy.int32)
+    fakeatm[:,gto.PTR_COORD] = numpy.arange(0, ncharge*3, 3)
+    fakebas = numpy.zeros((ncharge,gto.BAS_SLOTS), dtype=numpy.int32)
+    fakebas[:,gto.ATOM_OF] = numpy.arange(ncharge)
+    fakebas[:,gto.NPRIM_OF] = 1
+    fakebas[:,gto.NCTR_OF] = 1
+    fakebas[:,gto.PTR_EXP] = ncharge*3
+    fakebas[:,gto.PTR_COEFF] = ncharge*3 + 1
+# The integral of the s-type Gaussian (including the angular factor of s
+# function 1/sqrt(4pi)) is 1
+    coef = 2 * expnt**1.5 / numpy.pi
+    fakemol = gto.Mole()
+    fakemol._atm = fakeatm
+    fakemol._bas = fakebas
+    fakemol._env = numpy.hstack((numpy.asarray(coords).ravel(), (expnt, coef)))
+    fakemol.natm = ncharge
+    fakemol.nbas = ncharge
+    return fakemol
+
+def prange(start, end, step):
+    for i in range(start, end, step):
+        yield i, min(i+step, end)
@@ -18,7 +18,7 @@ from pyscf.ao2mo import _ao2mo
 OCCDROP = 1e-12
 BLOCKDIM = 240
 
-def density_fit(mf, auxbasis='weigend'):
+def density_fit(mf, auxbasis='weigend', with_df=None):
     '''For the given SCF object, update the J, K matrix constructor with
     corresponding density fitting integrals.
 
@@ -27,6 +27,9 @@ def density_fit(mf, auxbasis='weigend'):
 
     Kwargs:
         auxbasis : str
+        with_df : :class:`df.DF` object
+            To reuse the density fitting integrals of another calculation.
+            If it is given, auxbasis is taken from with_df.
 
     Returns:
         An SCF object with a modified J, K matrix constructor which uses density
@@ -50,12 +53,17 @@ def density_fit(mf, auxbasis='weigend'):
     class HF(mf.__class__):
         def __init__(self):
             self.__dict__.update(mf.__dict__)
-            self.auxbasis = auxbasis
             self.direct_scf = False
+            if with_df is None:
+                self.auxbasis = auxbasis
+            else:
+                self.auxbasis = with_df.auxbasis
+            self.with_df = with_df
+            get_df(self)
             self._cderi = None
             self._naoaux = None
             self._tag_df = True
-            self._keys = self._keys.union(['auxbasis'])
+            self._keys = self._keys.union(['auxbasis', 'with_df'])
 
         def get_jk(self, mol=None, dm=None, hermi=1):
             if mol is None: mol = self.mol
@@ -88,23 +96,9 @@ def get_jk_(mf, mol, dms, hermi=1, with_j=True, with_k=True):
     t0 = (time.clock(), time.time())
     log = logger.Logger(mf.stdout, mf.verbose)
     if not hasattr(mf, '_cderi') or mf._cderi is None:
-        nao = mol.nao_nr()
-        nao_pair = nao*(nao+1)//2
-        auxmol = df.incore.format_aux_basis(mol, mf.auxbasis)
-        mf._naoaux = auxmol.nao_nr()
-        if (nao_pair*mf._naoaux*8/1e6*2+pyscf.lib.current_memory()[0]
-            < mf.max_memory*.8):
-            mf._cderi = df.incore.cholesky_eri(mol, auxbasis=mf.auxbasis,
-                                               verbose=log)
-        else:
-            mf._cderi = tempfile.NamedTemporaryFile()
-            df.outcore.cholesky_eri(mol, mf._cderi.name, auxbasis=mf.auxbasis,
-                                    verbose=log)
-#            if (nao_pair*mf._naoaux*8/1e6+pyscf.lib.current_memory()[0]
-#                < mf.max_memory*.9):
-#                with df.load(mf._cderi) as feri:
-#                    cderi = numpy.asarray(feri)
-#                mf._cderi = cderi
+        with_df = get_df(mf, mol).build()
+        mf._cderi = with_df._cderi
+        mf._naoaux = with_df.get_naoaux()
     if mf._naoaux is None:
 # By overwriting mf._cderi, one can provide the Cholesky integrals for "DF/RI" calculation
         with df.load(mf._cderi) as feri:
@@ -231,6 +225,22 @@ def get_jk_(mf, mol, dms, hermi=1, with_j=True, with_k=True):
     return vj, vk
 
 
+def get_df(mf, mol=None):
+    '''The :class:`df.DF` object of mf (mf.with_df).  A new DF object is
+    created if mf has no DF object or mf.auxbasis was changed.
+    '''
+    if mol is None: mol = mf.mol
+    with_df = getattr(mf, 'with_df', None)
+    if (with_df is None or with_df.mol is not mol or
+        with_df.auxbasis != mf.auxbasis):
+        with_df = df.DF(mol, mf.auxbasis)
+        with_df.stdout = mf.stdout
+        with_df.verbose = mf.verbose
+        with_df.max_memory = mf.max_memory
+        mf.with_df = with_df
+    return with_df
+
+
 def r_get_jk_(mf, mol, dms, hermi=1):
     '''Relativistic density fitting JK'''
     t0 = (time.clock(), time.time())
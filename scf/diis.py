@@ -26,14 +26,7 @@ class DIIS(pyscf.lib.diis.DIIS):
         pyscf.lib.diis.DIIS.__init__(self, mf, filename)
         self.rollback = False
     def update(self, s, d, f):
-        if isinstance(f, numpy.ndarray) and f.ndim == 2:
-            sdf = reduce(numpy.dot, (s,d,f))
-            errvec = sdf.T.conj() - sdf
-        else:
-            sdf_a = reduce(numpy.dot, (s, d[0], f[0]))
-            sdf_b = reduce(numpy.dot, (s, d[1], f[1]))
-            errvec = numpy.hstack((sdf_a.T.conj() - sdf_a,
-                                   sdf_b.T.conj() - sdf_b))
+        errvec = get_err_vec(s, d, f)
         logger.debug1(self, 'diis-norm(errvec)=%g', numpy.linalg.norm(errvec))
         xnew = pyscf.lib.diis.DIIS.update(self, f, xerr=errvec)
         if self.rollback > 0 and len(self._bookkeep) == self.space:
@@ -46,4 +39,154 @@ class DIIS(pyscf.lib.diis.DIIS):
         else:
             return len(self._bookkeep)
 
-SCFDIIS = SCF_DIIS = DIIS
+SCFDIIS = SCF_DIIS = CDIIS = DIIS
+
+
+class EDIIS(DIIS):
+    '''Energy-DIIS (Kudin, Scuseria, Cances, JCP 116, 8255) combined with
+    Pulay's DIIS.  The Fock matrix is extrapolated with the coefficients which
+    minimize the HF energy of the interpolated density matrix.  The
+    coefficients are positive and sum to one, so EDIIS is robust far from
+    convergence.  When the max element of the error vector (FDS-SDF) goes
+    below hybrid_start, the EDIIS Fock matrix is mixed with the DIIS Fock
+    matrix.  Below hybrid_stop, EDIIS is switched off and the regular DIIS
+    extrapolation is used.  The EDIIS energy functional is exact for
+    Hartree-Fock only.  ADIIS is preferred for DFT.
+
+    Attributes:
+        hybrid_start : float
+            Default is 0.1
+        hybrid_stop : float
+            Default is 1e-4
+
+    Examples:
+
+    >>> mf = scf.UHF(mol)
+    >>> mf.DIIS = scf.diis.EDIIS
+    >>> mf.kernel()
+    '''
+    def __init__(self, mf, filename):
+        DIIS.__init__(self, mf, filename)
+        self.mf = mf
+        self.hybrid_start = .1
+        self.hybrid_stop = 1e-4
+        self._dfe = []  # density matrices, Fock matrices and energies
+        self._h1e = None
+
+    def push_dfe(self, d, f):
+        if self._h1e is None:
+            self._h1e = self.mf.get_hcore()
+        e = _dot(self._h1e + f, d) * .5
+        self._dfe.append((d, f, e))
+        if len(self._dfe) > self.space:
+            self._dfe.pop(0)
+
+    def get_coeff(self):
+        ds, fs, es = zip(*self._dfe)
+        return ediis_minimize(es, ds, fs)
+
+    def update(self, s, d, f):
+        err = abs(get_err_vec(s, d, f)).max()
+        f_diis = DIIS.update(self, s, d, f)
+        self.push_dfe(d, f)
+        if err < self.hybrid_stop or len(self._dfe) < 2:
+            return f_diis
+
+        c = self.get_coeff()
+        logger.debug1(self, '%s-c %s', self.__class__.__name__, c)
+        f_e = 0
+        for ci, (di, fi, ei) in zip(c, self._dfe):
+            f_e = f_e + fi * ci
+        if err > self.hybrid_start:
+            logger.debug(self, '%s extrapolation, max(errvec) = %g',
+                         self.__class__.__name__, err)
+            return f_e
+        else:
+            w = err / self.hybrid_start
+            logger.debug(self, '%s/DIIS extrapolation, weight = %g',
+                         self.__class__.__name__, w)
+            return f_e * w + f_diis * (1-w)
+
+class ADIIS(EDIIS):
+    '''Augmented Roothaan-Hall energy DIIS (Hu, Yang, JCP 132, 054109)
+    combined with Pulay's DIIS.  Unlike EDIIS, the approximate energy
+    functional is built from the density matrices and the Fock matrices only,
+    so it works for DFT as well.  The switching to DIIS is controlled by
+    hybrid_start and hybrid_stop, see :class:`EDIIS`.
+
+    Examples:
+
+    >>> mf = dft.RKS(mol)
+    >>> mf.DIIS = scf.diis.ADIIS
+    >>> mf.kernel()
+    '''
+    def push_dfe(self, d, f):
+        self._dfe.append((d, f, None))
+        if len(self._dfe) > self.space:
+            self._dfe.pop(0)
+
+    def get_coeff(self):
+        ds, fs, es = zip(*self._dfe)
+        return adiis_minimize(ds, fs)
+
+
+def get_err_vec(s, d, f):
+    '''error vector = SDF - FDS'''
+    if isinstance(f, numpy.ndarray) and f.ndim == 2:
+        sdf = reduce(numpy.dot, (s,d,f))
+        errvec = sdf.T.conj() - sdf
+    else:
+        sdf_a = reduce(numpy.dot, (s, d[0], f[0]))
+        sdf_b = reduce(numpy.dot, (s, d[1], f[1]))
+        errvec = numpy.hstack((sdf_a.T.conj() - sdf_a,
+                               sdf_b.T.conj() - sdf_b))
+    return errvec
+
+def ediis_minimize(es, ds, fs):
+    r'''EDIIS coefficients which minimize
+    E(c) = \sum_i c_i E_i - 1/4 \sum_ij c_i c_j Tr[(D_i-D_j)(F_i-F_j)]
+    '''
+    nx = len(es)
+    df = numpy.empty((nx,nx))
+    for i in range(nx):
+        for j in range(i+1):
+            df[i,j] = df[j,i] = _dot(fs[i]-fs[j], ds[i]-ds[j])
+    return _simplex_minimize(numpy.asarray(es), -.25*df)
+
+def adiis_minimize(ds, fs):
+    r'''ADIIS coefficients which minimize
+    f(c) = \sum_i c_i Tr[(D_i-D_n) F_n]
+         + 1/2 \sum_ij c_i c_j Tr[(D_i-D_n)(F_j-F_n)]
+    where n is the last iteration.
+    '''
+    nx = len(ds)
+    dn = ds[-1]
+    fn = fs[-1]
+    g = numpy.array([_dot(fn, d-dn) for d in ds])
+    h = numpy.empty((nx,nx))
+    for i in range(nx):
+        for j in range(nx):
+            h[i,j] = _dot(fs[j]-fn, ds[i]-dn)
+    return _simplex_minimize(g, (h+h.T)*.25)
+
+def _simplex_minimize(g, h):
+    r'''Minimize c.g + c.h.c subject to c_i >= 0 and \sum_i c_i = 1.  The
+    constraints are removed with the substitution c_i = x_i^2/\sum_j x_j^2
+    '''
+    import scipy.optimize
+    def costf(x):
+        c = x**2 / (x**2).sum()
+        return numpy.dot(c, g) + reduce(numpy.dot, (c, h, c))
+    def grad(x):
+        x2sum = (x**2).sum()
+        c = x**2 / x2sum
+        dfdc = g + numpy.dot(h+h.T, c)
+        return x * 2 / x2sum * (dfdc - numpy.dot(dfdc, c))
+    x0 = numpy.ones(g.size)
+    res = scipy.optimize.minimize(costf, x0, jac=grad, method='BFGS')
+    c = res.x**2 / (res.x**2).sum()
+    return c
+
+def _dot(a, b):
+    '''Tr(AB) for (a list of) hermitian matrices'''
+    return numpy.einsum('...ij,...ji', a, b).sum().real
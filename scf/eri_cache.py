@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+On-disk cache for the 8-fold symmetric AO 2-electron integrals.
+
+The cache is switched off by default.  When it is enabled, the integrals of
+a molecule are saved in the cache directory, in a file named after the
+fingerprint of mol._atm, mol._bas and mol._env.  Calculations on the same
+molecule (same geometry and basis) with other methods, other spin states or
+post-HF methods read the integrals from the memory-mapped file instead of
+regenerating them.  When the total size of the cache exceeds max_size, the
+least recently used integral files are removed.
+
+:func:`get_eri_mmap` generates the integrals in a memory-mapped file
+(SCF.eri_mmap), for systems whose integrals do not fit in memory.
+
+Examples:
+
+>>> from pyscf import gto, scf, dft
+>>> from pyscf.scf import eri_cache
+>>> eri_cache.enable('/scratch/eri_cache', max_size=20000)
+>>> mol = gto.M(atom='O 0 0 0; H 0 0 1; H 0 1 0', basis='ccpvdz')
+>>> scf.RHF(mol).kernel()
+>>> dft.RKS(mol).kernel()  # ERIs are loaded from /scratch/eri_cache
+'''
+
+import os
+import tempfile
+import hashlib
+import numpy
+from pyscf.lib import logger
+from pyscf.scf import _vhf
+
+_cache = None
+
+def fingerprint(mol):
+    '''Key of the integrals of mol in the ERI cache'''
+    h = hashlib.sha1()
+    h.update(b'cint2e_sph s8')
+    h.update(numpy.asarray(mol._atm, dtype=numpy.int32, order='C').tobytes())
+    h.update(numpy.asarray(mol._bas, dtype=numpy.int32, order='C').tobytes())
+    h.update(numpy.asarray(mol._env, dtype=numpy.double, order='C').tobytes())
+    return h.hexdigest()
+
+
+class ERICache(object):
+    '''Least-recently-used cache of AO integrals in memory-mapped files
+
+    Attributes:
+        cachedir : str
+            Directory to store the integral files.
+        max_size : float or int
+            Max size in MB of the integral files in cachedir.
+    '''
+    def __init__(self, cachedir, max_size=20000):
+        self.cachedir = cachedir
+        self.max_size = max_size
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+
+    def filename(self, mol):
+        return os.path.join(self.cachedir, fingerprint(mol)+'.eri')
+
+    def load(self, mol, mmap=False):
+        '''8-fold symmetric integrals of mol.  They are read from the cache
+        (as a read-only numpy.memmap) if available, otherwise generated and
+        added to the cache.  If mmap is True, the generated integrals are
+        written to the cache file directly instead of being held in memory.
+        '''
+        path = self.filename(mol)
+        nao = mol.nao_nr()
+        nao_pair = nao*(nao+1)//2
+        size = nao_pair*(nao_pair+1)//2
+        if os.path.isfile(path) and os.path.getsize(path) == size*8:
+            logger.debug(mol, 'Load ERIs from cache %s', path)
+            os.utime(path, None)  # mark as recently used
+            return numpy.memmap(path, dtype=numpy.double, mode='r',
+                                shape=(size,))
+
+        if mmap:
+            if size*8/1e6 >= self.max_size:
+                return _mmap_int2e(mol)
+            self.evict(size*8/1e6)
+            logger.debug(mol, 'Save ERIs in cache %s', path)
+            ftmp = tempfile.NamedTemporaryFile(dir=self.cachedir, delete=False)
+            eri = numpy.memmap(ftmp, dtype=numpy.double, mode='w+',
+                               shape=(size,))
+            _vhf.int2e_sph(mol._atm, mol._bas, mol._env, out=eri)
+            eri.flush()
+            del eri
+            ftmp.close()
+            os.rename(ftmp.name, path)
+            return numpy.memmap(path, dtype=numpy.double, mode='r',
+                                shape=(size,))
+
+        eri = _vhf.int2e_sph(mol._atm, mol._bas, mol._env)
+        if eri.nbytes/1e6 < self.max_size:
+            self.evict(eri.nbytes/1e6)
+            logger.debug(mol, 'Save ERIs in cache %s', path)
+# Write to a temporary file then rename it, so that other processes never
+# see an incomplete integral file
+            ftmp = tempfile.NamedTemporaryFile(dir=self.cachedir, delete=False)
+            eri.tofile(ftmp)
+            ftmp.close()
+            os.rename(ftmp.name, path)
+        return eri
+
+    def evict(self, size_required=0):
+        '''Remove the least recently used integral files until there is space
+        for size_required (in MB)'''
+        files = []
+        for f in os.listdir(self.cachedir):
+            if f.endswith('.eri'):
+                path = os.path.join(self.cachedir, f)
+                files.append((os.path.getmtime(path), os.path.getsize(path), path))
+        files.sort()
+        total = sum([x[1] for x in files]) / 1e6
+        for mtime, fsize, path in files:
+            if total + size_required < self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # removed by other process
+                pass
+            total -= fsize / 1e6
+
+    def clear(self):
+        for f in os.listdir(self.cachedir):
+            if f.endswith('.eri'):
+                os.remove(os.path.join(self.cachedir, f))
+
+
+def enable(cachedir, max_size=20000):
+    '''Switch on the ERI cache.  max_size is the max cache size in MB.'''
+    global _cache
+    _cache = ERICache(cachedir, max_size)
+    return _cache
+
+def disable():
+    global _cache
+    _cache = None
+
+def get_eri(mol):
+    '''8-fold symmetric AO integrals of mol.  They are taken from the ERI
+    cache if the cache is enabled.
+    '''
+    if _cache is None:
+        return _vhf.int2e_sph(mol._atm, mol._bas, mol._env)
+    else:
+        return _cache.load(mol)
+
+def get_eri_mmap(mol):
+    '''8-fold symmetric AO integrals of mol in a memory-mapped file.  The
+    integrals are stored in the ERI cache if the cache is enabled.  Otherwise
+    they are stored in an anonymous temporary file (under TMPDIR) which is
+    released with the returned numpy.memmap.
+    '''
+    if _cache is None:
+        return _mmap_int2e(mol)
+    else:
+        return _cache.load(mol, mmap=True)
+
+def _mmap_int2e(mol):
+    nao = mol.nao_nr()
+    nao_pair = nao*(nao+1)//2
+    size = nao_pair*(nao_pair+1)//2
+    logger.debug(mol, 'Store %.f MB ERIs in a memory-mapped file', size*8/1e6)
+    with tempfile.TemporaryFile() as ftmp:
+        eri = numpy.memmap(ftmp, dtype=numpy.double, mode='w+', shape=(size,))
+    _vhf.int2e_sph(mol._atm, mol._bas, mol._env, out=eri)
+    return eri
@@ -0,0 +1,710 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+r'''
+Multipole accelerated Coulomb matrix for large molecules
+
+The shell pairs (charge distributions) are sorted in an octree based on their
+centers.  For two tree nodes A and B which are well separated,
+
+    |c_A - c_B| - s_A - s_B > ext_A + ext_B  and  |c_A - c_B| * theta > s_A + s_B
+
+(c: center of the node, s: radius of the sphere which encloses the centers of
+all shell pairs in the node, ext: the largest extent of the charge
+distributions in the node), the Coulomb interaction between the two nodes is
+computed with the Cartesian multipole expansion up to the given order.  The
+multipoles of the nodes are assembled from the multipoles of each shell pair,
+which are computed up to the same order so that the error is controlled by
+theta and order only, and translated along the tree.  The interactions between
+the leaves which are not well separated (near-field) are computed with the
+integral-direct algorithm, in which the quartets of the far-field shell pairs
+are skipped by the prescreen function CVHFnrs8_nf_prescreen.
+
+The error of the multipole expansion is bounded by ~ theta^(order+1).
+'''
+
+import time
+import numpy
+import pyscf.lib
+from pyscf.lib import logger
+from pyscf import gto
+from pyscf.scf import _vhf
+
+# default well-separated parameter and the order of multipole expansion
+THETA = .4
+ORDER = 10
+# max number of shell pairs in the leaf of octree
+LEAF_SIZE = 64
+# the smallest box (in Bohr) of octree
+MIN_BOX_SIZE = .5
+
+
+def fmm(mf, theta=THETA, order=ORDER):
+    '''For the given SCF object, update the J matrix constructor with the
+    multipole accelerated algorithm.  K matrix is computed with the regular
+    integral-direct algorithm.
+
+    Args:
+        mf : an SCF object (RHF, UHF, RKS, UKS)
+
+    Kwargs:
+        theta : float
+            Well-separated parameter.  The smaller theta, the more accurate
+            far-field and the larger near-field.
+        order : int
+            The max order of the multipole expansion.
+
+    Returns:
+        An SCF object with a modified J matrix constructor
+
+    Examples:
+
+    >>> mol = gto.M(atom=[('C', (i*2.5, 0, 0)) for i in range(100)],
+    ...             basis='6-31g', spin=0)
+    >>> mf = scf.fmm(dft.RKS(mol))
+    >>> mf.scf()
+    '''
+    class HF(mf.__class__):
+        def __init__(self):
+            self.__dict__.update(mf.__dict__)
+            self.fmm_theta = theta
+            self.fmm_order = order
+            self._fmm = None
+            self._keys = self._keys.union(['fmm_theta', 'fmm_order'])
+
+        def get_jk(self, mol=None, dm=None, hermi=1):
+            return self.get_j(mol, dm, hermi), self.get_k(mol, dm, hermi)
+
+        def get_j(self, mol=None, dm=None, hermi=1):
+            if mol is None: mol = self.mol
+            if dm is None: dm = self.make_rdm1()
+            if (self._fmm is None or self._fmm.mol is not mol or
+                self._fmm.theta != self.fmm_theta or
+                self._fmm.order != self.fmm_order or
+                not numpy.array_equal(self._fmm._env, mol._env)):
+                self._fmm = MultipoleTree(mol, self.fmm_theta, self.fmm_order,
+                                          self.direct_scf_tol)
+                self._fmm.verbose = self.verbose
+                self._fmm.max_memory = self.max_memory
+                self._fmm.build()
+            return self._fmm.get_j(dm)
+
+        def get_k(self, mol=None, dm=None, hermi=1):
+            if mol is None: mol = self.mol
+            if dm is None: dm = self.make_rdm1()
+            if self.direct_scf and self.opt is None:
+                self.opt = self.init_direct_scf(mol)
+            return get_k(mol, dm, hermi, self.opt)
+
+    return HF()
+
+
+def get_k(mol, dm, hermi=1, vhfopt=None):
+    '''K matrix with the integral-direct algorithm, without building the
+    Coulomb matrix'''
+    if hermi == 1:
+        descr = 'li->s2kj'
+    else:
+        descr = 'li->s1kj'
+    vk = _vhf.direct_mapdm('cint2e_sph', 's8', descr,
+                           numpy.asarray(dm, order='C'), 1,
+                           mol._atm, mol._bas, mol._env, vhfopt)
+    if hermi != 0:
+        if vk.ndim == 2:
+            vk = pyscf.lib.hermi_triu_(vk, hermi)
+        else:
+            vk = numpy.array([pyscf.lib.hermi_triu_(v, hermi) for v in vk])
+    return vk
+
+
+class MultipoleTree(object):
+    '''Octree of the shell pairs of a molecule for the multipole accelerated J
+    matrix
+
+    Attributes:
+        theta : float
+            Well-separated parameter.
+        order : int
+            The max order of multipole expansion.  The multipoles of each
+            significant AO pair take (order+1)(order+2)(order+3)/6 doubles.
+            They are kept in memory if they take less than max_memory/2,
+            otherwise they are evaluated in every call of get_j.
+        tol : float
+            Shell pairs of which the overlap is smaller than tol are ignored.
+            It also defines the extent of the charge distributions.
+        leaf_size : int
+            Max number of shell pairs in the leaf of octree.
+        max_memory : float
+            Memory (in MB) for the multipoles and the intermediates.
+    '''
+    def __init__(self, mol, theta=THETA, order=ORDER, tol=1e-13):
+        self.mol = mol
+        self.verbose = mol.verbose
+        self.stdout = mol.stdout
+        self.max_memory = 2000
+        self.theta = theta
+        self.order = order
+        self.tol = tol
+        self.leaf_size = LEAF_SIZE
+        self._env = mol._env.copy()
+        self.vhfopt = None
+
+    def build(self):
+        mol = self.mol
+        log = logger.Logger(self.stdout, self.verbose)
+        t0 = (time.clock(), time.time())
+        nbas = mol.nbas
+
+        pair_ij, pair_center, pair_ext = _shell_pairs(mol, self.tol)
+        npair = len(pair_ij)
+        tree = _octree(pair_center, pair_ext, self.leaf_size, MIN_BOX_SIZE)
+        node_center, node_radius, node_ext, children, parent, depth, \
+                leaves, leaf_range, perm = tree
+        nleaf = len(leaves)
+        # shell pairs are stored in the order of the leaves
+        pair_ij = pair_ij[perm]
+        pair_center = pair_center[perm]
+        self.leaf_starts = leaf_range[:,0]
+        self.leaf_nodes = leaves
+        pair_leaf = numpy.repeat(numpy.arange(nleaf),
+                                 leaf_range[:,1]-leaf_range[:,0])
+
+        far, near = _dual_traverse(node_center, node_radius, node_ext,
+                                   children, self.theta)
+        idx = numpy.argsort(far[0], kind='mergesort')
+        self.far_list = (far[0][idx], far[1][idx])
+        leaf_id = numpy.empty(len(node_center), dtype=int)
+        leaf_id[self.leaf_nodes] = numpy.arange(nleaf)
+        near = (leaf_id[near[0]], leaf_id[near[1]])
+        log.debug('FMM: %d shell pairs, %d nodes, %d leaves, '
+                  '%d far-field and %d near-field interactions',
+                  npair, len(node_center), nleaf,
+                  len(self.far_list[0]), len(near[0]))
+
+        self.node_center = node_center
+        self.parent = parent
+        self.depth = depth
+        self.pair_center = pair_center
+        self.pair_leaf = pair_leaf
+        self._tables = _Tables(self.order)
+
+        # near-field screening.  The negligible shell pairs are put in the
+        # dummy box nleaf which has no interaction with any box
+        pair_box = numpy.empty((nbas,nbas), dtype=numpy.int32)
+        pair_box[:] = nleaf
+        pair_box[pair_ij[:,0],pair_ij[:,1]] = pair_leaf
+        pair_box[pair_ij[:,1],pair_ij[:,0]] = pair_leaf
+        box_near = numpy.zeros((nleaf+1,nleaf+1), dtype=numpy.int8)
+        box_near[near[0],near[1]] = 1
+        box_near[near[1],near[0]] = 1
+        self._pair_box = pair_box
+        self._box_near = box_near
+        self.vhfopt = _vhf.VHFOpt(mol, 'cint2e_sph', 'CVHFnrs8_nf_prescreen',
+                                  'CVHFsetnr_direct_scf',
+                                  'CVHFsetnr_direct_scf_dm')
+        self.vhfopt.direct_scf_tol = self.tol
+        copt = self.vhfopt._this.contents
+        copt.nbox = nleaf + 1
+        copt.pair_box = pair_box.ctypes.data
+        copt.box_near = box_near.ctypes.data
+
+        self._build_moments(pair_ij, pair_center)
+        log.timer('FMM tree and multipole moments', *t0)
+        return self
+
+    def _build_moments(self, pair_ij, pair_center):
+        '''AO pair indices of the shell pairs.  The multipoles (up to
+        self.order) of the AO pairs about the centers of the shell pairs are
+        kept in memory if they take less than max_memory/2.  Otherwise they
+        are evaluated block by block in far_field_j.'''
+        mol = self.mol
+        ao_loc = mol.ao_loc_nr()
+        di = ao_loc[pair_ij[:,0]+1] - ao_loc[pair_ij[:,0]]
+        dj = ao_loc[pair_ij[:,1]+1] - ao_loc[pair_ij[:,1]]
+        aop_starts = numpy.append(0, numpy.cumsum(di*dj))
+        aop_p = []
+        aop_q = []
+        for k, (ish, jsh) in enumerate(pair_ij):
+            aop_p.append(numpy.repeat(numpy.arange(ao_loc[ish],
+                                                   ao_loc[ish+1]), dj[k]))
+            aop_q.append(numpy.tile(numpy.arange(ao_loc[jsh],
+                                                 ao_loc[jsh+1]), di[k]))
+        self.pair_ij = pair_ij
+        self.aop_starts = aop_starts
+        self.aop_pair = numpy.repeat(numpy.arange(len(pair_ij)), di*dj)
+        self.aop_p = numpy.hstack(aop_p)
+        self.aop_q = numpy.hstack(aop_q)
+        self.aop_offdiag = (pair_ij[:,0] != pair_ij[:,1])[self.aop_pair]
+
+        self.aop_moments = None
+        naop = aop_starts[-1]
+        mem = naop * self._tables.ncart * 8/1e6
+        if mem < self.max_memory * .5:
+            self.aop_moments = self._pair_moments(0, len(pair_ij))
+        else:
+            logger.debug(self, 'FMM: multipoles of AO pairs (%.f MB) are '
+                         'evaluated on the fly', mem)
+
+    def _pair_moments(self, k0, k1):
+        '''Multipoles (naop,ncart) of the AO pairs of the shell pairs k0:k1'''
+        if self.aop_moments is not None:
+            a0, a1 = self.aop_starts[k0], self.aop_starts[k1]
+            return self.aop_moments[a0:a1]
+        mol = self.mol
+        powers = cart_powers(self.order)
+        moments = []
+        for k in range(k0, k1):
+            ish, jsh = self.pair_ij[k]
+            m = _shell_pair_moments(mol, ish, jsh, self.pair_center[k],
+                                    powers)
+            moments.append(m.reshape(-1,len(powers)))
+        return numpy.vstack(moments)
+
+    def _pair_blocks(self, blksize):
+        '''Blocks (k0,k1,a0,a1) of the shell pairs k0:k1, each holding at
+        most blksize AO pairs a0:a1 (or one shell pair)'''
+        aop_starts = self.aop_starts
+        npair = len(aop_starts) - 1
+        k0 = 0
+        while k0 < npair:
+            k1 = numpy.searchsorted(aop_starts, aop_starts[k0]+blksize,
+                                    side='right') - 1
+            k1 = min(max(k1, k0+1), npair)
+            yield k0, k1, aop_starts[k0], aop_starts[k1]
+            k0 = k1
+
+    def get_j(self, dm):
+        '''Coulomb matrix (matrices) for the given density matrix (matrices)'''
+        if self.vhfopt is None:
+            self.build()
+        mol = self.mol
+        dm = numpy.asarray(dm)
+        nao = dm.shape[-1]
+        dms = dm.reshape(-1,nao,nao)
+        vj = _vhf.direct_mapdm('cint2e_sph', 's8', 'ji->s2kl',
+                               numpy.asarray(dms, order='C'), 1,
+                               mol._atm, mol._bas, mol._env, self.vhfopt)
+        vj = vj.reshape(-1,nao,nao)
+        for i, d in enumerate(dms):
+            vj[i] = pyscf.lib.hermi_triu_(vj[i], 1)
+            vj[i] += self.far_field_j(d)
+        return vj.reshape(dm.shape)
+
+    def far_field_j(self, dm):
+        '''The far-field part of the Coulomb matrix'''
+        log = logger.Logger(self.stdout, self.verbose)
+        t0 = (time.clock(), time.time())
+        ncart = self._tables.ncart
+        npair = len(self.pair_ij)
+        p, q = self.aop_p, self.aop_q
+        aop_starts = self.aop_starts
+        # moments, the weighted moments (or the local expansions) of a block
+        blksize = int(max(self.max_memory*.5, 100)*1e6/8 / (ncart*3))
+        blksize = max(blksize, 16)
+
+        mpair = numpy.empty((npair,ncart))
+        for k0, k1, a0, a1 in self._pair_blocks(blksize):
+            pb, qb = p[a0:a1], q[a0:a1]
+            w = dm[pb,qb] + dm[qb,pb] * self.aop_offdiag[a0:a1]
+            m = self._pair_moments(k0, k1) * w.reshape(-1,1)
+            mpair[k0:k1] = numpy.add.reduceat(m, aop_starts[k0:k1]-a0, axis=0)
+            m = None
+        lpair = self.far_field(mpair)
+
+        vj = numpy.zeros_like(dm)
+        for k0, k1, a0, a1 in self._pair_blocks(blksize):
+            v = numpy.einsum('im,im->i', self._pair_moments(k0, k1),
+                             lpair[self.aop_pair[a0:a1]])
+            vj[p[a0:a1],q[a0:a1]] = v
+            vj[q[a0:a1],p[a0:a1]] = v
+        log.timer('FMM far-field J', *t0)
+        return vj
+
+    def far_field(self, mpair):
+        '''Local expansions at the centers of the shell pairs due to the
+        far-field charge distributions.
+
+        Args:
+            mpair : (npair,ncart) ndarray
+                Multipoles (in the order of cart_powers(self.order)) of the
+                charge distributions about the centers of the shell pairs,
+                in the convention  int rho(r) (r-P)^m/m! dr
+        '''
+        tab = self._tables
+        ncart = tab.ncart
+        nnode = len(self.node_center)
+        npair = len(self.pair_center)
+        blksize = int(max(self.max_memory*.5, 100)*1e6/8 /
+                      (tab.m2l_size+ncart*3))
+        blksize = max(blksize, 16)
+
+        # shell pair multipoles => leaf multipoles
+        mpole = numpy.zeros((nnode,ncart))
+        leaf_mpole = []
+        for p0, p1 in prange(0, npair, blksize):
+            d = self.pair_center[p0:p1] - \
+                    self.node_center[self.leaf_nodes[self.pair_leaf[p0:p1]]]
+            leaf_mpole.append(tab.m2m(mpair[p0:p1], d, self.order))
+        leaf_mpole = numpy.vstack(leaf_mpole)
+        mpole[self.leaf_nodes] = numpy.add.reduceat(leaf_mpole,
+                                                    self.leaf_starts, axis=0)
+        leaf_mpole = None
+
+        # upward pass
+        for l in range(self.depth.max(), 0, -1):
+            nodes = numpy.where(self.depth == l)[0]
+            par = self.parent[nodes]
+            for p0, p1 in prange(0, len(nodes), blksize):
+                d = self.node_center[nodes[p0:p1]] - self.node_center[par[p0:p1]]
+                numpy.add.at(mpole, par[p0:p1],
+                             tab.m2m(mpole[nodes[p0:p1]], d, self.order))
+
+        # multipole to local expansion
+        local = numpy.zeros((nnode,ncart))
+        tgt, src = self.far_list
+        mpole *= tab.parity
+        for p0, p1 in prange(0, len(tgt), blksize):
+            r = self.node_center[tgt[p0:p1]] - self.node_center[src[p0:p1]]
+            v = tab.m2l(mpole[src[p0:p1]], coulomb_derivatives(r, self.order))
+            uniq, starts = numpy.unique(tgt[p0:p1], return_index=True)
+            local[uniq] += numpy.add.reduceat(v, starts, axis=0)
+        mpole = None
+
+        # downward pass
+        for l in range(1, self.depth.max()+1):
+            nodes = numpy.where(self.depth == l)[0]
+            par = self.parent[nodes]
+            for p0, p1 in prange(0, len(nodes), blksize):
+                d = self.node_center[nodes[p0:p1]] - self.node_center[par[p0:p1]]
+                local[nodes[p0:p1]] += tab.l2l(local[par[p0:p1]], d, self.order)
+
+        # local expansion at the center of each shell pair
+        lpair = []
+        for p0, p1 in prange(0, npair, blksize):
+            leaf = self.leaf_nodes[self.pair_leaf[p0:p1]]
+            d = self.pair_center[p0:p1] - self.node_center[leaf]
+            lpair.append(tab.l2l(local[leaf], d, self.order))
+        return numpy.vstack(lpair)
+
+
+def _shell_pairs(mol, tol):
+    '''Significant shell pairs, their centers and the extents of the charge
+    distributions.  The center and the extent are estimated with the most
+    diffuse primitive functions of the two shells.'''
+    nbas = mol.nbas
+    coords = numpy.array([mol.atom_coord(i) for i in range(mol.natm)])
+    bas_coords = coords[[mol.bas_atom(i) for i in range(nbas)]]
+    exps = numpy.array([mol.bas_exp(i).min() for i in range(nbas)])
+    ish, jsh = numpy.tril_indices(nbas)
+    ai = exps[ish]
+    aj = exps[jsh]
+    aij = ai + aj
+    rij = bas_coords[ish] - bas_coords[jsh]
+    rr = numpy.einsum('ix,ix->i', rij, rij)
+    mask = ai * aj / aij * rr < -numpy.log(tol)
+    ish = ish[mask]
+    jsh = jsh[mask]
+    ai = ai[mask]
+    aj = aj[mask]
+    aij = aij[mask]
+    center = (bas_coords[ish] * ai.reshape(-1,1) +
+              bas_coords[jsh] * aj.reshape(-1,1)) / aij.reshape(-1,1)
+    # The primitive pairs of contracted shells are centered on the segment
+    # between the two atoms
+    spread = numpy.maximum(numpy.linalg.norm(center-bas_coords[ish], axis=1),
+                           numpy.linalg.norm(center-bas_coords[jsh], axis=1))
+    ext = numpy.sqrt(-numpy.log(tol) / aij) + spread
+    return numpy.vstack((ish,jsh)).T, center, ext
+
+# angular factors of s and p functions which are not included in cart2sph
+_FAC_SP = (0.282094791773878143, 0.488602511902919921)
+
+def _shell_pair_moments(mol, ish, jsh, center, powers):
+    '''Cartesian multipoles  int i(r) j(r) (r-C)^m/m! dr  of the AO pairs of
+    the shells ish and jsh for the multi-indices m in powers.  The 1D
+    integrals of the primitive pairs are evaluated with the Gauss-Hermite
+    quadrature, which is exact for the polynomial part of the integrands.
+
+    Returns:
+        (di,dj,len(powers)) ndarray, di and dj being the number of AOs of
+        the two shells
+    '''
+    li = mol.bas_angular(ish)
+    lj = mol.bas_angular(jsh)
+    order = powers.sum(axis=1).max()
+    ai = mol.bas_exp(ish)
+    aj = mol.bas_exp(jsh)
+    ra = numpy.asarray(mol.bas_coord(ish))
+    rb = numpy.asarray(mol.bas_coord(jsh))
+    aij = (ai.reshape(-1,1) + aj).ravel()
+    rp = (numpy.einsum('i,x->ix', ai, ra).reshape(-1,1,3) +
+          numpy.einsum('j,x->jx', aj, rb)).reshape(-1,3) / aij.reshape(-1,1)
+    rr = numpy.dot(ra-rb, ra-rb)
+    kab = numpy.exp(-(ai.reshape(-1,1)*aj).ravel() / aij * rr)
+
+    z, w = numpy.polynomial.hermite.hermgauss((li+lj+order)//2+1)
+    x = rp.reshape(-1,1,3) + \
+            numpy.einsum('k,p->pk', z, 1/numpy.sqrt(aij)).reshape(-1,len(z),1)
+    wt = numpy.einsum('k,p->pk', w, 1/numpy.sqrt(aij))
+    fac = numpy.cumprod(numpy.append(1., numpy.arange(1, order+1)))
+    pa = (x - ra)[...,None] ** numpy.arange(li+1)
+    pb = (x - rb)[...,None] ** numpy.arange(lj+1)
+    pc = (x - center)[...,None] ** numpy.arange(order+1) / fac
+    # 1D integrals (prim-pair,xyz,i,j,t)
+    i1d = numpy.einsum('pk,pkxi,pkxj,pkxt->pxijt', wt, pa, pb, pc)
+
+    ci = cart_powers(li)[-(li+1)*(li+2)//2:]
+    cj = cart_powers(lj)[-(lj+1)*(lj+2)//2:]
+    m = kab.reshape(-1,1,1,1)
+    for x in range(3):
+        m = m * i1d[:,x][:,ci[:,x]][:,:,cj[:,x]][:,:,:,powers[:,x]]
+    npi = len(ai)
+    npj = len(aj)
+    m = numpy.einsum('pqabm,pc,qd->cadbm', m.reshape(npi,npj,*m.shape[1:]),
+                     mol.bas_ctr_coeff(ish), mol.bas_ctr_coeff(jsh))
+    c2si = gto.cart2sph(li)
+    c2sj = gto.cart2sph(lj)
+    if li < 2:
+        c2si = c2si * _FAC_SP[li]
+    if lj < 2:
+        c2sj = c2sj * _FAC_SP[lj]
+    m = numpy.einsum('cadbm,ai,bj->cidjm', m, c2si, c2sj)
+    nci, nsi, ncj, nsj = m.shape[:4]
+    return m.reshape(nci*nsi,ncj*nsj,-1)
+
+def _octree(coords, ext, leaf_size, min_size):
+    '''Octree of the given coordinates.  Each node is associated with a
+    sphere which encloses the spheres of its children.
+
+    Returns:
+        node_center, node_radius, node_ext, children, parent, depth,
+        leaves (sorted by the order of items), leaf_range (the items of the
+        leaves in perm), perm
+    '''
+    n = len(coords)
+    cmin = coords.min(axis=0)
+    cmax = coords.max(axis=0)
+    perm = numpy.arange(n)
+    centers = [(cmin+cmax)*.5]
+    halves = [max((cmax-cmin).max()*.5, min_size)]
+    ranges = [(0,n)]
+    children = [[-1]*8]
+    parent = [-1]
+    depth = [0]
+    stack = [0]
+    while stack:
+        inode = stack.pop()
+        p0, p1 = ranges[inode]
+        if p1 - p0 <= leaf_size or halves[inode] < min_size:
+            continue
+        c = centers[inode]
+        h = halves[inode] * .5
+        sub = perm[p0:p1]
+        octant = numpy.dot(coords[sub] > c, (4,2,1))
+        idx = numpy.argsort(octant, kind='mergesort')
+        perm[p0:p1] = sub[idx]
+        counts = numpy.bincount(octant, minlength=8)
+        for k in range(8):
+            if counts[k] > 0:
+                shift = numpy.array(((k>>2)&1, (k>>1)&1, k&1)) * 2 - 1
+                children[inode][k] = len(centers)
+                stack.append(len(centers))
+                centers.append(c + shift * h)
+                halves.append(h)
+                ranges.append((p0, p0+counts[k]))
+                children.append([-1]*8)
+                parent.append(inode)
+                depth.append(depth[inode]+1)
+            p0 += counts[k]
+
+    centers = numpy.array(centers)
+    children = numpy.array(children)
+    parent = numpy.array(parent)
+    depth = numpy.array(depth)
+    ranges = numpy.array(ranges)
+    nnode = len(centers)
+    radius = numpy.zeros(nnode)
+    node_ext = numpy.zeros(nnode)
+    isleaf = (children < 0).all(axis=1)
+    leaves = numpy.where(isleaf)[0]
+    leaves = leaves[numpy.argsort(ranges[leaves,0])]
+    for i in leaves:
+        p0, p1 = ranges[i]
+        radius[i] = numpy.linalg.norm(coords[perm[p0:p1]]-centers[i], axis=1).max()
+        node_ext[i] = ext[perm[p0:p1]].max()
+    for l in range(depth.max(), 0, -1):
+        for i in numpy.where(depth == l)[0]:
+            k = parent[i]
+            radius[k] = max(radius[k],
+                            numpy.linalg.norm(centers[i]-centers[k]) + radius[i])
+            node_ext[k] = max(node_ext[k], node_ext[i])
+    return (centers, radius, node_ext, children, parent, depth,
+            leaves, ranges[leaves], perm)
+
+def _dual_traverse(center, radius, ext, children, theta):
+    '''Split the interactions of all nodes into far-field (target node,
+    source node) pairs and near-field (target leaf, source leaf) pairs'''
+    isleaf = (children < 0).all(axis=1)
+    tgt = numpy.zeros(1, dtype=int)
+    src = numpy.zeros(1, dtype=int)
+    far_t = []
+    far_s = []
+    near_t = []
+    near_s = []
+    while len(tgt) > 0:
+        r = numpy.linalg.norm(center[tgt]-center[src], axis=1)
+        rs = radius[tgt] + radius[src]
+        ok = (r - rs > ext[tgt] + ext[src]) & (r * theta > rs)
+        far_t.append(tgt[ok])
+        far_s.append(src[ok])
+        tgt = tgt[~ok]
+        src = src[~ok]
+
+        tleaf = isleaf[tgt]
+        sleaf = isleaf[src]
+        both = tleaf & sleaf
+        near_t.append(tgt[both])
+        near_s.append(src[both])
+        split_t = ~tleaf & (sleaf | (radius[tgt] >= radius[src]))
+        split_s = ~both & ~split_t
+
+        ct = children[tgt[split_t]]
+        st = numpy.repeat(src[split_t], 8).reshape(-1,8)
+        cs = children[src[split_s]]
+        ts = numpy.repeat(tgt[split_s], 8).reshape(-1,8)
+        tgt = numpy.hstack((ct[ct>=0], ts[cs>=0]))
+        src = numpy.hstack((st[ct>=0], cs[cs>=0]))
+    far = (numpy.hstack(far_t), numpy.hstack(far_s))
+    near = (numpy.hstack(near_t), numpy.hstack(near_s))
+    return far, near
+
+
+def cart_powers(order):
+    '''Cartesian multi-indices (t,u,v) of orders 0, 1, ..., order'''
+    powers = []
+    for l in range(order+1):
+        for t in range(l, -1, -1):
+            for u in range(l-t, -1, -1):
+                powers.append((t, u, l-t-u))
+    return numpy.array(powers)
+
+def monomials(d, order):
+    '''d^m/m! for the Cartesian multi-indices m up to the given order'''
+    powers = cart_powers(order)
+    fac = numpy.cumprod(numpy.append(1., numpy.arange(1, order+1)))
+    xyz = numpy.empty((3,len(d),order+1))
+    xyz[:,:,0] = 1
+    for i in range(1, order+1):
+        xyz[:,:,i] = xyz[:,:,i-1] * d.T
+    xyz /= fac
+    return xyz[0][:,powers[:,0]] * xyz[1][:,powers[:,1]] * xyz[2][:,powers[:,2]]
+
+def coulomb_derivatives(r, order):
+    '''Derivatives D^m (1/|r|) for the Cartesian multi-indices m up to the
+    given order, with the McMurchie-Davidson recursion
+
+        R^n_{t+1,u,v} = t R^{n+1}_{t-1,u,v} + x R^{n+1}_{t,u,v}
+        R^n_{0,0,0} = (-1)^n (2n-1)!! / |r|^{2n+1}
+    '''
+    nr = len(r)
+    x, y, z = r.T
+    r2inv = 1. / numpy.einsum('ix,ix->i', r, r)
+    rn = {}
+    f = numpy.empty((order+1,nr))
+    f[0] = numpy.sqrt(r2inv)
+    for n in range(1, order+1):
+        f[n] = -(2*n-1) * f[n-1] * r2inv
+    rn[0,0,0] = f
+    for t in range(order):
+        v = x * rn[t,0,0][1:]
+        if t > 0:
+            v += t * rn[t-1,0,0][1:-1]
+        rn[t+1,0,0] = v
+    for t in range(order+1):
+        for u in range(order-t):
+            v = y * rn[t,u,0][1:]
+            if u > 0:
+                v += u * rn[t,u-1,0][1:-1]
+            rn[t,u+1,0] = v
+    for t in range(order+1):
+        for u in range(order+1-t):
+            for w in range(order-t-u):
+                v = z * rn[t,u,w][1:]
+                if w > 0:
+                    v += w * rn[t,u,w-1][1:-1]
+                rn[t,u,w+1] = v
+    return numpy.array([rn[tuple(m)][0] for m in cart_powers(order)]).T
+
+class _Tables(object):
+    '''Index tables of the translations of multipoles and local expansions.
+    Each translation is computed as out[:,i] = sum_k a[:,ia[k]] * b[:,ib[k]]
+    for the terms k in the segment of i.'''
+    def __init__(self, order):
+        self.order = order
+        powers = cart_powers(order)
+        self.ncart = len(powers)
+        self.parity = (-1.) ** powers.sum(axis=1)
+        index = dict([(tuple(m), i) for i, m in enumerate(powers)])
+        self._m2m = {}
+        self._l2l = {}
+        for lsrc in range(order+1):
+            ia = []
+            ib = []
+            starts = []
+            for n in powers:
+                starts.append(len(ia))
+                for k in powers[:(lsrc+1)*(lsrc+2)*(lsrc+3)//6]:
+                    if all(k <= n):
+                        ia.append(index[tuple(k)])
+                        ib.append(index[tuple(n-k)])
+            self._m2m[lsrc] = (numpy.array(ia), numpy.array(ib),
+                               numpy.array(starts))
+        for ltgt in range(order+1):
+            ia = []
+            ib = []
+            starts = []
+            for m in powers[:(ltgt+1)*(ltgt+2)*(ltgt+3)//6]:
+                starts.append(len(ia))
+                for k in powers:
+                    if all(m <= k):
+                        ia.append(index[tuple(k)])
+                        ib.append(index[tuple(k-m)])
+            self._l2l[ltgt] = (numpy.array(ia), numpy.array(ib),
+                               numpy.array(starts))
+        ia = []
+        ib = []
+        starts = []
+        for m in powers:
+            starts.append(len(ia))
+            for n in powers:
+                if sum(m) + sum(n) <= order:
+                    ia.append(index[tuple(n)])
+                    ib.append(index[tuple(m+n)])
+        self._m2l = (numpy.array(ia), numpy.array(ib), numpy.array(starts))
+        self.m2l_size = len(ia)
+
+    def m2m(self, mpole, d, src_order):
+        '''Translate multipoles (up to src_order) by d, the vector from the
+        new center to the old center'''
+        ia, ib, starts = self._m2m[src_order]
+        mono = monomials(d, self.order)
+        return numpy.add.reduceat(mpole[:,ia] * mono[:,ib], starts, axis=1)
+
+    def l2l(self, local, d, tgt_order):
+        '''Translate local expansions by d, the vector from the old center to
+        the new center'''
+        ia, ib, starts = self._l2l[tgt_order]
+        mono = monomials(d, self.order)
+        return numpy.add.reduceat(local[:,ia] * mono[:,ib], starts, axis=1)
+
+    def m2l(self, mpole, dtensor):
+        '''Local expansions of the multipoles (multiplied by parity) with the
+        derivative tensors of 1/r'''
+        ia, ib, starts = self._m2l
+        return numpy.add.reduceat(mpole[:,ia] * dtensor[:,ib], starts, axis=1)
+
+def prange(start, end, step):
+    for i in range(start, end, step):
+        yield i, min(i+step, end)
@@ -20,6 +20,7 @@ from pyscf.lib import logger
 from pyscf.scf import chkfile
 from pyscf.scf import diis
 from pyscf.scf import _vhf
+from pyscf.scf import eri_cache
 
 
 
@@ -133,7 +134,13 @@ Keyword argument "init_dm" is replaced by "dm0"''')
         mo_energy, mo_coeff = mf.eig(fock, s1e)
         mo_occ = mf.get_occ(mo_energy, mo_coeff)
         dm = mf.make_rdm1(mo_coeff, mo_occ)
-        vhf = mf.get_veff(mol, dm, dm_last, vhf)
+        if mf.rebuild_nsteps > 0 and (cycle+1) % mf.rebuild_nsteps == 0:
+# Rebuild the potential from the full density matrix to remove the numerical
+# noise accumulated by the incremental (density difference) updates
+            logger.debug(mf, 'Rebuild HF potential with full density matrix')
+            vhf = mf.get_veff(mol, dm)
+        else:
+            vhf = mf.get_veff(mol, dm, dm_last, vhf)
         e_tot = mf.energy_tot(dm, h1e, vhf)
 
         norm_gorb = numpy.linalg.norm(mf.get_grad(mo_coeff, mo_occ, h1e+vhf))
@@ -536,7 +543,8 @@ def get_jk(mol, dm, hermi=1, vhfopt=None):
     '''
     vj, vk = _vhf.direct(numpy.array(dm, copy=False),
                          mol._atm, mol._bas, mol._env,
-                         vhfopt=vhfopt, hermi=hermi)
+                         vhfopt=vhfopt, hermi=hermi,
+                         max_memory=mol.max_memory)
     return vj, vk
 
 
@@ -818,6 +826,8 @@ class SCF(object):
             Default is 'minao'
         DIIS : class listed in :mod:`scf.diis`
             Default is :class:`diis.SCF_DIIS`. Set it to None to turn off DIIS.
+            :class:`diis.EDIIS` or :class:`diis.ADIIS` may converge faster
+            for difficult systems.
         diis : bool
             whether to do DIIS.  Default is True.
         diis_space : int
@@ -832,6 +842,18 @@ class SCF(object):
             Direct SCF is used by default.
         direct_scf_tol : float
             Direct SCF cutoff threshold.  Default is 1e-13.
+        rebuild_nsteps : int
+            In direct SCF, the HF potential is updated incrementally with the
+            density difference between two iterations.  Every rebuild_nsteps
+            cycles the potential is rebuilt from the full density matrix to
+            avoid the accumulation of numerical errors.  Set it to 0 to
+            switch off the rebuilding.  Default is 8.
+        eri_mmap : bool
+            When the AO integrals do not fit in max_memory, store them in a
+            memory-mapped file (in the ERI cache if it is enabled, otherwise
+            in TMPDIR) and use the incore J/K algorithm instead of direct
+            SCF.  The OS page cache keeps as many integrals in memory as
+            possible.  Default is False.
         callback : function(envs_dict) => None
             callback function takes one dict as the argument which is
             generated by the builtin function :func:`locals`, so that the
@@ -888,6 +910,8 @@ class SCF(object):
         self.level_shift = 0
         self.direct_scf = True
         self.direct_scf_tol = 1e-13
+        self.rebuild_nsteps = 8
+        self.eri_mmap = False
 ##################################################
 # don't modify the following attributes, they are not input options
         self.mo_energy = None
@@ -908,8 +932,8 @@ class SCF(object):
             pyscf.gto.mole.check_sanity(self, self._keys, self.stdout)
 
         if mol is None: mol = self.mol
-        if (self.direct_scf and not mol.incore_anyway and
-            not self._is_mem_enough()):
+        if (self.direct_scf and not self.eri_mmap and
+            not mol.incore_anyway and not self._is_mem_enough()):
 # Should I lazy initialize direct SCF?
             self.opt = self.init_direct_scf(mol)
 
@@ -929,6 +953,9 @@ class SCF(object):
         logger.info(self, 'direct_scf = %s', self.direct_scf)
         if self.direct_scf:
             logger.info(self, 'direct_scf_tol = %g', self.direct_scf_tol)
+            logger.info(self, 'rebuild HF potential every %d cycles',
+                        self.rebuild_nsteps)
+        logger.info(self, 'eri_mmap = %s', self.eri_mmap)
         if self.chkfile:
             logger.info(self, 'chkfile to save SCF result = %s', self.chkfile)
         logger.info(self, 'max_memory %d MB (current use %d MB)',
@@ -1187,9 +1214,19 @@ class SCF(object):
         nbf = self.mol.nao_nr()
         return nbf**4/1e6+pyscf.lib.current_memory()[0] < self.max_memory*.95
 
-    def density_fit(self, auxbasis='weigend'):
+    def density_fit(self, auxbasis='weigend', with_df=None):
         import pyscf.scf.dfhf
-        return pyscf.scf.dfhf.density_fit(self, auxbasis)
+        return pyscf.scf.dfhf.density_fit(self, auxbasis, with_df)
+
+    def cosx(self, grids=None):
+        import pyscf.scf.cosxhf
+        return pyscf.scf.cosxhf.cosx(self, grids)
+
+    def fmm(self, theta=None, order=None):
+        import pyscf.scf.fmmhf
+        if theta is None: theta = pyscf.scf.fmmhf.THETA
+        if order is None: order = pyscf.scf.fmmhf.ORDER
+        return pyscf.scf.fmmhf.fmm(self, theta, order)
 
     @property
     def hf_energy(self):
@@ -1254,12 +1291,14 @@ class RHF(SCF):
         if mol is None: mol = self.mol
         if dm is None: dm = self.make_rdm1()
         cpu0 = (time.clock(), time.time())
+        if self._eri is None and self.eri_mmap and not self._is_mem_enough():
+            self._eri = eri_cache.get_eri_mmap(mol)
         if self._eri is not None or mol.incore_anyway or self._is_mem_enough():
             if self._eri is None:
-                self._eri = _vhf.int2e_sph(mol._atm, mol._bas, mol._env)
+                self._eri = eri_cache.get_eri(mol)
             vj, vk = dot_eri_dm(self._eri, dm, hermi)
         else:
-            if self.direct_scf:
+            if self.direct_scf and self.opt is None:
                 self.opt = self.init_direct_scf(mol)
             vj, vk = get_jk(mol, dm, hermi, self.opt)
         logger.timer(self, 'vj and vk', *cpu0)
@@ -0,0 +1,42 @@
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import unittest
+from pyscf import gto
+from pyscf import scf
+from pyscf import dft
+
+mols = [gto.M(atom='H 0 0 0; F 0 0 %g' % r, basis='631g') for r in (.8, .9, 1.)]
+mols.append(dict(atom='O 0 0 0; H 0 -0.757 0.587; H 0 0.757 0.587',
+                 basis='cc-pvdz', spin=2))
+
+
+class KnowValues(unittest.TestCase):
+    def test_rhf(self):
+        ref = [scf.RHF(mol).scf() for mol in mols[:3]]
+        results = dict(scf.run_batch(mols[:3], 'RHF', nproc=2, verbose=0))
+        self.assertEqual(sorted(results.keys()), [0, 1, 2])
+        for i in range(3):
+            self.assertTrue(results[i]['converged'])
+            self.assertAlmostEqual(results[i]['e_tot'], ref[i], 9)
+
+    def test_uks(self):
+        mol = gto.M(atom=mols[3]['atom'], basis='cc-pvdz', spin=2)
+        mf = dft.UKS(mol)
+        mf.xc = 'b3lyp'
+        ref = mf.scf()
+        results = dict(scf.run_batch(mols[3:], 'UKS', nproc=1, verbose=0,
+                                     xc='b3lyp', with_mo=True))
+        self.assertAlmostEqual(results[0]['e_tot'], ref, 9)
+        self.assertEqual(results[0]['mo_coeff'].shape, (2,24,24))
+
+    def test_error(self):
+        mf_fn = lambda mol: scf.RHF(mol).set_not_exist()
+        results = dict(scf.run_batch(mols[:1], mf_fn, nproc=1, verbose=0))
+        self.assertTrue('error' in results[0])
+
+
+if __name__ == "__main__":
+    print("Full Tests for run_batch")
+    unittest.main()
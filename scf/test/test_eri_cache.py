@@ -0,0 +1,67 @@
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import os
+import shutil
+import tempfile
+import numpy
+import unittest
+from pyscf import gto
+from pyscf import scf
+from pyscf.scf import eri_cache
+
+mol = gto.M(
+    verbose = 5,
+    output = '/dev/null',
+    atom = '''
+O     0    0        0
+H     0    -0.757   0.587
+H     0    0.757    0.587''',
+    basis = 'cc-pvdz',
+)
+
+
+class KnowValues(unittest.TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.cache = eri_cache.enable(self.cachedir)
+
+    def tearDown(self):
+        eri_cache.disable()
+        shutil.rmtree(self.cachedir)
+
+    def test_reuse(self):
+        eri0 = eri_cache.get_eri(mol)
+        self.assertTrue(os.path.isfile(self.cache.filename(mol)))
+        eri1 = eri_cache.get_eri(mol)
+        self.assertTrue(isinstance(eri1, numpy.memmap))
+        self.assertTrue(numpy.allclose(eri0, eri1))
+        mf = scf.RHF(mol)
+        self.assertAlmostEqual(mf.scf(), -76.026765673119627, 9)
+
+    def test_fingerprint(self):
+        mol1 = mol.copy()
+        mol1.basis = '6-31g'
+        mol1.build(False, False)
+        self.assertEqual(eri_cache.fingerprint(mol), eri_cache.fingerprint(mol.copy()))
+        self.assertNotEqual(eri_cache.fingerprint(mol), eri_cache.fingerprint(mol1))
+
+    def test_evict(self):
+        mol1 = mol.copy()
+        mol1.basis = '6-31g'
+        mol1.build(False, False)
+        eri_cache.get_eri(mol1)
+        size1 = os.path.getsize(self.cache.filename(mol1)) / 1e6
+        nao_pair = mol.nao_nr()*(mol.nao_nr()+1)//2
+        size0 = nao_pair*(nao_pair+1)//2 * 8 / 1e6
+        # room for the ERIs of mol but not for both
+        self.cache.max_size = size0 + size1 * .5
+        eri_cache.get_eri(mol)
+        self.assertFalse(os.path.isfile(self.cache.filename(mol1)))
+        self.assertTrue(os.path.isfile(self.cache.filename(mol)))
+
+
+if __name__ == "__main__":
+    print("Full Tests for ERI cache")
+    unittest.main()
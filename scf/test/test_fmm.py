@@ -0,0 +1,133 @@
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import numpy
+import unittest
+from pyscf import gto
+from pyscf import scf
+from pyscf.scf import fmmhf
+
+mol = gto.M(
+    verbose = 5,
+    output = '/dev/null',
+    atom = '''
+        O     0    0        0
+        H     0    -0.757   0.587
+        H     0    0.757    0.587''',
+    basis = 'cc-pvdz',
+)
+
+# H chain, long enough to have far-field interactions
+hchain = gto.M(
+    verbose = 5,
+    output = '/dev/null',
+    atom = [['H', (0, 0, i*1.4)] for i in range(40)],
+    unit = 'Bohr',
+    basis = '6-31g',
+)
+
+# Ne chain, the far-field interactions between the compact charge
+# distributions need the high order multipoles of the shell pairs
+nechain = gto.M(
+    verbose = 5,
+    output = '/dev/null',
+    atom = [['Ne', (0, 0, i*3.)] for i in range(12)],
+    basis = 'cc-pvdz',
+)
+
+
+class KnowValues(unittest.TestCase):
+    def test_coulomb_derivatives(self):
+        r = numpy.array([[.8, -.5, 1.2], [-2., 1., .3]])
+        d = fmmhf.coulomb_derivatives(r, 3)
+        powers = fmmhf.cart_powers(3)
+        e = 1e-5
+        for i, m in enumerate(powers):
+            if m.sum() == 3:
+                continue
+            for x in range(3):
+                m1 = m.copy()
+                m1[x] += 1
+                j = [k for k, p in enumerate(powers) if tuple(p) == tuple(m1)][0]
+                dr = numpy.zeros(3)
+                dr[x] = e
+                ref = (fmmhf.coulomb_derivatives(r+dr, 3)[:,i] -
+                       fmmhf.coulomb_derivatives(r-dr, 3)[:,i]) / (2*e)
+                self.assertTrue(numpy.allclose(d[:,j], ref, rtol=1e-6))
+
+    def test_get_j(self):
+        numpy.random.seed(1)
+        nao = hchain.nao_nr()
+        dm = numpy.random.random((nao,nao)) - .5
+        dm = dm + dm.T
+        vj0 = scf.hf.get_jk(hchain, dm)[0]
+        mf = scf.fmm(scf.RHF(hchain))
+        vj1 = mf.get_j(hchain, dm)
+        self.assertTrue(len(mf._fmm.far_list[0]) > 0)
+        self.assertTrue(abs(vj1-vj0).max() < 1e-6)
+
+    def test_get_j_low_memory(self):
+        # multipoles of the AO pairs evaluated on the fly, in many blocks
+        numpy.random.seed(1)
+        nao = hchain.nao_nr()
+        dm = numpy.random.random((nao,nao)) - .5
+        dm = dm + dm.T
+        fmmobj = fmmhf.MultipoleTree(hchain).build()
+        vj0 = fmmobj.get_j(dm)
+        fmmobj = fmmhf.MultipoleTree(hchain)
+        fmmobj.max_memory = 1e-4
+        fmmobj.build()
+        self.assertTrue(fmmobj.aop_moments is None)
+        self.assertTrue(len(list(fmmobj._pair_blocks(16))) > 1)
+        self.assertTrue(numpy.allclose(fmmobj.get_j(dm), vj0))
+
+    def test_shell_pair_moments(self):
+        c = numpy.array([.3, -.2, 1.1])
+        s = mol.intor_symmetric('cint1e_ovlp_sph')
+        mol.set_common_origin_(c)
+        r = mol.intor('cint1e_r_sph', comp=3)
+        rr = mol.intor('cint1e_rr_sph', comp=9).reshape((3,3)+s.shape)
+        mol.set_common_origin_((0,0,0))
+        # int i j (r-C)^m/m! for m = 0, x, y, z, xx, xy, xz, yy, yz, zz
+        ref = numpy.vstack((s[None], r, rr[[0,0,0,1,1,2],[0,1,2,1,2,2]] *
+                            numpy.array([.5,1,1,.5,1,.5]).reshape(-1,1,1)))
+        ao_loc = mol.ao_loc_nr()
+        powers = fmmhf.cart_powers(2)
+        for ish in range(mol.nbas):
+            for jsh in range(mol.nbas):
+                m = fmmhf._shell_pair_moments(mol, ish, jsh, c, powers)
+                i0, i1 = ao_loc[ish], ao_loc[ish+1]
+                j0, j1 = ao_loc[jsh], ao_loc[jsh+1]
+                self.assertTrue(numpy.allclose(m.transpose(2,0,1),
+                                               ref[:,i0:i1,j0:j1]))
+
+    def test_get_j_error(self):
+        numpy.random.seed(1)
+        nao = nechain.nao_nr()
+        dm = numpy.random.random((nao,nao)) - .5
+        dm = dm + dm.T
+        vj0 = scf.hf.get_jk(nechain, dm)[0]
+        theta = fmmhf.THETA
+        errs = []
+        for order in (4, 6, 8, 10):
+            fmmobj = fmmhf.MultipoleTree(nechain, theta, order).build()
+            self.assertTrue(len(fmmobj.far_list[0]) > 0)
+            errs.append(abs(fmmobj.get_j(dm) - vj0).max())
+            self.assertTrue(errs[-1] < theta**(order+1))
+        self.assertTrue(numpy.all(numpy.diff(errs) < 0))
+        self.assertTrue(errs[-1] < 1e-7)
+
+    def test_rhf(self):
+        mf = scf.fmm(scf.RHF(mol))
+        self.assertAlmostEqual(mf.scf(), -76.026765673119627, 7)
+
+    def test_uhf(self):
+        mf = scf.fmm(scf.UHF(hchain))
+        e0 = scf.UHF(hchain).scf()
+        self.assertAlmostEqual(mf.scf(), e0, 7)
+
+
+if __name__ == "__main__":
+    print("Full Tests for FMM J")
+    unittest.main()
@@ -193,6 +193,60 @@ class KnowValues(unittest.TestCase):
         mf = scf.RHF(mol)
         self.assertAlmostEqual(mf.kernel(), -75.393287998638741, 9)
 
+    def test_direct_scf_rebuild(self):
+        mf1 = scf.RHF(mol)
+        mf1.max_memory = 0
+        mf1.conv_tol = 1e-10
+        mf1.rebuild_nsteps = 3
+        self.assertAlmostEqual(mf1.scf(), -76.026765673119627, 9)
+        mf1.rebuild_nsteps = 0
+        self.assertAlmostEqual(mf1.scf(), -76.026765673119627, 9)
+
+    def test_ediis(self):
+        mf1 = scf.RHF(mol)
+        mf1.conv_tol = 1e-10
+        mf1.DIIS = scf.diis.EDIIS
+        self.assertAlmostEqual(mf1.scf(), -76.026765673119627, 9)
+
+        mf1.DIIS = scf.diis.ADIIS
+        self.assertAlmostEqual(mf1.scf(), -76.026765673119627, 9)
+
+    def test_eri_mmap(self):
+        mf1 = scf.RHF(mol)
+        mf1.max_memory = 0
+        mf1.conv_tol = 1e-10
+        mf1.eri_mmap = True
+        self.assertAlmostEqual(mf1.scf(), -76.026765673119627, 9)
+        self.assertTrue(isinstance(mf1._eri, numpy.memmap))
+
+        numpy.random.seed(1)
+        nao = mol.nao_nr()
+        dm = numpy.random.random((nao,nao))
+        from pyscf.scf import _vhf
+        blksize = _vhf.MMAP_BLKSIZE
+        _vhf.MMAP_BLKSIZE = 5000
+        j1, k1 = scf.hf.dot_eri_dm(mf1._eri, dm, hermi=0)
+        _vhf.MMAP_BLKSIZE = blksize
+        self.assertAlmostEqual(numpy.linalg.norm(j1), 77.035779188661465, 9)
+        self.assertAlmostEqual(numpy.linalg.norm(k1), 46.253491700647963, 9)
+
+    def test_cosx(self):
+        mf1 = scf.cosx(scf.RHF(mol))
+        mf1.conv_tol = 1e-10
+        self.assertTrue(abs(mf1.scf() - mf.e_tot) < 1e-5)
+
+        dm = mf.make_rdm1()
+        vk0 = mf.get_k(mol, dm)
+        vk1 = mf1.get_k(mol, dm)
+        self.assertTrue(abs(numpy.einsum('ij,ji', vk1-vk0, dm)) * .25 < 1e-5)
+        self.assertTrue(abs(vk1-vk0).max() < 2e-5)
+        self.assertTrue(abs(mf1.get_j(mol, dm)-mf.get_j(mol, dm)).max() < 1e-9)
+
+        # screening does not change the exchange matrix beyond the cutoff
+        from pyscf.scf import cosxhf
+        vk2 = cosxhf.get_k(mol, dm, mf1.cosx_grids, cutoff=0)
+        self.assertTrue(abs(vk1-vk2).max() < 1e-8)
+
 
 if __name__ == "__main__":
     print("Full Tests for rhf")
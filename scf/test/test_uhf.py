@@ -57,6 +57,15 @@ class KnowValues(unittest.TestCase):
     def test_scf(self):
         self.assertAlmostEqual(mf.e_tot, -76.026765673119627, 9)
 
+    def test_ediis(self):
+        mf1 = scf.UHF(mol)
+        mf1.conv_tol = 1e-10
+        mf1.DIIS = scf.diis.EDIIS
+        self.assertAlmostEqual(mf1.scf(), -76.026765673119627, 9)
+
+        mf1.DIIS = scf.diis.ADIIS
+        self.assertAlmostEqual(mf1.scf(), -76.026765673119627, 9)
+
     def test_get_veff(self):
         nao = mol.nao_nr()
         numpy.random.seed(1)
@@ -34,6 +34,77 @@ class KnowValues(unittest.TestCase):
         self.assertTrue(numpy.allclose(vj0,vj1))
         self.assertTrue(numpy.allclose(vk0,vk1))
 
+    def test_direct_mdm(self):
+        numpy.random.seed(1)
+        dms = numpy.random.random((5,nao,nao))
+        vj0, vk0 = scf.hf.dot_eri_dm(mf._eri, dms, hermi=0)
+        vj1, vk1 = _vhf.direct(dms, mol._atm, mol._bas, mol._env)
+        self.assertTrue(numpy.allclose(vj0,vj1))
+        self.assertTrue(numpy.allclose(vk0,vk1))
+        opt = mf.init_direct_scf(mol)
+        vj1, vk1 = _vhf.direct(dms, mol._atm, mol._bas, mol._env, vhfopt=opt)
+        self.assertTrue(numpy.allclose(vj0,vj1))
+        self.assertTrue(numpy.allclose(vk0,vk1))
+
+    def test_direct_dm_blocks(self):
+        # max_memory too small for all DMs at once, one DM per pass
+        numpy.random.seed(1)
+        dms = numpy.random.random((5,nao,nao))
+        vj0, vk0 = _vhf.direct(dms, mol._atm, mol._bas, mol._env)
+        vj1, vk1 = _vhf.direct(dms, mol._atm, mol._bas, mol._env,
+                               max_memory=1e-3)
+        self.assertTrue(numpy.allclose(vj0,vj1))
+        self.assertTrue(numpy.allclose(vk0,vk1))
+        vj0, vk0 = _vhf.direct_mapdm('cint2e_sph', 's8',
+                                     ('ji->s2kl', 'li->s1kj'),
+                                     dms, 1, mol._atm, mol._bas, mol._env)
+        vj1, vk1 = _vhf.direct_mapdm('cint2e_sph', 's8',
+                                     ('ji->s2kl', 'li->s1kj'),
+                                     dms, 1, mol._atm, mol._bas, mol._env,
+                                     max_memory=1e-3)
+        self.assertTrue(numpy.allclose(vj0,vj1))
+        self.assertTrue(numpy.allclose(vk0,vk1))
+        v0 = _vhf.direct_bindm('cint2e_sph', 's8', ('ji->s2kl',)*5,
+                               dms, 1, mol._atm, mol._bas, mol._env)
+        v1 = _vhf.direct_bindm('cint2e_sph', 's8', ('ji->s2kl',)*5,
+                               dms, 1, mol._atm, mol._bas, mol._env,
+                               max_memory=1e-3)
+        self.assertTrue(numpy.allclose(v0,v1))
+
+    def test_schwarz_cache(self):
+        import ctypes
+        def get_q_cond(mol):
+            opt = mf.init_direct_scf(mol)
+            q = numpy.empty((mol.nbas,mol.nbas))
+            _vhf.libcvhf.CVHFget_q_cond(opt._this, q.ctypes.data_as(ctypes.c_void_p),
+                                        ctypes.c_int(mol.nbas))
+            return q
+        mol1 = mol.copy()
+        mol1.atom = [['O', (0, 0, 0)], ['H', (0, -0.757, 0.587)],
+                     ['H', (0, 0.757, 0.687)]]
+        mol1.build(False, False)
+
+        _vhf.clear_schwarz_cache()
+        cache_size = _vhf.SCHWARZ_CACHE_SIZE
+        _vhf.SCHWARZ_CACHE_SIZE = 0
+        q0 = get_q_cond(mol)
+        q1 = get_q_cond(mol1)
+        _vhf.SCHWARZ_CACHE_SIZE = cache_size
+        self.assertTrue(numpy.allclose(q0, get_q_cond(mol)))
+        self.assertEqual(len(_vhf._schwarz_cache), 1)
+        self.assertTrue(numpy.allclose(q0, get_q_cond(mol)))
+        self.assertTrue(numpy.allclose(q1, get_q_cond(mol1)))
+        self.assertEqual(len(_vhf._schwarz_cache), 1)
+        self.assertTrue(numpy.allclose(q0, get_q_cond(mol)))
+
+        # most shell pairs are negligible for small density matrix
+        dm = mf.make_rdm1() * 1e-4
+        opt = mf.init_direct_scf(mol)
+        vj0, vk0 = scf.hf.dot_eri_dm(mf._eri, dm, hermi=1)
+        vj1, vk1 = scf.hf.get_jk(mol, dm, hermi=1, vhfopt=opt)
+        self.assertTrue(numpy.allclose(vj0*1e4,vj1*1e4))
+        self.assertTrue(numpy.allclose(vk0*1e4,vk1*1e4))
+
     def test_direct_mapdm(self):
         numpy.random.seed(1)
         dm = numpy.random.random((nao,nao))
@@ -8,6 +8,7 @@ from pyscf.lib import logger
 from pyscf.scf import hf
 from pyscf.scf import chkfile
 from pyscf.scf import _vhf
+from pyscf.scf import eri_cache
 
 
 def init_guess_by_minao(mol):
@@ -539,12 +540,14 @@ class UHF(hf.SCF):
         dm = numpy.asarray(dm)
         nao = dm.shape[-1]
         cpu0 = (time.clock(), time.time())
+        if self._eri is None and self.eri_mmap and not self._is_mem_enough():
+            self._eri = eri_cache.get_eri_mmap(mol)
         if self._eri is not None or mol.incore_anyway or self._is_mem_enough():
             if self._eri is None:
-                self._eri = _vhf.int2e_sph(mol._atm, mol._bas, mol._env)
+                self._eri = eri_cache.get_eri(mol)
             vj, vk = hf.dot_eri_dm(self._eri, dm.reshape(-1,nao,nao), hermi)
         else:
-            if self.direct_scf:
+            if self.direct_scf and self.opt is None:
                 self.opt = self.init_direct_scf(mol)
             vj, vk = hf.get_jk(mol, dm.reshape(-1,nao,nao), hermi, self.opt)
         logger.timer(self, 'vj and vk', *cpu0)